@@ -15,6 +15,9 @@ const admin = process.env.ADMIN_ADDRESS; //"tz1RyejUffjfnHzWoRp1vYyZwGnfPuHsD5F5
 let all_farms = new Array();
 let all_farms_data = new MichelsonMap();
 let inverse_farms = new MichelsonMap();
+let all_pools = new MichelsonMap();
+let farms_by_index = new MichelsonMap();
+let farm_index = new MichelsonMap();
 
 async function orig() {
 
@@ -22,7 +25,10 @@ async function orig() {
         'admin': admin,
         'all_farms': all_farms,
         'all_farms_data': all_farms_data,
-        'inverse_farms': inverse_farms
+        'inverse_farms': inverse_farms,
+        'all_pools': all_pools,
+        'farms_by_index': farms_by_index,
+        'farm_index': farm_index
     }
     const originated = await Tezos.contract.originate({
         code: database,
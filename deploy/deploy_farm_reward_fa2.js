@@ -61,6 +61,7 @@ exports.__esModule = true;
 var signer_1 = require("@taquito/signer");
 var taquito_1 = require("@taquito/taquito");
 var farm_json_1 = __importDefault(require("./artefact/farm.json"));
+var farm_metadata_json_1 = __importDefault(require("./artefact/farm_metadata.json"));
 var dotenv = __importStar(require("dotenv"));
 dotenv.config(({ path: __dirname + '/.env' }));
 var rpc = process.env.RPC; //"http://127.0.0.1:8732"
@@ -82,9 +83,16 @@ var infoFarm = process.env.INFOFARM || '';
 var rate = process.env.RATE || 9500;
 var reward_at_week = [];
 var rewards = process.env.REWARD_AMOUNT; //50000000;
+var user_claimed_week = new taquito_1.MichelsonMap();
+// TZIP-16 metadata with the off-chain views (src/contract/test/farm_metadata.py)
+var metadata = taquito_1.MichelsonMap.fromLiteral({
+    '': Buffer.from('tezos-storage:contents').toString('hex'),
+    'contents': Buffer.from(JSON.stringify(farm_metadata_json_1["default"])).toString('hex')
+});
 var user_points = new taquito_1.MichelsonMap();
 var user_stakes = new taquito_1.MichelsonMap();
 var total_weeks = process.env.WEEKS; //5;
+var week_duration = process.env.DURATION_OF_PERIOD || 604800;
 function orig() {
     return __awaiter(this, void 0, void 0, function () {
         var store, originated, farmAddress, op, database_contract, op3, error_1;
@@ -103,9 +111,12 @@ function orig() {
                         'rate': rate,
                         'reward_at_week': reward_at_week,
                         'total_reward': rewards,
+                        'user_claimed_week': user_claimed_week,
+                        'metadata': metadata,
                         'user_points': user_points,
                         'user_stakes': user_stakes,
-                        'total_weeks': total_weeks
+                        'total_weeks': total_weeks,
+                        'week_duration': week_duration
                     };
                     _a.label = 1;
                 case 1:
@@ -1,6 +1,7 @@
 import { InMemorySigner } from '@taquito/signer';
 import { TezosToolkit, MichelsonMap } from '@taquito/taquito';
 import farm from './artefact/farm.json';
+import farm_metadata from './artefact/farm_metadata.json';
 import * as dotenv from 'dotenv'
 
 dotenv.config(({path:__dirname+'/.env'}))
@@ -24,9 +25,16 @@ const infoFarm = process.env.INFOFARM || '';
 const rate = process.env.RATE || 9500;
 let reward_at_week: [] = [];
 const rewards = process.env.REWARD_AMOUNT; //50000000;
+let user_claimed_week = new MichelsonMap();
+// TZIP-16 metadata with the off-chain views (src/contract/test/farm_metadata.py)
+let metadata = MichelsonMap.fromLiteral({
+    '': Buffer.from('tezos-storage:contents').toString('hex'),
+    'contents': Buffer.from(JSON.stringify(farm_metadata)).toString('hex'),
+});
 let user_points = new MichelsonMap();
 let user_stakes = new MichelsonMap();
 const total_weeks = process.env.WEEKS; //5;
+const week_duration = process.env.DURATION_OF_PERIOD || 604800;
 
 
 async function orig() {
@@ -44,9 +52,12 @@ async function orig() {
         'rate': rate,
         'reward_at_week': reward_at_week,
         'total_reward': rewards,
+        'user_claimed_week': user_claimed_week,
+        'metadata': metadata,
         'user_points': user_points,
         'user_stakes': user_stakes,
         'total_weeks': total_weeks,
+        'week_duration': week_duration,
     }
     try {
         const originated = await Tezos.contract.originate({
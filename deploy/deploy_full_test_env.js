@@ -61,6 +61,7 @@ exports.__esModule = true;
 var signer_1 = require("@taquito/signer");
 var taquito_1 = require("@taquito/taquito");
 var farm_json_1 = __importDefault(require("./artefact/farm.json"));
+var farm_metadata_json_1 = __importDefault(require("./artefact/farm_metadata.json"));
 var fa12_json_1 = __importDefault(require("./artefact/fa12.json"));
 var fa2_json_1 = __importDefault(require("./artefact/fa2.json"));
 var database_json_1 = __importDefault(require("./artefact/database.json"));
@@ -84,9 +85,16 @@ var infoFarm = process.env.INFOFARM || '';
 var rate = process.env.RATE || 9500;
 var reward_at_week = [];
 var rewards = process.env.REWARD_AMOUNT; //50000000;
+var user_claimed_week = new taquito_1.MichelsonMap();
+// TZIP-16 metadata with the off-chain views (src/contract/test/farm_metadata.py)
+var metadata = taquito_1.MichelsonMap.fromLiteral({
+    '': Buffer.from('tezos-storage:contents').toString('hex'),
+    'contents': Buffer.from(JSON.stringify(farm_metadata_json_1["default"])).toString('hex')
+});
 var user_points = new taquito_1.MichelsonMap();
 var user_stakes = new taquito_1.MichelsonMap();
 var total_weeks = process.env.WEEKS; //5;
+var week_duration = process.env.DURATION_OF_PERIOD || 604800;
 var farm_address = process.env.FARM_ADDRESS || undefined;
 // For FA1.2 input
 var fa12_input_tokens = new taquito_1.MichelsonMap();
@@ -114,6 +122,7 @@ fa2_reward_ledger.set({ 0: reward_reserve_address, 1: reward_fa2_token_id }, rew
 var database_all_farms = new Array();
 var database_all_farms_data = new taquito_1.MichelsonMap();
 var database_inverse_farms = new taquito_1.MichelsonMap();
+var database_all_pools = new taquito_1.MichelsonMap();
 function orig() {
     return __awaiter(this, void 0, void 0, function () {
         var farm_store, fa2_input_store, fa2_reward_store, fa12_input_store, fa12_reward_store, database_store, fa12_input_originated, fa2_input_originated, fa12_reward_originated, fa2_reward_originated, database_originated, farm_originated, op, database_contract, op3, error_1;
@@ -133,9 +142,12 @@ function orig() {
                         'rate': rate,
                         'reward_at_week': reward_at_week,
                         'total_reward': rewards,
+                        'user_claimed_week': user_claimed_week,
+                        'metadata': metadata,
                         'user_points': user_points,
                         'user_stakes': user_stakes,
-                        'total_weeks': total_weeks
+                        'total_weeks': total_weeks,
+                        'week_duration': week_duration
                     };
                     fa2_input_store = {
                         'paused': fa2_input_paused,
@@ -171,7 +183,8 @@ function orig() {
                         'admin': admin,
                         'all_farms': database_all_farms,
                         'all_farms_data': database_all_farms_data,
-                        'inverse_farms': database_inverse_farms
+                        'inverse_farms': database_inverse_farms,
+                        'all_pools': database_all_pools
                     };
                     _a.label = 1;
                 case 1:
@@ -1,6 +1,7 @@
 import { InMemorySigner } from '@taquito/signer';
 import { TezosToolkit, MichelsonMap } from '@taquito/taquito';
 import farm from './artefact/farm.json';
+import farm_metadata from './artefact/farm_metadata.json';
 import fa12 from './artefact/fa12.json';
 import fa2 from './artefact/fa2.json';
 import database from './artefact/database.json';
@@ -27,9 +28,16 @@ const infoFarm = process.env.INFOFARM || '';
 const rate = process.env.RATE || 9500;
 let reward_at_week: [] = [];
 const rewards = process.env.REWARD_AMOUNT; //50000000;
+let user_claimed_week = new MichelsonMap();
+// TZIP-16 metadata with the off-chain views (src/contract/test/farm_metadata.py)
+let metadata = MichelsonMap.fromLiteral({
+    '': Buffer.from('tezos-storage:contents').toString('hex'),
+    'contents': Buffer.from(JSON.stringify(farm_metadata)).toString('hex'),
+});
 let user_points = new MichelsonMap();
 let user_stakes = new MichelsonMap();
 const total_weeks = process.env.WEEKS; //5;
+const week_duration = process.env.DURATION_OF_PERIOD || 604800;
 
 let farm_address = process.env.FARM_ADDRESS || undefined;
 
@@ -64,6 +72,9 @@ fa2_reward_ledger.set({0:reward_reserve_address, 1:reward_fa2_token_id}, rewards
 let database_all_farms = new Array();
 let database_all_farms_data = new MichelsonMap();
 let database_inverse_farms = new MichelsonMap();
+let database_all_pools = new MichelsonMap();
+let database_farms_by_index = new MichelsonMap();
+let database_farm_index = new MichelsonMap();
 
 async function orig() {
 
@@ -80,9 +91,12 @@ async function orig() {
         'rate': rate,
         'reward_at_week': reward_at_week,
         'total_reward': rewards,
+        'user_claimed_week': user_claimed_week,
+        'metadata': metadata,
         'user_points': user_points,
         'user_stakes': user_stakes,
         'total_weeks': total_weeks,
+        'week_duration': week_duration,
     }
 
     const fa2_input_store = {
@@ -123,7 +137,10 @@ async function orig() {
         'admin': admin,
         'all_farms': database_all_farms,
         'all_farms_data': database_all_farms_data,
-        'inverse_farms': database_inverse_farms
+        'inverse_farms': database_inverse_farms,
+        'all_pools': database_all_pools,
+        'farms_by_index': database_farms_by_index,
+        'farm_index': database_farm_index
     }
 
     try {
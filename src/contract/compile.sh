@@ -0,0 +1,31 @@
+#!/bin/sh
+# Compiles every contract the tests and the gas baseline run on into test/compiled,
+# and the artefacts the deploy scripts import into deploy/artefact.
+# Run it from src/contract after any change to a .mligo file, then run
+# `python3 gas_benchmark.py --update` in test and commit both with the change.
+# LIGO defaults to `ligo`; set it to run the CLI from a Docker image instead, e.g.
+# LIGO='docker run --rm -v "$PWD":"$PWD" -w "$PWD" <ligo image>' sh compile.sh
+set -e
+
+LIGO=${LIGO:-ligo}
+
+mkdir -p test/compiled/views
+
+eval "$LIGO compile contract farm/main.mligo" > test/compiled/farm.tz
+
+for view in current_week pending_reward user_stake; do
+    eval "$LIGO compile expression cameligo $view --init-file farm/views.mligo --michelson-format json" > test/compiled/views/$view.json
+done
+
+eval "$LIGO compile contract farm/accumulator.mligo" > test/compiled/farm_accumulator.tz
+
+eval "$LIGO compile contract farm/multi_pool.mligo" > test/compiled/farm_multi.tz
+
+eval "$LIGO compile contract database/main.mligo --views get_farm,get_farms_by_lp,list_farms" > test/compiled/database.tz
+
+# Deploy artefacts
+eval "$LIGO compile contract farm/main.mligo --michelson-format json" > ../../deploy/artefact/farm.json
+
+eval "$LIGO compile contract database/main.mligo --views get_farm,get_farms_by_lp,list_farms --michelson-format json" > ../../deploy/artefact/database.json
+
+python3 test/farm_metadata.py --output ../../deploy/artefact/farm_metadata.json
@@ -0,0 +1,67 @@
+"""Loads compiled contracts once per contract version.
+
+The Micheline expression and the dummy storage of a `.tz` file are stored in
+`.contract_cache/<sha256 of the file>.json`, so the Michelson text parser only
+runs the first time a given contract version is seen. Within a process the
+`ContractInterface` itself is memoized.
+"""
+from copy import deepcopy
+from hashlib import sha256
+from typing import Dict, Tuple
+import json
+import os
+
+from pytezos import ContractInterface
+from pytezos.michelson.parse import michelson_to_micheline
+
+cache_dir = os.environ.get("CONTRACT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".contract_cache"))
+
+_loaded: Dict[str, Tuple[ContractInterface, dict]] = {}
+
+
+def _read_cache(cache_path: str):
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(cache_path: str, entry: dict) -> None:
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write then rename so that concurrent workers never read a partial file
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, cache_path)
+
+
+def _load(path: str) -> Tuple[ContractInterface, dict]:
+    with open(os.path.expanduser(path), "rb") as f:
+        source = f.read()
+    digest = sha256(source).hexdigest()
+    if digest in _loaded:
+        return _loaded[digest]
+
+    cache_path = os.path.join(cache_dir, f"{digest}.json")
+    entry = _read_cache(cache_path)
+    if entry is not None:
+        contract = ContractInterface.from_micheline(entry["micheline"])
+    else:
+        micheline = michelson_to_micheline(source.decode())
+        contract = ContractInterface.from_micheline(micheline)
+        entry = {"micheline": micheline, "dummy_storage": contract.storage.dummy()}
+        _write_cache(cache_path, entry)
+
+    _loaded[digest] = (contract, entry["dummy_storage"])
+    return _loaded[digest]
+
+
+def load_contract(path: str) -> ContractInterface:
+    """Same as `ContractInterface.from_file(path)`, served from the cache."""
+    return _load(path)[0]
+
+
+def load_dummy_storage(path: str) -> dict:
+    """Same as `ContractInterface.from_file(path).storage.dummy()`, served from the cache."""
+    return deepcopy(_load(path)[1])
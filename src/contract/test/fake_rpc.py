@@ -0,0 +1,61 @@
+"""Fake Tezos node RPC serving recorded responses, for the tests of the RPC clients.
+
+The responses are given by path, e.g. from `LocalChain.rpc_responses()` or
+from a JSON file recorded on a node; any other path answers 404 like the
+node does for a missing big_map key. The server counts the requests of
+every path and the largest number of requests it served at once.
+
+    async with FakeRpc(chain.rpc_responses(), latency=0.01) as rpc:
+        async with FarmClient(rpc.url) as client:
+            ...
+"""
+from collections import Counter
+from typing import Any, Dict
+import asyncio
+import json
+
+from aiohttp import web
+
+
+class FakeRpc:
+    def __init__(self, responses: Dict[str, Any], latency: float = 0.0):
+        self.responses = responses
+        # Seconds before every response, so that concurrent requests overlap
+        self.latency = latency
+        self.requests: Counter = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.url = ""
+        self._runner = None
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "FakeRpc":
+        with open(path) as f:
+            return cls(json.load(f), **kwargs)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests[request.path] += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if request.path not in self.responses:
+                return web.json_response([{"kind": "temporary", "id": "failure", "msg": "not found"}], status=404)
+            return web.json_response(self.responses[request.path])
+        finally:
+            self.in_flight -= 1
+
+    async def __aenter__(self) -> "FakeRpc":
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self._runner.cleanup()
@@ -0,0 +1,174 @@
+"""Asynchronous reader of farm storages from a Tezos node.
+
+`FarmClient` fetches the storage of many farms and the `user_stakes` and
+`user_points` of many addresses in each of them at once, over one pooled
+aiohttp session:
+
+- at most `concurrency` requests are in flight, whatever the number of reads;
+- the same RPC path is only requested once: concurrent and later reads of
+  the same value share the same request;
+- every read is made on the block the client is pinned to (the head when it
+  opens, `refresh()` moves it), so the values of a snapshot are consistent.
+
+Responses are decoded with the storage types of `compiled/farm.tz`, big_maps
+being read key by key from `/context/big_maps/<id>/<key hash>`.
+
+    async with FarmClient("http://127.0.0.1:8732") as client:
+        snapshots = await client.snapshots([farm_1, farm_2], [alice, bob])
+
+    python3 farm_client.py http://127.0.0.1:8732 --farm KT1... --user tz1... [--concurrency 16]
+"""
+from typing import Any, Awaitable, Dict, List, NamedTuple, Optional, Sequence
+import argparse
+import asyncio
+import json
+
+import aiohttp
+from pytezos.michelson.forge import forge_script_expr
+from pytezos.michelson.sections import StorageSection
+
+from contract_cache import load_contract
+from gas_benchmark import farm_contract_path
+
+default_concurrency = 16
+
+
+class FarmClientError(Exception):
+    pass
+
+
+class FarmSnapshot(NamedTuple):
+    # Python storage, big_maps given by id
+    storage: dict
+    # Addresses without an entry are left out
+    user_stakes: Dict[str, int]
+    user_points: Dict[str, List[int]]
+
+
+class FarmClient:
+    def __init__(self, rpc_url: str, contract_path: str = farm_contract_path, concurrency: int = default_concurrency,
+                 block: str = "head"):
+        self.rpc_url = rpc_url.rstrip("/")
+        self.concurrency = concurrency
+        self.block = block
+        self.storage_type = StorageSection.match(load_contract(contract_path).context.storage_expr)
+        self.big_map_types = {name: ty.args for name, ty in self.storage_type.args[0].get_flat_args(infer_names=True).items()
+                              if name in ("user_stakes", "user_points")}
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.requests = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._block_hash: Optional[str] = None
+        # RPC path -> task of its response, shared by every read of the path
+        self._responses: Dict[str, asyncio.Task] = {}
+
+    async def __aenter__(self) -> "FarmClient":
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        self.session = aiohttp.ClientSession(connector=connector, raise_for_status=False)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        await self.refresh()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.session.close()
+
+    async def refresh(self) -> str:
+        """Pins the client to the current `block` and forgets the responses of the previous one."""
+        self._responses.clear()
+        header = await self._fetch(f"/chains/main/blocks/{self.block}/header")
+        self._block_hash = header["hash"]
+        return self._block_hash
+
+    # -----------------
+    # --  REQUESTS  --
+    # -----------------
+    async def _fetch(self, path: str) -> Any:
+        async with self._semaphore:
+            self.requests += 1
+            async with self.session.get(self.rpc_url + path) as response:
+                if response.status == 404:
+                    return None
+                if response.status != 200:
+                    raise FarmClientError(f"GET {path}: HTTP {response.status} {await response.text()}")
+                return await response.json()
+
+    def _get(self, path: str) -> Awaitable[Any]:
+        """Response of `path` on the pinned block, requested once."""
+        path = f"/chains/main/blocks/{self._block_hash}{path}"
+        task = self._responses.get(path)
+        if task is None:
+            task = self._responses[path] = asyncio.ensure_future(self._fetch(path))
+            task.add_done_callback(lambda done: self._forget_failed(path, done))
+        return task
+
+    def _forget_failed(self, path: str, task: asyncio.Task) -> None:
+        # A failed request is made again by the next read
+        if task.cancelled() or task.exception() is not None:
+            if self._responses.get(path) is task:
+                del self._responses[path]
+
+    # -----------------
+    # --  READS  --
+    # -----------------
+    async def storage(self, farm: str) -> dict:
+        """Python storage of `farm`, its big_maps given by id."""
+        micheline = await self._get(f"/context/contracts/{farm}/storage")
+        if micheline is None:
+            raise FarmClientError(f"{farm} is not a contract")
+        return self.storage_type.from_micheline_value(micheline).to_python_object()
+
+    async def _big_map_values(self, farm: str, field: str, users: Sequence[str]) -> Dict[str, Any]:
+        big_map_id = (await self.storage(farm))[field]
+        key_type, value_type = self.big_map_types[field]
+        key_hashes = [forge_script_expr(key_type.from_python_object(user).pack(legacy=True)) for user in users]
+        values = await asyncio.gather(*(self._get(f"/context/big_maps/{big_map_id}/{key_hash}") for key_hash in key_hashes))
+        return {user: value_type.from_micheline_value(value).to_python_object()
+                for user, value in zip(users, values) if value is not None}
+
+    async def user_stakes(self, farm: str, users: Sequence[str]) -> Dict[str, int]:
+        return await self._big_map_values(farm, "user_stakes", users)
+
+    async def user_points(self, farm: str, users: Sequence[str]) -> Dict[str, List[int]]:
+        return await self._big_map_values(farm, "user_points", users)
+
+    async def snapshot(self, farm: str, users: Sequence[str]) -> FarmSnapshot:
+        storage, user_stakes, user_points = await asyncio.gather(
+            self.storage(farm), self.user_stakes(farm, users), self.user_points(farm, users))
+        return FarmSnapshot(storage, user_stakes, user_points)
+
+    async def snapshots(self, farms: Sequence[str], users: Sequence[str]) -> Dict[str, FarmSnapshot]:
+        """Storage, stakes and points of `users` in every farm, read concurrently."""
+        snapshots = await asyncio.gather(*(self.snapshot(farm, users) for farm in farms))
+        return dict(zip(farms, snapshots))
+
+
+def fetch_snapshots(rpc_url: str, farms: Sequence[str], users: Sequence[str], **kwargs) -> Dict[str, FarmSnapshot]:
+    """Blocking `FarmClient.snapshots`, for callers without an event loop."""
+    async def fetch():
+        async with FarmClient(rpc_url, **kwargs) as client:
+            return await client.snapshots(farms, users)
+    return asyncio.run(fetch())
+
+
+# -----------------
+# --  RUNNER  --
+# -----------------
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Read the storage, stakes and points of farms from a Tezos node")
+    parser.add_argument("rpc", help="URL of the node RPC")
+    parser.add_argument("--farm", action="append", required=True, help="farm address (repeatable)")
+    parser.add_argument("--user", action="append", default=[], help="staker address (repeatable)")
+    parser.add_argument("--concurrency", type=int, default=default_concurrency, help="requests in flight (default: %(default)s)")
+    args = parser.parse_args()
+
+    try:
+        snapshots = fetch_snapshots(args.rpc, args.farm, args.user, concurrency=args.concurrency)
+    except (FarmClientError, aiohttp.ClientError) as e:
+        print(f"Error: {e}")
+        return 1
+    print(json.dumps({farm: snapshot._asdict() for farm, snapshot in snapshots.items()}, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,531 @@
+"""Deployment of a season of farms from a manifest, in as few operation groups as possible.
+
+The manifest lists the farms with the variables of the deploy `.env` files,
+inline or by path (relative to the manifest), over shared defaults:
+
+    {
+        "defaults": {"FARMSDB_ADDRESS": "KT1...", "RATE": 9990, "NUMBER_OF_PERIODS": 4, "DURATION_OF_PERIOD": 604800},
+        "farms": [{"env": "../../../deploy/.env.prod2.xtzsmak_doga"}, {"INFOFARM": "...", ...}]
+    }
+
+The protocol includes one operation group per signer and per block, and the
+address of an originated contract derives from the hash of its group, so a
+deployment takes two rounds:
+
+1. the deployer registers the farm code as a global constant (once per code
+   version) and originates every farm with a script that only references
+   it, which leaves the storage as the size of an origination;
+2. once the farms are included, the deployer registers them in the database
+   with `add_farm`, the farm admins `initialize` them and the reward
+   reserves approve them (FA1.2 `approve`, FA2 `update_operators`), every
+   signer sending all its calls at once.
+
+The operations of a signer are packed in groups up to the protocol limits
+(forged size of a group, gas of a block), forged and signed locally with the
+keys given to the deployer, the first group of a signer whose key was never
+revealed starting with its `reveal`. The groups of the other signers are
+returned unsigned. Gas and storage limits come from a simulation: `TezosNode` runs
+the operations on a node, `LocalNode` on a `LocalChain` stand-in with the
+`gas_meter` estimates, and checks the branch, counters, limits, size and
+signature of every group injected into it.
+
+    python3 farm_deployer.py manifest.json --rpc https://rpc.tzbeta.net/ --key edsk... [--unsigned unsigned.json]
+"""
+from itertools import zip_longest
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import argparse
+import json
+import os
+import time
+
+from pytezos import ContractInterface, Key
+from pytezos.contract.call import ContractCall
+from pytezos.crypto.encoding import base58_decode, base58_encode
+from pytezos.crypto.key import blake2b_32
+from pytezos.michelson.forge import forge_micheline
+from pytezos.operation.fees import calculate_fee
+from pytezos.operation.forge import forge_operation, forge_operation_group
+from pytezos.rpc import RpcError, RpcNode, ShellQuery
+
+from contract_cache import load_contract, load_dummy_storage
+from farm_metadata import metadata_big_map
+from gas_benchmark import database_contract_path, farm_contract_path
+from gas_meter import (big_map_entry_overhead, decoding_cost_per_byte, encoding_cost_per_byte, manager_operation_cost,
+                       meter_call, origination_size, paid_size, storage_access_cost, storage_cost_per_byte, storage_layout)
+from local_chain import LocalChain, block_hash, constant_hash, expand_constants, originated_address
+
+artefact_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "deploy", "artefact")
+
+# Protocol constants
+max_operation_data_length = 32 * 1024
+hard_gas_limit_per_operation = 1_040_000
+hard_gas_limit_per_block = 5_200_000
+hard_storage_limit_per_operation = 60_000
+branch_size = 32
+# Blocks after its branch during which an operation can be included
+max_operations_ttl = 120
+signature_size = 64
+# Watermark of the signed manager operations
+generic_operation_watermark = b"\x03"
+
+
+class DeployError(Exception):
+    pass
+
+
+class FarmSpec(NamedTuple):
+    info: str
+    admin: str
+    input_token_address: str
+    input_fa2_token_id: Optional[int]
+    reward_token_address: str
+    reward_fa2_token_id: Optional[int]
+    reward_reserve_address: str
+    total_reward: int
+    rate: int
+    total_weeks: int
+    # Length of a week (reward period) in seconds
+    week_duration: int
+    database_address: str
+    # TZIP-16 URI of the metadata, stored instead of the metadata itself when given
+    metadata_uri: Optional[str]
+
+    @classmethod
+    def from_env(cls, env: Dict[str, Any]) -> "FarmSpec":
+        def value(name: str) -> str:
+            if str(env.get(name, "")) == "":
+                raise DeployError(f"{env.get('INFOFARM', 'farm')}: {name} is missing")
+            return str(env[name])
+
+        def optional_nat(name: str) -> Optional[int]:
+            return None if str(env.get(name, "")) == "" else int(env[name])
+
+        return cls(
+            info=value("INFOFARM"),
+            admin=value("ADMIN_ADDRESS"),
+            input_token_address=value("INPUT_CONTRACT_ADDRESS"),
+            input_fa2_token_id=optional_nat("INPUT_TOKEN_ID"),
+            reward_token_address=value("REWARD_CONTRACT_ADDRESS"),
+            reward_fa2_token_id=optional_nat("REWARD_TOKEN_ID"),
+            reward_reserve_address=value("REWARD_RESERVE_ADDRESS"),
+            total_reward=int(value("REWARD_AMOUNT")),
+            rate=int(value("RATE")),
+            total_weeks=int(value("NUMBER_OF_PERIODS")),
+            week_duration=int(value("DURATION_OF_PERIOD")),
+            database_address=value("FARMSDB_ADDRESS"),
+            metadata_uri=env.get("METADATA_URI") or None,
+        )
+
+
+def read_env(path: str) -> Dict[str, str]:
+    """Variables of a dotenv file."""
+    env = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            name, value = line.split("=", 1)
+            env[name.strip()] = value.strip().strip("\"'")
+    return env
+
+
+def load_manifest(path: str) -> List[FarmSpec]:
+    with open(path) as f:
+        manifest = json.load(f)
+    specs = []
+    for farm in manifest["farms"]:
+        env = dict(manifest.get("defaults", {}))
+        if "env" in farm:
+            env.update(read_env(os.path.join(os.path.dirname(os.path.abspath(path)), farm["env"])))
+        env.update({name: value for name, value in farm.items() if name != "env"})
+        specs.append(FarmSpec.from_env(env))
+    return specs
+
+
+class Group(NamedTuple):
+    branch: str
+    contents: List[dict]
+    # Base58 signature, None until the source signs the group
+    signature: Optional[str] = None
+
+    @property
+    def source(self) -> str:
+        return self.contents[0]["source"]
+
+    def forge(self) -> bytes:
+        return forge_operation_group({"branch": self.branch, "contents": self.contents})
+
+    def sign(self, key: Key) -> "Group":
+        return self._replace(signature=key.sign(generic_operation_watermark + self.forge()))
+
+    def payload(self) -> bytes:
+        return self.forge() + base58_decode(self.signature.encode())
+
+    def hash(self) -> str:
+        return base58_encode(blake2b_32(self.payload()).digest(), b"o").decode()
+
+    def originations(self) -> int:
+        return sum(content["kind"] == "origination" for content in self.contents)
+
+
+def load_artefact(name: str) -> ContractInterface:
+    with open(os.path.join(artefact_path, name)) as f:
+        return ContractInterface.from_micheline(json.load(f))
+
+
+def fill(content: dict, source: str, counter: int, gas_limit: int, storage_limit: int, fee: int = 0) -> dict:
+    return dict(content, source=source, counter=str(counter), fee=str(fee), gas_limit=str(gas_limit),
+                storage_limit=str(storage_limit))
+
+
+def with_margin(value: int) -> int:
+    return value + value // 10 + 100
+
+
+# -----------------
+# --  NODES  --
+# -----------------
+
+class TezosNode:
+    """Tezos node reached through its RPC."""
+
+    def __init__(self, rpc_url: str):
+        self.rpc = RpcNode(rpc_url)
+        self.shell = ShellQuery(self.rpc)
+
+    def branch(self) -> str:
+        return self.rpc.get("/chains/main/blocks/head/hash")
+
+    def counter(self, source: str) -> int:
+        return int(self.rpc.get(f"/chains/main/blocks/head/context/contracts/{source}/counter"))
+
+    def is_revealed(self, source: str) -> bool:
+        return self.rpc.get(f"/chains/main/blocks/head/context/contracts/{source}/manager_key") is not None
+
+    def has_constant(self, expr_hash: str) -> bool:
+        try:
+            self.rpc.get(f"/chains/main/blocks/head/context/constants/{expr_hash}")
+        except RpcError:
+            return False
+        return True
+
+    def simulate(self, contents: List[dict]) -> List[Tuple[int, int]]:
+        """Consumed gas and paid storage of every content, applied in sequence."""
+        operation = {"branch": self.branch(), "contents": contents,
+                     "signature": base58_encode(bytes(signature_size), b"sig").decode()}
+        res = self.rpc.post("/chains/main/blocks/head/helpers/scripts/run_operation",
+                            json={"operation": operation, "chain_id": self.rpc.get("/chains/main/chain_id")})
+        consumed = []
+        for content in res["contents"]:
+            result = content["metadata"]["operation_result"]
+            if result["status"] != "applied":
+                raise DeployError(f"{content['kind']} fails: {result.get('errors')}")
+            storage = int(result.get("paid_storage_size_diff", result.get("storage_size", 0)))
+            storage += origination_size * len(result.get("originated_contracts", []))
+            consumed.append(((int(result["consumed_milligas"]) + 999) // 1000, storage))
+        return consumed
+
+    def inject(self, group: Group) -> str:
+        return self.rpc.post("/injection/operation", json=group.payload().hex())
+
+    def wait(self, hashes: List[str]) -> None:
+        self.shell.wait_operations(hashes, ttl=max_operations_ttl, min_confirmations=1)
+
+
+class LocalNode:
+    """Stand-in of a node over a `LocalChain`, with the checks the protocol makes on a manager operation group."""
+
+    def __init__(self, chain: LocalChain):
+        self.chain = chain
+        self.public_keys: Dict[str, str] = {}
+        self.counters: Dict[str, int] = {}
+        self.groups: List[Group] = []
+        # Sources of the groups of the current block
+        self._sources = set()
+
+    def reveal(self, key: Key) -> None:
+        self.public_keys[key.public_key_hash()] = key.public_key()
+
+    def is_revealed(self, source: str) -> bool:
+        return source in self.public_keys
+
+    def branch(self) -> str:
+        return block_hash(self.chain.level - 1)
+
+    def counter(self, source: str) -> int:
+        return self.counters.get(source, 0)
+
+    def has_constant(self, expr_hash: str) -> bool:
+        return expr_hash in self.chain.constants
+
+    def simulate(self, contents: List[dict]) -> List[Tuple[int, int]]:
+        consumed = []
+        constants = dict(self.chain.constants)
+        storages = dict(self.chain.storages)
+        for content in contents:
+            if content["kind"] == "reveal":
+                consumed.append(((manager_operation_cost + 999) // 1000, 0))
+            elif content["kind"] == "register_global_constant":
+                size = len(forge_micheline(content["value"]))
+                constants[constant_hash(content["value"])] = content["value"]
+                milligas = manager_operation_cost + storage_access_cost + (decoding_cost_per_byte + storage_cost_per_byte) * size
+                consumed.append(((milligas + 999) // 1000, size + big_map_entry_overhead))
+            elif content["kind"] == "origination":
+                code = expand_constants(content["script"]["code"], constants)
+                contract = ContractInterface.from_micheline(code)
+                value_size, entries = storage_layout(contract.context.storage_expr, contract.storage.decode(content["script"]["storage"]))
+                # The stored script keeps the references to the constants
+                code_size = len(forge_micheline(content["script"]["code"]))
+                milligas = manager_operation_cost + decoding_cost_per_byte * (len(forge_micheline(code)) + value_size)
+                milligas += encoding_cost_per_byte * value_size
+                milligas += sum(storage_access_cost + storage_cost_per_byte * len(value) for value in entries.values())
+                consumed.append(((milligas + 999) // 1000, origination_size + code_size + paid_size(value_size, entries)))
+            elif content["kind"] == "transaction":
+                address = content["destination"]
+                call = ContractCall(self.chain.contracts[address].context, content["parameters"])
+                res, metering = meter_call(call, storages[address], sender=content["source"], source=content["source"],
+                                           amount=int(content["amount"]), now=self.chain.timestamp,
+                                           level=self.chain.level, self_address=address)
+                storages[address] = res.storage
+                consumed.append((metering.gas, max(metering.storage_delta, 0)))
+            else:
+                raise DeployError(f"{content['kind']} is not supported")
+        return consumed
+
+    def inject(self, group: Group) -> str:
+        source = group.source
+        public_key = self.public_keys.get(source)
+        for index, content in enumerate(group.contents):
+            if content["kind"] != "reveal":
+                continue
+            # Only the first operation of a fresh signer reveals its key
+            if public_key is not None:
+                raise DeployError(f"{source} is already revealed")
+            if index > 0:
+                raise DeployError(f"reveal of {source} after its other operations")
+            public_key = content["public_key"]
+            if Key.from_encoded_key(public_key).public_key_hash() != source:
+                raise DeployError(f"revealed key of {source} does not match it")
+        if public_key is None:
+            raise DeployError(f"{source} is not revealed")
+        if source in self._sources:
+            raise DeployError(f"{source} already has an operation group in the block")
+        if group.branch not in {block_hash(level) for level in range(self.chain.level - max_operations_ttl, self.chain.level)}:
+            raise DeployError(f"unknown branch {group.branch}")
+        if len(group.payload()) > max_operation_data_length:
+            raise DeployError(f"operation group of {len(group.payload())} bytes")
+        try:
+            Key.from_encoded_key(public_key).verify(group.signature, generic_operation_watermark + group.forge())
+        except ValueError as e:
+            raise DeployError(f"signature of {source}: {e}")
+        counter = self.counter(source)
+        for content in group.contents:
+            counter += 1
+            if content["source"] != source or int(content["counter"]) != counter:
+                raise DeployError(f"counter {content['counter']} of {content['source']}, expected {counter}")
+            if int(content["gas_limit"]) > hard_gas_limit_per_operation or int(content["storage_limit"]) > hard_storage_limit_per_operation:
+                raise DeployError(f"limits of {content['kind']} above the hard limits")
+        if sum(int(content["gas_limit"]) for content in group.contents) > hard_gas_limit_per_block:
+            raise DeployError("gas limit of the group above the gas of a block")
+        for content, (gas, storage) in zip(group.contents, self.simulate(group.contents)):
+            if gas > int(content["gas_limit"]) or storage > int(content["storage_limit"]):
+                raise DeployError(f"{content['kind']} exceeds its limits")
+        operation_hash = group.hash()
+        self.chain.apply(group.contents, operation_hash)
+        self.public_keys[source] = public_key
+        self.counters[source] = counter
+        self._sources.add(source)
+        self.groups.append(group)
+        return operation_hash
+
+    def wait(self, hashes: List[str]) -> None:
+        self.chain.bake()
+        self._sources.clear()
+
+
+# -----------------
+# --  DEPLOYER  --
+# -----------------
+
+class Deployment(NamedTuple):
+    farms: List[str]
+    # Hashes of the injected groups, by block
+    blocks: List[List[str]]
+    # Groups of the signers whose key was not given
+    unsigned: List[Group]
+
+
+class FarmDeployer:
+    def __init__(self, node, keys: Sequence[Key], metadata: Optional[dict] = None,
+                 farm_path: str = farm_contract_path, database_path: str = database_contract_path):
+        # The first key originates the farms and registers them in the database
+        self.node = node
+        self.keys = {key.public_key_hash(): key for key in keys}
+        self.deployer = keys[0].public_key_hash()
+        self.metadata = metadata
+        self.farm_path = farm_path
+        self.farm = load_contract(farm_path)
+        self.database = load_contract(database_path)
+        # Token interfaces of the deploy artefacts, to encode the FA1.2 and FA2 approvals
+        self.fa12 = load_artefact("fa12.json")
+        self.fa2 = load_artefact("fa2.json")
+
+    def farm_storage(self, spec: FarmSpec) -> dict:
+        """Storage of a farm to initialize, with the fields `farm_path` declares."""
+        storage = load_dummy_storage(self.farm_path)
+        if spec.metadata_uri is not None:
+            metadata = {"": spec.metadata_uri.encode()}
+        else:
+            metadata = metadata_big_map(self.metadata) if self.metadata is not None else {}
+        fields = {
+            "admin": spec.admin,
+            "creation_time": int(time.time()),
+            "input_token_address": spec.input_token_address,
+            "input_fa2_token_id_opt": spec.input_fa2_token_id,
+            "reward_token_address": spec.reward_token_address,
+            "reward_fa2_token_id_opt": spec.reward_fa2_token_id,
+            "reward_reserve_address": spec.reward_reserve_address,
+            "rate": spec.rate,
+            "total_reward": spec.total_reward,
+            "total_weeks": spec.total_weeks,
+            "week_duration": spec.week_duration,
+            "initialized": False,
+            "metadata": metadata,
+        }
+        storage.update({name: value for name, value in fields.items() if name in storage})
+        return storage
+
+    def code(self) -> Tuple[list, list]:
+        """Script of the farm referencing its code as a global constant, and the code to register."""
+        sections = self.farm.to_micheline()
+        code = next(section for section in sections if section["prim"] == "code")["args"][0]
+        constant = {"prim": "constant", "args": [{"string": constant_hash(code)}]}
+        script = [dict(section, args=[constant]) if section["prim"] == "code" else section for section in sections]
+        return script, code
+
+    def originations(self, specs: Sequence[FarmSpec]) -> List[dict]:
+        """RPC contents of the originations, without source, counter, fee and limits."""
+        script, code = self.code()
+        operations = []
+        if not self.node.has_constant(constant_hash(code)):
+            operations.append({"kind": "register_global_constant", "value": code})
+        for spec in specs:
+            storage = self.farm.storage.encode(self.farm_storage(spec))
+            operations.append({"kind": "origination", "balance": "0", "script": {"code": script, "storage": storage}})
+        return operations
+
+    def calls(self, specs: Sequence[FarmSpec], farms: Sequence[str]) -> Dict[str, List[dict]]:
+        """RPC contents of the calls that register, initialize and approve the originated `farms`, by source."""
+        calls: Dict[str, List[dict]] = {}
+
+        def call(source: str, destination: str, parameters: dict):
+            content = {"kind": "transaction", "amount": "0", "destination": destination, "parameters": parameters}
+            calls.setdefault(source, []).append(content)
+
+        for spec, farm in zip(specs, farms):
+            add_farm = {"farm_address": farm, "lp_address": spec.input_token_address, "farm_lp_info": spec.info}
+            call(self.deployer, spec.database_address, self.database.add_farm(add_farm).parameters)
+            call(spec.admin, farm, self.farm.initialize().parameters)
+            if spec.reward_fa2_token_id is None:
+                approval = self.fa12.approve({"spender": farm, "value": spec.total_reward})
+            else:
+                approval = self.fa2.update_operators([{"add_operator": {
+                    "owner": spec.reward_reserve_address, "operator": farm, "token_id": spec.reward_fa2_token_id}}])
+            call(spec.reward_reserve_address, spec.reward_token_address, approval.parameters)
+        return calls
+
+    def pack(self, source: str, operations: Sequence[dict]) -> List[Group]:
+        """Groups of consecutive counters holding the `operations` of `source`, each within the protocol limits.
+
+        The operations of a source whose key is given and was never revealed
+        start with its `reveal`.
+        """
+        if source in self.keys and not self.node.is_revealed(source):
+            operations = [{"kind": "reveal", "public_key": self.keys[source].public_key()}] + list(operations)
+        counter = self.node.counter(source)
+        # The simulated contents share the gas of a block
+        gas_share = min(hard_gas_limit_per_operation, hard_gas_limit_per_block // len(operations))
+        simulated = [fill(content, source, counter + i + 1, gas_share, hard_storage_limit_per_operation)
+                     for i, content in enumerate(operations)]
+        groups: List[List[dict]] = [[]]
+        size = gas = 0
+        for content, (consumed_gas, paid_storage) in zip(simulated, self.node.simulate(simulated)):
+            gas_limit = min(with_margin(consumed_gas), hard_gas_limit_per_operation)
+            storage_limit = min(with_margin(paid_storage), hard_storage_limit_per_operation)
+            content = fill(content, source, int(content["counter"]), gas_limit, storage_limit)
+            # The fee counts in the size that it pays for
+            content["fee"] = str(calculate_fee(content, gas_limit, 0))
+            content["fee"] = str(calculate_fee(content, gas_limit, 0))
+            content_size = len(forge_operation(content))
+            if branch_size + content_size + signature_size > max_operation_data_length:
+                raise DeployError(f"{content['kind']} of {content_size} bytes does not fit in an operation group")
+            if groups[-1] and (size + content_size > max_operation_data_length or gas + gas_limit > hard_gas_limit_per_block):
+                groups.append([])
+            if not groups[-1]:
+                size, gas = branch_size + signature_size, 0
+            groups[-1].append(content)
+            size += content_size
+            gas += gas_limit
+        branch = self.node.branch()
+        return [Group(branch, contents) for contents in groups]
+
+    def _inject(self, groups: Sequence[Group]) -> List[str]:
+        """Injects groups of distinct sources in the same block."""
+        hashes = [self.node.inject(group.sign(self.keys[group.source])) for group in groups]
+        self.node.wait(hashes)
+        return hashes
+
+    def deploy(self, specs: Sequence[FarmSpec]) -> Deployment:
+        blocks, farms = [], []
+        for group in self.pack(self.deployer, self.originations(specs)):
+            blocks.append(self._inject([group]))
+            farms += [originated_address(blocks[-1][0], i) for i in range(group.originations())]
+
+        groups = {source: self.pack(source, operations) for source, operations in self.calls(specs, farms).items()}
+        unsigned = [group for source, source_groups in groups.items() if source not in self.keys for group in source_groups]
+        signed = [source_groups for source, source_groups in groups.items() if source in self.keys]
+        for block_groups in zip_longest(*signed):
+            blocks.append(self._inject([group for group in block_groups if group is not None]))
+        return Deployment(farms, blocks, unsigned)
+
+
+# -----------------
+# --  RUNNER  --
+# -----------------
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Deploy the farms of a manifest in a few operation groups")
+    parser.add_argument("manifest", help="JSON manifest of the farms")
+    parser.add_argument("--rpc", required=True, help="URL of the node RPC")
+    parser.add_argument("--key", action="append", required=True,
+                        help="secret key of a signer (repeatable), the first one originates the farms")
+    parser.add_argument("--metadata", default=os.path.join(artefact_path, "farm_metadata.json"),
+                        help="TZIP-16 metadata of the farms (default: %(default)s)")
+    parser.add_argument("--unsigned", default="unsigned_groups.json",
+                        help="where the groups of the other signers are written (default: %(default)s)")
+    args = parser.parse_args()
+
+    try:
+        specs = load_manifest(args.manifest)
+        with open(args.metadata) as f:
+            metadata = json.load(f)
+        deployer = FarmDeployer(TezosNode(args.rpc), [Key.from_encoded_key(key) for key in args.key], metadata)
+        deployment = deployer.deploy(specs)
+    except (DeployError, RpcError, OSError) as e:
+        print(f"Error: {e}")
+        return 1
+    for spec, farm in zip(specs, deployment.farms):
+        print(f"{farm} {spec.info}")
+    print(f"{sum(map(len, deployment.blocks))} operation groups in {len(deployment.blocks)} blocks")
+    if deployment.unsigned:
+        with open(args.unsigned, "w") as f:
+            json.dump([{"branch": group.branch, "contents": group.contents, "forged": group.forge().hex()}
+                       for group in deployment.unsigned], f, indent=2)
+        sources = sorted({group.source for group in deployment.unsigned})
+        print(f"{len(deployment.unsigned)} groups to sign by {', '.join(sources)} written to {args.unsigned}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
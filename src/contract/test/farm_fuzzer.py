@@ -0,0 +1,264 @@
+"""Property-based fuzzer of the farm entrypoints.
+
+Every campaign generates a long random sequence of `stake`, `unstake`,
+`claim_all` and `increase_reward` calls over many senders and timestamps and
+runs it on the reference model (`FarmModel`). After every step it asserts the
+invariants of the contract:
+
+- the `user_points` of all the stakers, claimed weeks and settled stakers
+  included, sum up to `farm_points`, week by week;
+- the claimed rewards never exceed `total_reward`;
+- no stake nor points is negative.
+
+A random sample of the steps is also interpreted with `compiled/farm.tz`, from
+the storage of the model, and the new storage, the paid reward or the error
+message must match. A failing campaign is shrunk to a minimal sequence: chunks
+of steps are removed, then the amounts are lowered, while the same kind of
+failure remains.
+
+    python3 farm_fuzzer.py [--steps 1000000] [--length 10000] [--check-rate 0.0001] [-j WORKERS] [--seed 0]
+
+The step budget is split into campaigns of `--length` steps run on `-j`
+processes; the reference model runs about 5 000 steps per second per process.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, NamedTuple, Optional, Sequence
+import argparse
+import random
+import time
+
+import numpy as np
+from pytezos import MichelsonRuntimeError
+
+from contract_cache import load_contract
+from farm_model import FarmModel, FarmModelError, compute_new_rewards
+from gas_benchmark import farm_contract_path, farm_storage, admin, sec_week
+from gas_scaling import staker_address
+
+default_steps = 1_000_000
+default_length = 10_000
+default_check_rate = 0.0001
+# Storage fields compared with the interpreted contract
+checked_fields = ["total_reward", "reward_at_week", "farm_points", "user_points", "user_stakes", "user_claimed_week"]
+
+
+class Step(NamedTuple):
+    entrypoint: str
+    sender: str
+    amount: Optional[int]
+    now: int
+
+
+class Failure(NamedTuple):
+    # "invariant", "contract" (the interpreted contract disagrees) or "crash" (unexpected model exception)
+    kind: str
+    message: str
+    # Steps up to the failing one, which is the last
+    steps: List[Step]
+
+
+def farm_storage_of(total_weeks: int) -> dict:
+    storage = dict(farm_storage)
+    storage.update(total_weeks=total_weeks, reward_at_week=compute_new_rewards(farm_storage["total_reward"], total_weeks, farm_storage["rate"]))
+    return storage
+
+
+class FarmFuzzer:
+    def __init__(self, total_weeks: int = 52, stakers: int = 20, model_factory: Callable[[dict], FarmModel] = FarmModel.from_storage):
+        self.storage = farm_storage_of(total_weeks)
+        self.total_weeks = total_weeks
+        self.senders = [admin] + [staker_address(i) for i in range(stakers - 1)]
+        self.model_factory = model_factory
+
+    # -----------------
+    # --  STEPS  --
+    # -----------------
+    def _generate(self, rnd: random.Random, model: FarmModel, length: int, now: int) -> Step:
+        # The campaign reaches the end of the farm, and one week more, in about `length` steps
+        mean_gap = (self.total_weeks + 1) * sec_week / length
+        now += 0 if rnd.random() < 0.1 else int(rnd.expovariate(1 / mean_gap))
+        sender = rnd.choice(self.senders)
+        draw = rnd.random()
+        if draw < 0.35:
+            return Step("stake", sender, int(10 ** rnd.uniform(0, 6)), now)
+        if draw < 0.6:
+            staked = model.user_stake(sender) or 0
+            amount = rnd.randint(1, staked) if staked and rnd.random() < 0.8 else int(10 ** rnd.uniform(0, 6))
+            return Step("unstake", sender, amount, now)
+        if draw < 0.9:
+            return Step("claim_all", sender, None, now)
+        return Step("increase_reward", admin if rnd.random() < 0.9 else sender, rnd.randint(0, 10_000_000), now)
+
+    def _apply(self, model: FarmModel, step: Step) -> int:
+        """Applies `step` to the model, returns the paid reward."""
+        if step.entrypoint == "claim_all":
+            return int(model.claim_all(step.sender, step.now)[0])
+        if step.entrypoint == "increase_reward":
+            model.increase_reward(step.sender, step.amount, step.now)
+        else:
+            getattr(model, step.entrypoint)(step.sender, step.amount, step.now)
+        return 0
+
+    # -----------------
+    # --  CHECKS  --
+    # -----------------
+    @staticmethod
+    def _invariant(model: FarmModel, claimed: int) -> Optional[str]:
+        points, stakes = model.points, model.stakes
+        if np.any(points < 0) or np.any(stakes < 0):
+            return "negative user_points or user_stakes"
+        farm_points = model.farm_points if len(model.farm_points) else np.zeros(model.total_weeks, dtype=object)
+        # The settled users removed by claim_all keep their share of farm_points
+        total_points = points.sum(axis=0) + model.settled_points
+        if len(points) and list(total_points) != list(farm_points):
+            return f"sum of user_points {list(total_points)} != farm_points {list(farm_points)}"
+        if claimed > model.total_reward:
+            return f"claimed {claimed} > total_reward {model.total_reward}"
+        return None
+
+    def _cross_check(self, storage: dict, step: Step, model: FarmModel, paid: Optional[int], error: Optional[str]) -> Optional[str]:
+        farm = load_contract(farm_contract_path)
+        call = getattr(farm, step.entrypoint)() if step.amount is None else getattr(farm, step.entrypoint)(step.amount)
+        try:
+            res = call.interpret(storage=storage, sender=step.sender, now=step.now)
+        except MichelsonRuntimeError as e:
+            if error is None or f"'{error}'" not in e.format_stdout():
+                return f"contract failed with {e.format_stdout()!r}, model with {error!r}"
+            return None
+        if error is not None:
+            return f"contract succeeded, model failed with {error!r}"
+        expected = model.to_storage(storage)
+        for field in checked_fields:
+            if res.storage[field] != expected[field]:
+                return f"{field}: contract {res.storage[field]} != model {expected[field]}"
+        contract_paid = int(res.operations[0]["parameters"]["value"]["args"][2]["int"]) if res.operations else 0
+        if step.entrypoint == "claim_all" and contract_paid != paid:
+            return f"contract paid {contract_paid}, model {paid}"
+        return None
+
+    def run(self, steps: Callable[[FarmModel], Iterator[Step]], check: Callable[[int], bool]) -> Optional[Failure]:
+        """Runs `steps(model)`; `check(i)` tells whether step i is cross-checked with the contract."""
+        model = self.model_factory(self.storage)
+        claimed = 0
+        done: List[Step] = []
+        for index, step in enumerate(steps(model)):
+            done.append(step)
+            storage = model.to_storage(self.storage) if check(index) else None
+            paid, error = None, None
+            try:
+                paid = self._apply(model, step)
+                claimed += paid
+            except FarmModelError as e:
+                error = str(e)
+            except Exception as e:
+                return Failure("crash", f"{type(e).__name__}: {e}", done)
+            message = self._invariant(model, claimed)
+            if message is not None:
+                return Failure("invariant", message, done)
+            if storage is not None:
+                message = self._cross_check(storage, step, model, paid, error)
+                if message is not None:
+                    return Failure("contract", message, done)
+        return None
+
+    def fuzz(self, length: int, seed: int, check_rate: float = default_check_rate) -> Optional[Failure]:
+        """One campaign of `length` generated steps."""
+        rnd = random.Random(seed)
+
+        def steps(model: FarmModel) -> Iterator[Step]:
+            # The stakes of the model running the steps bound the generated unstakes
+            now = 0
+            for _ in range(length):
+                step = self._generate(rnd, model, length, now)
+                now = step.now
+                yield step
+
+        checks = random.Random(seed + 1)
+        return self.run(steps, lambda index: checks.random() < check_rate)
+
+    # -----------------
+    # --  SHRINKING  --
+    # -----------------
+    def _replay(self, steps: Sequence[Step], kind: str) -> Optional[Failure]:
+        # Only the last step is cross-checked: it is the one that failed
+        failure = self.run(lambda model: iter(steps), lambda index: kind == "contract" and index == len(steps) - 1)
+        return failure if failure is not None and failure.kind == kind else None
+
+    def shrink(self, failure: Failure) -> Failure:
+        """Smallest sequence found that still fails the same way."""
+        steps = list(failure.steps)
+        chunk = max(1, (len(steps) - 1) // 2)
+        while True:
+            index, removed = 0, False
+            while index < len(steps) - 1:
+                # The failing step, the last, is always kept
+                candidate = steps[:index] + steps[min(index + chunk, len(steps) - 1):]
+                shrunk = self._replay(candidate, failure.kind)
+                if shrunk is not None:
+                    failure, steps, removed = shrunk, shrunk.steps, True
+                else:
+                    index += chunk
+            if chunk == 1 and not removed:
+                break
+            chunk = max(1, chunk // 2)
+        lowered = True
+        while lowered:
+            lowered = False
+            for index, step in enumerate(steps):
+                if not step.amount:
+                    continue
+                smaller = [1] + [10 ** e for e in range(1, len(str(step.amount)))] + [step.amount // 2]
+                for amount in sorted(a for a in set(smaller) if a < step.amount):
+                    candidate = steps[:index] + [step._replace(amount=amount)] + steps[index + 1:]
+                    shrunk = self._replay(candidate, failure.kind)
+                    if shrunk is not None and len(shrunk.steps) == len(steps):
+                        failure, steps, lowered = shrunk, shrunk.steps, True
+                        break
+        return failure
+
+
+# -----------------
+# --  RUNNER  --
+# -----------------
+
+def _campaign(args) -> Optional[Failure]:
+    total_weeks, stakers, length, seed, check_rate = args
+    return FarmFuzzer(total_weeks, stakers).fuzz(length, seed, check_rate)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Fuzz the farm entrypoints against the reference model and farm.tz")
+    parser.add_argument("--steps", type=int, default=default_steps, help="total number of steps (default: %(default)s)")
+    parser.add_argument("--length", type=int, default=default_length, help="steps per campaign (default: %(default)s)")
+    parser.add_argument("--weeks", type=int, default=52, help="total_weeks of the fuzzed farm (default: %(default)s)")
+    parser.add_argument("--stakers", type=int, default=20, help="number of senders (default: %(default)s)")
+    parser.add_argument("--check-rate", type=float, default=default_check_rate,
+                        help="share of the steps interpreted with farm.tz (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first campaign")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    campaigns = max(1, -(-args.steps // args.length))
+    start = time.time()
+    failures = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        tasks = [(args.weeks, args.stakers, args.length, args.seed + 2 * i, args.check_rate) for i in range(campaigns)]
+        for seed, failure in zip((task[3] for task in tasks), pool.map(_campaign, tasks)):
+            if failure is not None:
+                failures.append((seed, failure))
+    elapsed = time.time() - start
+    print(f"Ran {campaigns * args.length} steps in {elapsed:.2f}s ({campaigns * args.length / elapsed:.0f} steps/s), "
+          f"{len(failures)} failing campaigns")
+    if not failures:
+        return 0
+    seed, failure = failures[0]
+    shrunk = FarmFuzzer(args.weeks, args.stakers).shrink(failure)
+    print(f"Campaign {seed} failed after {len(failure.steps)} steps: {failure.kind}: {failure.message}")
+    print(f"Shrunk to {len(shrunk.steps)} steps: {shrunk.kind}: {shrunk.message}")
+    for step in shrunk.steps:
+        print(f"    {tuple(step)},")
+    return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
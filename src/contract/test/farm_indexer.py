@@ -0,0 +1,380 @@
+"""Incremental index of the farm and database storages into SQLite.
+
+The indexer reads blocks as the node RPC returns them
+(`/chains/main/blocks/<level>`) and only applies what every operation result
+reports: the new storage, whose big_maps are given by id, and the
+`lazy_storage_diff` of the big_map keys that changed. No big_map is ever
+fetched again in full, so the cost of a block is proportional to the keys it
+touches, not to the number of stakers.
+
+    python3 farm_indexer.py blocks.jsonl [--db farms.sqlite] [--batch-size 1000]
+
+`blocks.jsonl` holds one RPC block per line (see `LocalChain.save`). Every
+origination of a `--code PATH` compiled contract is indexed from its origination
+on; contracts originated before the input starts are given with
+`--contract ADDRESS:PATH`.
+
+Blocks are applied in transactions of `batch_size` levels, each of which
+also moves the checkpoint of the indexed contracts. A block at or below the
+checkpoint is skipped: after a crash, the same input can be replayed from the
+start and the index resumes where the last transaction stopped.
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import argparse
+import json
+import sqlite3
+
+from pytezos import ContractInterface
+from pytezos.michelson.sections import StorageSection
+from pytezos.michelson.types import BigMapType
+
+from contract_cache import load_contract
+
+default_batch_size = 1000
+
+schema = """
+CREATE TABLE IF NOT EXISTS codes (script TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS contracts (address TEXT PRIMARY KEY, script TEXT NOT NULL, level INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS big_maps (id INTEGER PRIMARY KEY, contract TEXT NOT NULL, field TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS storage_fields (contract TEXT, field TEXT, value TEXT, PRIMARY KEY (contract, field));
+CREATE TABLE IF NOT EXISTS farm_points (contract TEXT, week INTEGER, points TEXT, PRIMARY KEY (contract, week));
+CREATE TABLE IF NOT EXISTS reward_at_week (contract TEXT, week INTEGER, reward TEXT, PRIMARY KEY (contract, week));
+CREATE TABLE IF NOT EXISTS user_stakes (contract TEXT, user TEXT, stake TEXT, PRIMARY KEY (contract, user));
+CREATE TABLE IF NOT EXISTS user_points (contract TEXT, user TEXT, week INTEGER, points TEXT, PRIMARY KEY (contract, user, week));
+CREATE TABLE IF NOT EXISTS user_claimed_week (contract TEXT, user TEXT, week INTEGER, PRIMARY KEY (contract, user));
+CREATE TABLE IF NOT EXISTS all_farms_data (contract TEXT, farm TEXT, lp_address TEXT, farm_lp_info TEXT, PRIMARY KEY (contract, farm));
+CREATE TABLE IF NOT EXISTS inverse_farms (contract TEXT, lp_address TEXT, farm TEXT, farm_lp_info TEXT, PRIMARY KEY (contract, lp_address, farm));
+CREATE TABLE IF NOT EXISTS big_map_entries (contract TEXT, field TEXT, key TEXT, value TEXT, PRIMARY KEY (contract, field, key));
+"""
+
+
+class IndexerError(Exception):
+    pass
+
+
+###################
+# Block reading #
+###################
+
+class OperationResult(dict):
+    """{"level", "contract", "script" (originations only), "storage", "lazy_storage_diff"}"""
+
+
+def operation_results(block: dict) -> Iterator[OperationResult]:
+    """Applied originations and transactions of an RPC block, internal ones included, in order."""
+    level = int(block["header"]["level"])
+    for validation_pass in block["operations"]:
+        for operation in validation_pass:
+            for content in operation["contents"]:
+                metadata = content.get("metadata", {})
+                yield from _results(level, content, metadata.get("operation_result"))
+                for internal in metadata.get("internal_operation_results", []):
+                    yield from _results(level, internal, internal.get("result"))
+
+
+def _results(level: int, content: dict, result: Optional[dict]) -> Iterator[OperationResult]:
+    if result is None or result.get("status") != "applied":
+        return
+    diff = result.get("lazy_storage_diff", [])
+    if content["kind"] == "origination":
+        for address in result.get("originated_contracts", []):
+            yield OperationResult(level=level, contract=address, script=content["script"]["code"],
+                                  storage=content["script"]["storage"], lazy_storage_diff=diff)
+    elif content["kind"] == "transaction" and "storage" in result:
+        yield OperationResult(level=level, contract=content["destination"], storage=result["storage"],
+                              lazy_storage_diff=diff)
+
+
+def read_blocks(path: str) -> Iterator[dict]:
+    """Blocks of a file holding one JSON block per line."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+##################
+# Field writers #
+##################
+
+def _rows(cursor: sqlite3.Cursor, sql: str, rows: Iterable[tuple]) -> None:
+    cursor.executemany(sql, list(rows))
+
+
+def _write_weeks(table: str, column: str):
+    def write(cursor, contract, values):
+        cursor.execute(f"DELETE FROM {table} WHERE contract = ?", (contract,))
+        _rows(cursor, f"INSERT INTO {table} (contract, week, {column}) VALUES (?, ?, ?)",
+              ((contract, week, str(value)) for week, value in enumerate(values, start=1)))
+    return write
+
+
+# Storage fields with their own table, the others go to `storage_fields` as JSON
+list_writers = {
+    "farm_points": _write_weeks("farm_points", "points"),
+    "reward_at_week": _write_weeks("reward_at_week", "reward"),
+}
+
+
+def _user_stakes(cursor, contract, key, value):
+    cursor.execute("DELETE FROM user_stakes WHERE contract = ? AND user = ?", (contract, key))
+    if value is not None:
+        cursor.execute("INSERT INTO user_stakes VALUES (?, ?, ?)", (contract, key, str(value)))
+
+
+def _user_points(cursor, contract, key, value):
+    # `week` is the position in the list, which starts after the claimed weeks;
+    # an empty list (every week claimed) is kept as a week 0 row without points
+    cursor.execute("DELETE FROM user_points WHERE contract = ? AND user = ?", (contract, key))
+    if value == []:
+        cursor.execute("INSERT INTO user_points VALUES (?, ?, 0, NULL)", (contract, key))
+    _rows(cursor, "INSERT INTO user_points VALUES (?, ?, ?, ?)",
+          ((contract, key, week, str(points)) for week, points in enumerate(value or [], start=1)))
+
+
+def _user_claimed_week(cursor, contract, key, value):
+    cursor.execute("DELETE FROM user_claimed_week WHERE contract = ? AND user = ?", (contract, key))
+    if value is not None:
+        cursor.execute("INSERT INTO user_claimed_week VALUES (?, ?, ?)", (contract, key, value))
+
+
+def _all_farms_data(cursor, contract, key, value):
+    cursor.execute("DELETE FROM all_farms_data WHERE contract = ? AND farm = ?", (contract, key))
+    if value is not None:
+        cursor.execute("INSERT INTO all_farms_data VALUES (?, ?, ?, ?)",
+                       (contract, key, value["lp_address"], value["farm_lp_info"]))
+
+
+def _inverse_farms(cursor, contract, key, value):
+    cursor.execute("DELETE FROM inverse_farms WHERE contract = ? AND lp_address = ?", (contract, key))
+    _rows(cursor, "INSERT INTO inverse_farms VALUES (?, ?, ?, ?)",
+          ((contract, key, farm, info) for farm, info in sorted((value or {}).items())))
+
+
+# big_map fields with their own table, the others go to `big_map_entries` as JSON
+big_map_writers = {
+    "user_stakes": _user_stakes,
+    "user_points": _user_points,
+    "user_claimed_week": _user_claimed_week,
+    "all_farms_data": _all_farms_data,
+    "inverse_farms": _inverse_farms,
+}
+
+
+def _generic_entry(field: str):
+    def write(cursor, contract, key, value):
+        encoded_key = json.dumps(key, sort_keys=True, default=str)
+        cursor.execute("DELETE FROM big_map_entries WHERE contract = ? AND field = ? AND key = ?", (contract, field, encoded_key))
+        if value is not None:
+            cursor.execute("INSERT INTO big_map_entries VALUES (?, ?, ?, ?)",
+                           (contract, field, encoded_key, json.dumps(value, sort_keys=True, default=str)))
+    return write
+
+
+###############
+# Indexer #
+###############
+
+class FarmIndexer:
+    def __init__(self, path: str = ":memory:", batch_size: int = default_batch_size):
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(schema)
+        self._codes = {script for script, in self.connection.execute("SELECT script FROM codes")}
+        # address -> storage type, loaded from the registered scripts
+        self._storage_types = {}
+        for address, script in self.connection.execute("SELECT address, script FROM contracts"):
+            self._storage_types[address] = self._storage_type(ContractInterface.from_micheline(json.loads(script)))
+
+    @staticmethod
+    def _script(micheline) -> str:
+        return json.dumps(micheline, sort_keys=True)
+
+    @staticmethod
+    def _storage_type(contract: ContractInterface):
+        return StorageSection.match(contract.context.storage_expr).args[0]
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def watch_code(self, contract: ContractInterface) -> None:
+        """Indexes every contract originated with the code of `contract`."""
+        script = self._script(contract.to_micheline())
+        with self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO codes VALUES (?)", (script,))
+        self._codes.add(script)
+
+    def watch(self, address: str, contract: ContractInterface, level: int = 0) -> None:
+        """Indexes `address`, already originated with the code of `contract`, from `level` on."""
+        if address in self._storage_types:
+            return
+        with self.connection:
+            self._register(self.connection.cursor(), address, contract.to_micheline(), level)
+
+    def _register(self, cursor: sqlite3.Cursor, address: str, script, level: int) -> None:
+        cursor.execute("INSERT INTO contracts VALUES (?, ?, ?)", (address, self._script(script), level))
+        self._storage_types[address] = self._storage_type(ContractInterface.from_micheline(script))
+
+    def checkpoint(self, address: str) -> Optional[int]:
+        """Last level applied for `address`, None when it is not indexed."""
+        row = self.connection.execute("SELECT level FROM contracts WHERE address = ?", (address,)).fetchone()
+        return row[0] if row else None
+
+    def apply(self, blocks: Iterable[dict]) -> int:
+        """Applies the new blocks, `batch_size` levels per transaction, returns the number of applied results."""
+        applied = 0
+        batch: List[OperationResult] = []
+        levels = 0
+        for block in blocks:
+            results = list(operation_results(block))
+            if not results:
+                continue
+            batch.extend(results)
+            levels += 1
+            if levels >= self.batch_size:
+                applied += self._apply_batch(batch)
+                batch, levels = [], 0
+        return applied + self._apply_batch(batch)
+
+    def _apply_batch(self, batch: List[OperationResult]) -> int:
+        applied = 0
+        with self.connection:
+            cursor = self.connection.cursor()
+            checkpoints = dict(cursor.execute("SELECT address, level FROM contracts"))
+            for result in batch:
+                address = result["contract"]
+                if "script" in result and address not in checkpoints and self._script(result["script"]) in self._codes:
+                    self._register(cursor, address, result["script"], result["level"] - 1)
+                    checkpoints[address] = result["level"] - 1
+                if address not in checkpoints or result["level"] <= checkpoints[address]:
+                    continue
+                self._apply_result(cursor, result)
+                applied += 1
+            for address in {r["contract"] for r in batch}:
+                levels = [r["level"] for r in batch if r["contract"] == address]
+                if address in checkpoints and max(levels) > checkpoints[address]:
+                    cursor.execute("UPDATE contracts SET level = ? WHERE address = ?", (max(levels), address))
+        return applied
+
+    def _apply_result(self, cursor: sqlite3.Cursor, result: OperationResult) -> None:
+        address = result["contract"]
+        storage_type = self._storage_types[address]
+        storage = storage_type.from_micheline_value(result["storage"]).to_python_object()
+        fields = storage_type.get_flat_args(infer_names=True)
+        for field, ty in fields.items():
+            if issubclass(ty, BigMapType):
+                cursor.execute("INSERT OR REPLACE INTO big_maps VALUES (?, ?, ?)", (storage[field], address, field))
+            elif field in list_writers:
+                list_writers[field](cursor, address, storage[field])
+            else:
+                cursor.execute("INSERT OR REPLACE INTO storage_fields VALUES (?, ?, ?)",
+                               (address, field, json.dumps(storage[field], sort_keys=True, default=str)))
+        for diff in result["lazy_storage_diff"]:
+            if diff["kind"] == "big_map":
+                self._apply_big_map_diff(cursor, int(diff["id"]), diff["diff"], fields)
+
+    def _apply_big_map_diff(self, cursor: sqlite3.Cursor, big_map_id: int, diff: dict, fields: Dict[str, type]) -> None:
+        row = cursor.execute("SELECT contract, field FROM big_maps WHERE id = ?", (big_map_id,)).fetchone()
+        if row is None:
+            # Temporary or foreign big_map
+            return
+        address, field = row
+        if diff["action"] == "copy":
+            raise IndexerError(f"big_map {big_map_id} ({address}%{field}) is copied from {diff['source']}, copies are not indexed")
+        if diff["action"] == "remove":
+            return
+        key_type, value_type = fields[field].args
+        write = big_map_writers.get(field) or _generic_entry(field)
+        for update in diff.get("updates", []):
+            key = key_type.from_micheline_value(update["key"]).to_python_object()
+            value = value_type.from_micheline_value(update["value"]).to_python_object() if "value" in update else None
+            write(cursor, address, key, value)
+
+    ###############
+    # Queries #
+    ###############
+
+    def _weeks(self, sql: str, args: tuple) -> List[int]:
+        return [int(value) for value, in self.connection.execute(sql, args)]
+
+    def field(self, address: str, field: str):
+        """Storage field that is neither a big_map nor a week list, as the interpreter returns it."""
+        row = self.connection.execute("SELECT value FROM storage_fields WHERE contract = ? AND field = ?", (address, field)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def farm_points(self, farm: str) -> List[int]:
+        return self._weeks("SELECT points FROM farm_points WHERE contract = ? ORDER BY week", (farm,))
+
+    def reward_at_week(self, farm: str) -> List[int]:
+        return self._weeks("SELECT reward FROM reward_at_week WHERE contract = ? ORDER BY week", (farm,))
+
+    def user_stakes(self, farm: str) -> Dict[str, int]:
+        return {user: int(stake) for user, stake in
+                self.connection.execute("SELECT user, stake FROM user_stakes WHERE contract = ?", (farm,))}
+
+    def user_points(self, farm: str) -> Dict[str, List[int]]:
+        points: Dict[str, List[int]] = {}
+        for user, value in self.connection.execute(
+                "SELECT user, points FROM user_points WHERE contract = ? ORDER BY user, week", (farm,)):
+            week_points = points.setdefault(user, [])
+            if value is not None:
+                week_points.append(int(value))
+        return points
+
+    def user_claimed_week(self, farm: str) -> Dict[str, int]:
+        return dict(self.connection.execute("SELECT user, week FROM user_claimed_week WHERE contract = ?", (farm,)))
+
+    def all_farms_data(self, database: str) -> Dict[str, dict]:
+        return {farm: {"lp_address": lp_address, "farm_lp_info": info} for farm, lp_address, info in self.connection.execute(
+            "SELECT farm, lp_address, farm_lp_info FROM all_farms_data WHERE contract = ?", (database,))}
+
+    def farms_by_lp(self, database: str, lp_address: str) -> Dict[str, str]:
+        return dict(self.connection.execute(
+            "SELECT farm, farm_lp_info FROM inverse_farms WHERE contract = ? AND lp_address = ?", (database, lp_address)))
+
+    def inverse_farms(self, database: str) -> Dict[str, Dict[str, str]]:
+        farms: Dict[str, Dict[str, str]] = {}
+        for lp_address, farm, info in self.connection.execute(
+                "SELECT lp_address, farm, farm_lp_info FROM inverse_farms WHERE contract = ?", (database,)):
+            farms.setdefault(lp_address, {})[farm] = info
+        return farms
+
+
+# -----------------
+# --  RUNNER  --
+# -----------------
+
+def _contract_argument(value: str) -> Tuple[str, str]:
+    address, _, path = value.partition(":")
+    if not path:
+        raise argparse.ArgumentTypeError("expected ADDRESS:PATH")
+    return address, path
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Index farm and database storages from RPC blocks into SQLite")
+    parser.add_argument("blocks", help="file holding one RPC block per line")
+    parser.add_argument("--db", default="farms.sqlite", help="SQLite database (default: %(default)s)")
+    parser.add_argument("--batch-size", type=int, default=default_batch_size, help="levels per transaction (default: %(default)s)")
+    parser.add_argument("--code", action="append", default=[], metavar="PATH",
+                        help="index every origination of this compiled contract (e.g. compiled/farm.tz)")
+    parser.add_argument("--contract", action="append", type=_contract_argument, default=[], metavar="ADDRESS:PATH",
+                        help="index this already originated contract, given with its compiled .tz file")
+    parser.add_argument("--level", type=int, default=0, help="level up to which the --contract contracts are not read")
+    args = parser.parse_args()
+
+    indexer = FarmIndexer(args.db, args.batch_size)
+    for path in args.code:
+        indexer.watch_code(load_contract(path))
+    for address, path in args.contract:
+        indexer.watch(address, load_contract(path), args.level)
+    applied = indexer.apply(read_blocks(args.blocks))
+    for address, level in indexer.connection.execute("SELECT address, level FROM contracts ORDER BY address"):
+        print(f"{address}: level {level}")
+    print(f"{applied} operation results applied")
+    indexer.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,131 @@
+"""FA1.2/FA2 scenario matrix for the farm tests.
+
+Scenarios are declared once with `@matrix_scenario` and `expand_matrix` turns each
+of them into one test method per input/reward token combination. Running this
+module executes the whole matrix on a process pool where every worker loads the
+farm contract once:
+
+    python3 farm_matrix.py [-j WORKERS] [-k SUBSTRING]
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import argparse
+import importlib
+import os
+import time
+import unittest
+
+input_token_id = 1
+reward_token_id = 5
+
+# name -> (input_fa2_token_id_opt, reward_fa2_token_id_opt)
+token_matrix: Dict[str, Tuple[Optional[int], Optional[int]]] = {
+    "fa12_fa12": (None, None),
+    "fa12_fa2": (None, reward_token_id),
+    "fa2_fa12": (input_token_id, None),
+    "fa2_fa2": (input_token_id, reward_token_id),
+}
+
+scenarios: Dict[str, Callable] = {}
+
+
+class MatrixResult(NamedTuple):
+    tests_run: int
+    # (test, traceback) of the failed assertions and of the unexpected exceptions
+    failures: List[Tuple[str, str]]
+    errors: List[Tuple[str, str]]
+    # (test, reason)
+    skipped: List[Tuple[str, str]]
+
+
+def matrix_scenario(scenario: Callable) -> Callable:
+    """Registers `scenario(test_case, init_storage)` to run on every token combination."""
+    scenarios[scenario.__name__] = scenario
+    return scenario
+
+
+def _matrix_test(scenario: Callable, storage_fixture, input_fa2_token_id_opt, reward_fa2_token_id_opt):
+    def test(self):
+        init_storage = storage_fixture.overlay(input_fa2_token_id_opt=input_fa2_token_id_opt,
+                                               reward_fa2_token_id_opt=reward_fa2_token_id_opt)
+        scenario(self, init_storage)
+    test.__doc__ = scenario.__doc__
+    return test
+
+
+def expand_matrix(test_class, storage_fixture):
+    """Adds `test_<scenario>_<input>_<reward>` methods to `test_class`."""
+    for name, scenario in scenarios.items():
+        for combination, (input_fa2_token_id_opt, reward_fa2_token_id_opt) in token_matrix.items():
+            test = _matrix_test(scenario, storage_fixture, input_fa2_token_id_opt, reward_fa2_token_id_opt)
+            test.__name__ = f"test_{name}_{combination}"
+            setattr(test_class, test.__name__, test)
+    return test_class
+
+
+# -----------------
+# --  RUNNER  --
+# -----------------
+_test_class = None
+
+
+def _preload(module_name: str, class_name: str) -> None:
+    global _test_class
+    _test_class = getattr(importlib.import_module(module_name), class_name)
+    # Loads the contract once for every case this worker will run
+    _test_class.setUpClass()
+
+
+def _run_shard(method_names: List[str]) -> MatrixResult:
+    result = unittest.TestResult()
+    for method_name in method_names:
+        _test_class(method_name).run(result)
+    return MatrixResult(result.testsRun, [(str(test), trace) for test, trace in result.failures],
+                        [(str(test), trace) for test, trace in result.errors],
+                        [(str(test), reason) for test, reason in result.skipped])
+
+
+def run_matrix(module_name: str = "test_farm_matrix", class_name: str = "FarmMatrixTest",
+               workers: Optional[int] = None, keyword: str = "") -> MatrixResult:
+    """Runs every expanded case on `workers` processes and merges the results of the shards."""
+    test_class = getattr(importlib.import_module(module_name), class_name)
+    method_names = [name for name in unittest.TestLoader().getTestCaseNames(test_class) if keyword in name]
+    workers = workers or os.cpu_count() or 1
+    # Interleaved shards keep the slow and the fast scenarios spread over the workers
+    shard_count = min(len(method_names), workers * 4) or 1
+    shards = [method_names[i::shard_count] for i in range(shard_count)]
+    merged = MatrixResult(0, [], [], [])
+    with ProcessPoolExecutor(max_workers=workers, initializer=_preload, initargs=(module_name, class_name)) as pool:
+        for shard in pool.map(_run_shard, shards):
+            merged = MatrixResult(merged.tests_run + shard.tests_run, merged.failures + shard.failures,
+                                  merged.errors + shard.errors, merged.skipped + shard.skipped)
+    return merged
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run the farm FA1.2/FA2 scenario matrix in parallel")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument("-k", "--keyword", default="", help="only run cases whose name contains this substring")
+    parser.add_argument("--module", default="test_farm_matrix")
+    parser.add_argument("--test-class", default="FarmMatrixTest")
+    args = parser.parse_args()
+
+    start = time.time()
+    result = run_matrix(args.module, args.test_class, args.workers, args.keyword)
+    for test, trace in result.errors:
+        print(f"ERROR: {test}\n{trace}")
+    for test, trace in result.failures:
+        print(f"FAIL: {test}\n{trace}")
+    for test, reason in result.skipped:
+        print(f"SKIP: {test}: {reason}")
+    print(f"Ran {result.tests_run} cases in {time.time() - start:.2f}s")
+    # Same summary line as unittest
+    counts = [f"{name}={len(items)}" for name, items in
+              (("failures", result.failures), ("errors", result.errors), ("skipped", result.skipped)) if items]
+    status = "FAILED" if result.failures or result.errors else "OK"
+    print(f"{status} ({', '.join(counts)})" if counts else status)
+    return 1 if result.failures or result.errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
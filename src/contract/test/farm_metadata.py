@@ -0,0 +1,128 @@
+"""TZIP-16 metadata of the farm, with its off-chain views.
+
+The views of `farm/views.mligo` are compiled one by one into
+`compiled/views/<name>.json` (see README). `farm_metadata()` puts them in the
+metadata JSON, which the farm keeps in its `metadata` big_map
+(`tezos-storage:contents`): wallets and the API read the views from the
+contract itself and get the exact `claim_all` figures with one `run_code`
+RPC call instead of re-implementing the week and reward computations.
+
+    python3 farm_metadata.py [--output ../../../deploy/artefact/farm_metadata.json]
+"""
+from typing import Dict, List, NamedTuple, Optional
+import argparse
+import json
+import os
+
+from pytezos import ContractInterface
+from pytezos.context.impl import ExecutionContext
+from pytezos.contract.metadata import ContractMetadata, _to_camelcase
+from pytezos.contract.view import format_view_params, format_view_script
+from pytezos.michelson.repl import Interpreter
+from pytezos.michelson.sections import StorageSection
+
+views_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "compiled", "views")
+metadata_key = "contents"
+
+
+class FarmView(NamedTuple):
+    name: str
+    description: str
+    parameter: dict
+    return_type: dict
+    # Does not depend on the block (NOW)
+    pure: bool
+
+
+farm_views: List[FarmView] = [
+    FarmView("current_week", "Week of the farm at the current block, the first one being 1",
+             {"prim": "unit"}, {"prim": "nat"}, False),
+    FarmView("pending_reward", "Reward that claim_all would send to the address at the current block",
+             {"prim": "address"}, {"prim": "nat"}, False),
+    FarmView("user_stake", "Input tokens staked by the address",
+             {"prim": "address"}, {"prim": "nat"}, True),
+]
+
+
+def view_code(name: str, path: str = views_path) -> list:
+    """Compiled Micheline code of the view `name`."""
+    with open(os.path.join(path, f"{name}.json")) as f:
+        return json.load(f)
+
+
+def farm_metadata(path: str = views_path) -> dict:
+    """TZIP-16 metadata JSON of the farm."""
+    return {
+        "name": "SMAK farm",
+        "description": "Vortex farm: stake an input token, earn a reward token week by week",
+        "interfaces": ["TZIP-016"],
+        "views": [
+            {
+                "name": view.name,
+                "description": view.description,
+                "pure": view.pure,
+                "implementations": [{"michelsonStorageView": {
+                    "parameter": view.parameter,
+                    "returnType": view.return_type,
+                    "code": view_code(view.name, path),
+                }}],
+            }
+            for view in farm_views
+        ],
+    }
+
+
+def metadata_big_map(metadata: dict) -> Dict[str, bytes]:
+    """Content of the farm `metadata` big_map storing `metadata` on chain."""
+    return {"": f"tezos-storage:{metadata_key}".encode(), metadata_key: json.dumps(metadata, separators=(",", ":")).encode()}
+
+
+def run_view(contract: ContractInterface, metadata: dict, name: str, parameter, storage: dict, now: Optional[int] = None):
+    """Value of the off-chain view `name` on the python `storage`, at the timestamp `now`.
+
+    Same as `contract.metadata.<view>(parameter).storage_view(storage)`, which
+    cannot set NOW. Raises `MichelsonRuntimeError` when the view fails.
+    """
+    view = getattr(ContractMetadata.from_json(metadata, contract.context), _to_camelcase(name))
+    call = view() if parameter is None else view(parameter)
+    storage_expr = StorageSection.match(contract.context.storage_expr).from_python_object(storage).to_micheline_value(lazy_diff=None)
+    parameters = format_view_params(param_expr=call.param_expr, storage_expr=storage_expr)
+    script = format_view_script(param_ty_expr=call.param_ty_expr, storage_ty_expr=contract.context.storage_expr,
+                                return_ty_expr=call.return_ty_expr, code_expr=call.code_expr)
+    _, value, stdout, error = Interpreter.run_callback(
+        entrypoint=parameters["entrypoint"],
+        parameter=parameters["value"],
+        storage={"prim": "None"},
+        context=ExecutionContext(script=script, now=now),
+    )
+    if error is not None:
+        raise error
+    return value
+
+
+# -----------------
+# --  RUNNER  --
+# -----------------
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Build the TZIP-16 metadata of the farm from its compiled views")
+    parser.add_argument("--views", default=views_path, help="directory of the compiled views (default: %(default)s)")
+    parser.add_argument("--output", default=None, help="metadata JSON file (default: stdout)")
+    args = parser.parse_args()
+
+    try:
+        metadata = farm_metadata(args.views)
+    except FileNotFoundError as e:
+        print(f"Missing compiled view: {e.filename}")
+        return 1
+    ContractMetadata.validate_metadata_json(metadata)
+    if args.output is None:
+        print(json.dumps(metadata, indent=2))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(metadata, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,694 @@
+"""Off-chain reference model of the farm contract (farm/partials/methods.mligo).
+
+Every entrypoint reproduces the Michelson semantics of the compiled farm: nat
+arithmetic, floor divisions, `abs` differences and the same checks and error
+messages. Per-user `user_points` live in a (users x total_weeks) array so that a
+whole batch of stakers can be stepped in one vectorized call; the storage only
+holds the weeks after `user_claimed_week`, the array keeps the claimed ones.
+`pending_rewards` computes what `claim_all` would pay to every staker of a
+farm at once, from the storage fields alone.
+
+`AccumulatorModel` is the same port for the accumulator mode of the farm
+(farm/accumulator.mligo), where stakers keep a checkpoint instead of a week list.
+"""
+from itertools import chain
+from typing import Callable, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+week_in_seconds = 604800
+reward_precision = 10 ** 18
+
+# Same messages as farm/partials/error.mligo
+only_admin = "Only the contract admin can change the contract administrator or increase reward"
+amount_is_null = "The farm staking amount must be greater than zero"
+increase_amount_is_null = "The increase amount must be greater than zero"
+time_too_early = "Please try again in few seconds"
+no_stakes = "You did not stake any token yet"
+unstake_more_than_stake = "You cannot unstake more than your farm staking"
+no_claim_first_week = "You cannot claim any reward before the first farm week as passed"
+no_week_left = "There are no more weeks left for staking in the farm"
+contract_already_initialized = "The contract is already initialized"
+contract_not_initialized = "The contract is not initialized"
+week_duration_is_null = "The week duration must be greater than zero"
+size_dont_match = "size don't match"
+some_points_should_exist = "Some points should exist"
+div_by_zero = "DIV by 0"
+accumulator_not_updated = "The farm accumulator was not updated for this week"
+
+Senders = Union[str, Sequence[str]]
+Amounts = Union[int, Sequence[int]]
+
+
+class FarmModelError(Exception):
+    """Raised where the contract would FAILWITH; the message is the contract's."""
+
+
+def compute_new_rewards(total_reward: int, week_number: int, rate: int) -> List[int]:
+    """Exact port of `compute_new_rewards`, one reward per week."""
+    numerator = abs(10_000 - rate) * 10_000 ** abs(week_number - 1) * total_reward
+    denominator = abs(10_000 ** week_number - rate ** week_number)
+    rewards = []
+    t_before, t_before_divisor = 1, 1
+    for _ in range(week_number):
+        final_denominator = t_before_divisor * denominator
+        if final_denominator == 0:
+            raise FarmModelError(div_by_zero)
+        rewards.append(numerator * t_before // final_denominator)
+        t_before, t_before_divisor = t_before * rate, t_before_divisor * 10_000
+    return rewards
+
+
+def _mul_div(points: Optional[np.ndarray], estimates: np.ndarray, factor: int, divisor: int,
+             exact: Callable[[int], int]) -> np.ndarray:
+    """Exact `points * factor / divisor` (nat division) of one week of points.
+
+    `points` holds the int64 points, None when some do not fit, `estimates`
+    the same points as floats and `exact(i)` the i-th one as a Python int.
+    The products are computed in int64 when they fit. Otherwise the quotients
+    are estimated in floating point and only the few estimates too close to an
+    integer to be floored safely are computed again with Python ints.
+    """
+    if points is not None and int(points.max(initial=0)) * factor < 2 ** 63:
+        return points * factor // divisor
+    estimate = estimates * (factor / divisor)
+    if estimate.max(initial=0) >= 2 ** 52:
+        return np.array([exact(i) * factor // divisor for i in range(len(estimates))], dtype=object)
+    quotients = np.floor(estimate)
+    # Three roundings, each of relative error 2^-53 at most
+    margin = (estimate + 1) * 2.0 ** -50
+    unsure = np.flatnonzero((estimate - quotients < margin) | (quotients + 1 - estimate < margin))
+    quotients = quotients.astype(np.int64)
+    quotients[unsure] = [exact(i) * factor // divisor for i in unsure]
+    return quotients
+
+
+def pending_rewards(reward_at_week: Sequence[int], farm_points: Sequence[int], creation_time: int,
+                    user_points: Mapping[str, Sequence[int]], now: int,
+                    user_claimed_week: Optional[Mapping[str, int]] = None,
+                    week_duration: int = week_in_seconds) -> Dict[str, int]:
+    """What `claim_all` would pay at `now` to every key of `user_points`.
+
+    Same per-week `acc + hd1 * hd3 / hd2` as `compute_total_reward`, weeks
+    without farm points and weeks up to `user_claimed_week` skipped, computed
+    week by week over all the users at once. `user_points` are the storage
+    lists, which start after the claimed weeks.
+    """
+    total_weeks = len(reward_at_week)
+    if len(farm_points) != total_weeks:
+        raise FarmModelError(size_dont_match)
+    addresses, rows = list(user_points), list(user_points.values())
+    claimed = np.zeros(len(addresses), dtype=np.int64)
+    if user_claimed_week:
+        index = {address: i for i, address in enumerate(addresses)}
+        for address, week in user_claimed_week.items():
+            if address in index:
+                claimed[index[address]] = week
+    # Claimed weeks are back as zeros, every row then holds total_weeks weeks
+    offsets = np.minimum(claimed, total_weeks)
+    lengths = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+    if np.any(offsets + lengths != total_weeks):
+        raise FarmModelError(size_dont_match)
+    count = int(lengths.sum())
+    # The unclaimed weeks, row after row, fill the cells right of the offsets
+    unclaimed = np.arange(total_weeks) >= offsets[:, None]
+    try:
+        points = np.zeros((len(rows), total_weeks), dtype=np.int64)
+        points[unclaimed] = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=count)
+        points = points.T.copy()
+        estimates = points.astype(np.float64)
+    except OverflowError:
+        points = None
+        estimates = np.zeros((len(rows), total_weeks), dtype=np.float64)
+        estimates[unclaimed] = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=count)
+        estimates = estimates.T.copy()
+
+    elapsed_weeks = abs(now - creation_time) // week_duration
+    totals = np.zeros(len(addresses), dtype=np.int64)
+    bound = 0
+    for week in range(min(elapsed_weeks, total_weeks)):
+        if farm_points[week] == 0:
+            continue
+        rewards = _mul_div(None if points is None else points[week], estimates[week],
+                           int(reward_at_week[week]), int(farm_points[week]),
+                           lambda i: int(rows[i][week - offsets[i]]) if week >= offsets[i] else 0)
+        rewards = np.where(claimed <= week, rewards, 0)
+        bound += int(rewards.max(initial=0))
+        if totals.dtype != object and (rewards.dtype == object or bound >= 2 ** 63):
+            totals = totals.astype(object)
+        totals = totals + rewards
+    return dict(zip(addresses, totals.tolist()))
+
+
+def _as_list(value, size: Optional[int] = None) -> list:
+    if isinstance(value, (str, int, np.integer)):
+        return [value] * (size if size is not None else 1)
+    return list(value)
+
+
+class FarmModel:
+    """Vectorized state of one farm.
+
+    `dtype=object` (default) keeps arbitrary precision Python ints, like Michelson
+    nats. `dtype=np.int64` is much faster but refuses any product that could
+    overflow.
+    """
+
+    def __init__(self, admin: str, total_reward: int, total_weeks: int, rate: int,
+                 creation_time: int = 0, initialized: bool = False,
+                 reward_at_week: Iterable[int] = (), farm_points: Iterable[int] = (),
+                 week_duration: int = week_in_seconds, dtype=object, capacity: int = 16):
+        self.admin = admin
+        self.total_reward = total_reward
+        self.total_weeks = total_weeks
+        self.week_duration = week_duration
+        self.rate = rate
+        self.creation_time = creation_time
+        self.initialized = initialized
+        self.dtype = dtype
+        self.reward_at_week = self._array(list(reward_at_week))
+        self.farm_points = self._array(list(farm_points))
+        self.users: Dict[str, int] = {}
+        self.addresses: List[str] = []
+        self._points = np.zeros((capacity, total_weeks), dtype=dtype)
+        self._stakes = np.zeros(capacity, dtype=dtype)
+        # Rows whose address is a key of the `user_points` / `user_stakes` big_maps
+        self._has_points = np.zeros(capacity, dtype=bool)
+        self._has_stake = np.zeros(capacity, dtype=bool)
+        # Last week claimed by each row, a key of `user_claimed_week` when _has_claimed
+        self._claimed = np.zeros(capacity, dtype=np.int64)
+        self._has_claimed = np.zeros(capacity, dtype=bool)
+        # Points of the settled users removed from the big_maps, week by week
+        self.settled_points = np.zeros(total_weeks, dtype=dtype)
+
+    # -----------------
+    # --  STORAGE  --
+    # -----------------
+    @classmethod
+    def from_storage(cls, storage: dict, dtype=object) -> "FarmModel":
+        """Builds a model from a storage dict as handed to `interpret(storage=...)`."""
+        model = cls(admin=storage["admin"], total_reward=storage["total_reward"],
+                    total_weeks=storage["total_weeks"], rate=storage["rate"],
+                    creation_time=storage["creation_time"], initialized=storage["initialized"],
+                    reward_at_week=storage["reward_at_week"], farm_points=storage["farm_points"],
+                    week_duration=storage.get("week_duration", week_in_seconds),
+                    dtype=dtype, capacity=max(16, len(storage["user_points"]) + len(storage["user_stakes"])))
+        for address, week in storage.get("user_claimed_week", {}).items():
+            row = model._rows([address], create=True)[0]
+            model._claimed[row] = week
+            model._has_claimed[row] = True
+        for address, points in storage["user_points"].items():
+            row = model._rows([address], create=True)[0]
+            claimed_weeks = min(int(model._claimed[row]), model.total_weeks)
+            if len(points) != model.total_weeks - claimed_weeks:
+                raise ValueError(f"user_points of {address} must hold the {model.total_weeks - claimed_weeks} weeks after the claimed ones")
+            model._points[row, claimed_weeks:] = points
+            model._has_points[row] = True
+        for address, stake in storage["user_stakes"].items():
+            row = model._rows([address], create=True)[0]
+            model._stakes[row] = stake
+            model._has_stake[row] = True
+        return model
+
+    def to_storage(self, base: Optional[dict] = None) -> dict:
+        """Returns the model as a storage dict, `base` providing the token fields."""
+        storage = dict(base) if base is not None else {}
+        storage.update({
+            "admin": self.admin,
+            "creation_time": self.creation_time,
+            "initialized": self.initialized,
+            "rate": self.rate,
+            "total_reward": self.total_reward,
+            "total_weeks": self.total_weeks,
+            "week_duration": self.week_duration,
+            "reward_at_week": [int(x) for x in self.reward_at_week],
+            "farm_points": [int(x) for x in self.farm_points],
+            "user_points": {self.addresses[row]: self.user_points(self.addresses[row])
+                            for row in np.flatnonzero(self._has_points[:len(self.addresses)])},
+            "user_stakes": {self.addresses[row]: int(self._stakes[row])
+                            for row in np.flatnonzero(self._has_stake[:len(self.addresses)])},
+            "user_claimed_week": {self.addresses[row]: int(self._claimed[row])
+                                  for row in np.flatnonzero(self._has_claimed[:len(self.addresses)])},
+        })
+        return storage
+
+    def user_points(self, address: str) -> Optional[List[int]]:
+        """The `user_points` entry of `address`: its weeks after the claimed ones."""
+        row = self.users.get(address)
+        if row is None or not self._has_points[row]:
+            return None
+        return [int(x) for x in self._points[row, self._claimed[row]:]]
+
+    def user_stake(self, address: str) -> Optional[int]:
+        row = self.users.get(address)
+        if row is None or not self._has_stake[row]:
+            return None
+        return int(self._stakes[row])
+
+    def user_claimed_week(self, address: str) -> Optional[int]:
+        row = self.users.get(address)
+        if row is None or not self._has_claimed[row]:
+            return None
+        return int(self._claimed[row])
+
+    @property
+    def points(self) -> np.ndarray:
+        """(users x total_weeks) view of `user_points`, rows ordered as `addresses`."""
+        return self._points[:len(self.addresses)]
+
+    @property
+    def stakes(self) -> np.ndarray:
+        return self._stakes[:len(self.addresses)]
+
+    # -----------------
+    # --  INTERNALS  --
+    # -----------------
+    def _array(self, values) -> np.ndarray:
+        return np.array(values, dtype=self.dtype).reshape(-1)
+
+    def _check_mul(self, lhs, rhs) -> None:
+        if self.dtype is object:
+            return
+        lhs_max = int(np.max(np.abs(lhs))) if np.size(lhs) else 0
+        rhs_max = int(np.max(np.abs(rhs))) if np.size(rhs) else 0
+        if lhs_max * rhs_max >= 2 ** 63:
+            raise OverflowError("nat product does not fit in int64, use dtype=object")
+
+    def _grow(self, size: int) -> None:
+        capacity = len(self._stakes)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        extra = capacity - len(self._stakes)
+        self._points = np.concatenate([self._points, np.zeros((extra, self.total_weeks), dtype=self.dtype)])
+        self._stakes = np.concatenate([self._stakes, np.zeros(extra, dtype=self.dtype)])
+        self._has_points = np.concatenate([self._has_points, np.zeros(extra, dtype=bool)])
+        self._has_stake = np.concatenate([self._has_stake, np.zeros(extra, dtype=bool)])
+        self._claimed = np.concatenate([self._claimed, np.zeros(extra, dtype=np.int64)])
+        self._has_claimed = np.concatenate([self._has_claimed, np.zeros(extra, dtype=bool)])
+
+    def _remove(self, rows: np.ndarray) -> None:
+        # The rows leave the big_maps, their points are kept in settled_points
+        if len(rows):
+            self.settled_points = self.settled_points + self._points[rows].sum(axis=0)
+        self._points[rows] = 0
+        self._stakes[rows] = 0
+        self._claimed[rows] = 0
+        self._has_points[rows] = False
+        self._has_stake[rows] = False
+        self._has_claimed[rows] = False
+
+    def _rows(self, senders: Sequence[str], create: bool = False) -> np.ndarray:
+        rows = []
+        for address in senders:
+            row = self.users.get(address)
+            if row is None:
+                row = len(self.addresses)
+                if create:
+                    self.users[address] = row
+                    self.addresses.append(address)
+            rows.append(row)
+        if create:
+            self._grow(len(self.addresses))
+        return np.array(rows, dtype=np.int64)
+
+    def get_current_week(self, now: int) -> int:
+        if self.week_duration == 0:
+            raise FarmModelError(div_by_zero)
+        return abs(now - self.creation_time) // self.week_duration + 1
+
+    def _new_points_by_weeks(self, now: int, amounts: np.ndarray) -> np.ndarray:
+        # calculate_new_points_by_week for every amount at once, shape (len(amounts), total_weeks)
+        current_week = self.get_current_week(now)
+        endofweek_in_seconds = self.creation_time + current_week * self.week_duration
+        before_end_week = abs(now - endofweek_in_seconds)
+        weeks = np.arange(1, self.total_weeks + 1)
+        seconds = np.where(weeks < current_week, 0, np.where(weeks == current_week, before_end_week, self.week_duration))
+        seconds = seconds.astype(self.dtype)
+        self._check_mul(amounts, seconds)
+        return amounts[:, None] * seconds[None, :]
+
+    def _aggregate(self, rows: np.ndarray, amounts: np.ndarray):
+        # A sender appearing twice in a batch behaves like two consecutive calls
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+        totals = np.zeros(len(unique_rows), dtype=self.dtype)
+        np.add.at(totals, inverse, amounts)
+        return unique_rows, totals
+
+    # ------------------
+    # -- ENTRY POINTS --
+    # ------------------
+    def set_admin(self, sender: str, new_admin: str) -> None:
+        if sender != self.admin:
+            raise FarmModelError(only_admin)
+        self.admin = new_admin
+
+    def initialize(self, sender: str, now: int) -> None:
+        if sender != self.admin:
+            raise FarmModelError(only_admin)
+        if not self.week_duration > 0:
+            raise FarmModelError(week_duration_is_null)
+        if not now < self.creation_time + self.week_duration:
+            raise FarmModelError(no_week_left)
+        if len(self.reward_at_week) != 0 or self.initialized:
+            raise FarmModelError(contract_already_initialized)
+        self.reward_at_week = self._array(compute_new_rewards(self.total_reward, self.total_weeks, self.rate))
+        self.creation_time = now
+        self.initialized = True
+
+    def increase_reward(self, sender: str, added_new_reward: int, now: int) -> None:
+        current_week = self.get_current_week(now)
+        if not self.initialized:
+            raise FarmModelError(contract_not_initialized)
+        if sender != self.admin:
+            raise FarmModelError(only_admin)
+        if not now < self.creation_time + self.total_weeks * self.week_duration:
+            raise FarmModelError(no_week_left)
+        if not added_new_reward > 0:
+            raise FarmModelError(increase_amount_is_null)
+        remaining_weeks = abs(self.total_weeks - current_week) + 1
+        new_list_to_add = [0] * abs(current_week - 1) + compute_new_rewards(added_new_reward, remaining_weeks, self.rate)
+        if len(new_list_to_add) != len(self.reward_at_week):
+            raise FarmModelError(size_dont_match)
+        self.reward_at_week = self.reward_at_week + self._array(new_list_to_add)
+        self.total_reward = self.total_reward + added_new_reward
+
+    def stake(self, senders: Senders, amounts: Amounts, now: int) -> None:
+        """`stake_some` for every (sender, amount) pair, all at time `now`."""
+        senders = _as_list(senders)
+        amounts = self._array(_as_list(amounts, len(senders)))
+        current_week = self.get_current_week(now)
+        endofweek_in_seconds = self.creation_time + current_week * self.week_duration
+        if not self.initialized:
+            raise FarmModelError(contract_not_initialized)
+        if len(amounts) and not np.all(amounts > 0):
+            raise FarmModelError(amount_is_null)
+        if not now < self.creation_time + self.total_weeks * self.week_duration:
+            raise FarmModelError(no_week_left)
+        if not now - endofweek_in_seconds < 0:
+            raise FarmModelError(time_too_early)
+        if len(senders) == 0:
+            return
+
+        first_row = self._rows(senders[:1], create=True)[0]
+        rows, totals = self._aggregate(self._rows(senders, create=True), amounts)
+        new_points_by_weeks = self._new_points_by_weeks(now, totals)
+        if len(self.farm_points) not in (0, self.total_weeks):
+            raise FarmModelError(size_dont_match)
+
+        self._stakes[rows] = np.where(self._has_stake[rows], self._stakes[rows] + totals, totals)
+        self._has_stake[rows] = True
+        self._points[rows] = np.where(self._has_points[rows][:, None], self._points[rows] + new_points_by_weeks, new_points_by_weeks)
+        self._has_points[rows] = True
+
+        if len(self.farm_points) == 0:
+            # The first staker's whole list (older points included) becomes farm_points
+            others = rows != first_row
+            self.farm_points = self._points[first_row] + new_points_by_weeks[others].sum(axis=0)
+        else:
+            self.farm_points = self.farm_points + new_points_by_weeks.sum(axis=0)
+
+    def unstake(self, senders: Senders, amounts: Amounts, now: int) -> None:
+        """`unstake_some` for every (sender, amount) pair, all at time `now`."""
+        senders = _as_list(senders)
+        amounts = self._array(_as_list(amounts, len(senders)))
+        if not self.initialized:
+            raise FarmModelError(contract_not_initialized)
+        if len(senders) == 0:
+            return
+        current_week = self.get_current_week(now)
+        endofweek_in_seconds = self.creation_time + current_week * self.week_duration
+
+        rows, totals = self._aggregate(self._rows(senders), amounts)
+        known = rows < len(self.addresses)
+        if not np.all(known) or not np.all(self._has_stake[rows]):
+            raise FarmModelError(no_stakes)
+        if not np.all(self._stakes[rows] >= totals):
+            raise FarmModelError(unstake_more_than_stake)
+        self._stakes[rows] = np.abs(self._stakes[rows] - totals)
+
+        if now < endofweek_in_seconds:
+            if not np.all(self._has_points[rows]):
+                raise FarmModelError(some_points_should_exist)
+            if len(self.farm_points) != self.total_weeks:
+                raise FarmModelError(size_dont_match)
+            new_points_by_weeks = self._new_points_by_weeks(now, totals)
+            self._points[rows] = np.abs(self._points[rows] - new_points_by_weeks)
+            self.farm_points = np.abs(self.farm_points - new_points_by_weeks.sum(axis=0))
+
+    def claimable(self, senders: Senders, now: int) -> np.ndarray:
+        """What `claim_all` would pay to each sender at `now`, without claiming."""
+        senders = _as_list(senders)
+        rows = self._rows(senders)
+        known = (rows < len(self.addresses))
+        known[known] = self._has_points[rows[known]]
+        rewards = np.zeros(len(senders), dtype=self.dtype)
+        if not np.any(known):
+            return rewards
+        elapsed_weeks = abs(self.get_current_week(now) - 1)
+        claimed_weeks = np.where(self._has_claimed[rows[known]], self._claimed[rows[known]], 0)
+        # Only the weeks after the claimed ones are computed, the others are dropped
+        lengths = (self.total_weeks, len(self.farm_points), len(self.reward_at_week))
+        remaining = np.maximum(min(lengths) - claimed_weeks, 0)
+        if min(lengths) < max(lengths) and np.any((elapsed_weeks > claimed_weeks) & (elapsed_weeks - claimed_weeks >= remaining)):
+            raise FarmModelError(size_dont_match)
+        weeks = min(elapsed_weeks, min(lengths))
+        farm_points = self.farm_points[:weeks]
+        reward_at_week = self.reward_at_week[:weeks]
+        points = self._points[rows[known], :weeks]
+        self._check_mul(points, reward_at_week)
+        divisor = np.where(farm_points == 0, 1, farm_points).astype(self.dtype)
+        per_week = points * reward_at_week[None, :] // divisor[None, :]
+        unclaimed = (farm_points != 0)[None, :] & (np.arange(weeks)[None, :] >= claimed_weeks[:, None])
+        per_week = np.where(unclaimed, per_week, 0).astype(self.dtype)
+        rewards[known] = per_week.sum(axis=1) if weeks else 0
+        return rewards
+
+    def claim_all(self, senders: Senders, now: int) -> np.ndarray:
+        """`claim_all` for every sender at `now`; returns the transferred rewards."""
+        senders = _as_list(senders)
+        if not self.initialized:
+            raise FarmModelError(contract_not_initialized)
+        current_week = self.get_current_week(now)
+        if not current_week > 1:
+            raise FarmModelError(no_claim_first_week)
+        rewards = self.claimable(senders, now)
+        elapsed_weeks = abs(current_week - 1)
+        rows = self._rows(senders)
+        rows = np.unique(rows[rows < len(self.addresses)])
+        # The elapsed weeks are dropped from user_points, whatever the reward
+        rows = rows[self._has_points[rows] & (np.where(self._has_claimed[rows], self._claimed[rows], 0) < elapsed_weeks)]
+        self._claimed[rows] = elapsed_weeks
+        self._has_claimed[rows] = True
+        stakes = np.where(self._has_stake[rows], self._stakes[rows], 0)
+        settled = (stakes == 0) & np.all(self._points[rows, min(elapsed_weeks, self.total_weeks):] == 0, axis=1)
+        self._remove(rows[settled])
+        return rewards
+
+class Staker(NamedTuple):
+    stake: int
+    week: int
+    week_points: int
+    reward_per_point: int
+    unclaimed: int
+
+
+class AccumulatorModel:
+    """State of one farm in accumulator mode, same checks and nat arithmetic as the `*_accumulator` entrypoints."""
+
+    def __init__(self, admin: str, total_reward: int, total_weeks: int, rate: int,
+                 creation_time: int = 0, initialized: bool = False, week_duration: int = week_in_seconds):
+        self.admin = admin
+        self.total_reward = total_reward
+        self.total_weeks = total_weeks
+        self.rate = rate
+        self.creation_time = creation_time
+        self.week_duration = week_duration
+        self.initialized = initialized
+        self.reward_until_week: Dict[int, int] = {}
+        self.total_stake = 0
+        self.last_week = 1
+        self.week_points = 0
+        self.reward_per_point = 0
+        self.reward_per_point_at_week: Dict[int, int] = {}
+        self.stakers: Dict[str, Staker] = {}
+
+    @classmethod
+    def from_rewards(cls, admin: str, reward_at_week: Sequence[int], rate: int, creation_time: int = 0,
+                     week_duration: int = week_in_seconds) -> "AccumulatorModel":
+        """An initialized farm paying `reward_at_week`, like a week mode storage."""
+        model = cls(admin, sum(reward_at_week), len(reward_at_week), rate, creation_time, initialized=True,
+                    week_duration=week_duration)
+        model._add_rewards(1, reward_at_week)
+        return model
+
+    def to_storage(self, base: Optional[dict] = None) -> dict:
+        storage = dict(base) if base is not None else {}
+        storage.update({
+            "admin": self.admin,
+            "creation_time": self.creation_time,
+            "initialized": self.initialized,
+            "rate": self.rate,
+            "total_reward": self.total_reward,
+            "total_weeks": self.total_weeks,
+            "week_duration": self.week_duration,
+            "reward_until_week": dict(self.reward_until_week),
+            "total_stake": self.total_stake,
+            "last_week": self.last_week,
+            "week_points": self.week_points,
+            "reward_per_point": self.reward_per_point,
+            "reward_per_point_at_week": dict(self.reward_per_point_at_week),
+            "stakers": {address: staker._asdict() for address, staker in self.stakers.items()},
+        })
+        return storage
+
+    # -----------------
+    # --  INTERNALS  --
+    # -----------------
+    def get_current_week(self, now: int) -> int:
+        if self.week_duration == 0:
+            raise FarmModelError(div_by_zero)
+        return abs(now - self.creation_time) // self.week_duration + 1
+
+    def _reward_until(self, week: int) -> int:
+        return self.reward_until_week.get(min(week, self.total_weeks), 0)
+
+    def _add_rewards(self, first_week: int, rewards: Sequence[int]) -> None:
+        added = 0
+        for week, reward in enumerate(rewards, start=first_week):
+            added += reward
+            self.reward_until_week[week] = self._reward_until(week) + added
+
+    def _update(self, current_week: int) -> None:
+        if current_week <= self.last_week:
+            return
+        last_week = self.last_week
+        reward_per_point = self.reward_per_point
+        if last_week <= self.total_weeks and self.week_points != 0:
+            reward_of_week = abs(self._reward_until(last_week) - self._reward_until(abs(last_week - 1)))
+            reward_per_point += reward_of_week * reward_precision // self.week_points
+        self.reward_per_point_at_week[last_week] = reward_per_point
+        idle_points = self.total_stake * self.week_duration
+        last_idle_week = abs(current_week - 1)
+        if last_idle_week > last_week and idle_points != 0:
+            idle_reward = abs(self._reward_until(last_idle_week) - self._reward_until(last_week))
+            reward_per_point += idle_reward * reward_precision // idle_points
+        self.last_week = current_week
+        self.week_points = idle_points
+        self.reward_per_point = reward_per_point
+
+    def _settle(self, staker: Staker, current_week: int) -> Staker:
+        if staker.week >= current_week:
+            return staker
+        if staker.week not in self.reward_per_point_at_week:
+            raise FarmModelError(accumulator_not_updated)
+        end_of_week = self.reward_per_point_at_week[staker.week]
+        checkpoint_week_reward = staker.week_points * abs(end_of_week - staker.reward_per_point)
+        next_weeks_reward = staker.stake * self.week_duration * abs(self.reward_per_point - end_of_week)
+        return Staker(staker.stake, current_week, staker.stake * self.week_duration, self.reward_per_point,
+                      staker.unclaimed + checkpoint_week_reward + next_weeks_reward)
+
+    # ------------------
+    # -- ENTRY POINTS --
+    # ------------------
+    def set_admin(self, sender: str, new_admin: str) -> None:
+        if sender != self.admin:
+            raise FarmModelError(only_admin)
+        self.admin = new_admin
+
+    def initialize(self, sender: str, now: int) -> None:
+        if sender != self.admin:
+            raise FarmModelError(only_admin)
+        if not self.week_duration > 0:
+            raise FarmModelError(week_duration_is_null)
+        if not now < self.creation_time + self.week_duration:
+            raise FarmModelError(no_week_left)
+        if self.initialized:
+            raise FarmModelError(contract_already_initialized)
+        self._add_rewards(1, compute_new_rewards(self.total_reward, self.total_weeks, self.rate))
+        self.creation_time = now
+        self.last_week = 1
+        self.initialized = True
+
+    def increase_reward(self, sender: str, added_new_reward: int, now: int) -> None:
+        current_week = self.get_current_week(now)
+        if not self.initialized:
+            raise FarmModelError(contract_not_initialized)
+        if sender != self.admin:
+            raise FarmModelError(only_admin)
+        if not now < self.creation_time + self.total_weeks * self.week_duration:
+            raise FarmModelError(no_week_left)
+        if not added_new_reward > 0:
+            raise FarmModelError(increase_amount_is_null)
+        remaining_weeks = abs(self.total_weeks - current_week) + 1
+        self._add_rewards(current_week, compute_new_rewards(added_new_reward, remaining_weeks, self.rate))
+        self.total_reward += added_new_reward
+
+    def stake(self, sender: str, amount: int, now: int) -> None:
+        current_week = self.get_current_week(now)
+        endofweek_in_seconds = self.creation_time + current_week * self.week_duration
+        if not self.initialized:
+            raise FarmModelError(contract_not_initialized)
+        if not amount > 0:
+            raise FarmModelError(amount_is_null)
+        if not now < self.creation_time + self.total_weeks * self.week_duration:
+            raise FarmModelError(no_week_left)
+        if not now - endofweek_in_seconds < 0:
+            raise FarmModelError(time_too_early)
+        self._update(current_week)
+        staker = self.stakers.get(sender)
+        if staker is None:
+            staker = Staker(0, current_week, 0, self.reward_per_point, 0)
+        else:
+            staker = self._settle(staker, current_week)
+        points_current_week = abs(now - endofweek_in_seconds) * amount
+        self.stakers[sender] = staker._replace(stake=staker.stake + amount, week_points=staker.week_points + points_current_week)
+        self.total_stake += amount
+        self.week_points += points_current_week
+
+    def unstake(self, sender: str, amount: int, now: int) -> None:
+        if not self.initialized:
+            raise FarmModelError(contract_not_initialized)
+        current_week = self.get_current_week(now)
+        endofweek_in_seconds = self.creation_time + current_week * self.week_duration
+        staker = self.stakers.get(sender)
+        if staker is None:
+            raise FarmModelError(no_stakes)
+        if not staker.stake >= amount:
+            raise FarmModelError(unstake_more_than_stake)
+        self._update(current_week)
+        staker = self._settle(staker, current_week)
+        points_current_week = abs(now - endofweek_in_seconds) * amount if now < endofweek_in_seconds else 0
+        self.stakers[sender] = staker._replace(stake=abs(staker.stake - amount),
+                                               week_points=abs(staker.week_points - points_current_week))
+        self.total_stake = abs(self.total_stake - amount)
+        self.week_points = abs(self.week_points - points_current_week)
+
+    def claimable(self, sender: str, now: int) -> int:
+        """What `claim_all` would pay to `sender` at `now`, without claiming."""
+        staker = self.stakers.get(sender)
+        if staker is None:
+            return 0
+        saved = (self.last_week, self.week_points, self.reward_per_point, dict(self.reward_per_point_at_week))
+        current_week = self.get_current_week(now)
+        self._update(current_week)
+        reward = self._settle(staker, current_week).unclaimed // reward_precision
+        self.last_week, self.week_points, self.reward_per_point, self.reward_per_point_at_week = saved
+        return reward
+
+    def claim_all(self, sender: str, now: int) -> int:
+        """`claim_all` for `sender` at `now`; returns the transferred reward."""
+        if not self.initialized:
+            raise FarmModelError(contract_not_initialized)
+        current_week = self.get_current_week(now)
+        if not current_week > 1:
+            raise FarmModelError(no_claim_first_week)
+        staker = self.stakers.get(sender)
+        if staker is None:
+            return 0
+        self._update(current_week)
+        staker = self._settle(staker, current_week)
+        reward = staker.unclaimed // reward_precision
+        self.stakers[sender] = staker._replace(unclaimed=staker.unclaimed % reward_precision)
+        return reward
@@ -0,0 +1,687 @@
+"""Gas and storage benchmark of the farm and database entrypoints and views.
+
+Every benchmark prepares a storage, runs one entrypoint or on-chain view
+through `gas_meter` and records its executed instructions, estimated gas and paid storage delta.
+`gas_baseline.json` holds the reference figures; a run fails when an
+entrypoint consumes more gas or storage than the baseline plus the tolerance:
+
+    python3 gas_benchmark.py [--tolerance 0.02] [-k SUBSTRING]
+    python3 gas_benchmark.py --update       # accept the current figures
+
+Every benchmark is gated: one whose entrypoint is missing from the compiled
+contract, or that has no baseline entry, fails the run until the contract is
+recompiled and the baseline updated.
+
+The comparisons measure the gas of the alternatives an entrypoint was added
+for (e.g. one `claim_farms` against as many `claim_all`). Their figures are
+gated the same way and a run also fails when the alternative they were added
+for is no longer the cheapest.
+"""
+from hashlib import sha256
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import argparse
+import glob
+import json
+import os
+
+from pytezos.crypto.encoding import base58_encode
+
+from contract_cache import load_contract, load_dummy_storage
+from farm_model import compute_new_rewards
+from gas_meter import Metering, lazy_storage, meter_call, meter_origination, meter_view
+from storage_fixture import StorageFixture
+
+admin = 'tz1fABJ97CJMSP2DKrQx2HAFazh6GgahQ7ZK'
+alice = 'tz1hNVs94TTjZh6BZ1PM5HL83A7aiZXkQ8ur'
+bob = 'tz1c6PPijJnZYjKiSQND4pMtGMg6csGeAiiF'
+sec_week = 604800
+
+farm_contract_path = "compiled/farm.tz"
+database_contract_path = "compiled/database.tz"
+multi_pool_contract_path = "compiled/farm_multi.tz"
+baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gas_baseline.json")
+sources_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+# LIGO sources of every compiled contract, a baseline only holds for the sources it was measured on
+contract_sources = {
+    farm_contract_path: [os.path.join("farm", "main.mligo"), os.path.join("farm", "partials", "*.mligo")],
+    database_contract_path: [os.path.join("database", "main.mligo")],
+    multi_pool_contract_path: [os.path.join("farm", "multi_pool.mligo"), os.path.join("farm", "partials", "*.mligo")],
+}
+default_tolerance = float(os.environ.get("GAS_TOLERANCE", "0.02"))
+
+farm_storage = load_dummy_storage(farm_contract_path)
+farm_storage["admin"] = admin
+farm_storage["input_token_address"] = "KT1XtQeSap9wvJGY1Lmek84NU6PK6cjzC9Qd"
+farm_storage["reward_token_address"] = "KT1TwzD6zV3WeJ39ukuqxcfK2fJCnhvrdN1X"
+farm_storage["reward_reserve_address"] = admin
+farm_storage["total_reward"] = 20_000_000
+farm_storage["total_weeks"] = 5
+farm_storage["rate"] = 7500
+farm_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
+farm_storage["user_stakes"] = {}
+farm_storage["user_points"] = {}
+farm_storage["farm_points"] = []
+farm_storage["creation_time"] = 0
+farm_storage["initialized"] = True
+farm_storage["input_fa2_token_id_opt"] = None
+farm_storage["reward_fa2_token_id_opt"] = None
+farm_storage["week_duration"] = sec_week
+farm_fixture = StorageFixture(farm_storage)
+
+database_storage = load_dummy_storage(database_contract_path)
+database_storage["admin"] = admin
+database_storage["all_farms"] = []
+database_storage["all_farms_data"] = {}
+database_storage["inverse_farms"] = {}
+database_storage["farms_by_index"] = {}
+database_storage["farm_index"] = {}
+database_fixture = StorageFixture(database_storage)
+
+farm_lp_info = "pair colibri-pouet"
+lp_address = "KT1XtQeSap9wvJGY1Lmek84NU6PK6cjzC9Qd"
+farm_addresses = ["KT1TwzD6zV3WeJ39ukuqxcfK2fJCnhvrdN1X", "KT1BEqzn5Wx8uJrZNvuS9DVHmLvG9td3fDLi"]
+database_address = "KT1DSXeqEMmYwnL43beEucR1y4EjWYTo7HiA"
+
+
+class Benchmark(NamedTuple):
+    contract_path: str
+    entrypoint: str
+    # contract -> (call, storage, interpret keyword arguments)
+    prepare: Callable
+
+
+benchmarks: Dict[str, Benchmark] = {}
+
+
+def benchmark(contract_path: str, entrypoint: str):
+    """Registers `prepare(contract)` under `<contract name>/<function name>`."""
+    def register(prepare: Callable) -> Callable:
+        contract_name = os.path.splitext(os.path.basename(contract_path))[0]
+        benchmarks[f"{contract_name}/{prepare.__name__}"] = Benchmark(contract_path, entrypoint, prepare)
+        return prepare
+    return register
+
+
+class Comparison(NamedTuple):
+    # (contract path, entrypoint) the alternatives call
+    requires: Sequence[Tuple[str, str]]
+    # () -> {alternative: gas}
+    measure: Callable
+    # Alternative that must stay the cheapest, None to only gate the figures
+    cheapest: Optional[str]
+
+
+comparisons: Dict[str, Comparison] = {}
+
+
+def comparison(*requires: Tuple[str, str], cheapest: Optional[str] = None):
+    """Registers `measure()` under its function name."""
+    def register(measure: Callable) -> Callable:
+        comparisons[measure.__name__] = Comparison(requires, measure, cheapest)
+        return measure
+    return register
+
+
+def _run(contract, storage, steps):
+    """Applies `(entrypoint, argument, sender, now)` steps with the interpreter."""
+    for entrypoint, argument, sender, now in steps:
+        call = getattr(contract, entrypoint)() if argument is None else getattr(contract, entrypoint)(argument)
+        storage = call.interpret(storage=storage, sender=sender, now=now).storage
+    return storage
+
+
+def _weeks_farm(total_weeks: int):
+    reward_at_week = compute_new_rewards(farm_storage["total_reward"], total_weeks, farm_storage["rate"])
+    return farm_fixture.overlay(total_weeks=total_weeks, reward_at_week=reward_at_week)
+
+
+##########
+# Farm #
+##########
+
+@benchmark(farm_contract_path, "set_admin")
+def set_admin(farm):
+    return farm.set_admin(alice), farm_fixture.overlay(), dict(sender=admin)
+
+@benchmark(farm_contract_path, "initialize")
+def initialize(farm):
+    return farm.initialize(), farm_fixture.overlay(initialized=False, reward_at_week=[]), dict(sender=admin, now=0)
+
+@benchmark(farm_contract_path, "initialize")
+def initialize_20_weeks(farm):
+    storage = farm_fixture.overlay(total_weeks=20, initialized=False, reward_at_week=[])
+    return farm.initialize(), storage, dict(sender=admin, now=0)
+
+@benchmark(farm_contract_path, "increase_reward")
+def increase_reward(farm):
+    return farm.increase_reward(10_000_000), farm_fixture.overlay(), dict(sender=admin, now=int(sec_week * 1.5))
+
+@benchmark(farm_contract_path, "stake")
+def stake_first_staker(farm):
+    return farm.stake(500), farm_fixture.overlay(), dict(sender=alice, now=int(sec_week / 2))
+
+@benchmark(farm_contract_path, "stake")
+def stake_second_staker(farm):
+    storage = _run(farm, farm_fixture.overlay(), [("stake", 500, alice, int(sec_week / 2))])
+    return farm.stake(300), storage, dict(sender=bob, now=int(sec_week * 1.5))
+
+@benchmark(farm_contract_path, "stake")
+def stake_again(farm):
+    storage = _run(farm, farm_fixture.overlay(), [("stake", 500, alice, int(sec_week / 2))])
+    return farm.stake(300), storage, dict(sender=alice, now=int(sec_week * 1.5))
+
+@benchmark(farm_contract_path, "stake")
+def stake_52_weeks(farm):
+    storage = _run(farm, _weeks_farm(52), [("stake", 500, alice, int(sec_week / 2))])
+    return farm.stake(300), storage, dict(sender=bob, now=int(sec_week * 1.5))
+
+@benchmark(farm_contract_path, "stake")
+def stake_after_claim_52_weeks(farm):
+    # The 39 claimed weeks are no longer in the user list
+    storage = _run(farm, _weeks_farm(52), [("stake", 500, alice, int(sec_week / 2)),
+                                           ("claim_all", None, alice, sec_week * 39 + 1)])
+    return farm.stake(300), storage, dict(sender=alice, now=sec_week * 39 + 2)
+
+@benchmark(farm_contract_path, "unstake")
+def unstake_partial(farm):
+    storage = _run(farm, farm_fixture.overlay(), [("stake", 500, alice, int(sec_week / 2))])
+    return farm.unstake(200), storage, dict(sender=alice, now=int(sec_week * 1.5))
+
+@benchmark(farm_contract_path, "unstake")
+def unstake_everything(farm):
+    storage = _run(farm, farm_fixture.overlay(), [("stake", 500, alice, int(sec_week / 2))])
+    return farm.unstake(500), storage, dict(sender=alice, now=int(sec_week * 1.5))
+
+@benchmark(farm_contract_path, "claim_all")
+def claim_all_one_week(farm):
+    storage = _run(farm, farm_fixture.overlay(), [("stake", 500, alice, int(sec_week / 2))])
+    return farm.claim_all(), storage, dict(sender=alice, now=int(sec_week * 1.5))
+
+@benchmark(farm_contract_path, "claim_all")
+def claim_all_after_pool_end(farm):
+    storage = _run(farm, farm_fixture.overlay(), [("stake", 500, alice, int(sec_week / 2)),
+                                                  ("stake", 300, bob, int(sec_week * 2.5))])
+    return farm.claim_all(), storage, dict(sender=alice, now=sec_week * 10)
+
+@benchmark(farm_contract_path, "claim_all")
+def claim_all_52_weeks(farm):
+    storage = _run(farm, _weeks_farm(52), [("stake", 500, alice, int(sec_week / 2)),
+                                           ("stake", 300, bob, int(sec_week * 2.5))])
+    return farm.claim_all(), storage, dict(sender=alice, now=sec_week * 60)
+
+@benchmark(farm_contract_path, "claim_all")
+def claim_all_settled_staker(farm):
+    # alice unstaked everything: her last claim removes her entries
+    storage = _run(farm, farm_fixture.overlay(), [("stake", 500, alice, int(sec_week / 2)),
+                                                  ("stake", 300, bob, int(sec_week / 2)),
+                                                  ("unstake", 500, alice, int(sec_week * 1.5))])
+    return farm.claim_all(), storage, dict(sender=alice, now=sec_week * 10)
+
+@benchmark(farm_contract_path, "exit")
+def exit_third_week(farm):
+    storage = _run(farm, farm_fixture.overlay(), [("stake", 500, alice, int(sec_week / 2)),
+                                                  ("stake", 300, bob, int(sec_week / 2))])
+    return farm.exit(), storage, dict(sender=alice, now=int(sec_week * 2.5))
+
+@benchmark(farm_contract_path, "claim_for")
+def claim_for_third_week(farm):
+    # Internal call of the database `claim_farms`
+    storage = _run(farm, farm_fixture.overlay(), [("stake", 500, alice, int(sec_week / 2))])
+    return farm.claim_for(alice), storage, dict(sender=database_address, now=int(sec_week * 2.5))
+
+@benchmark(farm_contract_path, "compound")
+def compound_third_week(farm):
+    # A farm rewarding its input token
+    storage = farm_fixture.overlay(reward_token_address=farm_storage["input_token_address"])
+    storage = _run(farm, storage, [("stake", 500, alice, int(sec_week / 2)),
+                                   ("stake", 300, bob, int(sec_week / 2))])
+    return farm.compound(), storage, dict(sender=alice, now=int(sec_week * 2.5))
+
+##############
+# Database #
+##############
+
+@benchmark(database_contract_path, "add_farm")
+def add_farm_new_lp(database):
+    parameter = dict(farm_address=farm_addresses[0], lp_address=lp_address, farm_lp_info=farm_lp_info)
+    return database.add_farm(parameter), database_fixture.overlay(), dict(sender=admin)
+
+@benchmark(database_contract_path, "add_farm")
+def add_farm_known_lp(database):
+    storage = database_fixture.overlay()
+    storage["all_farms"] = [farm_addresses[0]]
+    storage["all_farms_data"][farm_addresses[0]] = dict(lp_address=lp_address, farm_lp_info=farm_lp_info)
+    storage["inverse_farms"][lp_address] = {farm_addresses[0]: farm_lp_info}
+    storage["farms_by_index"][0], storage["farm_index"][farm_addresses[0]] = farm_addresses[0], 0
+    parameter = dict(farm_address=farm_addresses[1], lp_address=lp_address, farm_lp_info=farm_lp_info)
+    return database.add_farm(parameter), storage, dict(sender=admin)
+
+@benchmark(database_contract_path, "remove_farm")
+def remove_farm(database):
+    storage = database_fixture.overlay()
+    storage["all_farms"] = [farm_addresses[0]]
+    storage["all_farms_data"][farm_addresses[0]] = dict(lp_address=lp_address, farm_lp_info=farm_lp_info)
+    storage["inverse_farms"][lp_address] = {farm_addresses[0]: farm_lp_info}
+    storage["farms_by_index"][0], storage["farm_index"][farm_addresses[0]] = farm_addresses[0], 0
+    parameter = dict(farm_address=farm_addresses[0], lp_address=lp_address)
+    return database.remove_farm(parameter), storage, dict(sender=admin)
+
+def _registered_farms(farms_count: int):
+    addresses = [base58_encode(sha256(f"farm {i}".encode()).digest()[:20], b"KT1").decode() for i in range(farms_count)]
+    storage = database_fixture.overlay()
+    storage["all_farms"] = addresses
+    for address in addresses:
+        storage["all_farms_data"][address] = dict(lp_address=lp_address, farm_lp_info=farm_lp_info)
+    storage["inverse_farms"][lp_address] = {address: farm_lp_info for address in addresses}
+    storage["farms_by_index"] = dict(enumerate(addresses))
+    storage["farm_index"] = {address: index for index, address in enumerate(addresses)}
+    return addresses, storage
+
+@benchmark(database_contract_path, "claim_farms")
+def claim_farms_3_farms(database):
+    addresses, storage = _registered_farms(3)
+    return database.claim_farms(addresses), storage, dict(sender=alice, self_address=database_address)
+
+def _lazy_registered_farms(database, farms_count: int):
+    """`_registered_farms` with its big_maps given by id, as the views read them on chain."""
+    addresses, storage = _registered_farms(farms_count)
+    storage, big_maps = lazy_storage(database.context.storage_expr, storage,
+                                     ["all_farms_data", "inverse_farms", "farms_by_index", "farm_index"])
+    return addresses, storage, big_maps
+
+@benchmark(database_contract_path, "get_farm")
+def get_farm_3000_farms(database):
+    addresses, storage, big_maps = _lazy_registered_farms(database, 3000)
+    return database.get_farm(addresses[7]), storage, dict(big_maps=big_maps)
+
+@benchmark(database_contract_path, "list_farms")
+def list_farms_first_100_of_3000(database):
+    _, storage, big_maps = _lazy_registered_farms(database, 3000)
+    return database.list_farms(dict(offset=0, limit=100)), storage, dict(big_maps=big_maps)
+
+@benchmark(database_contract_path, "list_farms")
+def list_farms_last_100_of_3000(database):
+    # Costs the same as the first page: only the farms of the page are read
+    _, storage, big_maps = _lazy_registered_farms(database, 3000)
+    return database.list_farms(dict(offset=2900, limit=100)), storage, dict(big_maps=big_maps)
+
+@benchmark(database_contract_path, "get_farms_by_lp")
+def get_farms_by_lp_20_of_3000(database):
+    _, storage, big_maps = _lazy_registered_farms(database, 3000)
+    return database.get_farms_by_lp(dict(lp_address=lp_address, offset=100, limit=20)), storage, dict(big_maps=big_maps)
+
+
+#################
+# Batch claim #
+#################
+
+def batch_claim(farms_count: int) -> Tuple[int, int]:
+    """Gas of one `claim_farms` over `farms_count` farms and of as many separate `claim_all`.
+
+    The batch pays the database call and one internal `claim_for` per farm,
+    which do not pay the manager operation cost of a separate operation.
+    """
+    farm, database = load_contract(farm_contract_path), load_contract(database_contract_path)
+    now = int(sec_week * 2.5)
+    farm_storage = _run(farm, farm_fixture.overlay(), [("stake", 500, alice, int(sec_week / 2))])
+    addresses, storage = _registered_farms(farms_count)
+
+    separate_gas = 0
+    for address in addresses:
+        _, metering = meter_call(farm.claim_all(), farm_storage, sender=alice, now=now, self_address=address)
+        separate_gas += metering.gas
+
+    res, metering = meter_call(database.claim_farms(addresses), storage, sender=alice, now=now, self_address=database_address)
+    batch_gas = metering.gas
+    for operation in res.operations:
+        user = operation["parameters"]["value"]["string"]
+        _, metering = meter_call(farm.claim_for(user), farm_storage, sender=database_address, now=now,
+                                 self_address=operation["destination"], internal=True)
+        batch_gas += metering.gas
+    return batch_gas, separate_gas
+
+
+@comparison((farm_contract_path, "claim_for"), (database_contract_path, "claim_farms"), cheapest="claim_farms")
+def batch_claim_10_farms():
+    batch_gas, separate_gas = batch_claim(10)
+    return {"claim_farms": batch_gas, "claim_all": separate_gas}
+
+
+##########
+# Exit #
+##########
+
+def exit_farm(now: int) -> Tuple[Metering, Metering]:
+    """Metering of `exit` and of the `claim_all` then `unstake` of the whole stake it replaces, summed.
+
+    Both leave the user the points of the elapsed part of the current week,
+    the separate calls also keep a null stake entry that `exit` removes.
+    """
+    farm = load_contract(farm_contract_path)
+    storage = _run(farm, farm_fixture.overlay(), [("stake", 500, alice, int(sec_week / 2)),
+                                                  ("stake", 300, bob, int(sec_week / 2))])
+    _, exit_metering = meter_call(farm.exit(), storage, sender=alice, now=now)
+    res, claim = meter_call(farm.claim_all(), storage, sender=alice, now=now)
+    _, unstake = meter_call(farm.unstake(500), res.storage, sender=alice, now=now)
+    separate = Metering("claim_all+unstake", claim.steps + unstake.steps, claim.gas + unstake.gas, unstake.storage_size,
+                        claim.storage_delta + unstake.storage_delta, claim.instructions + unstake.instructions)
+    return exit_metering, separate
+
+
+@comparison((farm_contract_path, "exit"), (farm_contract_path, "claim_all"), (farm_contract_path, "unstake"), cheapest="exit")
+def exit_third_week_against_claim_and_unstake():
+    exit_metering, separate = exit_farm(int(sec_week * 2.5))
+    return {"exit": exit_metering.gas, "claim_all+unstake": separate.gas}
+
+
+###################
+# Period length #
+###################
+
+def period_length(duration: int, week_durations: Sequence[int]) -> Dict[int, Dict[str, int]]:
+    """Gas of `stake`, `unstake` and `claim_all` by week length, on farms lasting `duration` seconds.
+
+    The week lists of the farm hold one entry per week: the longer the
+    week, the fewer entries `stake`, `unstake` and `claim_all` walk.
+    """
+    farm = load_contract(farm_contract_path)
+    gas = {}
+    for week_duration in week_durations:
+        total_weeks = duration // week_duration
+        reward_at_week = compute_new_rewards(farm_storage["total_reward"], total_weeks, farm_storage["rate"])
+        storage = farm_fixture.overlay(total_weeks=total_weeks, week_duration=week_duration, reward_at_week=reward_at_week)
+        storage = _run(farm, storage, [("stake", 500, alice, week_duration // 2)])
+        calls = {
+            "stake": (farm.stake(300), bob, int(week_duration * 1.5)),
+            "unstake": (farm.unstake(200), alice, int(week_duration * 1.5)),
+            "claim_all": (farm.claim_all(), alice, duration + 1),
+        }
+        gas[week_duration] = {entrypoint: meter_call(call, storage, sender=sender, now=now)[1].gas
+                              for entrypoint, (call, sender, now) in calls.items()}
+    return gas
+
+
+@comparison((farm_contract_path, "stake"), (farm_contract_path, "unstake"), (farm_contract_path, "claim_all"), cheapest="4 weeks")
+def period_length_one_year():
+    gas = period_length(52 * sec_week, [sec_week, 4 * sec_week])
+    return {"1 week": sum(gas[sec_week].values()), "4 weeks": sum(gas[4 * sec_week].values())}
+
+
+################
+# Multi pool #
+################
+
+class PoolsCost(NamedTuple):
+    # Launch of the pools: originations and calls
+    gas: int
+    storage: int
+    # Stake in the last launched pool
+    stake_gas: int
+
+
+def _pool_config() -> dict:
+    fields = ["input_token_address", "input_fa2_token_id_opt", "reward_token_address", "reward_fa2_token_id_opt",
+              "reward_reserve_address", "rate", "total_reward", "total_weeks"]
+    return dict({field: farm_storage[field] for field in fields}, week_duration=sec_week)
+
+
+def separate_farms(pools_count: int) -> PoolsCost:
+    """Launch of `pools_count` farms: one origination, `initialize` and database `add_farm` each."""
+    farm, database = load_contract(farm_contract_path), load_contract(database_contract_path)
+    uninitialized = farm_fixture.overlay(initialized=False, reward_at_week=[])
+    addresses, _ = _registered_farms(pools_count)
+    storage = database_fixture.overlay()
+    gas, size = 0, 0
+    for address in addresses:
+        origination = meter_origination(farm, uninitialized)
+        res, initialize = meter_call(farm.initialize(), uninitialized, sender=admin, now=0, self_address=address)
+        initialized = res.storage
+        parameter = dict(farm_address=address, lp_address=lp_address, farm_lp_info=farm_lp_info)
+        res, add_farm = meter_call(database.add_farm(parameter), storage, sender=admin, self_address=database_address)
+        storage = res.storage
+        gas += origination.gas + initialize.gas + add_farm.gas
+        size += origination.storage_delta + initialize.storage_delta + add_farm.storage_delta
+    _, stake = meter_call(farm.stake(300), initialized, sender=alice, now=sec_week // 2, self_address=addresses[-1])
+    return PoolsCost(gas, size, stake.gas)
+
+
+def multi_pool(pools_count: int) -> PoolsCost:
+    """Launch of `pools_count` pools: one multi-pool farm origination and `add_farm`, then `add_pool` in the farm and in the database."""
+    farm, database = load_contract(multi_pool_contract_path), load_contract(database_contract_path)
+    farm_address = farm_addresses[0]
+    storage = dict(load_dummy_storage(multi_pool_contract_path), admin=admin)
+    origination = meter_origination(farm, storage)
+    # The farm is registered once, then each of its pools
+    parameter = dict(farm_address=farm_address, lp_address=lp_address, farm_lp_info=farm_lp_info)
+    res, add_farm = meter_call(database.add_farm(parameter), database_fixture.overlay(), sender=admin, self_address=database_address)
+    index = res.storage
+    gas, size = origination.gas + add_farm.gas, origination.storage_delta + add_farm.storage_delta
+    for pool_id in range(pools_count):
+        res, add_pool = meter_call(farm.add_pool(_pool_config()), storage, sender=admin, now=0, self_address=farm_address)
+        storage = res.storage
+        parameter = dict(farm_address=farm_address, pool_id=pool_id, lp_address=lp_address, farm_lp_info=farm_lp_info)
+        res, add_pool_entry = meter_call(database.add_pool(parameter), index, sender=admin, self_address=database_address)
+        index = res.storage
+        gas += add_pool.gas + add_pool_entry.gas
+        size += add_pool.storage_delta + add_pool_entry.storage_delta
+    _, stake = meter_call(farm.stake(dict(pool_id=pools_count - 1, amount=300)), storage, sender=alice, now=sec_week // 2,
+                          self_address=farm_address)
+    return PoolsCost(gas, size, stake.gas)
+
+
+def _pools_gas(pools_count: int) -> Dict[str, int]:
+    return {"farms": separate_farms(pools_count).gas, "multi_pool": multi_pool(pools_count).gas}
+
+pools_requires = [(farm_contract_path, "initialize"), (database_contract_path, "add_farm"),
+                  (multi_pool_contract_path, "add_pool"), (database_contract_path, "add_pool")]
+
+@comparison(*pools_requires)
+def pools_1():
+    return _pools_gas(1)
+
+@comparison(*pools_requires, cheapest="multi_pool")
+def pools_10():
+    return _pools_gas(10)
+
+@comparison(*pools_requires, cheapest="multi_pool")
+def pools_100():
+    return _pools_gas(100)
+
+
+# -----------------
+# --  RUNNER  --
+# -----------------
+
+def contract_digest(contract_path: str) -> str:
+    with open(contract_path, "rb") as f:
+        return sha256(f.read()).hexdigest()
+
+
+def sources_digest(compiled_path: str) -> str:
+    """Digest of the LIGO sources `compiled_path` is compiled from."""
+    digest = sha256()
+    for pattern in contract_sources[compiled_path]:
+        for path in sorted(glob.glob(os.path.join(sources_root, pattern))):
+            digest.update(os.path.relpath(path, sources_root).encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def run_benchmarks(keyword: str = "", contracts: Optional[Dict[str, str]] = None) -> Tuple[Dict[str, Metering], List[str]]:
+    """Returns the metering of every available benchmark and the names of the skipped ones.
+
+    `contracts` runs the benchmarks of a contract path on another compiled
+    contract with the same storage fields, e.g. `{farm_contract_path: "farm_comb.tz"}`.
+    """
+    results, skipped = {}, []
+    for name, (contract_path, entrypoint, prepare) in benchmarks.items():
+        if keyword not in name:
+            continue
+        contract = load_contract((contracts or {}).get(contract_path, contract_path))
+        if entrypoint not in contract.entrypoints and entrypoint not in contract.views:
+            skipped.append(name)
+            continue
+        call, storage, kwargs = prepare(contract)
+        # On-chain views are metered as run by the VIEW instruction of another contract
+        meter = meter_view if entrypoint in contract.views else meter_call
+        _, results[name] = meter(call, storage, **kwargs)
+    return results, skipped
+
+
+def run_comparisons(keyword: str = "") -> Tuple[Dict[str, Dict[str, int]], List[str]]:
+    """Returns the gas of the alternatives of every available comparison and the names of the skipped ones."""
+    results, skipped = {}, []
+    for name, (requires, measure, _) in comparisons.items():
+        if keyword not in name:
+            continue
+        if any(entrypoint not in load_contract(contract_path).entrypoints for contract_path, entrypoint in requires):
+            skipped.append(name)
+            continue
+        results[name] = measure()
+    return results, skipped
+
+
+def load_baseline(path: str = baseline_path) -> dict:
+    if not os.path.exists(path):
+        return {"contracts": {}, "sources": {}, "benchmarks": {}, "comparisons": {}}
+    with open(path) as f:
+        baseline = json.load(f)
+    baseline.setdefault("sources", {})
+    baseline.setdefault("comparisons", {})
+    return baseline
+
+
+def save_baseline(results: Dict[str, Metering], path: str = baseline_path,
+                  compared: Optional[Dict[str, Dict[str, int]]] = None) -> None:
+    """Merges `results` and the `compared` alternatives into the baseline at `path`."""
+    baseline = load_baseline(path)
+    contract_paths = set()
+    for name, metering in results.items():
+        baseline["benchmarks"][name] = dict(entrypoint=metering.entrypoint, **metering.as_dict())
+        contract_paths.add(benchmarks[name].contract_path)
+    for name, gas in (compared or {}).items():
+        baseline["comparisons"][name] = gas
+        contract_paths.update(contract_path for contract_path, _ in comparisons[name].requires)
+    for contract_path in contract_paths:
+        baseline["contracts"][contract_path] = contract_digest(contract_path)
+        baseline["sources"][contract_path] = sources_digest(contract_path)
+    baseline["benchmarks"] = dict(sorted(baseline["benchmarks"].items()))
+    baseline["comparisons"] = dict(sorted(baseline["comparisons"].items()))
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+
+
+def stale_contracts(baseline: dict) -> List[str]:
+    """Describes every contract whose LIGO sources changed since `baseline` was measured.
+
+    A commit changing a contract recompiles it and updates the baseline, its
+    figures are meaningless for other sources whatever they say.
+    """
+    contract_paths = {benchmark.contract_path for benchmark in benchmarks.values()}
+    contract_paths.update(contract_path for compared in comparisons.values() for contract_path, _ in compared.requires)
+    return [f"{path}: sources changed since the baseline, recompile it and run `gas_benchmark.py --update`"
+            for path in sorted(contract_paths)
+            if baseline["sources"].get(path) != sources_digest(path)]
+
+
+def regressions(results: Dict[str, Metering], baseline: dict, tolerance: float = default_tolerance) -> List[str]:
+    """Describes every benchmark costing more gas or storage than `baseline` allows or missing from it."""
+    failures = []
+    for name, metering in results.items():
+        reference = baseline["benchmarks"].get(name)
+        if reference is None:
+            failures.append(f"{name}: no baseline entry, run `gas_benchmark.py --update`")
+            continue
+        for metric in ("gas", "storage_delta"):
+            allowed = reference[metric] + tolerance * abs(reference[metric])
+            if getattr(metering, metric) > allowed:
+                failures.append(f"{name}: {metric} {getattr(metering, metric)} > {reference[metric]} (+{tolerance:.0%})")
+    return failures
+
+
+def comparison_failures(compared: Dict[str, Dict[str, int]], baseline: dict, tolerance: float = default_tolerance) -> List[str]:
+    """Describes every comparison missing from `baseline`, costing more gas than it allows or whose cheapest alternative changed."""
+    failures = []
+    for name, gas in compared.items():
+        reference = baseline["comparisons"].get(name)
+        if reference is None:
+            failures.append(f"{name}: no baseline entry, run `gas_benchmark.py --update`")
+            continue
+        for alternative, value in gas.items():
+            allowed = reference.get(alternative, 0) + tolerance * abs(reference.get(alternative, 0))
+            if value > allowed:
+                failures.append(f"{name}: {alternative} gas {value} > {reference.get(alternative, '-')} (+{tolerance:.0%})")
+        cheapest = comparisons[name].cheapest
+        if cheapest is not None and min(gas, key=gas.get) != cheapest:
+            failures.append(f"{name}: {cheapest} is no longer the cheapest ({gas})")
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the gas and storage of the farm and database entrypoints")
+    parser.add_argument("-k", "--keyword", default="", help="only run benchmarks whose name contains this substring")
+    parser.add_argument("--tolerance", type=float, default=default_tolerance, help="accepted relative increase (default: %(default)s)")
+    parser.add_argument("--baseline", default=baseline_path)
+    parser.add_argument("--update", action="store_true", help="write the current figures to the baseline")
+    parser.add_argument("--batch-claim", type=int, metavar="FARMS", help="also compare one claim_farms over FARMS farms with separate claims")
+    parser.add_argument("--pools", type=int, nargs="+", metavar="POOLS",
+                        help="also compare launching POOLS separate farms with as many pools of the multi-pool farm")
+    parser.add_argument("--exit", action="store_true", help="also compare exit with claim_all then unstake of the whole stake")
+    parser.add_argument("--periods", type=int, nargs="+", metavar="WEEKS",
+                        help="also compare a one-year farm cut in periods of WEEKS calendar weeks")
+    args = parser.parse_args()
+
+    results, skipped = run_benchmarks(args.keyword)
+    baseline = load_baseline(args.baseline)
+    print(f"{'benchmark':<32} {'steps':>7} {'gas':>7} {'baseline':>9} {'storage':>8} {'delta':>7}")
+    for name, metering in results.items():
+        reference = baseline["benchmarks"].get(name, {}).get("gas", "-")
+        print(f"{name:<32} {metering.steps:>7} {metering.gas:>7} {reference:>9} {metering.storage_size:>8} {metering.storage_delta:>7}")
+    for name in skipped:
+        print(f"{name:<32} skipped: `{benchmarks[name].entrypoint}` is not an entrypoint of {benchmarks[name].contract_path}")
+    compared, skipped_comparisons = run_comparisons(args.keyword)
+    if compared or skipped_comparisons:
+        print(f"\n{'comparison':<32} {'alternative':<24} {'gas':>9} {'baseline':>9}")
+    for name, gas in compared.items():
+        for alternative, value in gas.items():
+            reference = baseline["comparisons"].get(name, {}).get(alternative, "-")
+            print(f"{name:<32} {alternative:<24} {value:>9} {reference:>9}")
+    for name in skipped_comparisons:
+        print(f"{name:<32} skipped: the compiled contracts lack one of {[entrypoint for _, entrypoint in comparisons[name].requires]}")
+    if args.batch_claim:
+        batch_gas, separate_gas = batch_claim(args.batch_claim)
+        print(f"\nclaim_farms over {args.batch_claim} farms: {batch_gas} gas, {args.batch_claim} x claim_all: {separate_gas} gas")
+    if args.pools:
+        print(f"\n{'pools':>6} {'farms gas':>10} {'storage':>8} {'stake':>6} {'multi gas':>10} {'storage':>8} {'stake':>6}")
+        for pools_count in args.pools:
+            farms, pools = separate_farms(pools_count), multi_pool(pools_count)
+            print(f"{pools_count:>6} {farms.gas:>10} {farms.storage:>8} {farms.stake_gas:>6} {pools.gas:>10} {pools.storage:>8} {pools.stake_gas:>6}")
+    if args.exit:
+        print(f"\n{'week':<6} {'exit gas':>9} {'delta':>7} {'claim_all+unstake gas':>22} {'delta':>7}")
+        for week in [3, 10]:
+            exit_metering, separate = exit_farm(int(sec_week * (week - 0.5)))
+            print(f"{week:<6} {exit_metering.gas:>9} {exit_metering.storage_delta:>7} {separate.gas:>22} {separate.storage_delta:>7}")
+    if args.periods:
+        gas = period_length(52 * sec_week, [weeks * sec_week for weeks in args.periods])
+        print(f"\n{'period':<10} {'stake':>7} {'unstake':>8} {'claim_all':>10}")
+        for weeks in args.periods:
+            costs = gas[weeks * sec_week]
+            print(f"{f'{weeks} week(s)':<10} {costs['stake']:>7} {costs['unstake']:>8} {costs['claim_all']:>10}")
+
+    if args.update:
+        save_baseline(results, args.baseline, compared)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    stale = stale_contracts(baseline)
+    for contract in stale:
+        print(f"STALE BASELINE: {contract}")
+    failures = regressions(results, baseline, args.tolerance) + comparison_failures(compared, baseline, args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    return 1 if stale or failures or skipped or skipped_comparisons else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
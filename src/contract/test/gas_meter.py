@@ -0,0 +1,441 @@
+"""Approximate gas and storage metering for the pytezos interpreter.
+
+The pytezos interpreter does not consume gas, so `meter_call` runs a contract
+call exactly like `ContractCall.interpret` while recording every executed
+instruction with the stack items it consumed and produced. Gas is then derived
+from a cost table that follows the shape of the protocol cost model
+(constant base per instruction, operand-size terms for arithmetic and
+comparisons, storage accesses for big_maps and contract lookups, decoding and
+encoding of the script and storage). It is not the node's exact gas schedule:
+use it to compare entrypoints and contract versions with each other, and
+confirm absolute figures with a dry-run on a node.
+
+Storage sizes follow the protocol accounting: bytes of the Micheline storage
+with big_maps replaced by their id, plus key, value and 65 bytes per big_map
+entry.
+
+Big_maps can also be passed by id, with their values in a local
+`{id: {key hash: Micheline value}}` dict: like on chain, only the keys the
+call reads are then loaded, which keeps calls on storages of 100k stakers
+cheap to interpret. `lazy_call` runs such a call without metering and
+returns the entries it wrote.
+"""
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from pytezos.context.impl import ExecutionContext
+from pytezos.contract.interface import ContractInterface
+from pytezos.contract.call import ContractCall
+from pytezos.contract.result import ContractCallResult
+from pytezos.contract.view import ContractViewCall
+from pytezos.michelson.forge import forge_micheline, forge_script_expr
+from pytezos.michelson.program import MichelsonProgram
+from pytezos.michelson.sections import StorageSection
+from pytezos.michelson.stack import MichelsonStack
+from pytezos.michelson.types import (MichelsonType, BigMapType, IntType, ListType, MapType, OptionType, OrType, PairType,
+                                     SetType, StringType, BytesType)
+
+# Hard limit of gas per operation (protocol constant `hard_gas_limit_per_operation`)
+hard_gas_limit_per_operation = 1_040_000
+# Bytes paid for each new big_map key on top of its key and value
+big_map_entry_overhead = 65
+# Bytes paid by an originated contract on top of its script and storage
+origination_size = 257
+
+# Milligas costs
+manager_operation_cost = 1_000_000
+decoding_cost_per_byte = 20
+encoding_cost_per_byte = 20
+storage_access_cost = 80_000
+storage_cost_per_byte = 10
+default_instruction_cost = 10
+# prim -> (base, per operand byte)
+instruction_costs: Dict[str, Tuple[int, int]] = {
+    "ABS": (20, 1),
+    "ADD": (35, 1),
+    "SUB": (35, 1),
+    "NEG": (25, 1),
+    "INT": (10, 1),
+    "ISNAT": (10, 1),
+    "MUL": (55, 4),
+    "EDIV": (80, 10),
+    "COMPARE": (35, 1),
+    "EQ": (10, 0),
+    "NEQ": (10, 0),
+    "LT": (10, 0),
+    "GT": (10, 0),
+    "LE": (10, 0),
+    "GE": (10, 0),
+    "CONCAT": (30, 1),
+    "GET": (45, 1),
+    "MEM": (45, 1),
+    "UPDATE": (55, 1),
+    "GET_AND_UPDATE": (55, 1),
+    "SIZE": (10, 0),
+    "ITER": (20, 0),
+    "MAP": (20, 0),
+    "CONTRACT": (30, 0),
+    "TRANSFER_TOKENS": (60, 0),
+    "FAILWITH": (0, 0),
+}
+# Instructions that read or write the context storage when applied on a big_map
+big_map_instructions = {"GET", "MEM", "UPDATE", "GET_AND_UPDATE"}
+# Pseudo instructions printed by the interpreter that are accounted separately
+pseudo_instructions = {"BEGIN", "END"}
+
+
+def operand_size(item) -> int:
+    """Size in bytes of a stack item for the size-dependent costs."""
+    if isinstance(item, IntType):
+        return max(1, (int(item.value).bit_length() + 7) // 8)
+    if isinstance(item, (StringType, BytesType)):
+        return len(item.value)
+    if isinstance(item, BigMapType):
+        return 0
+    if isinstance(item, (ListType, SetType, PairType)):
+        return sum(operand_size(x) for x in item.items)
+    if isinstance(item, MapType):
+        return sum(operand_size(k) + operand_size(v) for k, v in item.items)
+    if isinstance(item, OptionType):
+        return operand_size(item.item) if item.item is not None else 1
+    return 1
+
+
+class MeteredStack(MichelsonStack):
+    """Stack remembering the items popped and pushed since the last instruction."""
+
+    def __init__(self, items=None) -> None:
+        super().__init__(items)
+        self.popped: List = []
+        self.pushed: List = []
+
+    def push(self, item):
+        self.pushed.append(item)
+        super().push(item)
+
+    def pop(self, count: int):
+        items = super().pop(count)
+        self.popped.extend(items)
+        return items
+
+    def take(self) -> Tuple[List, List]:
+        popped, pushed = self.popped, self.pushed
+        self.popped, self.pushed = [], []
+        return popped, pushed
+
+
+def instruction_cost(prim: str, popped: List, pushed: List) -> int:
+    """Milligas of one executed instruction."""
+    base, per_byte = instruction_costs.get(prim, (default_instruction_cost, 0))
+    cost = base
+    if per_byte:
+        cost += per_byte * sum(operand_size(x) for x in popped if not isinstance(x, MapType))
+    if prim in big_map_instructions and any(isinstance(x, BigMapType) for x in popped):
+        accessed = [x for x in popped + pushed if not isinstance(x, BigMapType)]
+        cost += storage_access_cost + storage_cost_per_byte * sum(operand_size(x) for x in accessed)
+    elif prim == "CONTRACT":
+        cost += storage_access_cost
+    return cost
+
+
+class InstructionTrace(list):
+    """Receives the interpreter stdout and meters each executed instruction.
+
+    Every line appended by the interpreter is kept as is, like the `stdout` of
+    `Interpreter.run_code`, and `steps` holds one `(prim, milligas)` per line.
+    `big_map_updates` holds the `(big_map id, key, value or None)` written by
+    UPDATE and GET_AND_UPDATE.
+    """
+
+    def __init__(self, stack: MeteredStack):
+        super().__init__()
+        self.stack = stack
+        self.steps: List[Tuple[str, int]] = []
+        self.big_map_updates: List[Tuple[int, MichelsonType, Optional[MichelsonType]]] = []
+
+    def append(self, line: str) -> None:
+        super().append(line)
+        prim = line.split(" ", 1)[0].rstrip(":")
+        popped, pushed = self.stack.take()
+        if prim in pseudo_instructions:
+            return
+        self.steps.append((prim, instruction_cost(prim, popped, pushed)))
+        if prim in ("UPDATE", "GET_AND_UPDATE") and len(popped) == 3 and isinstance(popped[2], BigMapType):
+            key, value, big_map = popped
+            self.big_map_updates.append((big_map.ptr, key, value.item))
+
+
+def _big_maps(value) -> Iterator[BigMapType]:
+    if isinstance(value, BigMapType):
+        yield value
+    elif isinstance(value, (PairType, OrType)):
+        for item in value.items:
+            if item is not None:
+                yield from _big_maps(item)
+    elif isinstance(value, OptionType) and value.item is not None:
+        yield from _big_maps(value.item)
+
+
+def storage_layout(storage_expr, storage) -> Tuple[int, Dict[Tuple[int, bytes], bytes]]:
+    """Returns the bytes of the storage value and its forged big_map entries.
+
+    Entries are keyed by (index of the big_map in the storage, forged key).
+    """
+    value = StorageSection.match(storage_expr).from_python_object(storage)
+    entries = {}
+    for index, big_map in enumerate(_big_maps(value.item)):
+        for key, val in big_map.items:
+            entries[index, forge_micheline(key.to_micheline_value())] = forge_micheline(val.to_micheline_value())
+        big_map.ptr = index
+    return len(forge_micheline(value.to_micheline_value(lazy_diff=False))), entries
+
+
+def paid_size(value_size: int, entries: Dict[Tuple[int, bytes], bytes]) -> int:
+    return value_size + sum(big_map_entry_overhead + len(key) + len(val) for (_, key), val in entries.items())
+
+
+def storage_size(storage_expr, storage) -> int:
+    """Paid storage of `storage` in bytes."""
+    return paid_size(*storage_layout(storage_expr, storage))
+
+
+class LocalBigMapContext(ExecutionContext):
+    """Execution context serving the big_maps given by id from a local dict instead of a node."""
+
+    def __init__(self, big_maps: Dict[int, Dict[str, dict]], **kwargs):
+        super().__init__(**kwargs)
+        self.local_big_maps = big_maps
+        self.alloc_big_map_index = max(big_maps, default=-1) + 1
+
+    def get_big_map_value(self, ptr: int, key_hash: str):
+        if ptr not in self.big_maps:
+            return None
+        ptr, _ = self.big_maps[ptr]
+        return self.local_big_maps.get(ptr, {}).get(key_hash)
+
+
+def lazy_storage(storage_expr, storage: dict, fields: List[str]) -> Tuple[dict, Dict[int, Dict[str, dict]]]:
+    """Moves the big_map `fields` of `storage` into local big_maps given by id.
+
+    Returns the storage to pass to `meter_call` and its `big_maps` argument.
+    pytezos loses the updates of keys that only exist in such big_maps, so
+    the storage returned by the call must not be reused; `meter_call`
+    accounts for these updates from the executed instructions.
+    """
+    field_types = StorageSection.match(storage_expr).args[0].get_flat_args(infer_names=True)
+    storage, big_maps = dict(storage), {}
+    for ptr, name in enumerate(fields):
+        key_type, value_type = field_types[name].args
+        big_maps[ptr] = {forge_script_expr(key_type.from_python_object(key).pack(legacy=True)): value_type.from_python_object(value).to_micheline_value()
+                         for key, value in storage[name].items()}
+        storage[name] = ptr
+    return storage, big_maps
+
+
+def _lazy_entries(trace: InstructionTrace, context: LocalBigMapContext):
+    """Forged (before, after) values of the entries a call wrote in the big_maps given by id."""
+    before, after = {}, {}
+    for ptr, key, value in trace.big_map_updates:
+        ptr = context.big_maps.get(ptr, (None, False))[0]
+        if ptr not in context.local_big_maps:
+            continue
+        entry = ("lazy", ptr), forge_micheline(key.to_micheline_value())
+        previous = context.local_big_maps[ptr].get(forge_script_expr(key.pack(legacy=True)))
+        if previous is not None:
+            before[entry] = forge_micheline(previous)
+        if value is not None:
+            after[entry] = forge_micheline(value.to_micheline_value())
+        else:
+            after.pop(entry, None)
+    return before, after
+
+
+@dataclass
+class Metering:
+    entrypoint: str
+    steps: int
+    gas: int
+    storage_size: int
+    storage_delta: int
+    instructions: Counter = field(default_factory=Counter, repr=False)
+
+    def as_dict(self) -> dict:
+        return {"steps": self.steps, "gas": self.gas, "storage_size": self.storage_size, "storage_delta": self.storage_delta}
+
+
+# id of the contract context -> (contract context, loaded program)
+_programs: Dict[int, Tuple[ExecutionContext, type]] = {}
+
+
+def _program(call: Union[ContractCall, ContractViewCall], context: LocalBigMapContext) -> type:
+    """`MichelsonProgram.load(context, with_code=True)`, parsed once per contract."""
+    cached = _programs.get(id(call.context))
+    if cached is None or cached[0] is not call.context:
+        cached = _programs[id(call.context)] = (call.context, MichelsonProgram.load(context, with_code=True))
+    return cached[1]
+
+
+def _execute(call: ContractCall, storage, sender=None, source=None, amount=None, balance=None, chain_id=None,
+             level=None, now=None, self_address=None, view_results=None,
+             big_maps: Optional[Dict[int, Dict[str, dict]]] = None, program: Optional[type] = None,
+             trace_type: Callable[[MeteredStack], InstructionTrace] = InstructionTrace) -> Tuple[ContractCallResult, InstructionTrace, LocalBigMapContext]:
+    """Runs `call`, with `program` instead of the cached program of the contract when given."""
+    storage_ty = StorageSection.match(call.context.storage_expr)
+    initial_storage = storage_ty.from_python_object(storage).to_micheline_value(lazy_diff=None)
+    context = LocalBigMapContext(
+        big_maps or {},
+        amount=amount or call.amount,
+        chain_id=chain_id,
+        source=source,
+        sender=sender or source,
+        balance=balance,
+        script=dict(code=call.context.script["code"], storage=initial_storage),
+        level=level,
+        now=now,
+        address=self_address,
+        view_results=view_results,
+    )
+    stack = MeteredStack()
+    trace = trace_type(stack)
+    program = program or _program(call, context)
+    instance = program.instantiate(entrypoint=call.parameters["entrypoint"], parameter=call.parameters["value"], storage=initial_storage)
+    instance.begin(stack, trace, context)
+    instance.execute(stack, trace, context)
+    operations, new_storage, lazy_diff, _ = instance.end(stack, trace)
+    result = ContractCallResult.from_run_code(
+        {"operations": operations, "storage": new_storage, "lazy_storage_diff": lazy_diff},
+        parameters=call.parameters,
+        context=call.context,
+    )
+    return result, trace, context
+
+
+def lazy_call(call: ContractCall, storage, big_maps: Dict[int, Dict[str, dict]], **kwargs) -> Tuple[ContractCallResult, Dict[int, Dict[str, tuple]]]:
+    """Runs `call` on a storage whose big_maps are given by id, without metering.
+
+    `big_maps` only needs a `get(key hash)` per id. Returns the call result,
+    whose big_maps stay given by id, and the entries the call wrote:
+    `{id: {key hash: (Micheline key, Micheline value or None when removed)}}`.
+    """
+    result, trace, context = _execute(call, storage, big_maps=big_maps, **kwargs)
+    writes: Dict[int, Dict[str, tuple]] = {}
+    for ptr, key, value in trace.big_map_updates:
+        ptr = context.big_maps.get(ptr, (None, False))[0]
+        if ptr not in context.local_big_maps:
+            continue
+        writes.setdefault(ptr, {})[forge_script_expr(key.pack(legacy=True))] = (
+            key.to_micheline_value(), None if value is None else value.to_micheline_value())
+    result.storage = _by_id(result.storage, storage)
+    return result, writes
+
+
+def _by_id(new_storage: dict, storage: dict) -> dict:
+    """`new_storage` where the big_maps that `storage` gives by id are given by the same id."""
+    stored = dict(new_storage)
+    stored.update((name, value) for name, value in storage.items()
+                  if type(value) is int and isinstance(stored.get(name), dict))
+    return stored
+
+
+def meter_call(call: ContractCall, storage, sender=None, source=None, amount=None, balance=None, chain_id=None,
+               level=None, now=None, self_address=None, view_results=None,
+               big_maps: Optional[Dict[int, Dict[str, dict]]] = None, internal: bool = False) -> Tuple[ContractCallResult, Metering]:
+    """Same as `call.interpret(storage=storage, ...)`, also returns the `Metering` of the call.
+
+    `big_maps` holds the values of the big_maps that `storage` gives by id.
+    Their entries count in `storage_delta` but not in `storage_size`.
+    An `internal` call is emitted by another contract and does not pay the
+    manager operation cost.
+    Raises `MichelsonRuntimeError` when the call fails, as `interpret` does.
+    """
+    storage_expr = call.context.storage_expr
+    code = call.context.script["code"]
+    result, trace, context = _execute(call, storage, sender=sender, source=source, amount=amount, balance=balance,
+                                      chain_id=chain_id, level=level, now=now, self_address=self_address,
+                                      view_results=view_results, big_maps=big_maps)
+
+    # Big_maps given by id stay given by id, their written entries come from the trace
+    stored = _by_id(result.storage, storage)
+    size_before, entries_before = storage_layout(storage_expr, storage)
+    size_after, entries_after = storage_layout(storage_expr, stored)
+    lazy_before, lazy_after = _lazy_entries(trace, context)
+    storage_size_after = paid_size(size_after, entries_after)
+    entries_before.update(lazy_before)
+    entries_after.update(lazy_after)
+    written = [entries_after.get(key, b"") for key in entries_before.keys() | entries_after.keys()
+               if entries_before.get(key) != entries_after.get(key)]
+    milligas = 0 if internal else manager_operation_cost
+    milligas += decoding_cost_per_byte * (len(forge_micheline(code)) + size_before
+                                          + len(forge_micheline(call.parameters["value"])))
+    milligas += sum(cost for _, cost in trace.steps)
+    milligas += encoding_cost_per_byte * size_after
+    milligas += sum(storage_access_cost + storage_cost_per_byte * len(value) for value in written)
+    paid_before = paid_size(size_before, entries_before)
+    paid_after = paid_size(size_after, entries_after)
+    metering = Metering(
+        entrypoint=call.parameters["entrypoint"],
+        steps=len(trace.steps),
+        gas=(milligas + 999) // 1000,
+        storage_size=storage_size_after,
+        storage_delta=paid_after - paid_before,
+        instructions=Counter(prim for prim, _ in trace.steps),
+    )
+    return result, metering
+
+
+def meter_view(view: ContractViewCall, storage, balance=None, self_address=None,
+               big_maps: Optional[Dict[int, Dict[str, dict]]] = None) -> Tuple[Any, Metering]:
+    """Same as `view.onchain_view(storage=storage)`, also returns the `Metering` of the view.
+
+    The view is metered as run by the `VIEW` instruction of another contract:
+    it pays its instructions and the decoding of the storage, not an operation.
+    Raises `MichelsonRuntimeError` when the view fails.
+    """
+    storage_ty = StorageSection.match(view.context.storage_expr)
+    initial_storage = storage_ty.from_python_object(storage).to_micheline_value(lazy_diff=None)
+    context = LocalBigMapContext(
+        big_maps or {},
+        balance=balance,
+        script=dict(code=view.context.script["code"], storage=initial_storage),
+        address=self_address,
+    )
+    stack = MeteredStack()
+    trace = InstructionTrace(stack)
+    instance = _program(view, context).instantiate_view(name=view.name, parameter=view.param_expr, storage=initial_storage)
+    instance.begin(stack, trace, context)
+    instance.execute_view(stack, trace, context)
+    value = instance.ret(stack, trace).to_python_object()
+    size = storage_size(view.context.storage_expr, storage)
+    milligas = decoding_cost_per_byte * (len(forge_micheline(initial_storage)) + len(forge_micheline(view.param_expr)))
+    milligas += sum(cost for _, cost in trace.steps)
+    metering = Metering(
+        entrypoint=view.name,
+        steps=len(trace.steps),
+        gas=(milligas + 999) // 1000,
+        storage_size=size,
+        storage_delta=0,
+        instructions=Counter(prim for prim, _ in trace.steps),
+    )
+    return value, metering
+
+
+def meter_origination(contract: ContractInterface, storage) -> Metering:
+    """`Metering` of the origination of `contract` with `storage`.
+
+    The origination pays the decoding of the script and of the storage, the
+    encoding of the storage and the write of every big_map entry; its
+    `storage_delta` is the whole script and storage.
+    """
+    code_size = len(forge_micheline(contract.context.script["code"]))
+    value_size, entries = storage_layout(contract.context.storage_expr, storage)
+    milligas = manager_operation_cost + decoding_cost_per_byte * (code_size + value_size) + encoding_cost_per_byte * value_size
+    milligas += sum(storage_access_cost + storage_cost_per_byte * len(value) for value in entries.values())
+    size = paid_size(value_size, entries)
+    return Metering(
+        entrypoint="origination",
+        steps=0,
+        gas=(milligas + 999) // 1000,
+        storage_size=size,
+        storage_delta=origination_size + code_size + size,
+    )
@@ -0,0 +1,552 @@
+"""Profiler of the farm and database entrypoints on the pytezos interpreter.
+
+Every benchmark of `gas_benchmark.py` runs once with its interpreted nodes
+instrumented: each executed Michelson instruction is counted, its gas is
+charged to the chain of frames enclosing it, and each node measures its own
+wall time (profiling overhead included, compare them with each other). The
+uninstrumented run of `gas_meter` is also timed, the best of `--repeat` runs.
+
+The frames are the LIGO functions of the sources. LIGO inlines them all, so
+their names are only known from the locations that
+`ligo compile contract --michelson-comments location` writes next to the
+instructions; `--ligo` compiles `farm/main.mligo` and `database/main.mligo`
+this way into `compiled/profile`. Without these comments, e.g. on the
+committed `compiled/*.tz`, the frames are the loops of the code
+(`LOOP_LEFT#3`, the recursive functions of LIGO) in code order.
+
+The output is a folded stacks file (`benchmark;function;...;PRIM weight`,
+weighted by milligas or by executed instructions) for `flamegraph.pl` or
+speedscope, and a text report sorted by gas.
+
+    python3 gas_profiler.py [-k stake] [--repeat 5] [--ligo "ligo"] [--weight gas|steps] [--folded gas_profile.folded] [--report gas_profile.txt]
+"""
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+import argparse
+import bisect
+import os
+import re
+import shlex
+import subprocess
+import time
+
+from pytezos.michelson.instructions.base import MichelsonInstruction
+from pytezos.michelson.micheline import MichelineSequence
+from pytezos.michelson.program import MichelsonProgram
+
+from contract_cache import load_contract
+from gas_benchmark import benchmarks, database_contract_path, farm_contract_path
+from gas_meter import InstructionTrace, Metering, _execute, meter_call
+
+root_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+contract_sources = {
+    farm_contract_path: os.path.join(root_path, "src", "contract", "farm", "main.mligo"),
+    database_contract_path: os.path.join(root_path, "src", "contract", "database", "main.mligo"),
+}
+database_views = "get_farm,get_farms_by_lp,list_farms"
+profile_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "compiled", "profile")
+
+loop_prims = {"LOOP", "LOOP_LEFT", "ITER", "MAP"}
+root_frame = "(code)"
+
+token_pattern = re.compile(r'\s+|#[^\n]*|(/\*.*?\*/)|("(?:[^"\\]|\\.)*"|0x[0-9a-fA-F]*|-?\d+)|([{}();])|([A-Za-z_%@:][\w.%@:]*)',
+                           re.DOTALL)
+location_pattern = re.compile(r'File "([^"]+)", line (\d+)')
+definition_pattern = re.compile(r"^(\s*)let\s+(?:rec\s+)?(\w+)")
+toplevel_pattern = re.compile(r"^(let|type|#|\[@|module)")
+
+
+class Location(NamedTuple):
+    file: str
+    line: int
+
+
+@dataclass
+class Node:
+    """Michelson node of the text: a sequence (`prim` is None) or a primitive application."""
+    prim: Optional[str]
+    args: List["Node"] = field(default_factory=list)
+    location: Optional[Location] = None
+
+
+# -----------------
+# --  SOURCE MAP  --
+# -----------------
+
+def _tokens(source: str) -> List[Tuple[str, str]]:
+    tokens, position = [], 0
+    while position < len(source):
+        match = token_pattern.match(source, position)
+        if not match:
+            raise ValueError(f"Unexpected character at {position}: {source[position:position + 20]!r}")
+        position = match.end()
+        comment, literal, punctuation, word = match.groups()
+        if comment:
+            tokens.append(("comment", comment))
+        elif literal:
+            tokens.append(("literal", literal))
+        elif punctuation:
+            tokens.append((punctuation, punctuation))
+        elif word and word[0] not in "%@:":
+            tokens.append(("prim", word))
+    return tokens
+
+
+def _location(comment: str) -> Optional[Location]:
+    match = location_pattern.search(comment)
+    return Location(match.group(1), int(match.group(2))) if match else None
+
+
+class _Parser:
+    def __init__(self, source: str):
+        self.tokens = _tokens(source)
+        self.position = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def take(self) -> Tuple[str, str]:
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def comment(self, node: Node) -> None:
+        location = _location(self.take()[1])
+        node.location = node.location or location
+
+    def sequence(self) -> Node:
+        self.take()
+        node = Node(None)
+        # A comment right after the brace locates the sequence itself
+        while self.peek() == "comment":
+            self.comment(node)
+        while self.peek() != "}":
+            if self.peek() is None:
+                raise ValueError("Unterminated sequence")
+            if self.peek() in (";", "comment"):
+                self.take()
+                continue
+            node.args.append(self.expression())
+        self.take()
+        return node
+
+    def expression(self) -> Node:
+        if self.peek() == "{":
+            return self.sequence()
+        if self.peek() == "(":
+            self.take()
+            node = self.expression()
+            self.take()
+            return node
+        kind, value = self.take()
+        node = Node(value if kind == "prim" else None)
+        if kind == "literal":
+            return node
+        while self.peek() not in (";", "}", ")", None):
+            self.argument(node)
+        return node
+
+    def argument(self, node: Node) -> None:
+        kind = self.peek()
+        if kind == "comment":
+            self.comment(node)
+        elif kind == "prim":
+            node.args.append(Node(self.take()[1]))
+        elif kind == "literal":
+            self.take()
+            node.args.append(Node(None))
+        elif kind in ("{", "("):
+            node.args.append(self.expression())
+        else:
+            raise ValueError(f"Unexpected token {self.tokens[self.position][1]!r}")
+
+
+def parse_michelson(source: str) -> Node:
+    """Parses a Michelson script, keeping the locations of its `/* File "...", line n */` comments."""
+    parser = _Parser(source)
+    if parser.peek() != "{":
+        # A script without its outer braces
+        parser.tokens = [("{", "{")] + parser.tokens + [("}", "}")]
+    return parser.sequence()
+
+
+class SourceIndex:
+    """Finds the LIGO function defining a line, local functions being `outer.inner`."""
+
+    def __init__(self):
+        self.definitions: Dict[str, Tuple[List[int], List[str]]] = {}
+
+    def _index(self, path: str) -> Tuple[List[int], List[str]]:
+        """Starts of the definitions of `path` with the function defined from each of them."""
+        if path not in self.definitions:
+            try:
+                with open(path) as f:
+                    lines = f.read().split("\n")
+            except OSError:
+                lines = []
+            starts, names = [0], [""]
+            outer, locals_ = "", []
+            for number, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                indent = len(line) - len(line.lstrip())
+                if toplevel_pattern.match(line):
+                    definition = definition_pattern.match(line)
+                    outer, locals_ = (definition.group(2) if definition else ""), []
+                    starts.append(number)
+                    names.append(outer)
+                    continue
+                closed = False
+                while locals_ and indent <= locals_[-1][0]:
+                    locals_.pop()
+                    closed = True
+                definition = definition_pattern.match(line)
+                if definition and "rec" in line.split(definition.group(2))[0]:
+                    locals_.append((indent, definition.group(2)))
+                elif not closed:
+                    continue
+                starts.append(number)
+                names.append(".".join([outer] + [name for _, name in locals_]))
+            self.definitions[path] = (starts, names)
+        return self.definitions[path]
+
+    def function(self, location: Location) -> Optional[str]:
+        path = location.file if os.path.isabs(location.file) else os.path.join(root_path, location.file)
+        starts, names = self._index(os.path.normpath(path))
+        return names[bisect.bisect_right(starts, location.line) - 1] or None
+
+
+def _frame_labels(program: type, source: Optional[Node], index: SourceIndex) -> Dict[type, str]:
+    """Frame of the interpreted nodes of `program` that open one.
+
+    The nodes take the location of the text node at the same place, or of
+    their closest located ancestor; where the trees differ (macros), the
+    nodes below are not mapped and stay in the frame of their parent.
+    """
+    labels: Dict[type, str] = {}
+    loops = Counter()
+
+    def visit(node: type, text: Optional[Node], location: Optional[Location]) -> None:
+        is_sequence = issubclass(node, MichelineSequence)
+        if text is not None and text.prim != (None if is_sequence else node.prim):
+            text = None
+        if text is not None:
+            location = text.location or location
+        if location is not None:
+            label = index.function(location) or f"{os.path.basename(location.file)}:{location.line}"
+            labels[node] = label
+        elif not is_sequence and node.prim in loop_prims:
+            loops[node.prim] += 1
+            labels[node] = f"{node.prim}#{loops[node.prim]}"
+        children = [arg for arg in node.args if isinstance(arg, type) and issubclass(arg, (MichelsonInstruction, MichelineSequence))]
+        texts = text.args if text is not None and len(text.args) == len(node.args) else None
+        for position, arg in enumerate(node.args):
+            if arg in children:
+                visit(arg, texts[position] if texts else None, location)
+
+    code_text = None
+    if source is not None:
+        code_text = next((section.args[0] for section in source.args if section.prim == "code" and section.args), None)
+    visit(program.code.args[0], code_text, None)
+    return labels
+
+
+# -----------------
+# --  PROFILING  --
+# -----------------
+
+@dataclass
+class Stats:
+    count: int = 0
+    milligas: int = 0
+    seconds: float = 0.0
+
+    @property
+    def gas(self) -> float:
+        return self.milligas / 1000
+
+    def add(self, other: "Stats") -> None:
+        self.count += other.count
+        self.milligas += other.milligas
+        self.seconds += other.seconds
+
+
+@dataclass
+class Profile:
+    name: str
+    entrypoint: str
+    # Best wall time of the uninstrumented run, in seconds
+    wall_time: float
+    metering: Metering
+    # Whether the frames are LIGO functions or only loops
+    located: bool
+    # Executed instructions (`count`), their gas and the self time of their nodes, by primitive
+    instructions: Dict[str, Stats] = field(default_factory=lambda: defaultdict(Stats))
+    # The same by innermost frame
+    functions: Dict[str, Stats] = field(default_factory=lambda: defaultdict(Stats))
+    # Executed instructions and milligas by folded stack
+    stacks: Dict[str, Stats] = field(default_factory=lambda: defaultdict(Stats))
+
+
+class _Recorder:
+    """Frames of the running node and charges of the executed instructions to them."""
+
+    def __init__(self, profile: Profile, labels: Dict[type, str]):
+        self.profile = profile
+        self.labels = labels
+        self.path: List[str] = []
+        self.extends: List[bool] = []
+        self.children: List[float] = []
+
+    def enter(self, node: type) -> None:
+        label = self.labels.get(node)
+        extends = label is not None and (not self.path or self.path[-1] != label)
+        if extends:
+            self.path.append(label)
+        self.extends.append(extends)
+        self.children.append(0.0)
+
+    def leave(self, node: type, elapsed: float) -> None:
+        own = elapsed - self.children.pop()
+        if self.children:
+            self.children[-1] += elapsed
+        self.profile.functions[self.path[-1] if self.path else root_frame].seconds += own
+        if not issubclass(node, MichelineSequence):
+            self.profile.instructions[node.prim].seconds += own
+        if self.extends.pop():
+            self.path.pop()
+
+    def step(self, prim: str, milligas: int) -> None:
+        for stats in (self.profile.instructions[prim], self.profile.functions[self.path[-1] if self.path else root_frame],
+                      self.profile.stacks[";".join([self.profile.name] + self.path + [prim])]):
+            stats.count += 1
+            stats.milligas += milligas
+
+
+class _ProfiledTrace(InstructionTrace):
+    def __init__(self, stack, recorder: _Recorder):
+        super().__init__(stack)
+        self.recorder = recorder
+
+    def append(self, line) -> None:
+        steps = len(self.steps)
+        super().append(line)
+        if len(self.steps) > steps:
+            self.recorder.step(*self.steps[-1])
+
+
+# Recorder of the running profile, None outside of it
+_recording: Optional[_Recorder] = None
+
+
+def _instrument(node: type) -> None:
+    if "_profiled" in vars(node):
+        return
+    execute = node.execute
+
+    def profiled(cls, stack, stdout, context):
+        recorder = _recording
+        if recorder is None:
+            return execute(stack, stdout, context)
+        recorder.enter(cls)
+        start = time.perf_counter()
+        try:
+            return execute(stack, stdout, context)
+        finally:
+            recorder.leave(cls, time.perf_counter() - start)
+
+    node.execute = classmethod(profiled)
+    node._profiled = True
+    for arg in node.args:
+        if isinstance(arg, type) and issubclass(arg, (MichelsonInstruction, MichelineSequence)):
+            _instrument(arg)
+
+
+_programs: Dict[str, Tuple[type, Dict[type, str], bool]] = {}
+
+
+def profiled_program(contract_path: str, script: list) -> Tuple[type, Dict[type, str], bool]:
+    """Instrumented program of the contract with its frame labels and whether they come from LIGO locations.
+
+    The program is a copy of the one `gas_meter` runs, its node classes are
+    patched once and only record while a profile runs.
+    """
+    key = os.path.abspath(contract_path)
+    if key not in _programs:
+        with open(os.path.expanduser(contract_path)) as f:
+            source = parse_michelson(f.read())
+        located = any(True for _ in _located_nodes(source))
+        program = MichelsonProgram.match(script)
+        labels = _frame_labels(program, source if located else None, SourceIndex())
+        _instrument(program.code.args[0])
+        _programs[key] = (program, labels, located)
+    return _programs[key]
+
+
+def _located_nodes(node: Node):
+    if node.location is not None:
+        yield node
+    for arg in node.args:
+        yield from _located_nodes(arg)
+
+
+def profile_call(name: str, contract_path: str, call, storage, repeat: int = 1, **kwargs) -> Profile:
+    """Profiles `call` of the contract compiled at `contract_path` on `storage`."""
+    global _recording
+    _, metering = meter_call(call, storage, **kwargs)
+    kwargs.pop("internal", None)
+    wall_time = float("inf")
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        _execute(call, storage, **kwargs)
+        wall_time = min(wall_time, time.perf_counter() - start)
+
+    program, labels, located = profiled_program(contract_path, call.context.script["code"])
+    profile = Profile(name, call.parameters["entrypoint"], wall_time, metering, located)
+    recorder = _Recorder(profile, labels)
+    _recording = recorder
+    try:
+        _execute(call, storage, program=program, trace_type=lambda stack: _ProfiledTrace(stack, recorder), **kwargs)
+    finally:
+        _recording = None
+    return profile
+
+
+def run_profiles(keyword: str = "", contracts: Optional[Dict[str, str]] = None, repeat: int = 1) -> Tuple[Dict[str, Profile], List[str]]:
+    """Returns the profile of every available benchmark and the names of the skipped ones.
+
+    `contracts` profiles the benchmarks of a contract path on another compiled
+    contract, as for `gas_benchmark.run_benchmarks`.
+    """
+    profiles, skipped = {}, []
+    for name, (contract_path, entrypoint, prepare) in benchmarks.items():
+        if keyword not in name:
+            continue
+        path = (contracts or {}).get(contract_path, contract_path)
+        contract = load_contract(path)
+        if entrypoint not in contract.entrypoints:
+            skipped.append(name)
+            continue
+        call, storage, kwargs = prepare(contract)
+        profiles[name] = profile_call(name, path, call, storage, repeat, **kwargs)
+    return profiles, skipped
+
+
+def compile_located(ligo: str = "ligo", output_dir: str = profile_path) -> Dict[str, str]:
+    """Compiles the farm and the database with location comments, returns the compiled path by committed path."""
+    os.makedirs(output_dir, exist_ok=True)
+    contracts = {}
+    for contract_path, source in contract_sources.items():
+        command = shlex.split(ligo) + ["compile", "contract", os.path.relpath(source, root_path), "-e", "main",
+                                       "--michelson-comments", "location"]
+        if contract_path == database_contract_path:
+            command += ["--views", database_views]
+        # From the root, so that the locations are relative to it
+        res = subprocess.run(command, capture_output=True, text=True, cwd=root_path)
+        if res.returncode != 0:
+            raise RuntimeError(f"{os.path.basename(source)}: {res.stderr.strip()}")
+        contracts[contract_path] = os.path.join(output_dir, os.path.basename(contract_path))
+        with open(contracts[contract_path], "w") as f:
+            f.write(res.stdout)
+    return contracts
+
+
+# -----------------
+# --  OUTPUTS  --
+# -----------------
+
+def folded_stacks(profiles: Sequence[Profile], weight: str = "gas") -> List[str]:
+    """Lines `frame;...;PRIM weight` of the profiles, weighted by milligas or by executed instructions."""
+    lines = []
+    for profile in profiles:
+        for stack, stats in sorted(profile.stacks.items()):
+            value = stats.milligas if weight == "gas" else stats.count
+            if value:
+                lines.append(f"{stack} {value}")
+    return lines
+
+
+def _table(title: str, rows: Dict[str, Stats], limit: Optional[int]) -> List[str]:
+    total = sum(stats.milligas for stats in rows.values()) or 1
+    ordered = sorted(rows.items(), key=lambda item: (-item[1].milligas, -item[1].count, item[0]))
+    lines = [f"  {title:<48} {'steps':>7} {'gas':>10} {'share':>7} {'self ms':>9}"]
+    for name, stats in ordered[:limit]:
+        lines.append(f"  {name:<48} {stats.count:>7} {stats.gas:>10.3f} {100 * stats.milligas / total:>6.1f}% "
+                     f"{1000 * stats.seconds:>9.3f}")
+    return lines
+
+
+def _merge(tables: Sequence[Dict[str, Stats]]) -> Dict[str, Stats]:
+    merged: Dict[str, Stats] = defaultdict(Stats)
+    for table in tables:
+        for name, stats in table.items():
+            merged[name].add(stats)
+    return merged
+
+
+def report(profiles: Union[Dict[str, Profile], Sequence[Profile]], limit: Optional[int] = 15) -> str:
+    """Text report of the profiles, the most expensive first."""
+    profiles = list(profiles.values()) if isinstance(profiles, dict) else list(profiles)
+    profiles.sort(key=lambda profile: -profile.metering.gas)
+    lines = [f"{'benchmark':<40} {'entrypoint':<16} {'wall ms':>9} {'steps':>7} {'gas':>7}"]
+    for profile in profiles:
+        lines.append(f"{profile.name:<40} {profile.entrypoint:<16} {1000 * profile.wall_time:>9.3f} "
+                     f"{profile.metering.steps:>7} {profile.metering.gas:>7}")
+    if profiles and not all(profile.located for profile in profiles):
+        lines.append("")
+        lines.append("No LIGO locations in the compiled contracts: the frames are their loops, run with --ligo for the LIGO functions")
+    lines.append("")
+    lines.append("The tables count the gas of the executed instructions only, their self time includes the profiling overhead")
+
+    sections = [("all benchmarks", _merge([profile.functions for profile in profiles]),
+                 _merge([profile.instructions for profile in profiles]))] if len(profiles) > 1 else []
+    sections += [(f"{profile.name} ({profile.entrypoint})", profile.functions, profile.instructions) for profile in profiles]
+    for title, functions, instructions in sections:
+        lines += ["", title]
+        lines += _table("function", functions, limit)
+        lines += _table("instruction", instructions, limit)
+    return "\n".join(lines) + "\n"
+
+
+# -----------------
+# --  RUNNER  --
+# -----------------
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Profile the farm and database entrypoints on the pytezos interpreter")
+    parser.add_argument("-k", "--keyword", default="", help="only profile the benchmarks whose name contains it")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs of each benchmark, the best is kept (default: %(default)s)")
+    parser.add_argument("--ligo", help="LIGO command, compiles the contracts with location comments to get the LIGO functions")
+    parser.add_argument("--weight", choices=("gas", "steps"), default="gas", help="weight of the folded stacks (default: %(default)s)")
+    parser.add_argument("--folded", default="gas_profile.folded", help="folded stacks output (default: %(default)s)")
+    parser.add_argument("--report", default="gas_profile.txt", help="text report output (default: %(default)s)")
+    parser.add_argument("--limit", type=int, default=15, help="rows of each table of the report (default: %(default)s)")
+    args = parser.parse_args()
+
+    contracts = None
+    if args.ligo:
+        try:
+            contracts = compile_located(args.ligo)
+        except (OSError, RuntimeError) as e:
+            print(f"Error: {e}")
+            return 1
+    profiles, skipped = run_profiles(args.keyword, contracts, args.repeat)
+    for name in skipped:
+        print(f"{name:<40} skipped, entrypoint not compiled")
+    if not profiles:
+        print("No benchmark to profile")
+        return 1
+
+    with open(args.folded, "w") as f:
+        f.write("\n".join(folded_stacks(list(profiles.values()), args.weight)) + "\n")
+    text = report(profiles, args.limit)
+    with open(args.report, "w") as f:
+        f.write(text)
+    print(text.split("\n\n")[0])
+    print(f"Folded stacks ({args.weight}) written to {args.folded}, report written to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
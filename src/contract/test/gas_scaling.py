@@ -0,0 +1,272 @@
+"""Scaling of the farm entrypoint costs with total_weeks and with the staker count.
+
+`initialize`, `increase_reward`, `stake`, `unstake` and `claim_all` walk nat
+lists of `total_weeks` elements, while `user_points`/`user_stakes` grow with
+the number of stakers. This sweep meters every entrypoint (see `gas_meter`)
+over both dimensions and reports where each one reaches the hard gas limit
+per operation:
+
+    python3 gas_scaling.py [--weeks 1,2,4,...] [--stakers 1,10,...] [--csv out.csv] [--plot out.png]
+                           [--calibration node_gas.json]
+
+The gas of `gas_meter` comes from its own cost table, not from the protocol
+gas schedule, so by default the sizes reported against the hard limit are
+relative only: they rank the entrypoints and the dimensions, they do not
+tell where a call fails on chain. `--calibration` takes the gas a node
+consumed for one call of a curve, e.g. the `consumed_milligas` of a
+`run_operation`/simulation (`octez-client ... --dry-run`):
+
+    {"total_weeks/claim_all": {"size": 52, "consumed_milligas": 6012345}, ...}
+
+The estimated gas of that curve is then scaled to match the node at that
+size, and its crossing of the hard limit is reported as calibrated.
+
+Points whose predicted step count exceeds `--max-steps` are not interpreted
+(the quadratic entrypoints would take hours at 520 weeks): they are
+extrapolated from a polynomial fit of the measured ones and flagged as such.
+Stakers live in big_maps given by id, so only the keys a call reads are
+loaded, like on chain. Plotting requires matplotlib.
+"""
+from hashlib import sha256
+from itertools import islice
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+import argparse
+import csv
+import json
+import time
+
+import numpy as np
+from pytezos.crypto.encoding import base58_encode
+from pytezos.michelson.forge import forge_script_expr
+from pytezos.michelson.types import AddressType
+
+from contract_cache import load_contract
+from farm_model import FarmModel, compute_new_rewards
+from gas_benchmark import farm_contract_path, farm_fixture, farm_storage, admin, alice, bob, sec_week
+from gas_meter import hard_gas_limit_per_operation, meter_call
+
+weeks_sizes = [1, 2, 4, 8, 13, 26, 52, 104, 156, 260, 364, 520]
+stakers_sizes = [1, 10, 100, 1_000, 10_000, 100_000]
+weeks_entrypoints = ["initialize", "increase_reward", "stake", "unstake", "claim_all"]
+stakers_entrypoints = ["stake", "unstake", "claim_all"]
+default_max_steps = 250_000
+# Degree of the fitted curves: compute_new_rewards multiplies nats whose size
+# grows with total_weeks, while big_map accesses do not depend on the staker count
+fit_degrees = {"total_weeks": 2, "stakers": 1}
+staked_amount = 500
+
+
+class Point(NamedTuple):
+    entrypoint: str
+    dimension: str
+    size: int
+    steps: float
+    gas: float
+    seconds: float
+    extrapolated: bool
+
+
+def fit(points: Sequence[Point], metric: str) -> np.poly1d:
+    """Polynomial fitted on the measured points, of the degree of their dimension."""
+    measured = [p for p in points if not p.extrapolated]
+    degree = min(fit_degrees[measured[0].dimension], len(measured) - 1)
+    return np.poly1d(np.polyfit([p.size for p in measured], [getattr(p, metric) for p in measured], degree))
+
+
+def gas_limit_size(points: Sequence[Point], limit: int = hard_gas_limit_per_operation) -> Optional[float]:
+    """Smallest size at which the fitted gas reaches `limit`, None when it never does."""
+    roots = (fit(points, "gas") - limit).roots
+    sizes = [r.real for r in np.atleast_1d(roots) if abs(r.imag) < 1e-9 and r.real > 0]
+    return min(sizes) if sizes else None
+
+
+def calibrate(points: Sequence[Point], size: int, consumed_milligas: int) -> List[Point]:
+    """Points whose gas is scaled so that the fitted gas at `size` is the gas a node consumed at that size."""
+    scale = consumed_milligas / 1000 / fit(points, "gas")(size)
+    return [p._replace(gas=p.gas * scale) for p in points]
+
+
+def sweep(entrypoint: str, dimension: str, sizes: Sequence[int], prepare: Callable,
+          max_steps: int = default_max_steps) -> List[Point]:
+    """Meters `prepare(entrypoint, size)` for every size, extrapolating the too expensive ones."""
+    points: List[Point] = []
+    for size in sizes:
+        measured = [p for p in points if not p.extrapolated]
+        if len(measured) >= 3 and fit(points, "steps")(size) > max_steps:
+            points.append(Point(entrypoint, dimension, size, *(float(fit(points, m)(size)) for m in ("steps", "gas", "seconds")), True))
+            continue
+        call, storage, kwargs = prepare(entrypoint, size)
+        start = time.perf_counter()
+        _, metering = meter_call(call, storage, **kwargs)
+        points.append(Point(entrypoint, dimension, size, metering.steps, metering.gas, time.perf_counter() - start, False))
+    return points
+
+
+###################
+# total_weeks #
+###################
+
+def prepare_weeks(entrypoint: str, total_weeks: int):
+    """One staker (alice) in a farm of `total_weeks` weeks, bob stakes, alice unstakes or claims."""
+    farm = load_contract(farm_contract_path)
+    rewards = compute_new_rewards(farm_storage["total_reward"], total_weeks, farm_storage["rate"])
+    if entrypoint == "initialize":
+        storage = farm_fixture.overlay(total_weeks=total_weeks, initialized=False, reward_at_week=[])
+        return farm.initialize(), storage, dict(sender=admin, now=0)
+    base = farm_fixture.overlay(total_weeks=total_weeks, reward_at_week=rewards)
+    model = FarmModel.from_storage(base)
+    model.stake(alice, staked_amount, int(sec_week / 2))
+    storage = model.to_storage(base)
+    if entrypoint == "increase_reward":
+        return farm.increase_reward(10_000_000), storage, dict(sender=admin, now=int(sec_week / 2))
+    if entrypoint == "stake":
+        return farm.stake(staked_amount), storage, dict(sender=bob, now=int(sec_week / 2))
+    if entrypoint == "unstake":
+        return farm.unstake(staked_amount // 2), storage, dict(sender=alice, now=int(sec_week / 2))
+    return farm.claim_all(), storage, dict(sender=alice, now=(total_weeks + 1) * sec_week)
+
+
+###############
+# Stakers #
+###############
+
+def staker_address(index: int) -> str:
+    return alice if index == 0 else base58_encode(sha256(index.to_bytes(8, "big")).digest()[:20], b"tz1").decode()
+
+
+class StakersFarm:
+    """Farm of `total_weeks` weeks whose stakers all staked at the start, stored in big_maps given by id."""
+
+    def __init__(self, total_weeks: int, max_stakers: int):
+        self.total_weeks = total_weeks
+        self.key_hashes = [forge_script_expr(AddressType.from_python_object(staker_address(i)).pack(legacy=True))
+                           for i in range(max_stakers)]
+        self.points = [{"int": str(staked_amount * sec_week)}] * total_weeks
+        self.stake = {"int": str(staked_amount)}
+
+    def prepare(self, entrypoint: str, stakers: int):
+        farm = load_contract(farm_contract_path)
+        storage = farm_fixture.overlay(
+            total_weeks=self.total_weeks,
+            reward_at_week=compute_new_rewards(farm_storage["total_reward"], self.total_weeks, farm_storage["rate"]),
+            farm_points=[stakers * staked_amount * sec_week] * self.total_weeks,
+            user_points=0,
+            user_stakes=1,
+        )
+        key_hashes = list(islice(self.key_hashes, stakers))
+        big_maps = {0: dict.fromkeys(key_hashes, self.points), 1: dict.fromkeys(key_hashes, self.stake)}
+        if entrypoint == "stake":
+            kwargs = dict(sender=bob, now=int(sec_week * 1.5))
+            return farm.stake(staked_amount), storage, dict(kwargs, big_maps=big_maps)
+        if entrypoint == "unstake":
+            kwargs = dict(sender=alice, now=int(sec_week * 1.5))
+            return farm.unstake(staked_amount // 2), storage, dict(kwargs, big_maps=big_maps)
+        kwargs = dict(sender=alice, now=(self.total_weeks + 1) * sec_week)
+        return farm.claim_all(), storage, dict(kwargs, big_maps=big_maps)
+
+
+# -----------------
+# --  RUNNER  --
+# -----------------
+
+def summary(points: Sequence[Point], calibrated: bool = False) -> str:
+    entrypoint, dimension = points[0].entrypoint, points[0].dimension
+    largest = points[-1]
+    limit_size = gas_limit_size(points)
+    kind = "calibrated" if calibrated else "relative only"
+    if limit_size is not None and limit_size <= largest.size:
+        extrapolated = ", extrapolated" if largest.extrapolated else ""
+        return f"{entrypoint}: reaches the gas limit at {dimension} ~ {limit_size:.0f} ({kind}{extrapolated})"
+    usage = largest.gas / hard_gas_limit_per_operation
+    # A fitted crossing far away from the swept sizes says nothing
+    beyond = f", fitted limit at {dimension} ~ {limit_size:.0f}" if limit_size is not None and limit_size < 10 * largest.size else ""
+    return f"{entrypoint}: {largest.gas:.0f} gas at {dimension} = {largest.size} ({usage:.1%} of the limit{beyond}, {kind})"
+
+
+def write_csv(points: Sequence[Point], path: str) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(Point._fields)
+        writer.writerows(points)
+
+
+def plot(curves: Dict[str, List[Point]], path: str) -> None:
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        raise SystemExit("--plot requires matplotlib (pip install matplotlib)")
+    dimensions = sorted({points[0].dimension for points in curves.values()})
+    fig, axes = plt.subplots(1, len(dimensions), figsize=(7 * len(dimensions), 5), squeeze=False)
+    for ax, dimension in zip(axes[0], dimensions):
+        for points in curves.values():
+            if points[0].dimension != dimension:
+                continue
+            ax.plot([p.size for p in points], [p.gas for p in points], marker="o", label=points[0].entrypoint)
+            extrapolated = [p for p in points if p.extrapolated]
+            ax.scatter([p.size for p in extrapolated], [p.gas for p in extrapolated], marker="x", color="black")
+        ax.axhline(hard_gas_limit_per_operation, color="red", linestyle="--", label="hard gas limit")
+        ax.set_xscale("log")
+        ax.set_yscale("log")
+        ax.set_xlabel(dimension)
+        ax.set_ylabel("estimated gas (x: extrapolated)")
+        ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+
+
+def _sizes(value: str) -> List[int]:
+    return [int(size) for size in value.split(",") if size]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Sweep the farm entrypoint costs over total_weeks and stakers")
+    parser.add_argument("--weeks", type=_sizes, default=weeks_sizes, help="comma separated total_weeks values")
+    parser.add_argument("--stakers", type=_sizes, default=stakers_sizes, help="comma separated staker counts")
+    parser.add_argument("--stakers-weeks", type=int, default=52, help="total_weeks of the stakers sweep (default: %(default)s)")
+    parser.add_argument("--max-steps", type=int, default=default_max_steps, help="extrapolate points predicted above this many instructions")
+    parser.add_argument("--csv", help="write every point to this CSV file")
+    parser.add_argument("--plot", help="draw the gas curves to this image (requires matplotlib)")
+    parser.add_argument("--calibration", help="JSON of the gas a node consumed for one call of some curves, see above")
+    args = parser.parse_args()
+
+    curves: Dict[str, List[Point]] = {}
+    if args.weeks:
+        for entrypoint in weeks_entrypoints:
+            curves[f"total_weeks/{entrypoint}"] = sweep(entrypoint, "total_weeks", args.weeks, prepare_weeks, args.max_steps)
+    if args.stakers:
+        farm = StakersFarm(args.stakers_weeks, max(args.stakers))
+        for entrypoint in stakers_entrypoints:
+            curves[f"stakers/{entrypoint}"] = sweep(entrypoint, "stakers", args.stakers, farm.prepare, args.max_steps)
+    calibration: Dict[str, dict] = {}
+    if args.calibration:
+        with open(args.calibration) as f:
+            calibration = json.load(f)
+        unknown = sorted(set(calibration) - set(curves))
+        if unknown:
+            raise SystemExit(f"--calibration: no such curve {', '.join(unknown)} (curves: {', '.join(curves)})")
+        for name, node in calibration.items():
+            curves[name] = calibrate(curves[name], node["size"], node["consumed_milligas"])
+
+    print(f"{'entrypoint':<16} {'dimension':<12} {'size':>7} {'steps':>12} {'gas':>10} {'seconds':>9}")
+    for points in curves.values():
+        for p in points:
+            flag = " (extrapolated)" if p.extrapolated else ""
+            print(f"{p.entrypoint:<16} {p.dimension:<12} {p.size:>7} {p.steps:>12.0f} {p.gas:>10.0f} {p.seconds:>9.2f}{flag}")
+    print(f"\nHard gas limit per operation: {hard_gas_limit_per_operation}")
+    if len(calibration) < len(curves):
+        print("The gas of the curves without --calibration is the gas_meter estimate: their limits are relative only")
+    for name, points in curves.items():
+        print(summary(points, name in calibration))
+
+    all_points = [p for points in curves.values() for p in points]
+    if args.csv:
+        write_csv(all_points, args.csv)
+    if args.plot:
+        plot(curves, args.plot)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
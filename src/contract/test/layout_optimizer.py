@@ -0,0 +1,235 @@
+"""Field order optimizer of the farm storage record.
+
+LIGO compiles a record with the default `tree` layout: a balanced tree of
+pairs over the fields sorted by name, whatever the declaration order, so
+`initialized` or `user_points` sit as deep as `reward_reserve_address`.
+With `[@layout:comb]` the fields form a right comb in declaration order,
+the first ones being the cheapest to read and update.
+
+The optimizer writes variants of `storage_farm` into a copy of
+`src/contract/farm`, compiles each of them with LIGO and runs the farm
+benchmarks of `gas_benchmark.py` on it (the benchmark storages name their
+fields, so they fit every layout). The variants are the current tree, the
+comb in declaration order, the comb with the fields the most accessed by
+`methods.mligo` first, and the orders given with `--order`. `--apply`
+writes the cheapest one to `types.mligo` and reorders the farm storage
+literals of the deploy scripts to match it.
+
+    python3 layout_optimizer.py [--ligo "ligo"] [--order admin,creation_time,...] [--apply]
+"""
+from collections import Counter
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+import argparse
+import glob
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import tempfile
+
+from gas_benchmark import farm_contract_path, run_benchmarks
+from gas_meter import Metering
+
+root_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+farm_path = os.path.join(root_path, "src", "contract", "farm")
+types_path = os.path.join(farm_path, "partials", "types.mligo")
+methods_path = os.path.join(farm_path, "partials", "methods.mligo")
+deploy_path = os.path.join(root_path, "deploy")
+layouts_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "compiled", "layouts")
+
+record_pattern = re.compile(r"type storage_farm = (\[@layout:\w+\] )?\{\n(.*?)\n\}", re.DOTALL)
+field_pattern = re.compile(r"^(\s*(\w+)\s*:\s*[^;/]*?)\s*;?(\s*//.*)?$")
+literal_entry_pattern = re.compile(r"^(\s*)'(\w+)'\s*:\s*(.*?)\s*(,?)\s*$")
+
+
+class Field(NamedTuple):
+    name: str
+    # Declaration without the separator, with its indentation
+    declaration: str
+    comment: str
+
+
+class Layout(NamedTuple):
+    name: str
+    order: List[str]
+    comb: bool
+
+
+def record_fields(types_source: str) -> List[Field]:
+    """Fields of `storage_farm`, in declaration order."""
+    match = record_pattern.search(types_source)
+    fields = []
+    for line in match.group(2).split("\n"):
+        field = field_pattern.match(line)
+        if field:
+            fields.append(Field(field.group(2), field.group(1), field.group(3) or ""))
+    return fields
+
+
+def with_layout(types_source: str, layout: Layout) -> str:
+    """`types_source` where `storage_farm` declares its fields in the order and layout of `layout`."""
+    fields = {field.name: field for field in record_fields(types_source)}
+    if sorted(layout.order) != sorted(fields):
+        raise ValueError(f"{layout.name}: the order must hold every field of storage_farm once")
+    lines = []
+    for index, name in enumerate(layout.order):
+        separator = ";" if index < len(layout.order) - 1 else ""
+        lines.append(fields[name].declaration + separator + fields[name].comment)
+    attribute = "[@layout:comb] " if layout.comb else ""
+    record = f"type storage_farm = {attribute}{{\n" + "\n".join(lines) + "\n}"
+    return record_pattern.sub(lambda _: record, types_source, count=1)
+
+
+def access_counts(methods_source: str, fields: Sequence[str]) -> Counter:
+    """Reads (`storage.field`) and record updates (`field = ...`) of every field in `methods_source`."""
+    return Counter({name: len(re.findall(rf"\.{name}\b", methods_source)) + len(re.findall(rf"\b{name}\s*=[^=]", methods_source))
+                    for name in fields})
+
+
+def candidate_layouts(types_source: str, methods_source: str, orders: Sequence[List[str]] = ()) -> List[Layout]:
+    declared = [field.name for field in record_fields(types_source)]
+    counts = access_counts(methods_source, declared)
+    layouts = [
+        Layout("tree", declared, comb=False),
+        Layout("comb", declared, comb=True),
+        Layout("comb_hot", sorted(declared, key=lambda name: -counts[name]), comb=True),
+    ]
+    layouts += [Layout(f"order_{index}", list(order), comb=True) for index, order in enumerate(orders, 1)]
+    return layouts
+
+
+# -----------------
+# --  MEASURES  --
+# -----------------
+
+def compile_layout(layout: Layout, ligo: str = "ligo", output_dir: str = layouts_path) -> str:
+    """Compiles the farm with `layout`, returns the path of the `.tz` file."""
+    os.makedirs(output_dir, exist_ok=True)
+    with open(types_path) as f:
+        types_source = f.read()
+    # Under the output directory so that a dockerized LIGO mounting the working directory sees it
+    with tempfile.TemporaryDirectory(dir=output_dir) as directory:
+        sources = os.path.join(directory, "farm")
+        shutil.copytree(farm_path, sources)
+        with open(os.path.join(sources, "partials", "types.mligo"), "w") as f:
+            f.write(with_layout(types_source, layout))
+        res = subprocess.run(shlex.split(ligo) + ["compile", "contract", os.path.join(sources, "main.mligo"), "-e", "main"],
+                             capture_output=True, text=True)
+        if res.returncode != 0:
+            raise RuntimeError(f"{layout.name}: {res.stderr.strip()}")
+    contract_path = os.path.join(output_dir, f"farm_{layout.name}.tz")
+    with open(contract_path, "w") as f:
+        f.write(res.stdout)
+    return contract_path
+
+
+def measure(contract_paths: Dict[str, str]) -> Dict[str, Dict[str, Metering]]:
+    """Metering of the farm benchmarks for every compiled layout, by layout name."""
+    return {name: run_benchmarks("farm/", {farm_contract_path: path})[0] for name, path in contract_paths.items()}
+
+
+def rank(results: Dict[str, Dict[str, Metering]]) -> List[Tuple[str, int]]:
+    """Layouts by total gas over the benchmarks they all run, the cheapest first."""
+    common = set.intersection(*(set(meterings) for meterings in results.values()))
+    totals = {name: sum(meterings[benchmark].gas for benchmark in common) for name, meterings in results.items()}
+    return sorted(totals.items(), key=lambda item: item[1])
+
+
+# -----------------
+# --  MIGRATION  --
+# -----------------
+
+def migrate_literals(source: str, order: Sequence[str]) -> str:
+    """Reorders the farm storage object literals of a deploy script in `order`.
+
+    A farm storage literal is an object with the `user_points` and
+    `reward_at_week` keys; its keys unknown to `order` keep their place
+    after the others.
+    """
+    lines = source.split("\n")
+    position = {name: index for index, name in enumerate(order)}
+    index = 0
+    while index < len(lines):
+        if not lines[index].rstrip().endswith("{"):
+            index += 1
+            continue
+        end = index + 1
+        entries = []
+        while end < len(lines) and literal_entry_pattern.match(lines[end]):
+            entries.append(literal_entry_pattern.match(lines[end]))
+            end += 1
+        names = [entry.group(2) for entry in entries]
+        if "user_points" in names and "reward_at_week" in names:
+            trailing_comma = entries[-1].group(4)
+            ordered = sorted(entries, key=lambda entry: position.get(entry.group(2), len(order)))
+            lines[index + 1:end] = [
+                f"{entry.group(1)}'{entry.group(2)}': {entry.group(3)}{',' if i < len(ordered) - 1 else trailing_comma}"
+                for i, entry in enumerate(ordered)
+            ]
+        index = end
+    return "\n".join(lines)
+
+
+def apply_layout(layout: Layout) -> List[str]:
+    """Writes `layout` to `types.mligo` and migrates the deploy scripts, returns the changed files."""
+    changed = []
+    with open(types_path) as f:
+        types_source = f.read()
+    with open(types_path, "w") as f:
+        f.write(with_layout(types_source, layout))
+    changed.append(types_path)
+    for path in sorted(glob.glob(os.path.join(deploy_path, "*.ts")) + glob.glob(os.path.join(deploy_path, "*.js"))):
+        with open(path) as f:
+            source = f.read()
+        migrated = migrate_literals(source, layout.order)
+        if migrated != source:
+            with open(path, "w") as f:
+                f.write(migrated)
+            changed.append(path)
+    return changed
+
+
+# -----------------
+# --  RUNNER  --
+# -----------------
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Find the cheapest field layout of the farm storage")
+    parser.add_argument("--ligo", default="ligo", help="LIGO command (default: %(default)s)")
+    parser.add_argument("--order", action="append", default=[], help="comma-separated field order to try (repeatable)")
+    parser.add_argument("--output", default=layouts_path, help="directory of the compiled variants (default: %(default)s)")
+    parser.add_argument("--apply", action="store_true", help="write the cheapest layout to types.mligo and the deploy scripts")
+    args = parser.parse_args()
+
+    with open(types_path) as f:
+        types_source = f.read()
+    with open(methods_path) as f:
+        methods_source = f.read()
+    layouts = {layout.name: layout for layout in candidate_layouts(types_source, methods_source,
+                                                                    [order.split(",") for order in args.order])}
+    try:
+        contract_paths = {name: compile_layout(layout, args.ligo, args.output) for name, layout in layouts.items()}
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
+    results = measure(contract_paths)
+
+    names = list(results)
+    print(f"{'benchmark':<32} " + " ".join(f"{name:>10}" for name in names))
+    for benchmark in sorted(set.intersection(*(set(meterings) for meterings in results.values()))):
+        print(f"{benchmark:<32} " + " ".join(f"{results[name][benchmark].gas:>10}" for name in names))
+    ranking = rank(results)
+    for name, gas in ranking:
+        print(f"{name:<10} {gas:>8} gas  {','.join(layouts[name].order) if layouts[name].comb else '(tree)'}")
+
+    best = layouts[ranking[0][0]]
+    if args.apply and best.name != "tree":
+        for path in apply_layout(best):
+            print(f"Updated {os.path.relpath(path, root_path)}")
+        print("Recompile farm.tz and the farm.json artefact, then run `python3 gas_benchmark.py --update`")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,222 @@
+"""In-process stand-in of a Tezos node for the farm tools.
+
+`LocalChain` originates and calls contracts with the pytezos interpreter and
+bakes the applied operations into blocks shaped like the RPC ones
+(`/chains/main/blocks/<level>`): every operation result carries the new
+storage, with its big_maps given by id, and the `lazy_storage_diff` of the
+big_map keys the call changed. Internal operations are returned to the
+caller, not applied.
+
+`apply` takes the RPC contents of a manager operation group instead: the
+contracts it originates get the addresses the protocol derives from the
+hash of the group, the global constants it registers are expanded in the
+scripts of the following originations and the public keys it reveals are
+kept by public key hash.
+"""
+from hashlib import blake2b, sha256
+from typing import Any, Dict, List, Optional
+import json
+
+from pytezos import ContractInterface
+from pytezos.contract.call import ContractCall
+from pytezos.crypto.encoding import base58_decode, base58_encode
+from pytezos.michelson.forge import forge_micheline, forge_script_expr
+from pytezos.michelson.sections import StorageSection
+from pytezos.michelson.types import BigMapType
+
+sec_block = 30
+
+
+class LocalChainError(Exception):
+    pass
+
+
+def contract_address(seed: str) -> str:
+    """Deterministic KT1 address derived from `seed`."""
+    return base58_encode(sha256(seed.encode()).digest()[:20], b"KT1").decode()
+
+
+def block_hash(level: int) -> str:
+    """Deterministic block hash of `level`."""
+    return base58_encode(sha256(f"block {level}".encode()).digest(), b"B").decode()
+
+
+def originated_address(operation_hash: str, index: int) -> str:
+    """Address of the `index`-th contract originated by the operation group `operation_hash`."""
+    nonce = base58_decode(operation_hash.encode()) + index.to_bytes(4, "big")
+    return base58_encode(blake2b(nonce, digest_size=20).digest(), b"KT1").decode()
+
+
+def constant_hash(value: Any) -> str:
+    """Hash under which the Micheline `value` is registered as a global constant."""
+    return forge_script_expr(forge_micheline(value))
+
+
+def expand_constants(expr: Any, constants: Dict[str, Any]) -> Any:
+    """`expr` where every `constant "expr..."` is replaced by its registered value."""
+    if isinstance(expr, list):
+        return [expand_constants(item, constants) for item in expr]
+    if not isinstance(expr, dict) or "prim" not in expr:
+        return expr
+    if expr["prim"] == "constant":
+        return expand_constants(constants[expr["args"][0]["string"]], constants)
+    return dict(expr, args=[expand_constants(arg, constants) for arg in expr.get("args", [])])
+
+
+class LocalChain:
+    def __init__(self, level: int = 1, timestamp: int = 0):
+        self.level = level
+        self.timestamp = timestamp
+        self.blocks: List[dict] = []
+        self.contracts: Dict[str, ContractInterface] = {}
+        # Python storages, big_maps as dicts
+        self.storages: Dict[str, dict] = {}
+        # address -> field -> big_map id
+        self.big_map_ids: Dict[str, Dict[str, int]] = {}
+        self._next_big_map_id = 0
+        # Global constants by hash
+        self.constants: Dict[str, Any] = {}
+        # Revealed public keys by public key hash
+        self.public_keys: Dict[str, str] = {}
+        self._contents: List[dict] = []
+
+    def _storage_type(self, address: str):
+        return StorageSection.match(self.contracts[address].context.storage_expr).args[0]
+
+    def _big_map_fields(self, address: str) -> Dict[str, BigMapType]:
+        fields = self._storage_type(address).get_flat_args(infer_names=True)
+        return {name: ty for name, ty in fields.items() if issubclass(ty, BigMapType)}
+
+    def _storage_micheline(self, address: str, storage: dict):
+        with_ids = dict(storage, **self.big_map_ids[address])
+        return self._storage_type(address).from_python_object(with_ids).to_micheline_value(lazy_diff=None)
+
+    def _lazy_storage_diff(self, address: str, old: dict, new: dict, alloc: bool) -> List[dict]:
+        diffs = []
+        for field, ty in self._big_map_fields(address).items():
+            key_type, value_type = ty.args
+            updates = []
+            for key in sorted(set(old[field]) | set(new[field]), key=repr):
+                if key in new[field] and old[field].get(key) == new[field][key]:
+                    continue
+                packed_key = key_type.from_python_object(key)
+                update = {"key": packed_key.to_micheline_value(), "key_hash": forge_script_expr(packed_key.pack(legacy=True))}
+                if key in new[field]:
+                    update["value"] = value_type.from_python_object(new[field][key]).to_micheline_value()
+                updates.append(update)
+            if not updates and not alloc:
+                continue
+            diff = {"action": "alloc" if alloc else "update", "updates": updates}
+            if alloc:
+                diff.update(key_type=key_type.as_micheline_expr(), value_type=value_type.as_micheline_expr())
+            diffs.append({"kind": "big_map", "id": str(self.big_map_ids[address][field]), "diff": diff})
+        return diffs
+
+    def originate(self, contract: ContractInterface, storage: dict, address: Optional[str] = None) -> str:
+        """Originates `contract` with the python `storage`, returns its address."""
+        address = address or contract_address(f"{self.level}/{len(self.contracts)}")
+        self.contracts[address] = contract
+        self.storages[address] = storage
+        self.big_map_ids[address] = {}
+        for field in self._big_map_fields(address):
+            self.big_map_ids[address][field] = self._next_big_map_id
+            self._next_big_map_id += 1
+        empty = {field: {} for field in self.big_map_ids[address]}
+        self._contents.append({
+            "kind": "origination",
+            "balance": "0",
+            "script": {"code": contract.to_micheline(), "storage": self._storage_micheline(address, storage)},
+            "metadata": {"operation_result": {
+                "status": "applied",
+                "originated_contracts": [address],
+                "lazy_storage_diff": self._lazy_storage_diff(address, empty, storage, alloc=True),
+            }},
+        })
+        return address
+
+    def call(self, address: str, entrypoint: str, *args, sender: str, amount: int = 0, now: Optional[int] = None):
+        """Applies `entrypoint(*args)` of the contract at `address`, returns the interpretation result."""
+        call = getattr(self.contracts[address], entrypoint)(*args)
+        return self._call(address, call, sender, amount, now)
+
+    def _call(self, address: str, call: ContractCall, sender: str, amount: int, now: Optional[int]):
+        now = self.timestamp if now is None else now
+        res = call.interpret(storage=self.storages[address], sender=sender, source=sender, amount=amount,
+                             now=now, level=self.level, self_address=address)
+        self._contents.append({
+            "kind": "transaction",
+            "source": sender,
+            "amount": str(amount),
+            "destination": address,
+            "parameters": call.parameters,
+            "metadata": {"operation_result": {
+                "status": "applied",
+                "storage": self._storage_micheline(address, res.storage),
+                "lazy_storage_diff": self._lazy_storage_diff(address, self.storages[address], res.storage, alloc=False),
+            }},
+        })
+        self.storages[address] = res.storage
+        return res
+
+    def apply(self, contents: List[dict], operation_hash: str) -> List[str]:
+        """Applies the RPC contents of the manager operation group `operation_hash`, returns the originated addresses.
+
+        Only reveals, originations, transactions to contracts and global
+        constant registrations are supported.
+        """
+        originated = []
+        for content in contents:
+            if content["kind"] == "reveal":
+                if content["source"] in self.public_keys:
+                    raise LocalChainError(f"{content['source']} is already revealed")
+                self.public_keys[content["source"]] = content["public_key"]
+                self._contents.append(dict(content, metadata={"operation_result": {"status": "applied"}}))
+            elif content["kind"] == "register_global_constant":
+                self.constants[constant_hash(content["value"])] = content["value"]
+            elif content["kind"] == "origination":
+                contract = ContractInterface.from_micheline(expand_constants(content["script"]["code"], self.constants))
+                address = originated_address(operation_hash, len(originated))
+                self.originate(contract, contract.storage.decode(content["script"]["storage"]), address)
+                originated.append(address)
+            elif content["kind"] == "transaction":
+                address = content["destination"]
+                call = ContractCall(self.contracts[address].context, content["parameters"])
+                self._call(address, call, content["source"], int(content["amount"]), None)
+            else:
+                raise LocalChainError(f"{content['kind']} operations are not supported")
+        return originated
+
+    def bake(self, seconds: int = sec_block) -> dict:
+        """Closes the current block with the operations applied since the last one."""
+        block = {
+            "header": {"level": self.level, "timestamp": self.timestamp},
+            "operations": [[], [], [], [{"contents": self._contents}]] if self._contents else [[], [], [], []],
+        }
+        self.blocks.append(block)
+        self._contents = []
+        self.level += 1
+        self.timestamp += seconds
+        return block
+
+    def rpc_responses(self) -> Dict[str, object]:
+        """RPC responses of the head (the last baked block) for the storages and big_map values, by path."""
+        level = self.level - 1
+        head = f"/chains/main/blocks/{block_hash(level)}"
+        responses: Dict[str, object] = {
+            "/chains/main/blocks/head/header": {"hash": block_hash(level), "level": level, "timestamp": self.timestamp - sec_block},
+        }
+        for address, storage in self.storages.items():
+            responses[f"{head}/context/contracts/{address}/storage"] = self._storage_micheline(address, storage)
+            for field, ty in self._big_map_fields(address).items():
+                key_type, value_type = ty.args
+                for key, value in storage[field].items():
+                    key_hash = forge_script_expr(key_type.from_python_object(key).pack(legacy=True))
+                    path = f"{head}/context/big_maps/{self.big_map_ids[address][field]}/{key_hash}"
+                    responses[path] = value_type.from_python_object(value).to_micheline_value()
+        return responses
+
+    def save(self, path: str) -> None:
+        """Writes the baked blocks, one JSON block per line."""
+        with open(path, "w") as f:
+            for block in self.blocks:
+                f.write(json.dumps(block) + "\n")
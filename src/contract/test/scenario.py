@@ -0,0 +1,187 @@
+"""Chained contract calls that thread the storage from one step to the next.
+
+A scenario is a list of declarative `Step`s. `ScenarioRunner.run` interprets
+them one after the other, each on the storage left by the previous one, and
+records the operations of every step. Big_maps are not materialized between
+steps: they stay given by id (see `gas_meter.lazy_call`), only the keys a call
+reads are loaded and the keys it writes are added as a new layer on top of the
+previous state. States are immutable and share their layers, so branching from
+any step of a long scenario copies nothing.
+
+Every state has a content hash, which is the same for two states holding the
+same storage, whatever the steps that led to them. The result of a step is
+cached under the hash of its state and the step, and replaying a prefix,
+or reaching the same state through another path, costs nothing.
+
+    runner = ScenarioRunner(load_contract("compiled/farm.tz"))
+    results = runner.run(runner.state(storage), [Step("stake", alice, now=100, parameter=500), ...])
+    results[-1].state.storage()["user_stakes"]
+"""
+from hashlib import sha256
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+import json
+
+from pytezos import ContractInterface
+from pytezos.michelson.forge import forge_script_expr
+from pytezos.michelson.sections import StorageSection
+from pytezos.michelson.types import BigMapType
+
+from gas_meter import lazy_call
+
+# Layers above which a big_map is flattened into a single dict
+max_layers = 64
+_hash_modulo = 2 ** 256
+
+
+def _entry_hash(key_hash: str, value) -> int:
+    return int.from_bytes(sha256(f"{key_hash}{json.dumps(value, sort_keys=True)}".encode()).digest(), "big")
+
+
+class LazyBigMap:
+    """Immutable big_map content: `{key hash: (Micheline key, Micheline value)}` layers.
+
+    `digest` is the sum of the hashes of the entries, so that it only depends
+    on the content and is updated entry by entry.
+    """
+
+    def __init__(self, entries: Dict[str, Tuple[Any, Any]], parent: Optional["LazyBigMap"] = None, digest: Optional[int] = None):
+        self.entries = entries
+        self.parent = parent
+        self.layers = 1 if parent is None else parent.layers + 1
+        if digest is None:
+            digest = sum(_entry_hash(key_hash, value) for key_hash, (_, value) in entries.items()) % _hash_modulo
+        self.digest = digest
+
+    def _entry(self, key_hash: str) -> Optional[Tuple[Any, Any]]:
+        layer = self
+        while layer is not None:
+            if key_hash in layer.entries:
+                return layer.entries[key_hash]
+            layer = layer.parent
+        return None
+
+    def get(self, key_hash: str, default=None):
+        """Micheline value of the key, as `LocalBigMapContext` reads it."""
+        entry = self._entry(key_hash)
+        return default if entry is None or entry[1] is None else entry[1]
+
+    def items(self) -> Iterator[Tuple[str, Tuple[Any, Any]]]:
+        """(key hash, (Micheline key, Micheline value)) of the present keys."""
+        seen = set()
+        layer = self
+        while layer is not None:
+            for key_hash, entry in layer.entries.items():
+                if key_hash not in seen:
+                    seen.add(key_hash)
+                    if entry[1] is not None:
+                        yield key_hash, entry
+            layer = layer.parent
+
+    def updated(self, writes: Dict[str, Tuple[Any, Any]]) -> "LazyBigMap":
+        """New big_map with `writes` applied, a value of None removing the key."""
+        digest = self.digest
+        for key_hash, (_, value) in writes.items():
+            previous = self.get(key_hash)
+            if previous is not None:
+                digest -= _entry_hash(key_hash, previous)
+            if value is not None:
+                digest += _entry_hash(key_hash, value)
+        if self.layers >= max_layers:
+            return LazyBigMap(dict(dict(self.items()), **writes), digest=digest % _hash_modulo)
+        return LazyBigMap(dict(writes), self, digest % _hash_modulo)
+
+
+class Step(NamedTuple):
+    entrypoint: str
+    sender: str
+    now: int = 0
+    # Tez sent with the call
+    amount: int = 0
+    # Argument of the entrypoint, None for unit
+    parameter: Any = None
+
+
+class State:
+    """Storage of the contract between two steps, its big_maps given by id."""
+
+    def __init__(self, runner: "ScenarioRunner", storage: dict, big_maps: Dict[int, LazyBigMap]):
+        self.runner = runner
+        self.lazy_storage = storage
+        self.big_maps = big_maps
+        value = runner.storage_type.from_python_object(storage).to_micheline_value(lazy_diff=None)
+        digests = [f"{ptr}:{big_map.digest}" for ptr, big_map in sorted(big_maps.items())]
+        self.digest = sha256(json.dumps([value, digests], sort_keys=True).encode()).hexdigest()
+
+    def big_map(self, field: str) -> Dict[Any, Any]:
+        """The python content of the big_map `field`."""
+        key_type, value_type = self.runner.big_map_fields[field].args
+        return {key_type.from_micheline_value(key).to_python_object(): value_type.from_micheline_value(value).to_python_object()
+                for _, (key, value) in self.big_maps[self.lazy_storage[field]].items()}
+
+    def storage(self) -> dict:
+        """The python storage with its big_maps materialized, as `interpret` returns it."""
+        storage = dict(self.lazy_storage)
+        storage.update((field, self.big_map(field)) for field in self.runner.big_map_fields)
+        return storage
+
+
+class StepResult(NamedTuple):
+    step: Step
+    state: State
+    operations: List[dict]
+
+
+class ScenarioRunner:
+    def __init__(self, contract: ContractInterface, self_address: Optional[str] = None):
+        self.contract = contract
+        self.self_address = self_address
+        self.storage_type = StorageSection.match(contract.context.storage_expr).args[0]
+        self.big_map_fields = {name: ty for name, ty in self.storage_type.get_flat_args(infer_names=True).items()
+                               if issubclass(ty, BigMapType)}
+        # sha256 of (state digest, step) -> result
+        self._cache: Dict[str, StepResult] = {}
+        self.cache_hits = 0
+
+    def state(self, storage: dict) -> State:
+        """Initial state from a python storage as handed to `interpret(storage=...)`."""
+        lazy_storage, big_maps = dict(storage), {}
+        for ptr, (field, ty) in enumerate(self.big_map_fields.items()):
+            key_type, value_type = ty.args
+            entries = {}
+            for key, value in storage[field].items():
+                key_value = key_type.from_python_object(key)
+                entries[forge_script_expr(key_value.pack(legacy=True))] = (
+                    key_value.to_micheline_value(), value_type.from_python_object(value).to_micheline_value())
+            big_maps[ptr] = LazyBigMap(entries)
+            lazy_storage[field] = ptr
+        return State(self, lazy_storage, big_maps)
+
+    def step(self, state: State, step: Step) -> StepResult:
+        """Interprets `step` on `state`; raises `MichelsonRuntimeError` when the call fails."""
+        key = sha256(f"{state.digest}{step!r}".encode()).hexdigest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        entrypoint = getattr(self.contract, step.entrypoint)
+        call = entrypoint() if step.parameter is None else entrypoint(step.parameter)
+        result, writes = lazy_call(call, state.lazy_storage, state.big_maps, sender=step.sender, source=step.sender,
+                                   amount=step.amount, now=step.now, self_address=self.self_address)
+        big_maps = dict(state.big_maps)
+        for ptr, entries in writes.items():
+            big_maps[ptr] = big_maps[ptr].updated(entries)
+        self._cache[key] = StepResult(step, State(self, result.storage, big_maps), result.operations)
+        return self._cache[key]
+
+    def run(self, state: State, steps: Sequence[Step]) -> List[StepResult]:
+        """Interprets the steps in order, each on the state left by the previous one."""
+        results = []
+        for index, step in enumerate(steps):
+            try:
+                result = self.step(state, step)
+            except Exception as e:
+                e.args = e.args + (f"step {index}: {step}",)
+                raise
+            results.append(result)
+            state = result.state
+        return results
@@ -0,0 +1,120 @@
+"""Copy-on-write storages for tests.
+
+`StorageFixture(storage)` freezes a base storage once. `overlay()` then hands out
+a dict that shares every field with the base until the test reads it for
+modification: only the containers a test touches (e.g. `user_points`, then the
+one user list it edits) are copied. Overlays are plain `dict`/`list`
+subclasses, so they go straight into `interpret(storage=...)`. `deepcopy`,
+`copy`, `pickle` and `dict(...)` of a frozen container or an overlay give
+plain mutable containers.
+"""
+from copy import deepcopy
+from typing import Any
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError("frozen storage cannot be modified, use StorageFixture.overlay()")
+
+
+class FrozenList(list):
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    # The default copy protocol rebuilds the list through extend
+    def __copy__(self):
+        return thaw(self)
+
+    def __deepcopy__(self, memo):
+        return [deepcopy(item, memo) for item in self]
+
+    def __reduce_ex__(self, protocol):
+        return list, (list(self),)
+
+
+class FrozenDict(dict):
+    __setitem__ = __delitem__ = _read_only
+    pop = popitem = clear = update = setdefault = _read_only
+
+    # The default copy protocol rebuilds the dict through __setitem__
+    def __copy__(self):
+        return thaw(self)
+
+    def __deepcopy__(self, memo):
+        return {deepcopy(key, memo): deepcopy(value, memo) for key, value in dict.items(self)}
+
+    def __reduce_ex__(self, protocol):
+        return dict, (dict(self),)
+
+
+def freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Writable copy of a frozen container.
+
+    A dict becomes an overlay whose values stay shared until they are read.
+    A list is copied with its container items thawed in turn, a list having
+    no way to copy an item on read.
+    """
+    if isinstance(value, FrozenDict):
+        return StorageOverlay(value)
+    if isinstance(value, FrozenList):
+        return [item if not isinstance(item, (FrozenDict, FrozenList)) else thaw(item) for item in value]
+    return value
+
+
+class StorageOverlay(dict):
+    """dict whose frozen values are copied the first time they are read."""
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, (FrozenDict, FrozenList)):
+            value = thaw(value)
+            dict.__setitem__(self, key, value)
+        return value
+
+    # Not dict.__iter__: dict(overlay) and {**overlay} then read the values through __getitem__
+    def __iter__(self):
+        return dict.__iter__(self)
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def copy(self):
+        return StorageOverlay(dict.items(self))
+
+    def __deepcopy__(self, memo):
+        return {deepcopy(key, memo): deepcopy(value, memo) for key, value in dict.items(self)}
+
+    def __reduce_ex__(self, protocol):
+        return dict, (dict(self),)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+
+class StorageFixture:
+    def __init__(self, storage: dict):
+        self.base = freeze(storage)
+
+    def overlay(self, **fields) -> StorageOverlay:
+        storage = StorageOverlay(self.base)
+        storage.update(fields)
+        return storage
@@ -2,9 +2,15 @@ from unittest import TestCase
 from contextlib import contextmanager
 from copy import deepcopy
 from pytezos import ContractInterface, MichelsonRuntimeError, pytezos
+from pytezos.michelson.forge import forge_address
 from pytezos.michelson.types.big_map import big_map_diff_to_lazy_diff
 import time
 
+from contract_cache import load_contract, load_dummy_storage
+from gas_meter import hard_gas_limit_per_operation, lazy_storage, meter_view
+from local_chain import contract_address
+from storage_fixture import StorageFixture
+
 alice = 'tz1hNVs94TTjZh6BZ1PM5HL83A7aiZXkQ8ur'
 admin = 'tz1fABJ97CJMSP2DKrQx2HAFazh6GgahQ7ZK'
 bob = 'tz1c6PPijJnZYjKiSQND4pMtGMg6csGeAiiF'
@@ -13,10 +19,13 @@ fox = 'tz1XH5UyhRCUmCdUUbqD4tZaaqRTgGaFXt7q'
 
 compiled_contract_path = "compiled/database.tz"
 # Permet de charger le smart contract zvec Pytest de le simuler avec un faux storage
-initial_storage = ContractInterface.from_file(compiled_contract_path).storage.dummy()
+initial_storage = load_dummy_storage(compiled_contract_path)
 initial_storage["admin"] = admin
 initial_storage["all_farms"] = []
 initial_storage["all_farms_data"] = {}
+initial_storage["farms_by_index"] = {}
+initial_storage["farm_index"] = {}
+database_storage = StorageFixture(initial_storage)
 
 farm_address = "KT1TwzD6zV3WeJ39ukuqxcfK2fJCnhvrdN1X"
 lp_address ="KT1XtQeSap9wvJGY1Lmek84NU6PK6cjzC9Qd"
@@ -24,11 +33,39 @@ farm_lp_info = "pair colibri-pouet"
 
 only_admin = "Only admin"
 amount_zero = "This smart contract does not accept tez"
+unknown_farm = "Unknown farm"
+
+big_map_fields = ["all_farms_data", "inverse_farms", "farms_by_index", "farm_index"]
+
+second_lp_address = "KT1BEqzn5Wx8uJrZNvuS9DVHmLvG9td3fDLi"
+registered_farms = 3000
+
+
+def registered_storage(farms_count: int):
+    """Database storage of `farms_count` farms spread over two LP tokens, its big_maps given by id."""
+    addresses = [contract_address(f"farm {i}") for i in range(farms_count)]
+    lps = [lp_address if i % 3 else second_lp_address for i in range(farms_count)]
+    storage = database_storage.overlay()
+    storage["all_farms"] = addresses
+    storage["all_farms_data"] = {address: {"lp_address": lp, "farm_lp_info": f"{farm_lp_info} {i}"}
+                                 for i, (address, lp) in enumerate(zip(addresses, lps))}
+    storage["inverse_farms"] = {}
+    for address, lp in zip(addresses, lps):
+        storage["inverse_farms"].setdefault(lp, {})[address] = storage["all_farms_data"][address]["farm_lp_info"]
+    storage["farms_by_index"] = dict(enumerate(addresses))
+    storage["farm_index"] = {address: index for index, address in enumerate(addresses)}
+    return storage
+
+
+def ordered(addresses):
+    """`addresses` in the order of Michelson sets and maps."""
+    return sorted(addresses, key=forge_address)
+
 
 class FarmsContractTest(TestCase):
     @classmethod
     def setUpClass(cls):
-        cls.farms = ContractInterface.from_file(compiled_contract_path)
+        cls.farms = load_contract(compiled_contract_path)
         cls.maxDiff = None
 
     @contextmanager
@@ -46,7 +83,7 @@ class FarmsContractTest(TestCase):
     # Admin add a new farm (works) #
     ######################################
     def test_addFarm(self):
-        init_storage = deepcopy(initial_storage)
+        init_storage = database_storage.overlay()
         input = {}
         input["farm_address"] = farm_address
         input["lp_address"] = lp_address
@@ -63,7 +100,7 @@ class FarmsContractTest(TestCase):
     # random user add a new farm (fails) #
     ######################################
     def test_addFarm_not_admin_fails(self):
-        init_storage = deepcopy(initial_storage)
+        init_storage = database_storage.overlay()
         input = {}
         input["farm_address"] = farm_address
         input["lp_address"] = lp_address
@@ -76,7 +113,7 @@ class FarmsContractTest(TestCase):
     # Admin add a new farm with some tez (fails) #
     ######################################
     def test_addFarm_with_amount_fails(self):
-        init_storage = deepcopy(initial_storage)
+        init_storage = database_storage.overlay()
         input = {}
         input["farm_address"] = farm_address
         input["lp_address"] = lp_address
@@ -85,3 +122,135 @@ class FarmsContractTest(TestCase):
         with self.raisesMichelsonError(amount_zero):
             self.farms.add_farm(input).interpret(storage=init_storage, sender=admin, amount=1)
 
+    ######################################
+    # Admin adds a known farm again (works) #
+    ######################################
+    def test_addFarm_again_should_keep_its_index(self):
+        init_storage = registered_storage(3)
+        input = {"farm_address": init_storage["all_farms"][1], "lp_address": lp_address, "farm_lp_info": "new info"}
+
+        res = self.farms.add_farm(input).interpret(storage=init_storage, sender=admin)
+        self.assertEqual(res.storage["farms_by_index"], init_storage["farms_by_index"])
+        self.assertEqual(res.storage["farm_index"], init_storage["farm_index"])
+        self.assertEqual(res.storage["all_farms_data"][input["farm_address"]]["farm_lp_info"], "new info")
+
+    ######################################
+    # Admin removes a farm (works) #
+    ######################################
+    def test_removeFarm_should_move_the_last_farm_to_its_index(self):
+        init_storage = registered_storage(4)
+        addresses = init_storage["all_farms"]
+
+        res = self.farms.remove_farm({"farm_address": addresses[1], "lp_address": lp_address}).interpret(storage=init_storage, sender=admin)
+        # Removed big_map keys are None
+        self.assertEqual(res.storage["farms_by_index"], {0: addresses[0], 1: addresses[3], 2: addresses[2], 3: None})
+        self.assertEqual(res.storage["farm_index"], {addresses[0]: 0, addresses[1]: None, addresses[2]: 2, addresses[3]: 1})
+        # The last farm itself
+        res = self.farms.remove_farm({"farm_address": addresses[3], "lp_address": second_lp_address}).interpret(storage=init_storage, sender=admin)
+        self.assertEqual(res.storage["farms_by_index"], {0: addresses[0], 1: addresses[1], 2: addresses[2], 3: None})
+        self.assertEqual(res.storage["farm_index"], {addresses[0]: 0, addresses[1]: 1, addresses[2]: 2, addresses[3]: None})
+
+    ######################################
+    # Admin adds a pool of an unknown farm (fails) #
+    ######################################
+    def test_addPool_unknown_farm_fails(self):
+        init_storage = registered_storage(3)
+        input = {"farm_address": farm_address, "pool_id": 0, "lp_address": lp_address, "farm_lp_info": farm_lp_info}
+
+        with self.raisesMichelsonError(unknown_farm):
+            self.farms.add_pool(input).interpret(storage=init_storage, sender=admin)
+        res = self.farms.add_pool(dict(input, farm_address=init_storage["all_farms"][0])).interpret(storage=init_storage, sender=admin)
+        self.assertEqual(res.storage["all_pools"][(init_storage["all_farms"][0], 0)], {"lp_address": lp_address, "farm_lp_info": farm_lp_info})
+
+    ######################################
+    # User claims several farms at once (works) #
+    ######################################
+    def test_claimFarms_should_claim_every_farm_for_sender(self):
+        init_storage = database_storage.overlay()
+        init_storage["all_farms"] = [farm_address, lp_address]
+
+        res = self.farms.claim_farms([farm_address, lp_address]).interpret(storage=init_storage, sender=alice, amount=0)
+        self.assertEqual(res.storage["all_farms"], [farm_address, lp_address])
+        self.assertEqual([op["destination"] for op in res.operations], [farm_address, lp_address])
+        for op in res.operations:
+            self.assertEqual(op["parameters"]["entrypoint"], "claim_for")
+            self.assertEqual(op["parameters"]["value"], {"string": alice})
+            self.assertEqual(op["amount"], "0")
+
+    ######################################
+    # User claims an unknown farm (fails) #
+    ######################################
+    def test_claimFarms_unknown_farm_fails(self):
+        init_storage = database_storage.overlay()
+        init_storage["all_farms"] = [farm_address]
+
+        with self.raisesMichelsonError(unknown_farm):
+            self.farms.claim_farms([farm_address, lp_address]).interpret(storage=init_storage, sender=alice)
+
+    ######################################
+    # User claims farms with some tez (fails) #
+    ######################################
+    def test_claimFarms_with_amount_fails(self):
+        init_storage = database_storage.overlay()
+        init_storage["all_farms"] = [farm_address]
+
+        with self.raisesMichelsonError(amount_zero):
+            self.farms.claim_farms([farm_address]).interpret(storage=init_storage, sender=alice, amount=1)
+
+    ######################################
+    # Views on thousands of farms (works) #
+    ######################################
+    def test_getFarm_should_return_farm_metadata(self):
+        storage = registered_storage(registered_farms)
+        lazy, big_maps = lazy_storage(self.farms.context.storage_expr, storage, big_map_fields)
+        address = storage["all_farms"][7]
+
+        metadata, metering = meter_view(self.farms.get_farm(address), lazy, big_maps=big_maps)
+        self.assertEqual(metadata, storage["all_farms_data"][address])
+        self.assertIsNone(meter_view(self.farms.get_farm(farm_address), lazy, big_maps=big_maps)[0])
+        # The set of farms is decoded, the big_map only read once
+        self.assertLess(metering.gas, hard_gas_limit_per_operation // 10)
+
+    def test_listFarms_should_page_registered_farms(self):
+        storage = registered_storage(registered_farms)
+        lazy, big_maps = lazy_storage(self.farms.context.storage_expr, storage, big_map_fields)
+        # In the order of registration
+        addresses = storage["all_farms"]
+
+        pages, gas = [], []
+        for offset in range(0, registered_farms, 1000):
+            page, metering = meter_view(self.farms.list_farms({"offset": offset, "limit": 1000}), lazy, big_maps=big_maps)
+            self.assertEqual(page["total"], registered_farms)
+            pages += page["farms"]
+            gas.append(metering.gas)
+        self.assertEqual([farm["farm_address"] for farm in pages], addresses)
+        for farm in pages:
+            self.assertEqual(farm["lp_address"], storage["all_farms_data"][farm["farm_address"]]["lp_address"])
+            self.assertEqual(farm["farm_lp_info"], storage["all_farms_data"][farm["farm_address"]]["farm_lp_info"])
+        self.assertLess(max(gas), hard_gas_limit_per_operation)
+        # Only the farms of the page are read
+        self.assertLess(max(gas) - min(gas), min(gas) // 100)
+        print(f"list_farms: {registered_farms} farms, pages of 1000 farms cost {gas} gas")
+
+        last, _ = meter_view(self.farms.list_farms({"offset": registered_farms - 10, "limit": 50}), lazy, big_maps=big_maps)
+        self.assertEqual([farm["farm_address"] for farm in last["farms"]], addresses[-10:])
+        beyond, _ = meter_view(self.farms.list_farms({"offset": registered_farms, "limit": 50}), lazy, big_maps=big_maps)
+        self.assertEqual(beyond, {"farms": [], "total": registered_farms})
+
+    def test_getFarmsByLp_should_page_farms_of_lp(self):
+        storage = registered_storage(registered_farms)
+        lazy, big_maps = lazy_storage(self.farms.context.storage_expr, storage, big_map_fields)
+        addresses = ordered(storage["inverse_farms"][lp_address])
+
+        page, metering = meter_view(self.farms.get_farms_by_lp({"lp_address": lp_address, "offset": 100, "limit": 20}),
+                                    lazy, big_maps=big_maps)
+        self.assertEqual(page["total"], len(addresses))
+        self.assertEqual([farm["farm_address"] for farm in page["farms"]], addresses[100:120])
+        self.assertEqual({farm["lp_address"] for farm in page["farms"]}, {lp_address})
+        self.assertEqual([farm["farm_lp_info"] for farm in page["farms"]], [storage["inverse_farms"][lp_address][a] for a in addresses[100:120]])
+        self.assertLess(metering.gas, hard_gas_limit_per_operation)
+        print(f"get_farms_by_lp: {len(addresses)} farms of the LP, a page of 20 farms costs {metering.gas} gas")
+
+        unknown, _ = meter_view(self.farms.get_farms_by_lp({"lp_address": farm_address, "offset": 0, "limit": 20}),
+                                lazy, big_maps=big_maps)
+        self.assertEqual(unknown, {"farms": [], "total": 0})
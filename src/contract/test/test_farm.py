@@ -9,6 +9,9 @@ from typing import Optional
 import time
 import json 
 
+from contract_cache import load_contract, load_dummy_storage
+from storage_fixture import StorageFixture
+
 alice = 'tz1hNVs94TTjZh6BZ1PM5HL83A7aiZXkQ8ur'
 admin = 'tz1fABJ97CJMSP2DKrQx2HAFazh6GgahQ7ZK'
 bob = 'tz1c6PPijJnZYjKiSQND4pMtGMg6csGeAiiF'
@@ -19,7 +22,7 @@ sec_week = 604800
 farm_address = "KT1BEqzn5Wx8uJrZNvuS9DVHmLvG9td3fDLi" # Hardcoded farm address for tests
 compiled_contract_path = "compiled/farm.tz"
 
-initial_storage = ContractInterface.from_file(compiled_contract_path).storage.dummy()
+initial_storage = load_dummy_storage(compiled_contract_path)
 initial_storage["admin"] = admin
 initial_storage["input_token_address"] ="KT1XtQeSap9wvJGY1Lmek84NU6PK6cjzC9Qd"
 initial_storage["reward_token_address"] = "KT1TwzD6zV3WeJ39ukuqxcfK2fJCnhvrdN1X"
@@ -32,11 +35,13 @@ initial_storage["user_points"] = {}
 initial_storage["farm_points"] = []
 initial_storage["creation_time"] = 0
 initial_storage["initialized"] = True
+initial_storage["week_duration"] = sec_week
 
 input_fa2_token_id_opt : Optional[int] = None
 reward_fa2_token_id : Optional[int] = None
 initial_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
 initial_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
+farm_storage = StorageFixture(initial_storage)
 
 
 only_admin = "Only the contract admin can change the contract administrator or increase reward"
@@ -51,6 +56,9 @@ unstake_more_than_stake = "You cannot unstake more than your farm staking"
 no_week_left = "There are no more weeks left for staking in the farm"
 contract_already_initialized = "The contract is already initialized"
 contract_not_initialized = "The contract is not initialized"
+week_duration_is_null = "The week duration must be greater than zero"
+no_claim_first_week = "You cannot claim any reward before the first farm week as passed"
+compound_not_supported = "Only a farm rewarding its input token can compound"
 
 def verify_fa12_stake_tx(tx, account, farm_addr, amount):
     assert(account == tx[0]['string'])
@@ -88,7 +96,7 @@ def verify_fa2_claim_tx(tx, account, farm_addr, token_id, amount):
 class FarmsContractTest(TestCase):
     @classmethod
     def setUpClass(cls):
-        cls.farms = ContractInterface.from_file(compiled_contract_path)
+        cls.farms = load_contract(compiled_contract_path)
         cls.maxDiff = None
 
     @contextmanager
@@ -108,7 +116,7 @@ class FarmsContractTest(TestCase):
 
     def test_set_admin_should_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         # Execute entrypoint
         res = self.farms.set_admin(bob).interpret(storage=init_storage, sender=admin, now=int(sec_week + sec_week/2))
         self.assertEqual(bob, res.storage["admin"])
@@ -116,14 +124,14 @@ class FarmsContractTest(TestCase):
 
     def test_set_admin_user_sets_new_admin_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         # Execute entrypoint
         with self.raisesMichelsonError(only_admin):
             self.farms.set_admin(bob).interpret(storage=init_storage, sender=alice, now=int(sec_week + sec_week/2))
 
     def test_set_admin_sending_XTZ_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         # Execute entrypoint
         with self.raisesMichelsonError(amount_must_be_zero_tez):
             self.farms.set_admin(bob).interpret(storage=init_storage, sender=admin, now=int(sec_week + sec_week/2), amount=1)
@@ -135,7 +143,7 @@ class FarmsContractTest(TestCase):
 
     def test_initializeReward_5week_20Kreward_75rate_initialization_should_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         init_storage["total_reward"] = 20_000_000
         init_storage["total_weeks"] = 5
         init_storage["rate"] = 7500
@@ -147,7 +155,7 @@ class FarmsContractTest(TestCase):
 
     def test_initializeReward_5week_30Kreward_80rate_initialization_should_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         init_storage["total_reward"] = 30_000_000
         init_storage["total_weeks"] = 5
         init_storage["rate"] = 8000
@@ -159,7 +167,7 @@ class FarmsContractTest(TestCase):
 
     def test_initializeReward_3week_40Kreward_60rate_initialization_should_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         init_storage["total_reward"] = 40_000_000
         init_storage["total_weeks"] = 3
         init_storage["rate"] = 6000
@@ -169,13 +177,23 @@ class FarmsContractTest(TestCase):
         expected_rewards = [20408163, 12244897, 7346938]
         self.assertEqual(res.storage["reward_at_week"], expected_rewards)
 
+    def test_initialize_with_null_week_duration_should_fail(self):
+        # Init
+        init_storage = farm_storage.overlay()
+        init_storage["week_duration"] = 0
+        init_storage["initialized"] = False
+        init_storage["reward_at_week"] = []
+        # Execute entrypoint
+        with self.raisesMichelsonError(week_duration_is_null):
+            self.farms.initialize().interpret(storage=init_storage, sender=admin, now=0)
+
     #########################
     # Test increase rewards #
     #########################
 
     def test_increase_reward_reward_50k_on_week_3_should_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         init_storage["total_reward"] = 20_000_000
         init_storage["total_weeks"] = 5
         init_storage["rate"] = 7500
@@ -189,7 +207,7 @@ class FarmsContractTest(TestCase):
 
     def test_increase_reward_reward_20k_on_week_2_should_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         init_storage["total_reward"] = 10_000_000
         init_storage["total_weeks"] = 3
         init_storage["rate"] = 7500
@@ -203,7 +221,7 @@ class FarmsContractTest(TestCase):
 
     def test_increase_reward_if_not_admin_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
         # Execute entrypoint
         with self.raisesMichelsonError(only_admin):
@@ -211,7 +229,7 @@ class FarmsContractTest(TestCase):
 
     def test_increase_reward_after_end_of_pool_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
         # Execute entrypoint
         with self.raisesMichelsonError(no_week_left):
@@ -219,7 +237,7 @@ class FarmsContractTest(TestCase):
 
     def test_increase_reward_if_farm_not_initialized_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
         init_storage["initialized"] = False
         # Execute entrypoint
@@ -230,326 +248,57 @@ class FarmsContractTest(TestCase):
     # Tests for Staking #
     ######################
 
-    def test_stake_fa12_one_time_on_second_week_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        locked_amount = 20
-
-        # Execute entrypoint
-        res = self.farms.stake(locked_amount).interpret(storage=init_storage, sender=bob, now=int(sec_week + sec_week/2))
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():
-            verify_fa12_stake_tx(transfer_tx_params, bob, farm_address, locked_amount)   
-            self.assertEqual(locked_amount, res.storage["user_stakes"][bob])
-        else:
-            verify_fa2_stake_tx(transfer_tx_params, bob, farm_address, input_token_id, locked_amount)
-            
-        expected_user_points = [0, sec_week * locked_amount / 2, sec_week * locked_amount, sec_week * locked_amount, sec_week * locked_amount]
-        self.assertEqual(res.storage["user_points"][bob], expected_user_points)
-        self.assertEqual(res.storage["farm_points"], expected_user_points)
-
-    def test_stake_one_time_on_second_week_with_fa2_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        locked_amount = 20
-        ############### FOR FA2   ################################
-        input_token_id = 1
-        input_fa2_token_id_opt : Optional[int] = input_token_id
-        reward_fa2_token_id : Optional[int] = 1
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-
-        # Execute entrypoint
-        res = self.farms.stake(locked_amount).interpret(storage=init_storage, sender=bob, now=int(sec_week + sec_week/2))
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():
-            # For FA12
-            verify_fa12_stake_tx(transfer_tx_params, bob, farm_address, locked_amount)   
-            self.assertEqual(locked_amount, res.storage["user_stakes"][bob])
-        else:
-            # For FA2
-            verify_fa2_stake_tx(transfer_tx_params, bob, farm_address, input_token_id, locked_amount)
-
-        expected_user_points = [0, sec_week * locked_amount / 2, sec_week * locked_amount, sec_week * locked_amount, sec_week * locked_amount]
-        self.assertEqual(res.storage["user_points"][bob], expected_user_points)
-        self.assertEqual(res.storage["farm_points"], expected_user_points)
-
-
-
     def test_stake_with_XTZ_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         # Execute entrypoint
         with self.raisesMichelsonError(amount_must_be_zero_tez):
             self.farms.stake(20).interpret(storage=init_storage, sender=bob, now=int(sec_week + sec_week/2), amount=1)
 
-    def test_stake_two_times_should_work(self):
-        # Init
-        test_init_storage = deepcopy(initial_storage)
-        test_init_storage["user_stakes"][bob] = 300
-        test_init_storage["user_points"][bob] = [0,0,int(300 * sec_week / 2),300 * sec_week, 300 * sec_week ]
-        test_init_storage["farm_points"] = [0,0,int(300 * sec_week / 2),300 * sec_week, 300 * sec_week ]
-
-        input_fa2_token_id_opt : Optional[int] = None
-        reward_fa2_token_id : Optional[int] = None
-        test_init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        test_init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-        #print(test_init_storage)
-
-        # Execute entrypoint
-        res = self.farms.stake(500).interpret(storage=test_init_storage, sender=bob, now=int(3 * sec_week + sec_week*2/3))
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-        verify_fa12_stake_tx(transfer_tx_params, bob, farm_address, 500)   
-        
-        self.assertEqual(800, res.storage["user_stakes"][bob])
-        expected_user_points = [0, 0, int(sec_week * 300 / 2), int(sec_week * 300 + sec_week * 500 / 3), int(sec_week * 300 + sec_week * 500) ]
-        self.assertEqual(res.storage["user_points"][bob], expected_user_points)
-        self.assertEqual(res.storage["farm_points"], expected_user_points)
-
-
-    def test_stake_two_times_with_fa2_should_work(self):
-        # Init
-        test_init_storage = deepcopy(initial_storage)
-        test_init_storage["user_stakes"][bob] = 300
-        test_init_storage["user_points"][bob] = [0,0,int(300 * sec_week / 2),300 * sec_week, 300 * sec_week ]
-        test_init_storage["farm_points"] = [0,0,int(300 * sec_week / 2),300 * sec_week, 300 * sec_week ]
-        ############### FOR FA2   ################################
-        input_token_id = 1
-        reward_token_id = 1
-        input_fa2_token_id_opt : Optional[int] = input_token_id
-        reward_fa2_token_id : Optional[int] = reward_token_id
-        test_init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        test_init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-
-        # Execute entrypoint
-        res = self.farms.stake(500).interpret(storage=test_init_storage, sender=bob, now=int(3 * sec_week + sec_week*2/3))
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        #print(transfer_tx_params)
-        if OptionType(test_init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12
-            verify_fa12_stake_tx(transfer_tx_params, bob, farm_address, 500)    
-        else: # For FA2            
-            verify_fa2_stake_tx(transfer_tx_params, bob, farm_address, input_token_id, 500)
-        self.assertEqual(800, res.storage["user_stakes"][bob])
-        expected_user_points = [0, 0, int(sec_week * 300 / 2), int(sec_week * 300 + sec_week * 500 / 3), int(sec_week * 300 + sec_week * 500) ]
-        self.assertEqual(res.storage["user_points"][bob], expected_user_points)
-        self.assertEqual(res.storage["farm_points"], expected_user_points)
-
-
-    def test_stake_fa12_with_two_different_users_should_work(self):
-        # Init
-        new_storage = deepcopy(initial_storage)
-        new_storage["user_stakes"][bob] = 300
-        new_storage["user_points"][bob] = [0,0,int(300 * sec_week / 2),300 * sec_week, 300 * sec_week ]
-        new_storage["farm_points"] = [0,0,int(300 * sec_week / 2),300 * sec_week, 300 * sec_week ]
-        # Execute entrypoint
-        res = self.farms.stake(400).interpret(storage=new_storage, sender=alice, now=int(2*sec_week + sec_week*2/3))
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-        if OptionType(new_storage["input_fa2_token_id_opt"]).is_none():  # For FA12
-            verify_fa12_stake_tx(transfer_tx_params, alice, farm_address, 400)   
-        self.assertEqual(400, res.storage["user_stakes"][alice])
-        expected_user_points = [0, 0, int(sec_week * 400 / 3), sec_week * 400, sec_week * 400 ]
-        expected_farm_points = [0, 0, int(sec_week * 400 / 3) + int(300 * sec_week / 2), sec_week * 700, sec_week * 700 ]
-        self.assertEqual(res.storage["user_points"][alice], expected_user_points)
-        self.assertEqual(res.storage["farm_points"], expected_farm_points)
-
-    def test_stake_fa2_with_two_different_users_should_work(self):
-        # Init
-        new_storage = deepcopy(initial_storage)
-        new_storage["user_stakes"][bob] = 300
-        new_storage["user_points"][bob] = [0,0,int(300 * sec_week / 2),300 * sec_week, 300 * sec_week ]
-        new_storage["farm_points"] = [0,0,int(300 * sec_week / 2),300 * sec_week, 300 * sec_week ]
-        ############### FOR FA2   ################################
-        input_token_id = 1
-        input_fa2_token_id_opt : Optional[int] = input_token_id
-        reward_fa2_token_id : Optional[int] = None
-        new_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        new_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-        # Execute entrypoint
-        res = self.farms.stake(400).interpret(storage=new_storage, sender=alice, now=int(2*sec_week + sec_week*2/3))
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(new_storage["input_fa2_token_id_opt"]).is_none():  # For FA12
-            verify_fa12_stake_tx(transfer_tx_params, alice, farm_address, 400)
-        else:
-            verify_fa2_stake_tx(transfer_tx_params, alice, farm_address, new_storage["input_fa2_token_id_opt"], 400)
-        self.assertEqual(400, res.storage["user_stakes"][alice])
-        expected_user_points = [0, 0, int(sec_week * 400 / 3), sec_week * 400, sec_week * 400 ]
-        expected_farm_points = [0, 0, int(sec_week * 400 / 3) + int(300 * sec_week / 2), sec_week * 700, sec_week * 700 ]
-        self.assertEqual(res.storage["user_points"][alice], expected_user_points)
-        self.assertEqual(res.storage["farm_points"], expected_farm_points)
-
     def test_stake_0_LP_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         # Execute entrypoint
         with self.raisesMichelsonError(amount_is_null):
             res = self.farms.stake(0).interpret(storage=init_storage, sender=alice, now=int(sec_week + sec_week/2))
     
     def test_stake_after_end_of_pool_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         # Execute entrypoint
         with self.raisesMichelsonError(no_week_left):
             self.farms.stake(10).interpret(storage=init_storage, sender=alice, now=int(5 * sec_week + sec_week/2))
 
     def test_stake_with_farm_not_initialized_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         init_storage["initialized"] = False
         # Execute entrypoint
         with self.raisesMichelsonError(contract_not_initialized):
             self.farms.stake(10).interpret(storage=init_storage, sender=alice, now=int(5 * sec_week + sec_week/2))
 
-    #####################
-    # Tests for Unstake #
-    #####################
-
-    def test_unstake_basic_with_fa12_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        ############### FOR FA12   ################################
-        input_fa2_token_id_opt : Optional[int] = None
-        reward_fa2_token_id : Optional[int] = None
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-        # Execute entrypoint
-        res = self.farms.unstake(250).interpret(sender=alice, storage=init_storage, now=int(sec_week + sec_week/2))
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12
-            verify_fa12_unstake_tx(transfer_tx_params, alice, farm_address, 250)
-        else: # For FA2  
-            verify_fa2_unstake_tx(transfer_tx_params, alice, farm_address, input_token_id, 250)
-        expected_user_points = [int(500 * sec_week/2), int((500+250) * sec_week/2), 250 * sec_week, 250 * sec_week, 250 * sec_week]
-        self.assertEqual(res.storage["user_stakes"][alice], 250)
-        self.assertEqual(res.storage["user_points"][alice], expected_user_points)
-        self.assertEqual(res.storage["farm_points"], expected_user_points)
-
-    def test_unstake_basic_with_fa2_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        ############### FOR FA2   ################################
-        input_token_id = 1
-        reward_token_id = 5
-        input_fa2_token_id_opt : Optional[int] = input_token_id
-        reward_fa2_token_id : Optional[int] = reward_token_id
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-        # Execute entrypoint
-        res = self.farms.unstake(250).interpret(sender=alice, storage=init_storage, now=int(sec_week + sec_week/2))
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        #print(transfer_tx_params)
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_unstake_tx(transfer_tx_params, alice, farm_address, 250)
-        else: # For FA2  
-            verify_fa2_unstake_tx(transfer_tx_params, alice, farm_address, input_token_id, 250)
-        expected_user_points = [int(500 * sec_week/2), int((500+250) * sec_week/2), 250 * sec_week, 250 * sec_week, 250 * sec_week]
-        self.assertEqual(res.storage["user_stakes"][alice], 250)
-        self.assertEqual(res.storage["user_points"][alice], expected_user_points)
-        self.assertEqual(res.storage["farm_points"], expected_user_points)
-
-
-    def test_unstake_same_week_with_fa12_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        # Execute entrypoint
-        res = self.farms.unstake(499).interpret(sender=alice, storage=init_storage, now=int(sec_week*3/4))
-        expected_user_points = [int(500 * sec_week/2) - int(499 * sec_week/4), sec_week, sec_week, sec_week, sec_week ]
-        self.assertEqual(res.storage["user_points"][alice], expected_user_points)
-        self.assertEqual(res.storage["farm_points"], expected_user_points)
-        self.assertEqual(res.storage["user_stakes"][alice], 1)
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_unstake_tx(transfer_tx_params, alice, farm_address, 499)
-
-
-    def test_unstake_same_week_with_fa2_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        ############### FOR FA2   ################################
-        input_token_id = 1
-        input_fa2_token_id_opt : Optional[int] = input_token_id
-        reward_fa2_token_id : Optional[int] = None
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-        # Execute entrypoint
-        res = self.farms.unstake(499).interpret(sender=alice, storage=init_storage, now=int(sec_week*3/4))
-        expected_user_points = [int(500 * sec_week/2) - int(499 * sec_week/4), sec_week, sec_week, sec_week, sec_week ]
-        self.assertEqual(res.storage["user_points"][alice], expected_user_points)
-        self.assertEqual(res.storage["farm_points"], expected_user_points)
-        self.assertEqual(res.storage["user_stakes"][alice], 1)
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_unstake_tx(transfer_tx_params, alice, farm_address, 499)
-        else:
-            verify_fa2_unstake_tx(transfer_tx_params, alice, farm_address, init_storage["input_fa2_token_id_opt"], 499)
-
-    def test_unstake_total_stake_with_fa12_should_work(self):
+    def test_stake_with_4_week_periods_should_count_points_by_period(self):
         # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        # Execute entrypoint
-        res = self.farms.unstake(500).interpret(sender=alice, storage=init_storage, now=int(sec_week + sec_week/2))
-        expected_user_points = [int(500 * sec_week/2), int(500 * sec_week/2), 0, 0, 0 ]
+        init_storage = farm_storage.overlay()
+        init_storage["week_duration"] = 4 * sec_week
+        init_storage["total_weeks"] = 3
+        init_storage["reward_at_week"] = [20408163, 12244897, 7346938]
+        # Execute entrypoint: 2 weeks before the end of the second period
+        res = self.farms.stake(10).interpret(storage=init_storage, sender=alice, now=6 * sec_week)
+        expected_user_points = [0, 10 * 2 * sec_week, 10 * 4 * sec_week]
         self.assertEqual(res.storage["user_points"][alice], expected_user_points)
         self.assertEqual(res.storage["farm_points"], expected_user_points)
-        self.assertEqual(res.storage["user_stakes"][alice], 0)
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_unstake_tx(transfer_tx_params, alice, farm_address, 500)
+        # The farm ends after 3 periods, not 3 weeks
+        with self.raisesMichelsonError(no_week_left):
+            self.farms.stake(10).interpret(storage=init_storage, sender=alice, now=12 * sec_week)
 
-    def test_unstake_total_stake_with_fa2_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        ############### FOR FA2   ################################
-        input_token_id = 1
-        input_fa2_token_id_opt : Optional[int] = input_token_id
-        reward_fa2_token_id : Optional[int] = None
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-        # Execute entrypoint
-        res = self.farms.unstake(500).interpret(sender=alice, storage=init_storage, now=int(sec_week + sec_week/2))
-        expected_user_points = [int(500 * sec_week/2), int(500 * sec_week/2), 0, 0, 0 ]
-        self.assertEqual(res.storage["user_points"][alice], expected_user_points)
-        self.assertEqual(res.storage["farm_points"], expected_user_points)
-        self.assertEqual(res.storage["user_stakes"][alice], 0)
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_unstake_tx(transfer_tx_params, alice, farm_address, 500)
-        else:   # for FA2
-            verify_fa2_unstake_tx(transfer_tx_params, alice, farm_address, init_storage["input_fa2_token_id_opt"], 500)
+    #####################
+    # Tests for Unstake #
+    #####################
 
     def test_unstake_more_than_staked_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         init_storage["user_stakes"][alice] = 500
         init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
         init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
@@ -559,7 +308,7 @@ class FarmsContractTest(TestCase):
 
     def test_unstake_with_0_staked_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         init_storage["user_stakes"][alice] = 500
         init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
         init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
@@ -567,266 +316,9 @@ class FarmsContractTest(TestCase):
         with self.raisesMichelsonError(no_stakes):
             self.farms.unstake(10).interpret(storage=init_storage, sender=bob)
 
-    def test_unstake_with_two_users_with_fa12_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["user_stakes"][bob] = 600
-        init_storage["user_points"][bob] = [0, 0, int(600 * sec_week / 3), 600 * sec_week, 600 * sec_week]
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week / 2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, 600 * sec_week + 500 * sec_week, 600 * sec_week + 500 * sec_week]
-        # Execute entrypoint
-        res = self.farms.unstake(100).interpret(storage=init_storage, sender=bob, now=int(3 * sec_week + sec_week * 6 / 7))
-        expected_userpoint_bob = [0, 0, int(600 * sec_week / 3), int((600 * (6 / 7) + 500 / 7) * sec_week), 500 * sec_week]
-        expected_userpoint_alice = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        expected_farmpoint = [int(500 * sec_week / 2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, int((600 * (6 / 7) + 500 / 7) * sec_week) + 500 * sec_week, 500 * sec_week + 500 * sec_week]
-        self.assertEqual(res.storage["user_points"][bob], expected_userpoint_bob)
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["farm_points"], expected_farmpoint)
-        self.assertEqual(res.storage["user_stakes"][bob], 500)
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_unstake_tx(transfer_tx_params, bob, farm_address, 100)
-
-
-    def test_unstake_with_two_users_with_fa2_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["user_stakes"][bob] = 600
-        init_storage["user_points"][bob] = [0, 0, int(600 * sec_week / 3), 600 * sec_week, 600 * sec_week]
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week / 2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, 600 * sec_week + 500 * sec_week, 600 * sec_week + 500 * sec_week]
-        ############### FOR FA2   ################################
-        input_token_id = 1
-        input_fa2_token_id_opt : Optional[int] = input_token_id
-        reward_fa2_token_id : Optional[int] = None
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-        # Execute entrypoint
-        res = self.farms.unstake(100).interpret(storage=init_storage, sender=bob, now=int(3 * sec_week + sec_week * 6 / 7))
-        expected_userpoint_bob = [0, 0, int(600 * sec_week / 3), int((600 * (6 / 7) + 500 / 7) * sec_week), 500 * sec_week]
-        expected_userpoint_alice = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        expected_farmpoint = [int(500 * sec_week / 2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, int((600 * (6 / 7) + 500 / 7) * sec_week) + 500 * sec_week, 500 * sec_week + 500 * sec_week]
-        self.assertEqual(res.storage["user_points"][bob], expected_userpoint_bob)
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["farm_points"], expected_farmpoint)
-        self.assertEqual(res.storage["user_stakes"][bob], 500)
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_unstake_tx(transfer_tx_params, bob, farm_address, 100)
-        else:
-            verify_fa2_unstake_tx(transfer_tx_params, bob, farm_address, init_storage["input_fa2_token_id_opt"], 100)
-
-    def test_unstake_fa12_should_work_after_pool_end(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        # Execute entrypoint
-        res = self.farms.unstake(250).interpret(sender=alice, storage=init_storage, now=sec_week * 1000)
-        expected_userpoint_alice = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        self.assertEqual(res.storage["user_stakes"][alice], 250)
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["farm_points"], expected_userpoint_alice)
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_unstake_tx(transfer_tx_params, alice, farm_address, 250)
-
-    def test_unstake_fa2_should_work_after_pool_end(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        ############### FOR FA2   ################################
-        input_token_id = 1
-        input_fa2_token_id_opt : Optional[int] = input_token_id
-        reward_fa2_token_id : Optional[int] = None
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-        # Execute entrypoint
-        res = self.farms.unstake(250).interpret(sender=alice, storage=init_storage, now=sec_week * 1000)
-        expected_userpoint_alice = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        self.assertEqual(res.storage["user_stakes"][alice], 250)
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["farm_points"], expected_userpoint_alice)
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_unstake_tx(transfer_tx_params, alice, farm_address, 250)
-        else:
-            verify_fa2_unstake_tx(transfer_tx_params, alice, farm_address, init_storage["input_fa2_token_id_opt"], 250)
-
-
-    def test_unstake_fa12_with_two_users_at_the_pool_end_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["user_stakes"][bob] = 600
-        init_storage["user_points"][bob] = [0, 0, int(600 * sec_week / 3), 600 * sec_week, 600 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, 1100 * sec_week, 1100 * sec_week]
-        # Execute entrypoint
-        res = self.farms.unstake(500).interpret(storage=init_storage, sender=bob, now=int(30 * sec_week + sec_week * 6 / 7))
-        expected_userpoint_alice = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        expected_userpoint_bob = [0, 0, int(600 * sec_week / 3), 600 * sec_week, 600 * sec_week]
-        expected_farmpoint = [int(500 * sec_week/2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, 1100 * sec_week, 1100 * sec_week]
-        self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["user_stakes"][bob], 100)
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["user_points"][bob], expected_userpoint_bob)
-        self.assertEqual(res.storage["farm_points"], expected_farmpoint)
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_unstake_tx(transfer_tx_params, bob, farm_address, 500)
-
-
-    def test_unstake_fa2_with_two_users_at_the_pool_end_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["user_stakes"][bob] = 600
-        init_storage["user_points"][bob] = [0, 0, int(600 * sec_week / 3), 600 * sec_week, 600 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, 1100 * sec_week, 1100 * sec_week]
-        ############### FOR FA2   ################################
-        input_token_id = 1
-        input_fa2_token_id_opt : Optional[int] = input_token_id
-        reward_fa2_token_id : Optional[int] = None
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-        # Execute entrypoint
-        res = self.farms.unstake(500).interpret(storage=init_storage, sender=bob, now=int(30 * sec_week + sec_week * 6 / 7))
-        expected_userpoint_alice = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        expected_userpoint_bob = [0, 0, int(600 * sec_week / 3), 600 * sec_week, 600 * sec_week]
-        expected_farmpoint = [int(500 * sec_week/2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, 1100 * sec_week, 1100 * sec_week]
-        self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["user_stakes"][bob], 100)
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["user_points"][bob], expected_userpoint_bob)
-        self.assertEqual(res.storage["farm_points"], expected_farmpoint)
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_unstake_tx(transfer_tx_params, bob, farm_address, 500)
-        else:
-            verify_fa2_unstake_tx(transfer_tx_params, bob, farm_address, init_storage["input_fa2_token_id_opt"], 500)
-        
-    def test_unstake_fa12_everything_with_two_users_at_the_pool_end_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["user_stakes"][bob] = 600
-        init_storage["user_points"][bob] = [0, 0, int(600 * sec_week / 3), 600 * sec_week, 600 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, 1100 * sec_week, 1100 * sec_week]
-        # Execute entrypoint
-        res = self.farms.unstake(600).interpret(storage=init_storage, sender=bob, now=int(30 * sec_week + sec_week * 6 / 7))
-        expected_userpoint_alice = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        expected_userpoint_bob = [0, 0, int(600 * sec_week / 3), 600 * sec_week, 600 * sec_week]
-        expected_farmpoint = [int(500 * sec_week/2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, 1100 * sec_week, 1100 * sec_week]
-        self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["user_stakes"][bob], 0)
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["user_points"][bob], expected_userpoint_bob)
-        self.assertEqual(res.storage["farm_points"], expected_farmpoint)
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_unstake_tx(transfer_tx_params, bob, farm_address, 600)
-
-    def test_unstake_fa2_everything_with_two_users_at_the_pool_end_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["user_stakes"][bob] = 600
-        init_storage["user_points"][bob] = [0, 0, int(600 * sec_week / 3), 600 * sec_week, 600 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, 1100 * sec_week, 1100 * sec_week]
-        ############### FOR FA2   ################################
-        input_token_id = 1
-        input_fa2_token_id_opt : Optional[int] = input_token_id
-        reward_fa2_token_id : Optional[int] = None
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-        # Execute entrypoint
-        res = self.farms.unstake(600).interpret(storage=init_storage, sender=bob, now=int(30 * sec_week + sec_week * 6 / 7))
-        expected_userpoint_alice = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        expected_userpoint_bob = [0, 0, int(600 * sec_week / 3), 600 * sec_week, 600 * sec_week]
-        expected_farmpoint = [int(500 * sec_week/2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, 1100 * sec_week, 1100 * sec_week]
-        self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["user_stakes"][bob], 0)
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["user_points"][bob], expected_userpoint_bob)
-        self.assertEqual(res.storage["farm_points"], expected_farmpoint)
-        self.assertEqual(len(res.operations), 1)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_unstake_tx(transfer_tx_params, bob, farm_address, 600)
-        else:
-            verify_fa2_unstake_tx(transfer_tx_params, bob, farm_address, init_storage["input_fa2_token_id_opt"], 600)
-
-
-    def test_unstake_fa12_after_increasing_reward_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["total_reward"] = 10_000_000
-        init_storage["total_weeks"] = 3
-        init_storage["rate"] = 7500
-        init_storage["reward_at_week"] = [4324324, 3243243, 2432432]
-        # Execute entrypoint
-        res = self.farms.increase_reward(20_000_000).interpret(storage=init_storage, sender=admin, now=int(sec_week + sec_week/2))
-        res2 = self.farms.stake(10000).interpret(storage=res.storage, sender=alice, now=int(2 * sec_week + sec_week/2))
-        res3 = self.farms.unstake(10000).interpret(storage=res2.storage, sender=alice, now=int(3 * sec_week + sec_week/2))
-        self.assertEqual(res3.storage["total_reward"], 30000000)
-        self.assertEqual(res3.storage["total_weeks"], 3)
-        self.assertEqual(res3.storage["admin"], admin)
-        self.assertEqual(len(res3.operations), 1)
-        transfer_tx_params = res3.operations[0]["parameters"]["value"]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_unstake_tx(transfer_tx_params, alice, farm_address, 10000)
-        expected_farmpoint = [0, 0, int(10000*sec_week/2)]
-        self.assertEqual(res3.storage["farm_points"], expected_farmpoint)
-        self.assertEqual(res3.storage["user_stakes"][alice], 0)
-        
-
-    def test_unstake_fa2_after_increasing_reward_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["total_reward"] = 10_000_000
-        init_storage["total_weeks"] = 3
-        init_storage["rate"] = 7500
-        init_storage["reward_at_week"] = [4324324, 3243243, 2432432]
-        ############### FOR FA2   ################################
-        input_token_id = 1
-        input_fa2_token_id_opt : Optional[int] = input_token_id
-        reward_fa2_token_id : Optional[int] = None
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-        # Execute entrypoint
-        res = self.farms.increase_reward(20_000_000).interpret(storage=init_storage, sender=admin, now=int(sec_week + sec_week/2))
-        res2 = self.farms.stake(10000).interpret(storage=res.storage, sender=alice, now=int(2 * sec_week + sec_week/2))
-        res3 = self.farms.unstake(10000).interpret(storage=res2.storage, sender=alice, now=int(3 * sec_week + sec_week/2))
-        self.assertEqual(res3.storage["total_reward"], 30000000)
-        self.assertEqual(res3.storage["total_weeks"], 3)
-        self.assertEqual(res3.storage["admin"], admin)
-        self.assertEqual(len(res3.operations), 1)
-        transfer_tx_params = res3.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(init_storage["input_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_unstake_tx(transfer_tx_params, alice, farm_address, 10000)
-        else: 
-            verify_fa2_unstake_tx(transfer_tx_params, alice, farm_address, init_storage["input_fa2_token_id_opt"], 10000)
-        expected_farmpoint = [0, 0, int(10000*sec_week/2)]
-        self.assertEqual(res3.storage["farm_points"], expected_farmpoint)
-        self.assertEqual(res3.storage["user_stakes"][alice], 0)
-        
     def test_unstake_with_farm_not_initialized_should_fail(self):
        # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         init_storage["user_stakes"][alice] = 500
         init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
         init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
@@ -841,7 +333,7 @@ class FarmsContractTest(TestCase):
 
     def test_claimall_with_0_points_should_work_with_0_operation(self):
         # Init
-        init_storage = deepcopy(initial_storage)
+        init_storage = farm_storage.overlay()
         init_storage["total_reward"] = 20_000_000
         init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
         init_storage["creation_time"] = 0
@@ -853,411 +345,153 @@ class FarmsContractTest(TestCase):
         self.assertEqual(res.storage["admin"], admin)
         self.assertEqual(res.operations, [])
 
-    def test_claimall_2rd_week_with_fa12_should_work(self):
+    def test_claimall_with_XTZ_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["total_reward"] = 20_000_000
+        init_storage = farm_storage.overlay()
         init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
         init_storage["creation_time"] = 0
         init_storage["user_stakes"][alice] = 500
         init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+        init_storage["farm_points"] = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
         # Execute entrypoint
-        res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week + sec_week/2))
-        self.assertEqual(res.storage["admin"], admin)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-        if OptionType(init_storage["reward_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_claim_tx(transfer_tx_params, alice, initial_storage["reward_reserve_address"], init_storage["reward_at_week"][0])
-        expected_userpoint_alice = [0, 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["farm_points"], init_storage["farm_points"] )
+        with self.raisesMichelsonError(amount_must_be_zero_tez):
+            self.farms.claim_all().interpret(storage=init_storage, sender=bob, now=sec_week * 12, amount=1)
+
 
-    def test_claimall_2rd_week_with_fa2_should_work(self):
+    def test_claimall_with_farm_not_initialized_should_work(self):
         # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["total_reward"] = 20_000_000
+        init_storage = farm_storage.overlay()
         init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
         init_storage["creation_time"] = 0
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+        init_storage["user_stakes"][alice] = 0
+        init_storage["user_points"][alice] = [int(500 * sec_week/2), int(500 * sec_week) +  int(500 * sec_week / 2 ) - int(1000 * sec_week / 3 ), 0, 0, 0]
+        init_storage["farm_points"] = [int(500 * sec_week/2), int(500 * sec_week) +  int(500 * sec_week / 2 ) - int(1000 * sec_week / 3 ), 0, 0, 0]
         ############### FOR FA2   ################################
         reward_token_id = 5
         input_fa2_token_id_opt : Optional[int] = None
         reward_fa2_token_id : Optional[int] = reward_token_id
         init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
         init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
+        reward_expected = init_storage["reward_at_week"][1]        
+        init_storage["initialized"] = False
         # Execute entrypoint
-        res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week + sec_week/2))
-        self.assertEqual(res.storage["admin"], admin)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(init_storage["reward_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], init_storage["reward_at_week"][0])
-        else:
-            verify_fa2_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], init_storage["reward_fa2_token_id_opt"], init_storage["reward_at_week"][0])
-        expected_userpoint_alice = [0, 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["farm_points"], init_storage["farm_points"] )
+        with self.raisesMichelsonError(contract_not_initialized):
+            self.farms.claim_all().interpret(sender=alice, storage=init_storage, now=int(sec_week + sec_week*3/4))
 
+    ##################
+    # Tests for Exit #
+    ##################
 
-    def test_claimall_3rd_week_with_fa12_should_work(self):
+    def test_exit_with_0_staked_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["total_reward"] = 20_000_000
-        init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
-        init_storage["creation_time"] = 0
+        init_storage = farm_storage.overlay()
         init_storage["user_stakes"][alice] = 500
         init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
         init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
         # Execute entrypoint
-        res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week * 2 + sec_week/2))
-        self.assertEqual(res.storage["admin"], admin)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-        if OptionType(init_storage["reward_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], sum(init_storage["reward_at_week"][:2]))
-        else:
-            verify_fa2_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], init_storage["reward_fa2_token_id_opt"], sum(init_storage["reward_at_week"][:2]))
-        expected_userpoint_alice = [0, 0, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
-
+        with self.raisesMichelsonError(no_stakes):
+            self.farms.exit().interpret(storage=init_storage, sender=bob, now=int(sec_week + sec_week / 2))
 
-    def test_claimall_3rd_week_with_fa2_should_work(self):
+    def test_exit_with_XTZ_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["total_reward"] = 20_000_000
-        init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
-        init_storage["creation_time"] = 0
+        init_storage = farm_storage.overlay()
         init_storage["user_stakes"][alice] = 500
         init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
         init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        ############### FOR FA2   ################################
-        reward_token_id = 5
-        input_fa2_token_id_opt : Optional[int] = None
-        reward_fa2_token_id : Optional[int] = reward_token_id
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
         # Execute entrypoint
-        res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week * 2 + sec_week/2))
-        self.assertEqual(res.storage["admin"], admin)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(init_storage["reward_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], sum(init_storage["reward_at_week"][:2]))
-        else:
-            verify_fa2_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], init_storage["reward_fa2_token_id_opt"], sum(init_storage["reward_at_week"][:2]))
-        expected_userpoint_alice = [0, 0, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])        
-
-    def test_claimall_with_2_stakers_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["total_reward"] = 20_000_000
-        init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
-        init_storage["creation_time"] = 0
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [0, int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["user_stakes"][bob] = 100
-        init_storage["user_points"][bob] = [0, int(100 * sec_week * (1 - 1/2)), 100 * sec_week, 100 * sec_week, 100 * sec_week]
-        init_storage["farm_points"] = [x + y for x, y in zip(init_storage["user_points"][alice],init_storage["user_points"][bob])]
-        alice_week1_reward_expected = init_storage["reward_at_week"][1] * init_storage["user_points"][alice][1]/ init_storage["farm_points"][1] 
-        alice_week2_reward_expected = init_storage["reward_at_week"][2] * init_storage["user_points"][alice][2]/ init_storage["farm_points"][2]
-        alice_total_reward_expected = int(alice_week1_reward_expected + alice_week2_reward_expected) -1
-        # Execute entrypoint
-        res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week * 3 + sec_week / 2))
-        self.assertEqual(res.storage["admin"], admin)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-        if OptionType(init_storage["reward_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], alice_total_reward_expected)
-        expected_userpoint_alice = [0, 0, 0, 500 * sec_week, 500 * sec_week]
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
+        with self.raisesMichelsonError(amount_must_be_zero_tez):
+            self.farms.exit().interpret(storage=init_storage, sender=alice, now=int(sec_week + sec_week / 2), amount=1)
 
-    def test_claimall_with_2_stakers_with_fa2_should_work(self):
+    def test_exit_with_farm_not_initialized_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["total_reward"] = 20_000_000
-        init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
-        init_storage["creation_time"] = 0
+        init_storage = farm_storage.overlay()
         init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [0, int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["user_stakes"][bob] = 100
-        init_storage["user_points"][bob] = [0, int(100 * sec_week * (1 - 1/2)), 100 * sec_week, 100 * sec_week, 100 * sec_week]
-        init_storage["farm_points"] = [x + y for x, y in zip(init_storage["user_points"][alice],init_storage["user_points"][bob])]
-        alice_week1_reward_expected = init_storage["reward_at_week"][1] * init_storage["user_points"][alice][1]/ init_storage["farm_points"][1] 
-        alice_week2_reward_expected = init_storage["reward_at_week"][2] * init_storage["user_points"][alice][2]/ init_storage["farm_points"][2]
-        alice_total_reward_expected = int(alice_week1_reward_expected + alice_week2_reward_expected) -1
-        ############### FOR FA2   ################################
-        reward_token_id = 5
-        input_fa2_token_id_opt : Optional[int] = None
-        reward_fa2_token_id : Optional[int] = reward_token_id
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
+        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+        init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+        init_storage["initialized"] = False
         # Execute entrypoint
-        res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week * 3 + sec_week / 2))
-        self.assertEqual(res.storage["admin"], admin)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(init_storage["reward_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], alice_total_reward_expected)
-        else:
-            verify_fa2_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], init_storage["reward_fa2_token_id_opt"], alice_total_reward_expected)
-        expected_userpoint_alice = [0, 0, 0, 500 * sec_week, 500 * sec_week]
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
-
+        with self.raisesMichelsonError(contract_not_initialized):
+            self.farms.exit().interpret(storage=init_storage, sender=alice, now=int(sec_week + sec_week / 2))
 
-    def test_claimall_with_2_stakers_not_staking_middle_week_with_fa12_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["total_reward"] = 20_000_000
-        init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
-        init_storage["creation_time"] = 0
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [500 * sec_week, 0, int(500 * sec_week * (1 - 2/3)), 500 * sec_week, 500 * sec_week]
-        init_storage["user_stakes"][bob] = 500
-        init_storage["user_points"][bob] = [500 * sec_week, 0, int(500 * sec_week * (1 - 1/2)), 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [x + y for x, y in zip(init_storage["user_points"][alice],init_storage["user_points"][bob])]
-        # Execute entrypoint
-        res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week * 3 + sec_week / 2))
-        reward_expected = int(6555697/2) + int((int(500 * sec_week * (1 - 2/3)) / int(500 * sec_week * (1 - 2/3) + 500 * sec_week * (1 - 1/2)) )* 3687580) - 1 + 1
-        self.assertEqual(res.storage["admin"], admin)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-        if OptionType(init_storage["reward_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], reward_expected)
-        else:
-            verify_fa2_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], init_storage["reward_fa2_token_id_opt"], reward_expected)
-        expected_userpoint_alice = [0, 0, 0, 500 * sec_week, 500 * sec_week]
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
+    ######################
+    # Tests for Compound #
+    ######################
 
-    def test_claimall_with_2_stakers_not_staking_middle_week_with_fa2_should_work(self):
-        # Init
-        init_storage = deepcopy(initial_storage)
+    def compound_storage(self, token_id_opt):
+        """A farm rewarding its input token, alice staked 500 in the middle of the first week, bob 300 since the farm start."""
+        init_storage = farm_storage.overlay()
+        init_storage["reward_token_address"] = init_storage["input_token_address"]
+        init_storage["input_fa2_token_id_opt"] = token_id_opt
+        init_storage["reward_fa2_token_id_opt"] = token_id_opt
         init_storage["total_reward"] = 20_000_000
         init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
-        init_storage["creation_time"] = 0
         init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [500 * sec_week, 0, int(500 * sec_week * (1 - 2/3)), 500 * sec_week, 500 * sec_week]
-        init_storage["user_stakes"][bob] = 500
-        init_storage["user_points"][bob] = [500 * sec_week, 0, int(500 * sec_week * (1 - 1/2)), 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [x + y for x, y in zip(init_storage["user_points"][alice],init_storage["user_points"][bob])]
-        ############### FOR FA2   ################################
-        reward_token_id = 5
-        input_fa2_token_id_opt : Optional[int] = None
-        reward_fa2_token_id : Optional[int] = reward_token_id
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-        # Execute entrypoint
-        res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week * 3 + sec_week / 2))
-        reward_expected = int(6555697/2) + int((int(500 * sec_week * (1 - 2/3)) / int(500 * sec_week * (1 - 2/3) + 500 * sec_week * (1 - 1/2)) )* 3687580) - 1 + 1
-        self.assertEqual(res.storage["admin"], admin)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(init_storage["reward_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], reward_expected)
-        else:
-            verify_fa2_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], init_storage["reward_fa2_token_id_opt"], reward_expected)
-        expected_userpoint_alice = [0, 0, 0, 500 * sec_week, 500 * sec_week]
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
+        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+        init_storage["user_stakes"][bob] = 300
+        init_storage["user_points"][bob] = [300 * sec_week, 300 * sec_week, 300 * sec_week, 300 * sec_week, 300 * sec_week]
+        init_storage["farm_points"] = [550 * sec_week, 800 * sec_week, 800 * sec_week, 800 * sec_week, 800 * sec_week]
+        return init_storage
 
-    def test_claimall_after_pool_end_with_fa12_should_work(self):
+    def test_compound_fa12_then_claim_should_pay_the_compounded_stake(self):
         # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["total_reward"] = 20_000_000
-        init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
-        init_storage["creation_time"] = 0
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        reward_expected = init_storage["total_reward"] - 2
+        init_storage = self.compound_storage(None)
+        res = self.farms.compound().interpret(storage=init_storage, sender=alice, now=int(sec_week * 2 + sec_week/2))
+        compounded = res.storage["user_stakes"][alice]
         # Execute entrypoint
-        res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=sec_week * 100)
-        self.assertEqual(res.storage["admin"], admin)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-        if OptionType(init_storage["reward_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], reward_expected)
-        else:
-            verify_fa2_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], init_storage["reward_fa2_token_id_opt"], reward_expected)
-        expected_userpoint_alice = [0, 0, 0, 0, 0]
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
+        res = self.farms.claim_all().interpret(storage=res.storage, sender=alice, now=int(sec_week * 3 + sec_week/2))
+        reward_expected = (compounded * sec_week - int((compounded - 500) * sec_week/2)) * 3687580 // (800 * sec_week + int((compounded - 500) * sec_week/2))
+        verify_fa12_claim_tx(res.operations[0]["parameters"]["value"]["args"], alice, admin, reward_expected)
 
-    def test_claimall_after_pool_end_with_fa2_should_work(self):
+    def test_compound_fa2_with_nothing_to_claim_should_work_with_0_operation(self):
         # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["total_reward"] = 20_000_000
-        init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
-        init_storage["creation_time"] = 0
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        reward_expected = init_storage["total_reward"] - 2
-        ############### FOR FA2   ################################
-        reward_token_id = 5
-        input_fa2_token_id_opt : Optional[int] = None
-        reward_fa2_token_id : Optional[int] = reward_token_id
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
+        init_storage = self.compound_storage(1)
+        init_storage["user_points"][alice] = init_storage["user_points"][alice][2:]
+        init_storage["user_claimed_week"][alice] = 2
         # Execute entrypoint
-        res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=sec_week * 100)
-        self.assertEqual(res.storage["admin"], admin)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(init_storage["reward_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], reward_expected)
-        else:
-            verify_fa2_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], init_storage["reward_fa2_token_id_opt"], reward_expected)
-        expected_userpoint_alice = [0, 0, 0, 0, 0]
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
+        res = self.farms.compound().interpret(storage=init_storage, sender=alice, now=int(sec_week * 2 + sec_week/2))
+        self.assertEqual(res.operations, [])
         self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
 
-    def test_claimall_with_2_stakers_not_staking_last_week_with_fa12_should_work(self):
+    def test_compound_with_another_reward_token_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["total_reward"] = 20_000_000
-        init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
-        init_storage["creation_time"] = 0
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week, 0]
-        init_storage["user_stakes"][bob] = 500
-        init_storage["user_points"][bob] = [500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week, 0]
-        init_storage["farm_points"] = [x + y for x, y in zip(init_storage["user_points"][alice],init_storage["user_points"][bob])]
+        init_storage = self.compound_storage(None)
+        init_storage["reward_token_address"] = "KT1TwzD6zV3WeJ39ukuqxcfK2fJCnhvrdN1X"
         # Execute entrypoint
-        res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week * 6 + sec_week / 2))
-        reward_expected = int(6555697 / 2) + int(4916773 / 2) + int(3687580 / 2)  + int(2765685 / 2) 
-        self.assertEqual(res.storage["admin"], admin)
-        transfer_tx_params = res.operations[0]["parameters"]["value"]['args']
-        if OptionType(init_storage["reward_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], reward_expected)
-        else:
-            verify_fa2_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], init_storage["reward_fa2_token_id_opt"], reward_expected)
-        expected_userpoint_alice = [0]*5
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
+        with self.raisesMichelsonError(compound_not_supported):
+            self.farms.compound().interpret(storage=init_storage, sender=alice, now=int(sec_week * 2 + sec_week/2))
 
-    def test_claimall_with_2_stakers_not_staking_last_week_with_fa2_should_work(self):
+    def test_compound_fa2_with_another_reward_token_id_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["total_reward"] = 20_000_000
-        init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
-        init_storage["creation_time"] = 0
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week, 0]
-        init_storage["user_stakes"][bob] = 500
-        init_storage["user_points"][bob] = [500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week, 0]
-        init_storage["farm_points"] = [x + y for x, y in zip(init_storage["user_points"][alice],init_storage["user_points"][bob])]
-        ############### FOR FA2   ################################
-        reward_token_id = 5
-        input_fa2_token_id_opt : Optional[int] = None
-        reward_fa2_token_id : Optional[int] = reward_token_id
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
+        init_storage = self.compound_storage(1)
+        init_storage["reward_fa2_token_id_opt"] = 5
         # Execute entrypoint
-        res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week * 6 + sec_week / 2))
-        reward_expected = int(6555697 / 2) + int(4916773 / 2) + int(3687580 / 2)  + int(2765685 / 2) 
-        self.assertEqual(res.storage["admin"], admin)
-        transfer_tx_params = res.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(init_storage["reward_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], reward_expected)
-        else:
-            verify_fa2_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], init_storage["reward_fa2_token_id_opt"], reward_expected)
-        expected_userpoint_alice = [0]*5
-        self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res.storage["user_stakes"][alice], 500)
-        self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
+        with self.raisesMichelsonError(compound_not_supported):
+            self.farms.compound().interpret(storage=init_storage, sender=alice, now=int(sec_week * 2 + sec_week/2))
 
-    def test_claimall_with_XTZ_should_fail(self):
+    def test_compound_on_first_week_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
-        init_storage["creation_time"] = 0
-        init_storage["user_stakes"][alice] = 500
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
-        init_storage["farm_points"] = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+        init_storage = self.compound_storage(None)
         # Execute entrypoint
-        with self.raisesMichelsonError(amount_must_be_zero_tez):
-            self.farms.claim_all().interpret(storage=init_storage, sender=bob, now=sec_week * 12, amount=1)
-
+        with self.raisesMichelsonError(no_claim_first_week):
+            self.farms.compound().interpret(storage=init_storage, sender=alice, now=int(sec_week * 3/4))
 
-    def test_claimall_two_times_after_unstake_and_staking_two_times_with_fa12_should_work(self):
+    def test_compound_after_end_of_pool_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
-        init_storage["creation_time"] = 0
-        init_storage["user_stakes"][alice] = 0
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), int(500 * sec_week) +  int(500 * sec_week / 2 ) - int(1000 * sec_week / 3 ), 0, 0, 0]
-        init_storage["farm_points"] = [int(500 * sec_week/2), int(500 * sec_week) +  int(500 * sec_week / 2 ) - int(1000 * sec_week / 3 ), 0, 0, 0]
-        reward_expected = init_storage["reward_at_week"][1]        
-        res = self.farms.claim_all().interpret(sender=alice, storage=init_storage, now=int(sec_week + sec_week*3/4))
+        init_storage = self.compound_storage(None)
         # Execute entrypoint
-        res2 = self.farms.claim_all().interpret(sender=alice, storage=res.storage, now=int(sec_week * 2 + sec_week*3/4))
-        self.assertEqual(res2.storage["admin"], admin)
-        transfer_tx_params = res2.operations[0]["parameters"]["value"]['args']
-        if OptionType(init_storage["reward_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], reward_expected)
-        else:
-            verify_fa2_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], init_storage["reward_fa2_token_id_opt"], reward_expected)
-        expected_userpoint_alice = [0]*5
-        self.assertEqual(res2.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res2.storage["user_stakes"][alice], 0)
-        self.assertEqual(res2.storage["farm_points"], init_storage["farm_points"])
+        with self.raisesMichelsonError(no_week_left):
+            self.farms.compound().interpret(storage=init_storage, sender=alice, now=int(5 * sec_week + sec_week/2))
 
-    def test_claimall_two_times_after_unstake_and_staking_two_times_with_fa2_should_work(self):
+    def test_compound_with_0_staked_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
-        init_storage["creation_time"] = 0
-        init_storage["user_stakes"][alice] = 0
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), int(500 * sec_week) +  int(500 * sec_week / 2 ) - int(1000 * sec_week / 3 ), 0, 0, 0]
-        init_storage["farm_points"] = [int(500 * sec_week/2), int(500 * sec_week) +  int(500 * sec_week / 2 ) - int(1000 * sec_week / 3 ), 0, 0, 0]
-        ############### FOR FA2   ################################
-        reward_token_id = 5
-        input_fa2_token_id_opt : Optional[int] = None
-        reward_fa2_token_id : Optional[int] = reward_token_id
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-        reward_expected = init_storage["reward_at_week"][1]        
-        res = self.farms.claim_all().interpret(sender=alice, storage=init_storage, now=int(sec_week + sec_week*3/4))
+        init_storage = self.compound_storage(None)
         # Execute entrypoint
-        res2 = self.farms.claim_all().interpret(sender=alice, storage=res.storage, now=int(sec_week * 2 + sec_week*3/4))
-        self.assertEqual(res2.storage["admin"], admin)
-        transfer_tx_params = res2.operations[0]["parameters"]["value"][0]['args']
-        if OptionType(init_storage["reward_fa2_token_id_opt"]).is_none():  # For FA12 
-            verify_fa12_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], reward_expected)
-        else:
-            verify_fa2_claim_tx(transfer_tx_params, alice, init_storage["reward_reserve_address"], init_storage["reward_fa2_token_id_opt"], reward_expected)
-        expected_userpoint_alice = [0]*5
-        self.assertEqual(res2.storage["user_points"][alice], expected_userpoint_alice)
-        self.assertEqual(res2.storage["user_stakes"][alice], 0)
-        self.assertEqual(res2.storage["farm_points"], init_storage["farm_points"])
-
+        with self.raisesMichelsonError(no_stakes):
+            self.farms.compound().interpret(storage=init_storage, sender=oscar, now=int(sec_week * 2 + sec_week/2))
 
-    def test_claimall_with_farm_not_initialized_should_work(self):
+    def test_compound_with_XTZ_should_fail(self):
         # Init
-        init_storage = deepcopy(initial_storage)
-        init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
-        init_storage["creation_time"] = 0
-        init_storage["user_stakes"][alice] = 0
-        init_storage["user_points"][alice] = [int(500 * sec_week/2), int(500 * sec_week) +  int(500 * sec_week / 2 ) - int(1000 * sec_week / 3 ), 0, 0, 0]
-        init_storage["farm_points"] = [int(500 * sec_week/2), int(500 * sec_week) +  int(500 * sec_week / 2 ) - int(1000 * sec_week / 3 ), 0, 0, 0]
-        ############### FOR FA2   ################################
-        reward_token_id = 5
-        input_fa2_token_id_opt : Optional[int] = None
-        reward_fa2_token_id : Optional[int] = reward_token_id
-        init_storage["input_fa2_token_id_opt"] = input_fa2_token_id_opt
-        init_storage["reward_fa2_token_id_opt"] = reward_fa2_token_id
-        reward_expected = init_storage["reward_at_week"][1]        
-        init_storage["initialized"] = False
+        init_storage = self.compound_storage(None)
         # Execute entrypoint
-        with self.raisesMichelsonError(contract_not_initialized):
-            self.farms.claim_all().interpret(sender=alice, storage=init_storage, now=int(sec_week + sec_week*3/4))
\ No newline at end of file
+        with self.raisesMichelsonError(amount_must_be_zero_tez):
+            self.farms.compound().interpret(storage=init_storage, sender=alice, now=int(sec_week * 2 + sec_week/2), amount=1)
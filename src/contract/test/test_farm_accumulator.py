@@ -0,0 +1,247 @@
+from unittest import TestCase
+import random
+
+from pytezos import MichelsonRuntimeError
+
+from contract_cache import load_contract, load_dummy_storage
+from farm_model import AccumulatorModel, FarmModel, FarmModelError, compute_new_rewards, reward_precision, week_duration_is_null
+from gas_benchmark import farm_contract_path, farm_fixture, farm_storage
+from test_farm import admin, alice, bob, fox, oscar, sec_week
+
+compiled_accumulator_path = "compiled/farm_accumulator.tz"
+
+scenario = [
+    ("stake", alice, 500, int(sec_week / 2)),
+    ("stake", bob, 100, int(sec_week + sec_week / 3)),
+    ("stake", alice, 250, int(sec_week + sec_week * 2 / 3)),
+    ("claim_all", alice, None, int(2 * sec_week + 10)),
+    ("unstake", bob, 40, int(2 * sec_week + sec_week / 4)),
+    ("increase_reward", admin, 7_000_000, int(2 * sec_week + sec_week / 2)),
+    ("stake", oscar, 900, int(3 * sec_week + sec_week / 5)),
+    ("claim_all", bob, None, int(3 * sec_week + sec_week / 2)),
+    ("unstake", alice, 750, int(4 * sec_week + 1)),
+    ("claim_all", alice, None, int(6 * sec_week)),
+    ("claim_all", oscar, None, int(6 * sec_week)),
+    ("claim_all", bob, None, int(7 * sec_week)),
+]
+
+
+def claimed_amount(res):
+    if len(res.operations) == 0:
+        return 0
+    return int(res.operations[0]["parameters"]["value"]["args"][2]["int"])
+
+
+def outcome(call, model):
+    """(result, None) of `call(model)`, or (None, error message) when the model rejects it."""
+    try:
+        return call(model), None
+    except FarmModelError as error:
+        return None, str(error)
+
+
+def accumulator_model(storage):
+    return AccumulatorModel.from_rewards(storage["admin"], storage["reward_at_week"], storage["rate"], storage["creation_time"],
+                                         storage["week_duration"])
+
+
+class FarmAccumulatorTest(TestCase):
+    """The accumulator mode pays what the week mode pays, up to the roundings.
+
+    The week mode floors the reward of every week, the accumulator floors the
+    reward per point of every closed week then the total once: for each staker,
+    the two payouts differ by at most one token unit per elapsed week, and the
+    accumulator never pays more than the farm reward.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.farms = load_contract(farm_contract_path)
+        cls.maxDiff = None
+
+    def assertCloseToWeekMode(self, accumulated, week_mode, elapsed_weeks):
+        self.assertLessEqual(abs(accumulated - week_mode), elapsed_weeks, f"{accumulated} != {week_mode}")
+
+    def test_scenario_should_pay_like_week_mode_contract(self):
+        # Init
+        storage = farm_fixture.overlay()
+        model = accumulator_model(storage)
+        paid = {}
+        # Execute entrypoints
+        for entrypoint, sender, amount, now in scenario:
+            if entrypoint == "claim_all":
+                res = self.farms.claim_all().interpret(storage=storage, sender=sender, now=now)
+                week_paid, accumulated = paid.get(sender, (0, 0))
+                paid[sender] = (week_paid + claimed_amount(res), accumulated + model.claim_all(sender, now))
+                self.assertCloseToWeekMode(paid[sender][1], paid[sender][0], model.get_current_week(now) - 1)
+            else:
+                res = getattr(self.farms, entrypoint)(amount).interpret(storage=storage, sender=sender, now=now)
+                getattr(model, entrypoint)(sender, amount, now)
+            storage = res.storage
+        self.assertLessEqual(sum(accumulated for _, accumulated in paid.values()), model.total_reward)
+
+    def test_random_scenarios_should_pay_like_week_mode(self):
+        total_weeks = 10
+        reward_at_week = compute_new_rewards(20_000_000, total_weeks, 7500)
+        stakers = [alice, bob, oscar, fox]
+        for seed in range(50):
+            # Init
+            rnd = random.Random(seed)
+            week_mode = FarmModel(admin, 20_000_000, total_weeks, 7500, initialized=True, reward_at_week=reward_at_week)
+            accumulator = AccumulatorModel.from_rewards(admin, reward_at_week, 7500)
+            now = 0
+            # Execute entrypoints
+            for _ in range(40):
+                now += rnd.randint(0, sec_week // 3)
+                sender = rnd.choice(stakers)
+                entrypoint = rnd.choice(["stake", "stake", "unstake", "claim_all", "increase_reward"])
+                if entrypoint == "stake":
+                    amount = rnd.randint(1, 1000)
+                    week_call = accumulator_call = lambda model: model.stake(sender, amount, now)
+                elif entrypoint == "unstake":
+                    amount = rnd.randint(1, week_mode.user_stake(sender) or 1)
+                    week_call = accumulator_call = lambda model: model.unstake(sender, amount, now)
+                elif entrypoint == "increase_reward":
+                    amount = rnd.randint(1, 10_000_000)
+                    week_call = accumulator_call = lambda model: model.increase_reward(admin, amount, now)
+                else:
+                    week_call = lambda model: int(model.claim_all(sender, now)[0])
+                    accumulator_call = lambda model: model.claim_all(sender, now)
+                week_paid, week_error = outcome(week_call, week_mode)
+                accumulated, accumulator_error = outcome(accumulator_call, accumulator)
+                # Both modes accept the call or reject it with the same error
+                self.assertEqual(accumulator_error, week_error, (seed, entrypoint, sender, now))
+                if entrypoint == "claim_all" and week_error is None:
+                    self.assertCloseToWeekMode(accumulated, week_paid, week_mode.get_current_week(now) - 1)
+            end = (total_weeks + 1) * sec_week
+            pending = [accumulator.claimable(sender, end) for sender in stakers]
+            for sender, accumulated in zip(stakers, pending):
+                self.assertCloseToWeekMode(accumulated, int(week_mode.claimable(sender, end)[0]), total_weeks)
+
+    def test_idle_weeks_should_be_settled_at_once(self):
+        # Init
+        model = accumulator_model(farm_storage)
+        model.stake(alice, 500, int(sec_week / 2))
+        model.stake(bob, 1500, int(sec_week / 2))
+        # Execute entrypoint
+        model.claim_all(alice, 5 * sec_week)
+        self.assertEqual(model.last_week, 6)
+        self.assertEqual(sorted(model.reward_per_point_at_week), [1])
+        self.assertEqual(model.stakers[alice].week, 6)
+        self.assertLess(model.stakers[alice].unclaimed, reward_precision)
+        self.assertEqual(model.claimable(bob, 8 * sec_week), 3 * sum(farm_storage["reward_at_week"]) // 4)
+
+    def test_week_duration_should_set_the_reward_period(self):
+        # Init
+        sec_day = 86400
+        storage = farm_fixture.overlay()
+        storage["week_duration"] = sec_day
+        week_mode = FarmModel.from_storage(storage)
+        accumulator = accumulator_model(storage)
+        # Execute entrypoints
+        for entrypoint, sender, amount, now in scenario:
+            now = now * sec_day // sec_week
+            if entrypoint == "claim_all":
+                self.assertCloseToWeekMode(accumulator.claim_all(sender, now), int(week_mode.claim_all(sender, now)[0]),
+                                           accumulator.get_current_week(now) - 1)
+            else:
+                getattr(week_mode, entrypoint)(sender, amount, now)
+                getattr(accumulator, entrypoint)(sender, amount, now)
+        self.assertEqual(accumulator.get_current_week(sec_week), 8)
+        self.assertEqual(accumulator.stakers[alice].week, 7)
+
+
+class FarmAccumulatorContractTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.farms = load_contract(compiled_accumulator_path)
+        cls.base_storage = load_dummy_storage(compiled_accumulator_path)
+        cls.base_storage.update({field: farm_storage[field] for field in
+                                 ["input_token_address", "reward_token_address", "reward_reserve_address"]})
+        cls.maxDiff = None
+
+    def assertSameStorage(self, model, storage):
+        expected = model.to_storage()
+        for field in ["total_reward", "reward_until_week", "total_stake", "last_week", "week_points",
+                      "reward_per_point", "reward_per_point_at_week", "stakers"]:
+            self.assertEqual(expected[field], storage[field], field)
+
+    def test_initialize_should_cumulate_rewards(self):
+        # Init
+        model = AccumulatorModel(admin, 20_000_000, 5, 7500)
+        storage = model.to_storage(self.base_storage)
+        # Execute entrypoint
+        res = self.farms.initialize().interpret(storage=storage, sender=admin, now=100)
+        model.initialize(admin, 100)
+        self.assertEqual(res.storage["reward_until_week"], {1: 6555697, 2: 11472470, 3: 15160050, 4: 17925735, 5: 19999998})
+        self.assertSameStorage(model, res.storage)
+
+    def test_initialize_should_fail_on_a_null_week_duration(self):
+        # Init
+        model = AccumulatorModel(admin, 20_000_000, 5, 7500, week_duration=0)
+        storage = model.to_storage(self.base_storage)
+        # Execute entrypoint
+        with self.assertRaises(MichelsonRuntimeError) as error:
+            self.farms.initialize().interpret(storage=storage, sender=admin, now=100)
+        self.assertIn(week_duration_is_null, error.exception.format_stdout())
+
+    def test_scenario_should_match_model(self):
+        # Init
+        model = accumulator_model(farm_storage)
+        storage = model.to_storage(self.base_storage)
+        # Execute entrypoints
+        for entrypoint, sender, amount, now in scenario:
+            if entrypoint == "claim_all":
+                res = self.farms.claim_all().interpret(storage=storage, sender=sender, now=now)
+                self.assertEqual(claimed_amount(res), model.claim_all(sender, now))
+            else:
+                res = getattr(self.farms, entrypoint)(amount).interpret(storage=storage, sender=sender, now=now)
+                getattr(model, entrypoint)(sender, amount, now)
+            self.assertSameStorage(model, res.storage)
+            storage = res.storage
+
+    def test_exit_should_claim_and_unstake_everything(self):
+        # Init
+        model = accumulator_model(farm_storage)
+        model.stake(alice, 500, int(sec_week / 2))
+        model.stake(bob, 100, int(sec_week + sec_week / 3))
+        storage = model.to_storage(self.base_storage)
+        now = int(2 * sec_week + sec_week / 2)
+        # Execute entrypoint
+        res = self.farms.exit().interpret(storage=storage, sender=alice, now=now)
+        self.assertEqual(claimed_amount(res), model.claim_all(alice, now))
+        self.assertEqual(int(res.operations[1]["parameters"]["value"]["args"][2]["int"]), 500)
+        # Same storage as claim_all then unstake of the whole stake: the elapsed half week stays claimable
+        model.unstake(alice, 500, now)
+        self.assertSameStorage(model, res.storage)
+        self.assertEqual(res.storage["stakers"][alice]["week_points"], 500 * sec_week // 2)
+        self.assertEqual(res.storage["total_stake"], 100)
+        res = self.farms.claim_all().interpret(storage=res.storage, sender=alice, now=3 * sec_week)
+        self.assertEqual(claimed_amount(res), model.claim_all(alice, 3 * sec_week))
+
+    def test_exit_after_the_farm_should_remove_the_staker(self):
+        # Init
+        model = accumulator_model(farm_storage)
+        model.stake(alice, 500, int(sec_week / 2))
+        storage = model.to_storage(self.base_storage)
+        now = 6 * sec_week
+        # Execute entrypoint
+        res = self.farms.exit().interpret(storage=storage, sender=alice, now=now)
+        self.assertEqual(claimed_amount(res), model.claimable(alice, now))
+        self.assertNotIn(alice, res.storage["stakers"])
+        self.assertEqual(res.storage["total_stake"], 0)
+
+    def test_compound_should_stake_the_reward(self):
+        # Init
+        model = accumulator_model(farm_storage)
+        model.stake(alice, 500, int(sec_week / 2))
+        model.stake(bob, 100, int(sec_week + sec_week / 3))
+        storage = model.to_storage(self.base_storage)
+        storage["reward_token_address"] = storage["input_token_address"]
+        now = int(2 * sec_week + sec_week / 2)
+        # Execute entrypoint
+        res = self.farms.compound().interpret(storage=storage, sender=alice, now=now)
+        reward = model.claimable(alice, now)
+        self.assertEqual(claimed_amount(res), reward)
+        self.assertEqual(res.storage["stakers"][alice]["stake"], 500 + reward)
+        self.assertEqual(res.storage["total_stake"], 600 + reward)
@@ -0,0 +1,96 @@
+from unittest import TestCase
+import asyncio
+
+from contract_cache import load_contract
+from fake_rpc import FakeRpc
+from farm_client import FarmClient, FarmClientError
+from gas_benchmark import farm_fixture, farm_contract_path
+from gas_scaling import staker_address
+from local_chain import LocalChain, contract_address
+from test_farm import sec_week
+
+farms_count = 5
+users = [staker_address(i) for i in range(40)]
+
+
+def staked_chain() -> LocalChain:
+    """Chain of farms, one user out of index + 1 staking in the farm `index`."""
+    chain = LocalChain()
+    farm = load_contract(farm_contract_path)
+    for index in range(farms_count):
+        storage = farm_fixture.overlay()
+        stakers = users[::index + 1]
+        storage["user_stakes"] = {user: 10 * (index + 1) + i for i, user in enumerate(stakers)}
+        storage["user_points"] = {user: [stake * sec_week] * 5 for user, stake in storage["user_stakes"].items()}
+        storage["farm_points"] = [sum(points[0] for points in storage["user_points"].values())] * 5
+        chain.originate(farm, storage, contract_address(f"farm {index}"))
+    chain.bake()
+    return chain
+
+
+class FarmClientTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.chain = staked_chain()
+        cls.farms = list(cls.chain.storages)
+
+    def test_snapshots_should_decode_storages_and_big_maps(self):
+        async def run():
+            async with FakeRpc(self.chain.rpc_responses()) as rpc:
+                async with FarmClient(rpc.url) as client:
+                    return await client.snapshots(self.farms, users)
+
+        snapshots = asyncio.run(run())
+        for farm in self.farms:
+            expected = self.chain.storages[farm]
+            snapshot = snapshots[farm]
+            self.assertEqual(snapshot.user_stakes, expected["user_stakes"])
+            self.assertEqual(snapshot.user_points, expected["user_points"])
+            self.assertEqual(snapshot.storage["user_stakes"], self.chain.big_map_ids[farm]["user_stakes"])
+            for field in ["admin", "farm_points", "reward_at_week", "total_reward", "total_weeks"]:
+                self.assertEqual(snapshot.storage[field], expected[field])
+
+    def test_requests_should_be_bounded_and_coalesced(self):
+        async def run():
+            async with FakeRpc(self.chain.rpc_responses(), latency=0.005) as rpc:
+                async with FarmClient(rpc.url, concurrency=4) as client:
+                    # Every farm and user twice
+                    await client.snapshots(self.farms + self.farms, users + users)
+                    requests = client.requests
+                    await client.user_points(self.farms[0], users)
+                    return rpc, requests, client.requests
+
+        rpc, requests, requests_after = asyncio.run(run())
+        self.assertEqual(rpc.max_in_flight, 4)
+        # One header, one storage per farm and one request per farm, big_map and user
+        self.assertEqual(requests, 1 + farms_count + farms_count * 2 * len(users))
+        self.assertEqual(max(rpc.requests.values()), 1)
+        self.assertEqual(requests_after, requests)
+
+    def test_refresh_should_read_the_new_head(self):
+        chain = staked_chain()
+        farm, user = self.farms[0], users[0]
+
+        async def run():
+            async with FakeRpc(chain.rpc_responses()) as rpc:
+                async with FarmClient(rpc.url) as client:
+                    before = await client.user_stakes(farm, [user])
+                    chain.call(farm, "stake", 5, sender=user, now=int(sec_week / 2))
+                    chain.bake()
+                    rpc.responses = chain.rpc_responses()
+                    still = await client.user_stakes(farm, [user])
+                    await client.refresh()
+                    return before, still, await client.user_stakes(farm, [user])
+
+        before, still, after = asyncio.run(run())
+        self.assertEqual(still, before)
+        self.assertEqual(after, {user: before[user] + 5})
+
+    def test_unknown_contract_should_fail(self):
+        async def run():
+            async with FakeRpc(self.chain.rpc_responses()) as rpc:
+                async with FarmClient(rpc.url) as client:
+                    with self.assertRaises(FarmClientError):
+                        await client.snapshots([contract_address("unknown")], users)
+
+        asyncio.run(run())
@@ -0,0 +1,159 @@
+from unittest import TestCase
+from copy import deepcopy
+from hashlib import sha256
+import json
+import os
+import tempfile
+
+from pytezos import Key
+
+from contract_cache import load_contract
+from farm_deployer import (DeployError, FarmDeployer, FarmSpec, Group, LocalNode, load_artefact, load_manifest,
+                           max_operation_data_length)
+from gas_benchmark import database_contract_path, database_storage
+from local_chain import LocalChain, LocalChainError, contract_address
+
+deployer_key = Key.from_secret_exponent(sha256(b"deployer").digest())
+reserve_key = Key.from_secret_exponent(sha256(b"reserve").digest())
+deployer = deployer_key.public_key_hash()
+reserve = reserve_key.public_key_hash()
+
+metadata = {"name": "Smartlink farm", "version": "1.0.0"}
+season = 20
+
+
+class FarmDeployerTest(TestCase):
+    def setUp(self):
+        self.chain = LocalChain()
+        self.database = self.chain.originate(load_contract(database_contract_path), dict(deepcopy(database_storage), admin=deployer),
+                                             contract_address("database"))
+        fa12, fa2 = load_artefact("fa12.json"), load_artefact("fa2.json")
+        self.fa12 = self.chain.originate(fa12, dict(fa12.storage.dummy(), admin=deployer), contract_address("fa12"))
+        self.fa2 = self.chain.originate(fa2, dict(fa2.storage.dummy(), administrator=reserve), contract_address("fa2"))
+        self.chain.bake()
+        self.node = LocalNode(self.chain)
+        self.node.reveal(deployer_key)
+        self.node.reveal(reserve_key)
+
+    def spec(self, index: int, **kwargs) -> FarmSpec:
+        fields = dict(info=f"LP {index}/SMAK", admin=deployer, input_token_address=contract_address(f"lp {index}"),
+                      input_fa2_token_id=None, reward_token_address=self.fa12, reward_fa2_token_id=None,
+                      reward_reserve_address=reserve, total_reward=1_000_000 * (index + 1), rate=9990, total_weeks=4,
+                      week_duration=604800, database_address=self.database, metadata_uri=None)
+        fields.update(kwargs)
+        return FarmSpec(**fields)
+
+    def test_originations_should_fit_in_one_group(self):
+        # Init
+        deployer_ = FarmDeployer(self.node, [deployer_key], metadata)
+        specs = [self.spec(index) for index in range(season)]
+        # Execute
+        groups = deployer_.pack(deployer, deployer_.originations(specs))
+        self.assertEqual([len(group.contents) for group in groups], [season + 1])
+        self.assertLessEqual(len(groups[0].sign(deployer_key).payload()), max_operation_data_length)
+        self.node.inject(groups[0].sign(deployer_key))
+        self.node.wait([])
+        # The farm code is registered once, the originations reference it
+        self.assertEqual(len(self.chain.constants), 1)
+        farms = [address for address in self.chain.storages if address not in (self.database, self.fa12, self.fa2)]
+        self.assertEqual(len(farms), season)
+        for farm in farms:
+            storage = self.chain.storages[farm]
+            self.assertFalse(storage["initialized"])
+            self.assertEqual(storage["total_weeks"], 4)
+        # A second season only originates
+        self.assertEqual([content["kind"] for content in deployer_.originations(specs[:2])], ["origination"] * 2)
+
+    def test_deploy_should_register_initialize_and_approve_every_farm(self):
+        # Init
+        specs = [self.spec(index) for index in range(season - 1)]
+        specs.append(self.spec(season - 1, reward_token_address=self.fa2, reward_fa2_token_id=0))
+        # Execute
+        deployment = FarmDeployer(self.node, [deployer_key, reserve_key], metadata).deploy(specs)
+        # One block for the originations, one for the calls of the deployer and of the reserve
+        self.assertEqual([len(hashes) for hashes in deployment.blocks], [1, 2])
+        self.assertEqual(deployment.unsigned, [])
+        self.assertEqual(sorted(self.chain.storages[self.database]["all_farms"]), sorted(deployment.farms))
+        for spec, farm in zip(specs, deployment.farms):
+            storage = self.chain.storages[farm]
+            self.assertTrue(storage["initialized"])
+            self.assertEqual(len(storage["reward_at_week"]), spec.total_weeks)
+            self.assertEqual(self.chain.storages[self.database]["all_farms_data"][farm]["farm_lp_info"], spec.info)
+        allowances = self.chain.storages[self.fa12]["allowances"]
+        for spec, farm in zip(specs[:-1], deployment.farms):
+            self.assertEqual(allowances[reserve, farm], spec.total_reward)
+        self.assertIn((reserve, deployment.farms[-1], 0), self.chain.storages[self.fa2]["operators"])
+
+    def test_groups_of_other_signers_should_be_returned_unsigned(self):
+        # Init
+        specs = [self.spec(index) for index in range(3)]
+        # Execute
+        deployment = FarmDeployer(self.node, [deployer_key], metadata).deploy(specs)
+        self.assertEqual([group.source for group in deployment.unsigned], [reserve])
+        self.assertEqual(self.chain.storages[self.fa12]["allowances"], {})
+        # The reserve signs them later
+        with self.assertRaises(DeployError):
+            self.node.inject(deployment.unsigned[0].sign(deployer_key))
+        for group in deployment.unsigned:
+            self.node.inject(group.sign(reserve_key))
+        self.assertEqual(len(self.chain.storages[self.fa12]["allowances"]), 3)
+
+    def test_inject_should_check_the_group(self):
+        deployer_ = FarmDeployer(self.node, [deployer_key], metadata)
+        group = deployer_.pack(deployer, deployer_.originations([self.spec(0)]))[0]
+        content = dict(group.contents[-1], counter=str(int(group.contents[-1]["counter"]) + 1))
+        with self.assertRaises(DeployError):
+            self.node.inject(Group(group.branch, group.contents[:-1] + [content]).sign(deployer_key))
+        self.node.inject(group.sign(deployer_key))
+        # One group per source and per block
+        with self.assertRaises(DeployError):
+            self.node.inject(deployer_.pack(deployer, deployer_.originations([self.spec(1)]))[0].sign(deployer_key))
+
+    def test_first_group_of_a_fresh_signer_should_reveal_it(self):
+        # Init
+        node = LocalNode(self.chain)
+        node.reveal(deployer_key)
+        deployer_ = FarmDeployer(node, [deployer_key, reserve_key], metadata)
+        approval = deployer_.fa12.approve({"spender": self.database, "value": 10})
+        operation = {"kind": "transaction", "amount": "0", "destination": self.fa12, "parameters": approval.parameters}
+        # Execute
+        group = deployer_.pack(reserve, [operation])[0]
+        self.assertEqual([content["kind"] for content in group.contents], ["reveal", "transaction"])
+        with self.assertRaises(DeployError):
+            node.inject(Group(group.branch, group.contents[1:]).sign(reserve_key))
+        node.inject(group.sign(reserve_key))
+        self.assertTrue(node.is_revealed(reserve))
+        self.assertEqual(self.chain.public_keys, {reserve: reserve_key.public_key()})
+        self.assertEqual(self.chain.storages[self.fa12]["allowances"], {(reserve, self.database): 10})
+        # Its next groups do not reveal it again
+        node.wait([])
+        other = dict(operation, parameters=deployer_.fa12.approve({"spender": self.fa2, "value": 10}).parameters)
+        self.assertEqual([content["kind"] for content in deployer_.pack(reserve, [other])[0].contents], ["transaction"])
+        with self.assertRaises(DeployError):
+            node.inject(group.sign(reserve_key))
+
+    def test_chain_should_reject_unsupported_operations(self):
+        with self.assertRaises(LocalChainError):
+            self.chain.apply([{"kind": "delegation", "source": deployer, "delegate": deployer}], "")
+
+    def test_metadata_uri_should_replace_metadata(self):
+        deployer_ = FarmDeployer(self.node, [deployer_key], metadata)
+        storage = deployer_.farm_storage(self.spec(0, metadata_uri="ipfs://QmFarmMetadata"))
+        self.assertEqual(storage["metadata"], {"": b"ipfs://QmFarmMetadata"})
+
+    def test_manifest_should_read_env_files(self):
+        env_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "deploy", ".env.prod2.xtzsmak_doga")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "manifest.json")
+            with open(path, "w") as f:
+                json.dump({"defaults": {"RATE": 9000},
+                           "farms": [{"env": env_path}, {"env": env_path, "INFOFARM": "second", "REWARD_TOKEN_ID": 3}]}, f)
+            specs = load_manifest(path)
+        self.assertEqual(specs[0].info, "XTZ/SMAK->DOGA, 4 period(s), 4 weeks approx in total")
+        self.assertEqual(specs[0].admin, "tz1a7SHgLgEyohB8rDEUjuSYj4sjnw8JuDyR")
+        self.assertEqual((specs[0].rate, specs[0].total_weeks, specs[0].week_duration, specs[0].total_reward),
+                         (9990, 4, 604800, 1_000_000_000))
+        self.assertEqual((specs[0].input_fa2_token_id, specs[0].reward_fa2_token_id), (None, None))
+        self.assertEqual((specs[1].info, specs[1].reward_fa2_token_id), ("second", 3))
+        with self.assertRaises(DeployError):
+            FarmSpec.from_env({"INFOFARM": "incomplete"})
@@ -0,0 +1,57 @@
+from unittest import TestCase
+
+from farm_fuzzer import FarmFuzzer
+from farm_model import FarmModel
+
+
+class ForgetfulUnstakeModel(FarmModel):
+    """Bug injected on purpose: unstake forgets farm_points."""
+
+    def unstake(self, senders, amounts, now):
+        farm_points = self.farm_points.copy()
+        super().unstake(senders, amounts, now)
+        self.farm_points = farm_points
+
+
+class GreedyStakeModel(FarmModel):
+    """Bug injected on purpose: stakes of 500 or more get one point too many."""
+
+    def stake(self, senders, amounts, now):
+        super().stake(senders, amounts, now)
+        if amounts >= 500:
+            self._points[self.users[senders]][-1] += 1
+
+
+class FarmFuzzerTest(TestCase):
+    def test_fuzz_should_keep_invariants(self):
+        fuzzer = FarmFuzzer(total_weeks=10, stakers=8)
+        for seed in range(3):
+            self.assertIsNone(fuzzer.fuzz(2000, seed, check_rate=0))
+
+    def test_fuzz_should_match_contract_on_sampled_steps(self):
+        fuzzer = FarmFuzzer(total_weeks=5, stakers=6)
+        for seed in range(3):
+            failure = fuzzer.fuzz(300, seed, check_rate=0.05)
+            self.assertIsNone(failure, failure and failure.message)
+
+    def test_shrink_should_keep_stake_and_unstake(self):
+        # Init
+        fuzzer = FarmFuzzer(total_weeks=10, stakers=8, model_factory=ForgetfulUnstakeModel.from_storage)
+        failure = fuzzer.fuzz(2000, 0, check_rate=0)
+        self.assertEqual(failure.kind, "invariant")
+        # Execute
+        shrunk = fuzzer.shrink(failure)
+        self.assertEqual([step.entrypoint for step in shrunk.steps], ["stake", "unstake"])
+        self.assertEqual([step.amount for step in shrunk.steps], [1, 1])
+        self.assertEqual(shrunk.steps[0].sender, shrunk.steps[1].sender)
+
+    def test_shrink_should_lower_amounts(self):
+        # Init
+        fuzzer = FarmFuzzer(total_weeks=10, stakers=8, model_factory=GreedyStakeModel.from_storage)
+        failure = fuzzer.fuzz(2000, 0, check_rate=0)
+        # Execute
+        shrunk = fuzzer.shrink(failure)
+        self.assertEqual(len(shrunk.steps), 1)
+        self.assertEqual(shrunk.steps[0].entrypoint, "stake")
+        self.assertGreaterEqual(shrunk.steps[0].amount, 500)
+        self.assertLess(shrunk.steps[0].amount, 1000)
@@ -0,0 +1,142 @@
+from unittest import TestCase
+from copy import deepcopy
+import os
+import tempfile
+
+from contract_cache import load_contract
+from farm_indexer import FarmIndexer, IndexerError, operation_results
+from gas_benchmark import farm_fixture, database_fixture, farm_contract_path, database_contract_path
+from local_chain import LocalChain
+from test_farm import alice, bob, oscar, sec_week
+
+lp_address = "KT1XtQeSap9wvJGY1Lmek84NU6PK6cjzC9Qd"
+
+scenario = [
+    ("stake", alice, 500, int(sec_week / 2)),
+    ("stake", bob, 100, int(sec_week + sec_week / 3)),
+    ("stake", alice, 250, int(sec_week + sec_week * 2 / 3)),
+    ("claim_all", alice, None, int(2 * sec_week + 10)),
+    ("unstake", bob, 40, int(2 * sec_week + sec_week / 4)),
+    ("stake", oscar, 900, int(3 * sec_week + sec_week / 5)),
+    ("claim_all", bob, None, int(3 * sec_week + sec_week / 2)),
+    ("unstake", alice, 750, int(4 * sec_week + 1)),
+    ("claim_all", oscar, None, int(6 * sec_week)),
+]
+
+
+def farm_chain():
+    """Chain where a farm and a database are originated, then the scenario runs one call per block."""
+    chain = LocalChain()
+    farm = chain.originate(load_contract(farm_contract_path), farm_fixture.overlay())
+    storage = database_fixture.overlay()
+    storage["all_farms"] = [farm]
+    storage["all_farms_data"] = {farm: {"farm_lp_info": "pair colibri-pouet", "lp_address": lp_address}}
+    storage["inverse_farms"] = {lp_address: {farm: "pair colibri-pouet"}}
+    storage["farms_by_index"], storage["farm_index"] = {0: farm}, {farm: 0}
+    database = chain.originate(load_contract(database_contract_path), storage)
+    chain.bake()
+    for entrypoint, sender, amount, now in scenario:
+        args = [] if amount is None else [amount]
+        chain.call(farm, entrypoint, *args, sender=sender, now=now)
+        chain.bake()
+    return chain, farm, database
+
+
+def new_indexer(path=":memory:", batch_size=3):
+    indexer = FarmIndexer(path, batch_size)
+    indexer.watch_code(load_contract(farm_contract_path))
+    indexer.watch_code(load_contract(database_contract_path))
+    return indexer
+
+
+class FarmIndexerTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.chain, cls.farm, cls.database = farm_chain()
+        cls.maxDiff = None
+
+    def assertSameFarm(self, indexer, storage):
+        self.assertEqual(indexer.user_stakes(self.farm), storage["user_stakes"])
+        self.assertEqual(indexer.user_points(self.farm), storage["user_points"])
+        self.assertEqual(indexer.user_claimed_week(self.farm), storage.get("user_claimed_week", {}))
+        self.assertEqual(indexer.farm_points(self.farm), storage["farm_points"])
+        self.assertEqual(indexer.reward_at_week(self.farm), storage["reward_at_week"])
+        self.assertEqual(indexer.field(self.farm, "total_reward"), storage["total_reward"])
+
+    def test_index_should_match_chain_storages(self):
+        # Init
+        indexer = new_indexer()
+        # Execute
+        applied = indexer.apply(self.chain.blocks)
+        self.assertEqual(applied, 2 + len(scenario))
+        self.assertSameFarm(indexer, self.chain.storages[self.farm])
+        self.assertEqual(indexer.all_farms_data(self.database), self.chain.storages[self.database]["all_farms_data"])
+        self.assertEqual(indexer.inverse_farms(self.database), self.chain.storages[self.database]["inverse_farms"])
+        self.assertEqual(indexer.farms_by_lp(self.database, lp_address), {self.farm: "pair colibri-pouet"})
+        self.assertEqual(indexer.checkpoint(self.farm), self.chain.blocks[-1]["header"]["level"])
+        self.assertEqual(indexer.checkpoint(self.database), self.chain.blocks[0]["header"]["level"])
+
+    def test_index_should_follow_every_block(self):
+        # Init
+        indexer = new_indexer(batch_size=1)
+        chain = LocalChain()
+        farm = chain.originate(load_contract(farm_contract_path), farm_fixture.overlay(), self.farm)
+        indexer.apply([chain.bake()])
+        # Execute
+        for entrypoint, sender, amount, now in scenario:
+            chain.call(farm, entrypoint, *([] if amount is None else [amount]), sender=sender, now=now)
+            self.assertEqual(indexer.apply([chain.bake()]), 1)
+            self.assertSameFarm(indexer, chain.storages[farm])
+
+    def test_replay_should_resume_from_checkpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # Init
+            path = os.path.join(directory, "farms.sqlite")
+            indexer = new_indexer(path)
+            indexer.apply(self.chain.blocks[:5])
+            indexer.close()
+            # Execute
+            indexer = new_indexer(path)
+            applied = indexer.apply(self.chain.blocks)
+            self.assertEqual(applied, len(self.chain.blocks) - 5)
+            self.assertSameFarm(indexer, self.chain.storages[self.farm])
+            self.assertEqual(indexer.apply(self.chain.blocks), 0)
+            indexer.close()
+
+    def test_failed_batch_should_not_move_checkpoint(self):
+        # Init
+        indexer = new_indexer(batch_size=3)
+        blocks = deepcopy(self.chain.blocks)
+        result = blocks[5]["operations"][3][0]["contents"][0]["metadata"]["operation_result"]
+        big_map_id = self.chain.big_map_ids[self.farm]["user_stakes"]
+        result["lazy_storage_diff"] = [{"kind": "big_map", "id": str(big_map_id), "diff": {"action": "copy", "source": "42", "updates": []}}]
+        # Execute
+        with self.assertRaises(IndexerError):
+            indexer.apply(blocks)
+        self.assertEqual(indexer.checkpoint(self.farm), blocks[2]["header"]["level"])
+        expected = new_indexer()
+        expected.apply(blocks[:3])
+        self.assertEqual(indexer.user_stakes(self.farm), expected.user_stakes(self.farm))
+        self.assertEqual(indexer.user_points(self.farm), expected.user_points(self.farm))
+        self.assertEqual(indexer.farm_points(self.farm), expected.farm_points(self.farm))
+
+    def test_removed_key_should_be_deleted(self):
+        # Init
+        indexer = new_indexer()
+        indexer.apply(self.chain.blocks)
+        database_block = self.chain.blocks[0]["operations"][3][0]["contents"][1]
+        updates = database_block["metadata"]["operation_result"]["lazy_storage_diff"]
+        removal = {"kind": "transaction", "destination": self.database, "metadata": {"operation_result": {
+            "status": "applied",
+            "storage": database_block["script"]["storage"],
+            "lazy_storage_diff": [{"kind": "big_map", "id": diff["id"], "diff": {
+                "action": "update", "updates": [{"key": u["key"], "key_hash": u["key_hash"]} for u in diff["diff"]["updates"]]}}
+                for diff in updates],
+        }}}
+        block = {"header": {"level": self.chain.level}, "operations": [[], [], [], [{"contents": [removal]}]]}
+        # Execute
+        self.assertEqual(len(list(operation_results(block))), 1)
+        indexer.apply([block])
+        self.assertEqual(indexer.all_farms_data(self.database), {})
+        self.assertEqual(indexer.inverse_farms(self.database), {})
+        self.assertSameFarm(indexer, self.chain.storages[self.farm])
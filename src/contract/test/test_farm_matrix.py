@@ -0,0 +1,574 @@
+from unittest import TestCase
+
+from contract_cache import load_contract
+from farm_matrix import matrix_scenario, expand_matrix
+from scenario import ScenarioRunner, Step
+from test_farm import (compiled_contract_path, farm_storage, farm_address, admin, alice, bob, sec_week,
+                       verify_fa12_stake_tx, verify_fa2_stake_tx, verify_fa12_unstake_tx, verify_fa2_unstake_tx,
+                       verify_fa12_claim_tx, verify_fa2_claim_tx)
+
+
+def transfer_tx_params(operation, token_id_opt):
+    if token_id_opt is None:
+        return operation["parameters"]["value"]['args']
+    return operation["parameters"]["value"][0]['args']
+
+def verify_stake_tx(operation, token_id_opt, account, amount):
+    tx = transfer_tx_params(operation, token_id_opt)
+    if token_id_opt is None:
+        verify_fa12_stake_tx(tx, account, farm_address, amount)
+    else:
+        verify_fa2_stake_tx(tx, account, farm_address, token_id_opt, amount)
+
+def verify_unstake_tx(operation, token_id_opt, account, amount):
+    tx = transfer_tx_params(operation, token_id_opt)
+    if token_id_opt is None:
+        verify_fa12_unstake_tx(tx, account, farm_address, amount)
+    else:
+        verify_fa2_unstake_tx(tx, account, farm_address, token_id_opt, amount)
+
+def verify_claim_tx(operation, token_id_opt, account, amount):
+    tx = transfer_tx_params(operation, token_id_opt)
+    reserve_address = farm_storage.base["reward_reserve_address"]
+    if token_id_opt is None:
+        verify_fa12_claim_tx(tx, account, reserve_address, amount)
+    else:
+        verify_fa2_claim_tx(tx, account, reserve_address, token_id_opt, amount)
+
+
+class FarmMatrixTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.farms = load_contract(compiled_contract_path)
+        cls.maxDiff = None
+
+
+######################
+# Tests for Staking #
+######################
+
+@matrix_scenario
+def stake_one_time_on_second_week(self, init_storage):
+    locked_amount = 20
+    # Execute entrypoint
+    res = self.farms.stake(locked_amount).interpret(storage=init_storage, sender=bob, now=int(sec_week + sec_week/2))
+    self.assertEqual(len(res.operations), 1)
+    verify_stake_tx(res.operations[0], init_storage["input_fa2_token_id_opt"], bob, locked_amount)
+    self.assertEqual(locked_amount, res.storage["user_stakes"][bob])
+    expected_user_points = [0, sec_week * locked_amount / 2, sec_week * locked_amount, sec_week * locked_amount, sec_week * locked_amount]
+    self.assertEqual(res.storage["user_points"][bob], expected_user_points)
+    self.assertEqual(res.storage["farm_points"], expected_user_points)
+
+@matrix_scenario
+def stake_two_times(self, init_storage):
+    init_storage["user_stakes"][bob] = 300
+    init_storage["user_points"][bob] = [0,0,int(300 * sec_week / 2),300 * sec_week, 300 * sec_week ]
+    init_storage["farm_points"] = [0,0,int(300 * sec_week / 2),300 * sec_week, 300 * sec_week ]
+    # Execute entrypoint
+    res = self.farms.stake(500).interpret(storage=init_storage, sender=bob, now=int(3 * sec_week + sec_week*2/3))
+    self.assertEqual(len(res.operations), 1)
+    verify_stake_tx(res.operations[0], init_storage["input_fa2_token_id_opt"], bob, 500)
+    self.assertEqual(800, res.storage["user_stakes"][bob])
+    expected_user_points = [0, 0, int(sec_week * 300 / 2), int(sec_week * 300 + sec_week * 500 / 3), int(sec_week * 300 + sec_week * 500) ]
+    self.assertEqual(res.storage["user_points"][bob], expected_user_points)
+    self.assertEqual(res.storage["farm_points"], expected_user_points)
+
+@matrix_scenario
+def stake_with_two_different_users(self, init_storage):
+    init_storage["user_stakes"][bob] = 300
+    init_storage["user_points"][bob] = [0,0,int(300 * sec_week / 2),300 * sec_week, 300 * sec_week ]
+    init_storage["farm_points"] = [0,0,int(300 * sec_week / 2),300 * sec_week, 300 * sec_week ]
+    # Execute entrypoint
+    res = self.farms.stake(400).interpret(storage=init_storage, sender=alice, now=int(2*sec_week + sec_week*2/3))
+    self.assertEqual(len(res.operations), 1)
+    verify_stake_tx(res.operations[0], init_storage["input_fa2_token_id_opt"], alice, 400)
+    self.assertEqual(400, res.storage["user_stakes"][alice])
+    expected_user_points = [0, 0, int(sec_week * 400 / 3), sec_week * 400, sec_week * 400 ]
+    expected_farm_points = [0, 0, int(sec_week * 400 / 3) + int(300 * sec_week / 2), sec_week * 700, sec_week * 700 ]
+    self.assertEqual(res.storage["user_points"][alice], expected_user_points)
+    self.assertEqual(res.storage["farm_points"], expected_farm_points)
+
+#####################
+# Tests for Unstake #
+#####################
+
+@matrix_scenario
+def unstake_basic(self, init_storage):
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    # Execute entrypoint
+    res = self.farms.unstake(250).interpret(sender=alice, storage=init_storage, now=int(sec_week + sec_week/2))
+    self.assertEqual(len(res.operations), 1)
+    verify_unstake_tx(res.operations[0], init_storage["input_fa2_token_id_opt"], alice, 250)
+    expected_user_points = [int(500 * sec_week/2), int((500+250) * sec_week/2), 250 * sec_week, 250 * sec_week, 250 * sec_week]
+    self.assertEqual(res.storage["user_stakes"][alice], 250)
+    self.assertEqual(res.storage["user_points"][alice], expected_user_points)
+    self.assertEqual(res.storage["farm_points"], expected_user_points)
+
+@matrix_scenario
+def unstake_same_week(self, init_storage):
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    # Execute entrypoint
+    res = self.farms.unstake(499).interpret(sender=alice, storage=init_storage, now=int(sec_week*3/4))
+    expected_user_points = [int(500 * sec_week/2) - int(499 * sec_week/4), sec_week, sec_week, sec_week, sec_week ]
+    self.assertEqual(res.storage["user_points"][alice], expected_user_points)
+    self.assertEqual(res.storage["farm_points"], expected_user_points)
+    self.assertEqual(res.storage["user_stakes"][alice], 1)
+    self.assertEqual(len(res.operations), 1)
+    verify_unstake_tx(res.operations[0], init_storage["input_fa2_token_id_opt"], alice, 499)
+
+@matrix_scenario
+def unstake_total_stake(self, init_storage):
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    # Execute entrypoint
+    res = self.farms.unstake(500).interpret(sender=alice, storage=init_storage, now=int(sec_week + sec_week/2))
+    expected_user_points = [int(500 * sec_week/2), int(500 * sec_week/2), 0, 0, 0 ]
+    self.assertEqual(res.storage["user_points"][alice], expected_user_points)
+    self.assertEqual(res.storage["farm_points"], expected_user_points)
+    self.assertEqual(res.storage["user_stakes"][alice], 0)
+    self.assertEqual(len(res.operations), 1)
+    verify_unstake_tx(res.operations[0], init_storage["input_fa2_token_id_opt"], alice, 500)
+
+@matrix_scenario
+def unstake_with_two_users(self, init_storage):
+    init_storage["user_stakes"][bob] = 600
+    init_storage["user_points"][bob] = [0, 0, int(600 * sec_week / 3), 600 * sec_week, 600 * sec_week]
+    init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    init_storage["farm_points"] = [int(500 * sec_week / 2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, 600 * sec_week + 500 * sec_week, 600 * sec_week + 500 * sec_week]
+    # Execute entrypoint
+    res = self.farms.unstake(100).interpret(storage=init_storage, sender=bob, now=int(3 * sec_week + sec_week * 6 / 7))
+    expected_userpoint_bob = [0, 0, int(600 * sec_week / 3), int((600 * (6 / 7) + 500 / 7) * sec_week), 500 * sec_week]
+    expected_userpoint_alice = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    expected_farmpoint = [int(500 * sec_week / 2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, int((600 * (6 / 7) + 500 / 7) * sec_week) + 500 * sec_week, 500 * sec_week + 500 * sec_week]
+    self.assertEqual(res.storage["user_points"][bob], expected_userpoint_bob)
+    self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
+    self.assertEqual(res.storage["farm_points"], expected_farmpoint)
+    self.assertEqual(res.storage["user_stakes"][bob], 500)
+    self.assertEqual(len(res.operations), 1)
+    verify_unstake_tx(res.operations[0], init_storage["input_fa2_token_id_opt"], bob, 100)
+
+@matrix_scenario
+def unstake_after_pool_end(self, init_storage):
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    # Execute entrypoint
+    res = self.farms.unstake(250).interpret(sender=alice, storage=init_storage, now=sec_week * 1000)
+    expected_userpoint_alice = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    self.assertEqual(res.storage["user_stakes"][alice], 250)
+    self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
+    self.assertEqual(res.storage["farm_points"], expected_userpoint_alice)
+    self.assertEqual(len(res.operations), 1)
+    verify_unstake_tx(res.operations[0], init_storage["input_fa2_token_id_opt"], alice, 250)
+
+@matrix_scenario
+def unstake_with_two_users_at_the_pool_end(self, init_storage):
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    init_storage["user_stakes"][bob] = 600
+    init_storage["user_points"][bob] = [0, 0, int(600 * sec_week / 3), 600 * sec_week, 600 * sec_week]
+    init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, 1100 * sec_week, 1100 * sec_week]
+    # Execute entrypoint
+    res = self.farms.unstake(500).interpret(storage=init_storage, sender=bob, now=int(30 * sec_week + sec_week * 6 / 7))
+    expected_userpoint_alice = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    expected_userpoint_bob = [0, 0, int(600 * sec_week / 3), 600 * sec_week, 600 * sec_week]
+    expected_farmpoint = [int(500 * sec_week/2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, 1100 * sec_week, 1100 * sec_week]
+    self.assertEqual(res.storage["user_stakes"][alice], 500)
+    self.assertEqual(res.storage["user_stakes"][bob], 100)
+    self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
+    self.assertEqual(res.storage["user_points"][bob], expected_userpoint_bob)
+    self.assertEqual(res.storage["farm_points"], expected_farmpoint)
+    self.assertEqual(len(res.operations), 1)
+    verify_unstake_tx(res.operations[0], init_storage["input_fa2_token_id_opt"], bob, 500)
+
+@matrix_scenario
+def unstake_everything_with_two_users_at_the_pool_end(self, init_storage):
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    init_storage["user_stakes"][bob] = 600
+    init_storage["user_points"][bob] = [0, 0, int(600 * sec_week / 3), 600 * sec_week, 600 * sec_week]
+    init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, 1100 * sec_week, 1100 * sec_week]
+    # Execute entrypoint
+    res = self.farms.unstake(600).interpret(storage=init_storage, sender=bob, now=int(30 * sec_week + sec_week * 6 / 7))
+    expected_userpoint_alice = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    expected_userpoint_bob = [0, 0, int(600 * sec_week / 3), 600 * sec_week, 600 * sec_week]
+    expected_farmpoint = [int(500 * sec_week/2), 500 * sec_week, int(600 * sec_week / 3) + 500 * sec_week, 1100 * sec_week, 1100 * sec_week]
+    self.assertEqual(res.storage["user_stakes"][alice], 500)
+    self.assertEqual(res.storage["user_stakes"][bob], 0)
+    self.assertEqual(res.storage["user_points"][alice], expected_userpoint_alice)
+    self.assertEqual(res.storage["user_points"][bob], expected_userpoint_bob)
+    self.assertEqual(res.storage["farm_points"], expected_farmpoint)
+    self.assertEqual(len(res.operations), 1)
+    verify_unstake_tx(res.operations[0], init_storage["input_fa2_token_id_opt"], bob, 600)
+
+@matrix_scenario
+def unstake_after_increasing_reward(self, init_storage):
+    init_storage["total_reward"] = 10_000_000
+    init_storage["total_weeks"] = 3
+    init_storage["rate"] = 7500
+    init_storage["reward_at_week"] = [4324324, 3243243, 2432432]
+    runner = ScenarioRunner(self.farms)
+    # Execute entrypoints
+    results = runner.run(runner.state(init_storage), [
+        Step("increase_reward", admin, now=int(sec_week + sec_week/2), parameter=20_000_000),
+        Step("stake", alice, now=int(2 * sec_week + sec_week/2), parameter=10000),
+        Step("unstake", alice, now=int(3 * sec_week + sec_week/2), parameter=10000),
+    ])
+    storage, operations = results[-1].state.storage(), results[-1].operations
+    self.assertEqual(storage["total_reward"], 30000000)
+    self.assertEqual(storage["total_weeks"], 3)
+    self.assertEqual(storage["admin"], admin)
+    self.assertEqual(len(operations), 1)
+    verify_unstake_tx(operations[0], init_storage["input_fa2_token_id_opt"], alice, 10000)
+    expected_farmpoint = [0, 0, int(10000*sec_week/2)]
+    self.assertEqual(storage["farm_points"], expected_farmpoint)
+    self.assertEqual(storage["user_stakes"][alice], 0)
+
+######################
+# Tests for ClaimAll #
+######################
+
+@matrix_scenario
+def claimall_2rd_week(self, init_storage):
+    init_storage["total_reward"] = 20_000_000
+    init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
+    init_storage["creation_time"] = 0
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    # Execute entrypoint
+    res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week + sec_week/2))
+    self.assertEqual(res.storage["admin"], admin)
+    verify_claim_tx(res.operations[0], init_storage["reward_fa2_token_id_opt"], alice, init_storage["reward_at_week"][0])
+    self.assertEqual(res.storage["user_points"][alice], init_storage["user_points"][alice][1:])
+    self.assertEqual(res.storage["user_claimed_week"][alice], 1)
+    self.assertEqual(res.storage["user_stakes"][alice], 500)
+    self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
+
+@matrix_scenario
+def claimall_3rd_week(self, init_storage):
+    init_storage["total_reward"] = 20_000_000
+    init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
+    init_storage["creation_time"] = 0
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    # Execute entrypoint
+    res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week * 2 + sec_week/2))
+    self.assertEqual(res.storage["admin"], admin)
+    verify_claim_tx(res.operations[0], init_storage["reward_fa2_token_id_opt"], alice, sum(init_storage["reward_at_week"][:2]))
+    self.assertEqual(res.storage["user_points"][alice], init_storage["user_points"][alice][2:])
+    self.assertEqual(res.storage["user_claimed_week"][alice], 2)
+    self.assertEqual(res.storage["user_stakes"][alice], 500)
+    self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
+
+@matrix_scenario
+def claimall_should_skip_claimed_weeks(self, init_storage):
+    init_storage["total_reward"] = 20_000_000
+    init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
+    init_storage["creation_time"] = 0
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    # The 2 claimed weeks are no longer in the list
+    init_storage["user_points"][alice] = init_storage["user_points"][alice][2:]
+    init_storage["user_claimed_week"][alice] = 2
+    # Execute entrypoint
+    res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week * 4 + sec_week/2))
+    verify_claim_tx(res.operations[0], init_storage["reward_fa2_token_id_opt"], alice, sum(init_storage["reward_at_week"][2:4]))
+    self.assertEqual(res.storage["user_points"][alice], [500 * sec_week])
+    self.assertEqual(res.storage["user_claimed_week"][alice], 4)
+    # Nothing left to claim until the next week
+    res2 = self.farms.claim_all().interpret(storage=res.storage, sender=alice, now=int(sec_week * 4 + sec_week * 3/4))
+    self.assertEqual(res2.operations, [])
+    self.assertEqual(res2.storage["user_points"][alice], [500 * sec_week])
+    self.assertEqual(res2.storage["user_claimed_week"][alice], 4)
+
+@matrix_scenario
+def stake_after_claim_should_skip_claimed_weeks(self, init_storage):
+    init_storage["creation_time"] = 0
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [500 * sec_week, 500 * sec_week, 500 * sec_week]
+    init_storage["user_claimed_week"][alice] = 2
+    init_storage["farm_points"] = [500 * sec_week] * 5
+    # Execute entrypoint
+    res = self.farms.stake(100).interpret(storage=init_storage, sender=alice, now=int(sec_week * 2 + sec_week / 2))
+    verify_stake_tx(res.operations[0], init_storage["input_fa2_token_id_opt"], alice, 100)
+    self.assertEqual(res.storage["user_points"][alice], [int(550 * sec_week), 600 * sec_week, 600 * sec_week])
+    self.assertEqual(res.storage["user_claimed_week"][alice], 2)
+    self.assertEqual(res.storage["farm_points"], [500 * sec_week, 500 * sec_week, int(550 * sec_week), 600 * sec_week, 600 * sec_week])
+    # Unstaking subtracts from the same weeks
+    res2 = self.farms.unstake(100).interpret(storage=res.storage, sender=alice, now=int(sec_week * 2 + sec_week / 2))
+    self.assertEqual(res2.storage["user_points"][alice], init_storage["user_points"][alice])
+    self.assertEqual(res2.storage["farm_points"], init_storage["farm_points"])
+
+@matrix_scenario
+def claim_for_should_send_reward_to_user(self, init_storage):
+    init_storage["total_reward"] = 20_000_000
+    init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
+    init_storage["creation_time"] = 0
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    init_storage["farm_points"] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    # Execute entrypoint
+    res = self.farms.claim_for(alice).interpret(storage=init_storage, sender=bob, now=int(sec_week * 2 + sec_week/2))
+    verify_claim_tx(res.operations[0], init_storage["reward_fa2_token_id_opt"], alice, sum(init_storage["reward_at_week"][:2]))
+    self.assertEqual(res.storage["user_claimed_week"][alice], 2)
+    self.assertNotIn(bob, res.storage["user_claimed_week"])
+
+@matrix_scenario
+def claim_for_by_third_party_should_settle_user(self, init_storage):
+    init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
+    init_storage["creation_time"] = 0
+    # alice unstaked everything during the second week
+    init_storage["user_stakes"][alice] = 0
+    init_storage["user_points"][alice] = [int(500 * sec_week/2), int(500 * sec_week/3), 0, 0, 0]
+    init_storage["farm_points"] = [int(500 * sec_week/2), int(500 * sec_week/3), 0, 0, 0]
+    # Execute entrypoint
+    res = self.farms.claim_for(alice).interpret(storage=init_storage, sender=bob, now=int(sec_week * 2 + sec_week*3/4))
+    # claim_for is permissionless: the reward still goes to alice, who is removed as by her own last claim
+    self.assertEqual(len(res.operations), 1)
+    verify_claim_tx(res.operations[0], init_storage["reward_fa2_token_id_opt"], alice, sum(init_storage["reward_at_week"][:2]))
+    own_claim = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week * 2 + sec_week*3/4))
+    self.assertEqual(res.storage, own_claim.storage)
+    self.assertNotIn(alice, res.storage["user_points"])
+    self.assertNotIn(alice, res.storage["user_claimed_week"])
+    self.assertNotIn(alice, res.storage["user_stakes"])
+
+@matrix_scenario
+def claimall_with_2_stakers(self, init_storage):
+    init_storage["total_reward"] = 20_000_000
+    init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
+    init_storage["creation_time"] = 0
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [0, int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    init_storage["user_stakes"][bob] = 100
+    init_storage["user_points"][bob] = [0, int(100 * sec_week * (1 - 1/2)), 100 * sec_week, 100 * sec_week, 100 * sec_week]
+    init_storage["farm_points"] = [x + y for x, y in zip(init_storage["user_points"][alice],init_storage["user_points"][bob])]
+    alice_week1_reward_expected = init_storage["reward_at_week"][1] * init_storage["user_points"][alice][1]/ init_storage["farm_points"][1]
+    alice_week2_reward_expected = init_storage["reward_at_week"][2] * init_storage["user_points"][alice][2]/ init_storage["farm_points"][2]
+    alice_total_reward_expected = int(alice_week1_reward_expected + alice_week2_reward_expected) -1
+    # Execute entrypoint
+    res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week * 3 + sec_week / 2))
+    self.assertEqual(res.storage["admin"], admin)
+    verify_claim_tx(res.operations[0], init_storage["reward_fa2_token_id_opt"], alice, alice_total_reward_expected)
+    self.assertEqual(res.storage["user_points"][alice], init_storage["user_points"][alice][3:])
+    self.assertEqual(res.storage["user_points"][bob], init_storage["user_points"][bob])
+    self.assertEqual(res.storage["user_claimed_week"][alice], 3)
+    self.assertEqual(res.storage["user_stakes"][alice], 500)
+    self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
+
+@matrix_scenario
+def claimall_with_2_stakers_not_staking_middle_week(self, init_storage):
+    init_storage["total_reward"] = 20_000_000
+    init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
+    init_storage["creation_time"] = 0
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [500 * sec_week, 0, int(500 * sec_week * (1 - 2/3)), 500 * sec_week, 500 * sec_week]
+    init_storage["user_stakes"][bob] = 500
+    init_storage["user_points"][bob] = [500 * sec_week, 0, int(500 * sec_week * (1 - 1/2)), 500 * sec_week, 500 * sec_week]
+    init_storage["farm_points"] = [x + y for x, y in zip(init_storage["user_points"][alice],init_storage["user_points"][bob])]
+    # Execute entrypoint
+    res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week * 3 + sec_week / 2))
+    reward_expected = int(6555697/2) + int((int(500 * sec_week * (1 - 2/3)) / int(500 * sec_week * (1 - 2/3) + 500 * sec_week * (1 - 1/2)) )* 3687580) - 1 + 1
+    self.assertEqual(res.storage["admin"], admin)
+    verify_claim_tx(res.operations[0], init_storage["reward_fa2_token_id_opt"], alice, reward_expected)
+    self.assertEqual(res.storage["user_points"][alice], init_storage["user_points"][alice][3:])
+    self.assertEqual(res.storage["user_claimed_week"][alice], 3)
+    self.assertEqual(res.storage["user_stakes"][alice], 500)
+    self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
+
+@matrix_scenario
+def claimall_after_pool_end(self, init_storage):
+    init_storage["total_reward"] = 20_000_000
+    init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
+    init_storage["creation_time"] = 0
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    init_storage["farm_points"] = [int(500 * sec_week / 2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    reward_expected = init_storage["total_reward"] - 2
+    # Execute entrypoint
+    res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=sec_week * 100)
+    self.assertEqual(res.storage["admin"], admin)
+    verify_claim_tx(res.operations[0], init_storage["reward_fa2_token_id_opt"], alice, reward_expected)
+    # Every week is claimed, the stake is left to unstake
+    self.assertEqual(res.storage["user_points"][alice], [])
+    self.assertEqual(res.storage["user_claimed_week"][alice], 100)
+    self.assertEqual(res.storage["user_stakes"][alice], 500)
+    self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
+
+@matrix_scenario
+def claimall_with_2_stakers_not_staking_last_week(self, init_storage):
+    init_storage["total_reward"] = 20_000_000
+    init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
+    init_storage["creation_time"] = 0
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week, 0]
+    init_storage["user_stakes"][bob] = 500
+    init_storage["user_points"][bob] = [500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week, 0]
+    init_storage["farm_points"] = [x + y for x, y in zip(init_storage["user_points"][alice],init_storage["user_points"][bob])]
+    # Execute entrypoint
+    res = self.farms.claim_all().interpret(storage=init_storage, sender=alice, now=int(sec_week * 6 + sec_week / 2))
+    reward_expected = int(6555697 / 2) + int(4916773 / 2) + int(3687580 / 2)  + int(2765685 / 2)
+    self.assertEqual(res.storage["admin"], admin)
+    verify_claim_tx(res.operations[0], init_storage["reward_fa2_token_id_opt"], alice, reward_expected)
+    self.assertEqual(res.storage["user_points"][alice], [])
+    self.assertEqual(res.storage["user_claimed_week"][alice], 6)
+    self.assertEqual(res.storage["user_stakes"][alice], 500)
+    self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
+
+@matrix_scenario
+def claimall_two_times_after_unstake_and_staking_two_times(self, init_storage):
+    init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
+    init_storage["creation_time"] = 0
+    init_storage["user_stakes"][alice] = 0
+    init_storage["user_points"][alice] = [int(500 * sec_week/2), int(500 * sec_week) +  int(500 * sec_week / 2 ) - int(1000 * sec_week / 3 ), 0, 0, 0]
+    init_storage["farm_points"] = [int(500 * sec_week/2), int(500 * sec_week) +  int(500 * sec_week / 2 ) - int(1000 * sec_week / 3 ), 0, 0, 0]
+    reward_expected = init_storage["reward_at_week"][1]
+    res = self.farms.claim_all().interpret(sender=alice, storage=init_storage, now=int(sec_week + sec_week*3/4))
+    # Execute entrypoint
+    res2 = self.farms.claim_all().interpret(sender=alice, storage=res.storage, now=int(sec_week * 2 + sec_week*3/4))
+    self.assertEqual(res.storage["user_points"][alice], init_storage["user_points"][alice][1:])
+    self.assertEqual(res2.storage["admin"], admin)
+    verify_claim_tx(res2.operations[0], init_storage["reward_fa2_token_id_opt"], alice, reward_expected)
+    # Nothing staked nor left to claim: alice is removed from the farm
+    self.assertNotIn(alice, res2.storage["user_points"])
+    self.assertNotIn(alice, res2.storage["user_claimed_week"])
+    self.assertNotIn(alice, res2.storage["user_stakes"])
+    self.assertEqual(res2.storage["farm_points"], init_storage["farm_points"])
+
+
+##################
+# Tests for Exit #
+##################
+
+def two_stakers_storage(init_storage):
+    """alice staked 500 in the middle of the first week, bob 300 since the farm start."""
+    init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
+    init_storage["creation_time"] = 0
+    init_storage["user_stakes"][alice] = 500
+    init_storage["user_points"][alice] = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+    init_storage["user_stakes"][bob] = 300
+    init_storage["user_points"][bob] = [300 * sec_week, 300 * sec_week, 300 * sec_week, 300 * sec_week, 300 * sec_week]
+    init_storage["farm_points"] = [550 * sec_week, 800 * sec_week, 800 * sec_week, 800 * sec_week, 800 * sec_week]
+    return init_storage
+
+def verify_user_removed(self, storage, user):
+    self.assertNotIn(user, storage["user_points"])
+    self.assertNotIn(user, storage["user_claimed_week"])
+    self.assertNotIn(user, storage["user_stakes"])
+
+@matrix_scenario
+def exit_3rd_week(self, init_storage):
+    init_storage = two_stakers_storage(init_storage)
+    # Execute entrypoint
+    res = self.farms.exit().interpret(sender=alice, storage=init_storage, now=int(sec_week * 2 + sec_week/2))
+    reward_expected = (250 * sec_week * 6555697) // (550 * sec_week) + (500 * sec_week * 4916773) // (800 * sec_week)
+    self.assertEqual(len(res.operations), 2)
+    verify_claim_tx(res.operations[0], init_storage["reward_fa2_token_id_opt"], alice, reward_expected)
+    verify_unstake_tx(res.operations[1], init_storage["input_fa2_token_id_opt"], alice, 500)
+    # The same reward and points as claim_all then unstake of the whole stake
+    claim = self.farms.claim_all().interpret(sender=alice, storage=init_storage, now=int(sec_week * 2 + sec_week/2))
+    self.assertEqual(res.operations[0]["parameters"], claim.operations[0]["parameters"])
+    unstake = self.farms.unstake(500).interpret(sender=alice, storage=claim.storage, now=int(sec_week * 2 + sec_week/2))
+    self.assertEqual(res.storage["user_points"][alice], unstake.storage["user_points"][alice])
+    self.assertEqual(res.storage["farm_points"], unstake.storage["farm_points"])
+    self.assertEqual(res.storage["user_points"][bob], init_storage["user_points"][bob])
+    self.assertEqual(res.storage["user_stakes"][bob], 300)
+    # Only the points of alice from now on are removed, the elapsed half of the current week stays hers
+    self.assertEqual(res.storage["farm_points"], [550 * sec_week, 800 * sec_week, 550 * sec_week, 300 * sec_week, 300 * sec_week])
+    self.assertEqual(res.storage["user_points"][alice], [250 * sec_week, 0, 0])
+    self.assertEqual(res.storage["user_claimed_week"][alice], 2)
+    self.assertNotIn(alice, res.storage["user_stakes"])
+    # and is claimed once the week is over
+    res2 = self.farms.claim_all().interpret(sender=alice, storage=res.storage, now=int(sec_week * 3 + sec_week/2))
+    verify_claim_tx(res2.operations[0], init_storage["reward_fa2_token_id_opt"], alice, (250 * sec_week * 3687580) // (550 * sec_week))
+    verify_user_removed(self, res2.storage, alice)
+
+@matrix_scenario
+def exit_first_week_should_only_unstake(self, init_storage):
+    init_storage = two_stakers_storage(init_storage)
+    # Execute entrypoint
+    res = self.farms.exit().interpret(sender=alice, storage=init_storage, now=int(sec_week*3/4))
+    self.assertEqual(len(res.operations), 1)
+    verify_unstake_tx(res.operations[0], init_storage["input_fa2_token_id_opt"], alice, 500)
+    self.assertEqual(res.storage["user_points"][alice], [int(500 * sec_week/4), 0, 0, 0, 0])
+    self.assertNotIn(alice, res.storage["user_stakes"])
+    self.assertEqual(res.storage["farm_points"], [int(300 * sec_week + 500 * sec_week/4), 300 * sec_week, 300 * sec_week,
+                                                  300 * sec_week, 300 * sec_week])
+
+@matrix_scenario
+def exit_after_claim_should_skip_claimed_weeks(self, init_storage):
+    init_storage = two_stakers_storage(init_storage)
+    init_storage["user_points"][alice] = init_storage["user_points"][alice][1:]
+    init_storage["user_claimed_week"][alice] = 1
+    # Execute entrypoint
+    res = self.farms.exit().interpret(sender=alice, storage=init_storage, now=int(sec_week * 2 + sec_week/2))
+    reward_expected = (500 * sec_week * 4916773) // (800 * sec_week)
+    verify_claim_tx(res.operations[0], init_storage["reward_fa2_token_id_opt"], alice, reward_expected)
+    verify_unstake_tx(res.operations[1], init_storage["input_fa2_token_id_opt"], alice, 500)
+    self.assertEqual(res.storage["user_points"][alice], [250 * sec_week, 0, 0])
+    self.assertEqual(res.storage["user_claimed_week"][alice], 2)
+    self.assertEqual(res.storage["farm_points"], [550 * sec_week, 800 * sec_week, 550 * sec_week, 300 * sec_week, 300 * sec_week])
+
+@matrix_scenario
+def exit_after_pool_end(self, init_storage):
+    init_storage = two_stakers_storage(init_storage)
+    # Execute entrypoint
+    res = self.farms.exit().interpret(sender=alice, storage=init_storage, now=sec_week * 10)
+    reward_expected = (250 * sec_week * 6555697) // (550 * sec_week) + sum((500 * reward) // 800 for reward in init_storage["reward_at_week"][1:])
+    verify_claim_tx(res.operations[0], init_storage["reward_fa2_token_id_opt"], alice, reward_expected)
+    verify_unstake_tx(res.operations[1], init_storage["input_fa2_token_id_opt"], alice, 500)
+    verify_user_removed(self, res.storage, alice)
+    self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
+
+@matrix_scenario
+def exit_after_unstaking_everything_should_only_claim(self, init_storage):
+    second_week_points = int(500 * sec_week) +  int(500 * sec_week / 2 ) - int(1000 * sec_week / 3 )
+    init_storage["reward_at_week"] = [6555697, 4916773, 3687580, 2765685, 2074263]
+    init_storage["creation_time"] = 0
+    init_storage["user_stakes"][alice] = 0
+    init_storage["user_points"][alice] = [int(500 * sec_week/2), second_week_points, 0, 0, 0]
+    init_storage["farm_points"] = [int(500 * sec_week/2), second_week_points, 0, 0, 0]
+    # Execute entrypoint
+    res = self.farms.exit().interpret(sender=alice, storage=init_storage, now=int(sec_week + sec_week*3/4))
+    self.assertEqual(len(res.operations), 1)
+    verify_claim_tx(res.operations[0], init_storage["reward_fa2_token_id_opt"], alice, init_storage["reward_at_week"][0])
+    # The points of the current week, earned before unstaking, are still claimable
+    self.assertEqual(res.storage["user_points"][alice], [second_week_points, 0, 0, 0])
+    self.assertEqual(res.storage["user_claimed_week"][alice], 1)
+    self.assertNotIn(alice, res.storage["user_stakes"])
+    self.assertEqual(res.storage["farm_points"], init_storage["farm_points"])
+
+######################
+# Tests for Compound #
+######################
+
+@matrix_scenario
+def compound_3rd_week_should_stake_the_reward(self, init_storage):
+    init_storage = two_stakers_storage(init_storage)
+    # Only a farm rewarding its input token can compound
+    init_storage["reward_token_address"] = init_storage["input_token_address"]
+    init_storage["reward_fa2_token_id_opt"] = init_storage["input_fa2_token_id_opt"]
+    init_storage["total_reward"] = 20_000_000
+    # Execute entrypoint
+    res = self.farms.compound().interpret(storage=init_storage, sender=alice, now=int(sec_week * 2 + sec_week/2))
+    reward_expected = (250 * sec_week * 6555697) // (550 * sec_week) + (500 * sec_week * 4916773) // (800 * sec_week)
+    self.assertEqual(len(res.operations), 1)
+    self.assertEqual(res.operations[0]["destination"], init_storage["input_token_address"])
+    # The reward goes from the reserve to the farm and is staked for alice from the middle of the 3rd week
+    verify_claim_tx(res.operations[0], init_storage["reward_fa2_token_id_opt"], farm_address, reward_expected)
+    self.assertEqual(res.storage["user_stakes"][alice], 500 + reward_expected)
+    self.assertEqual(res.storage["user_stakes"][bob], 300)
+    self.assertEqual(res.storage["user_points"][alice], [500 * sec_week + int(reward_expected * sec_week/2),
+                                                        (500 + reward_expected) * sec_week, (500 + reward_expected) * sec_week])
+    self.assertEqual(res.storage["user_claimed_week"][alice], 2)
+    self.assertEqual(res.storage["farm_points"], [550 * sec_week, 800 * sec_week, 800 * sec_week + int(reward_expected * sec_week/2),
+                                                  (800 + reward_expected) * sec_week, (800 + reward_expected) * sec_week])
+
+expand_matrix(FarmMatrixTest, farm_storage)
@@ -0,0 +1,276 @@
+from unittest import TestCase
+import timeit
+
+import numpy as np
+
+from contract_cache import load_contract
+from farm_model import FarmModel, FarmModelError, compute_new_rewards, no_week_left, pending_rewards, unstake_more_than_stake
+from gas_benchmark import farm_contract_path, farm_fixture, farm_storage
+from test_farm import admin, alice, bob, fox, oscar, sec_week
+
+
+def claimed_amount(res):
+    if len(res.operations) == 0:
+        return 0
+    return int(res.operations[0]["parameters"]["value"]["args"][2]["int"])
+
+
+class FarmModelTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.farms = load_contract(farm_contract_path)
+        cls.maxDiff = None
+
+    def assertSameStorage(self, model, storage):
+        expected = model.to_storage()
+        for field in ["creation_time", "initialized", "total_reward", "reward_at_week", "farm_points", "user_points", "user_stakes",
+                      "user_claimed_week", "week_duration"]:
+            self.assertEqual(expected[field], storage[field], field)
+
+    #####################
+    # Tests for rewards #
+    #####################
+
+    def test_compute_new_rewards_should_match_initialize(self):
+        self.assertEqual(compute_new_rewards(20_000_000, 5, 7500), [6555697, 4916773, 3687580, 2765685, 2074263])
+        self.assertEqual(compute_new_rewards(30_000_000, 5, 8000), [8924321, 7139457, 5711565, 4569252, 3655402])
+        self.assertEqual(compute_new_rewards(40_000_000, 3, 6000), [20408163, 12244897, 7346938])
+
+    def test_compute_new_rewards_should_match_closed_formula(self):
+        def reward_per_week(total_reward, week_number, rate, week_indice):
+            numerator = abs(10_000 - rate) * 10_000 ** abs(week_number - 1) * total_reward * rate ** (week_indice - 1)
+            denominator = 10_000 ** (week_indice - 1) * abs(10_000 ** week_number - rate ** week_number)
+            return numerator // denominator
+
+        for rate in [0, 1, 2500, 5000, 7500, 8000, 9000, 9999, 10_001, 15_000]:
+            for week_number in [0, 1, 2, 3, 5, 12, 52, 104]:
+                for total_reward in [1, 20_000_000, 10 ** 24]:
+                    expected = [reward_per_week(total_reward, week_number, rate, week) for week in range(1, week_number + 1)]
+                    self.assertEqual(compute_new_rewards(total_reward, week_number, rate), expected, (rate, week_number, total_reward))
+        with self.assertRaises(FarmModelError):
+            compute_new_rewards(20_000_000, 5, 10_000)
+
+    def test_compute_new_rewards_should_match_contract_initialize(self):
+        for rate in [0, 5000, 7500, 9999]:
+            for total_weeks in [1, 2, 5, 8]:
+                # Init
+                init_storage = farm_fixture.overlay()
+                init_storage.update(reward_at_week=[], initialized=False, rate=rate, total_weeks=total_weeks)
+                # Execute entrypoint
+                res = self.farms.initialize().interpret(storage=init_storage, sender=admin, now=100)
+                self.assertEqual(res.storage["reward_at_week"], compute_new_rewards(20_000_000, total_weeks, rate), (rate, total_weeks))
+
+    def test_initialize_should_match_contract(self):
+        # Init
+        init_storage = farm_fixture.overlay()
+        init_storage["reward_at_week"] = []
+        init_storage["initialized"] = False
+        model = FarmModel.from_storage(init_storage)
+        # Execute entrypoint
+        res = self.farms.initialize().interpret(storage=init_storage, sender=admin, now=100)
+        model.initialize(admin, 100)
+        self.assertSameStorage(model, res.storage)
+
+    def test_increase_reward_should_match_contract(self):
+        # Init
+        init_storage = farm_fixture.overlay()
+        model = FarmModel.from_storage(init_storage)
+        # Execute entrypoint
+        res = self.farms.increase_reward(50_000_000).interpret(storage=init_storage, sender=admin, now=int(sec_week * 2 + sec_week/2))
+        model.increase_reward(admin, 50_000_000, int(sec_week * 2 + sec_week/2))
+        self.assertEqual(model.to_storage()["reward_at_week"], [6555697, 4916773, 25309201, 18981901, 14236425])
+        self.assertSameStorage(model, res.storage)
+
+    ##########################
+    # Tests for stake flows #
+    ##########################
+
+    def assertScenarioMatchesContract(self, storage, week_duration):
+        model = FarmModel.from_storage(storage)
+        steps = [
+            ("stake", alice, 500, int(week_duration / 2)),
+            ("stake", bob, 100, int(week_duration + week_duration / 3)),
+            ("stake", alice, 250, int(week_duration + week_duration * 2 / 3)),
+            ("claim_all", alice, None, int(2 * week_duration + 10)),
+            ("unstake", bob, 40, int(2 * week_duration + week_duration / 4)),
+            ("stake", oscar, 900, int(3 * week_duration + week_duration / 5)),
+            ("claim_all", bob, None, int(3 * week_duration + week_duration / 2)),
+            ("unstake", alice, 750, int(4 * week_duration + 1)),
+            ("claim_all", alice, None, int(6 * week_duration)),
+            ("claim_all", oscar, None, int(6 * week_duration)),
+            ("claim_all", bob, None, int(7 * week_duration)),
+        ]
+        for entrypoint, sender, amount, now in steps:
+            if entrypoint == "claim_all":
+                res = self.farms.claim_all().interpret(storage=storage, sender=sender, now=now)
+                self.assertEqual(claimed_amount(res), int(model.claim_all(sender, now)[0]))
+            else:
+                res = getattr(self.farms, entrypoint)(amount).interpret(storage=storage, sender=sender, now=now)
+                getattr(model, entrypoint)(sender, amount, now)
+            self.assertSameStorage(model, res.storage)
+            storage = res.storage
+
+    def test_scenario_should_match_contract(self):
+        # Init
+        storage = farm_fixture.overlay()
+        # Execute entrypoints
+        self.assertScenarioMatchesContract(storage, sec_week)
+
+    def test_scenario_with_4_week_periods_should_match_contract(self):
+        # Init
+        storage = farm_fixture.overlay()
+        storage["week_duration"] = 4 * sec_week
+        # Execute entrypoints
+        self.assertScenarioMatchesContract(storage, 4 * sec_week)
+
+    def test_batched_stakes_should_match_sequential_calls(self):
+        # Init
+        storage = farm_fixture.overlay()
+        storage["user_stakes"][bob] = 300
+        storage["user_points"][bob] = [0, 0, int(300 * sec_week / 2), 300 * sec_week, 300 * sec_week]
+        storage["farm_points"] = [0, 0, int(300 * sec_week / 2), 300 * sec_week, 300 * sec_week]
+        model = FarmModel.from_storage(storage)
+        senders = [alice, bob, oscar, fox, alice]
+        amounts = [400, 20, 7, 1000, 3]
+        now = int(2 * sec_week + sec_week * 2 / 3)
+        # Execute entrypoints
+        for sender, amount in zip(senders, amounts):
+            storage = self.farms.stake(amount).interpret(storage=storage, sender=sender, now=now).storage
+        model.stake(senders, amounts, now)
+        self.assertSameStorage(model, storage)
+
+    def test_batched_stakes_on_empty_farm_points_should_match_sequential_calls(self):
+        # Init
+        storage = farm_fixture.overlay()
+        storage["user_stakes"][bob] = 300
+        storage["user_points"][bob] = [0, 0, 42, 300 * sec_week, 300 * sec_week]
+        model = FarmModel.from_storage(storage)
+        senders = [bob, alice, bob]
+        amounts = [10, 20, 30]
+        now = int(sec_week + sec_week / 2)
+        # Execute entrypoints
+        for sender, amount in zip(senders, amounts):
+            storage = self.farms.stake(amount).interpret(storage=storage, sender=sender, now=now).storage
+        model.stake(senders, amounts, now)
+        self.assertSameStorage(model, storage)
+
+    def test_claim_all_should_not_pay_claimed_weeks_twice(self):
+        # Init
+        model = FarmModel.from_storage(farm_storage)
+        unclaimed = FarmModel.from_storage(farm_storage)
+        for m in (model, unclaimed):
+            m.stake([alice, bob], [500, 1500], int(sec_week / 2))
+        # Execute entrypoints
+        first = model.claim_all([alice, bob], int(2 * sec_week + 1))
+        again = model.claim_all([alice, bob], int(2 * sec_week + sec_week / 2))
+        later = model.claim_all([alice, bob], int(3 * sec_week + 1))
+        self.assertEqual(list(again), [0, 0])
+        self.assertEqual(list(first + later), list(unclaimed.claimable([alice, bob], int(3 * sec_week + 1))))
+        self.assertEqual(model.user_claimed_week(alice), 3)
+        # The claimed weeks are dropped from user_points
+        self.assertEqual(model.user_points(alice), [500 * sec_week] * 2)
+        self.assertEqual(FarmModel.from_storage(model.to_storage(farm_storage)).to_storage(farm_storage), model.to_storage(farm_storage))
+
+    def test_claim_all_should_remove_settled_stakers(self):
+        # Init
+        model = FarmModel.from_storage(farm_storage)
+        model.stake([alice, bob], [500, 1500], int(sec_week / 2))
+        model.unstake([alice, bob], [500, 1000], int(sec_week + sec_week / 2))
+        # Execute entrypoints
+        model.claim_all([alice, bob], int(sec_week + sec_week * 3 / 4))
+        # alice still has points in week 2
+        self.assertEqual(model.user_points(alice), [int(500 * sec_week / 2), 0, 0, 0])
+        model.claim_all([alice, bob], int(2 * sec_week + 1))
+        storage = model.to_storage(farm_storage)
+        self.assertEqual(storage["user_points"], {bob: [500 * sec_week] * 3})
+        self.assertEqual(storage["user_stakes"], {bob: 500})
+        self.assertEqual(storage["user_claimed_week"], {bob: 2})
+        self.assertEqual(list(model.settled_points + model.points.sum(axis=0)), list(model.farm_points))
+        # A settled staker starts again from an empty entry
+        model.stake(alice, 100, int(3 * sec_week + 1))
+        self.assertIsNone(model.user_claimed_week(alice))
+        self.assertEqual(model.user_points(alice), [0, 0, 0, (sec_week - 1) * 100, 100 * sec_week])
+
+    def test_int64_model_should_match_object_model(self):
+        # Init
+        stakers = [f"user{i}" for i in range(2000)]
+        amounts = np.arange(1, len(stakers) + 1)
+        exact = FarmModel.from_storage(farm_storage)
+        fast = FarmModel.from_storage(farm_storage, dtype=np.int64)
+        # Execute entrypoints
+        for model in (exact, fast):
+            model.stake(stakers, amounts, int(sec_week / 3))
+            model.unstake(stakers[::3], amounts[::3], int(sec_week + sec_week / 2))
+        self.assertEqual(exact.to_storage(), fast.to_storage())
+        self.assertEqual(list(exact.claim_all(stakers, 3 * sec_week)), list(fast.claim_all(stakers, 3 * sec_week)))
+
+    def test_int64_model_overflow_should_fail(self):
+        model = FarmModel.from_storage(farm_storage, dtype=np.int64)
+        with self.assertRaises(OverflowError):
+            model.stake(alice, 10 ** 15, int(sec_week / 3))
+
+    def test_pending_rewards_should_match_claimable(self):
+        # Init
+        stakers = [f"user{i}" for i in range(500)]
+        model = FarmModel.from_storage(farm_storage)
+        model.stake(stakers, np.arange(1, len(stakers) + 1), int(sec_week / 3))
+        model.stake(stakers[::2], 1000, int(sec_week + sec_week / 2))
+        model.claim_all(stakers[::5], int(2 * sec_week + 1))
+        storage = model.to_storage()
+        for now in [0, 2 * sec_week, 4 * sec_week + 1, 10 * sec_week]:
+            # Execute
+            pending = pending_rewards(storage["reward_at_week"], storage["farm_points"], storage["creation_time"],
+                                      storage["user_points"], now, storage["user_claimed_week"], storage["week_duration"])
+            self.assertEqual(list(pending), stakers)
+            self.assertEqual(list(pending.values()), [int(x) for x in model.claimable(stakers, now)])
+
+    def test_pending_rewards_should_be_exact_for_large_nats(self):
+        rng = np.random.default_rng(0)
+        for stake_scale, reward in [(10 ** 3, 20_000_000), (10 ** 9, 10 ** 18), (10 ** 15, 10 ** 24), (10 ** 30, 10 ** 40)]:
+            # Init
+            stakes = [int(x) * stake_scale // 1000 + 1 for x in rng.integers(1, 1000, size=(300, 3)).ravel()]
+            user_points = {f"user{i}": [s * sec_week for s in stakes[3 * i:3 * i + 3]] for i in range(300)}
+            # Divisions without remainder put the float estimates right on an integer
+            user_points["whole"] = [sum(stakes[0::3]) * sec_week, 0, 0]
+            farm_points = [sum(points[week] for points in user_points.values()) for week in range(3)]
+            reward_at_week = [reward, reward // 3, farm_points[2] * 7]
+            # Execute
+            pending = pending_rewards(reward_at_week, farm_points, 0, user_points, 4 * sec_week)
+            expected = {user: sum(p * r // f for p, r, f in zip(points, reward_at_week, farm_points))
+                        for user, points in user_points.items()}
+            self.assertEqual(pending, expected, stake_scale)
+
+    def test_pending_rewards_should_cost_a_few_reads_of_the_points(self):
+        # Init
+        total_weeks = 52
+        rng = np.random.default_rng(0)
+        points = rng.integers(1, 10 ** 6, size=(100_000, total_weeks)) * sec_week
+        user_points = {f"user{i}": row for i, row in enumerate(points.tolist())}
+        farm_points = [int(x) for x in points.sum(axis=0)]
+        reward_at_week = compute_new_rewards(10 ** 18, total_weeks, 7500)
+        now = (total_weeks + 1) * sec_week
+        # Execute
+        pending_time = min(timeit.repeat(lambda: pending_rewards(reward_at_week, farm_points, 0, user_points, now), number=1, repeat=3))
+        # One conversion of the storage lists to an array, whatever the speed of the machine
+        read_time = min(timeit.repeat(lambda: np.array(list(user_points.values()), dtype=np.int64), number=1, repeat=3))
+        self.assertLess(pending_time, 4 * read_time)
+        pending = pending_rewards(reward_at_week, farm_points, 0, user_points, now)
+        self.assertLessEqual(sum(pending.values()), sum(reward_at_week))
+
+    ###########################
+    # Tests for failing calls #
+    ###########################
+
+    def test_stake_after_end_of_pool_should_fail(self):
+        model = FarmModel.from_storage(farm_storage)
+        with self.assertRaises(FarmModelError) as r:
+            model.stake([alice, bob], [10, 20], int(5 * sec_week + sec_week/2))
+        self.assertEqual(str(r.exception), no_week_left)
+
+    def test_unstake_more_than_staked_in_one_batch_should_fail(self):
+        model = FarmModel.from_storage(farm_storage)
+        model.stake(alice, 100, int(sec_week / 2))
+        with self.assertRaises(FarmModelError) as r:
+            model.unstake([alice, alice], [60, 60], int(sec_week + sec_week/2))
+        self.assertEqual(str(r.exception), unstake_more_than_stake)
+        self.assertEqual(model.user_stake(alice), 100)
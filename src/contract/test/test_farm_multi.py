@@ -0,0 +1,383 @@
+from unittest import TestCase
+from contextlib import contextmanager
+
+from pytezos import MichelsonRuntimeError
+
+from contract_cache import load_contract, load_dummy_storage
+from storage_fixture import StorageFixture
+from test_farm import (admin, alice, bob, fox, sec_week, farm_address, only_admin, amount_is_null, increase_amount_is_null,
+                       amount_must_be_zero_tez, no_stakes, unstake_more_than_stake, no_week_left, week_duration_is_null,
+                       verify_fa12_stake_tx, verify_fa2_stake_tx, verify_fa12_unstake_tx, verify_fa12_claim_tx,
+                       verify_fa2_claim_tx)
+
+compiled_contract_path = "compiled/farm_multi.tz"
+
+unknown_pool = "This pool does not exist"
+no_claim_first_week = "You cannot claim any reward before the first farm week as passed"
+
+reward_at_week = [6555697, 4916773, 3687580, 2765685, 2074263]
+config = {
+    "input_token_address": "KT1XtQeSap9wvJGY1Lmek84NU6PK6cjzC9Qd",
+    "input_fa2_token_id_opt": None,
+    "reward_token_address": "KT1TwzD6zV3WeJ39ukuqxcfK2fJCnhvrdN1X",
+    "reward_fa2_token_id_opt": None,
+    "reward_reserve_address": admin,
+    "rate": 7500,
+    "total_reward": 20_000_000,
+    "total_weeks": 5,
+    "week_duration": sec_week,
+}
+# Pool 1 pays in an FA2 token for an FA2 LP token
+fa2_config = dict(config, input_fa2_token_id_opt=3, reward_fa2_token_id_opt=5)
+staked_points = [int(500 * sec_week/2), 500 * sec_week, 500 * sec_week, 500 * sec_week, 500 * sec_week]
+
+
+def pool(pool_config: dict, farm_points=(), creation_time: int = 0) -> dict:
+    return {"config": pool_config, "creation_time": creation_time, "reward_at_week": list(reward_at_week),
+            "farm_points": list(farm_points)}
+
+
+def transfer_tx_params(operation, token_id_opt):
+    if token_id_opt is None:
+        return operation["parameters"]["value"]['args']
+    return operation["parameters"]["value"][0]['args']
+
+
+class FarmMultiPoolTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.farms = load_contract(compiled_contract_path)
+        storage = load_dummy_storage(compiled_contract_path)
+        storage["admin"] = admin
+        storage["next_pool_id"] = 2
+        storage["pools"] = {0: pool(config), 1: pool(fa2_config)}
+        storage["user_stakes"] = {}
+        storage["user_points"] = {}
+        storage["user_claimed_week"] = {}
+        cls.farm_storage = StorageFixture(storage)
+        cls.maxDiff = None
+
+    @contextmanager
+    def raisesMichelsonError(self, error_message):
+        with self.assertRaises(MichelsonRuntimeError) as r:
+            yield r
+
+        error_msg = r.exception.format_stdout()
+        if "FAILWITH" in error_msg:
+            self.assertEqual(f"FAILWITH: '{error_message}'", r.exception.format_stdout())
+        else:
+            self.assertEqual(f"'{error_message}': ", r.exception.format_stdout())
+
+    def staked_storage(self, pool_id: int = 0):
+        """alice staked 500 in the middle of the first week of `pool_id`."""
+        init_storage = self.farm_storage.overlay()
+        init_storage["pools"][pool_id]["farm_points"] = list(staked_points)
+        init_storage["user_stakes"][pool_id, alice] = 500
+        init_storage["user_points"][pool_id, alice] = list(staked_points)
+        return init_storage
+
+    #######################
+    # Tests for set_admin #
+    #######################
+
+    def test_set_admin_should_work(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        res = self.farms.set_admin(bob).interpret(storage=init_storage, sender=admin, now=int(sec_week + sec_week/2))
+        self.assertEqual(bob, res.storage["admin"])
+        self.assertEqual([], res.operations)
+
+    def test_set_admin_user_sets_new_admin_should_fail(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        with self.raisesMichelsonError(only_admin):
+            self.farms.set_admin(bob).interpret(storage=init_storage, sender=alice, now=int(sec_week + sec_week/2))
+
+    def test_set_admin_sending_XTZ_should_fail(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        with self.raisesMichelsonError(amount_must_be_zero_tez):
+            self.farms.set_admin(bob).interpret(storage=init_storage, sender=admin, now=int(sec_week + sec_week/2), amount=1)
+
+    #####################
+    # Test for add_pool #
+    #####################
+
+    def test_add_pool_5week_20Kreward_75rate_should_initialize_the_pool(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        res = self.farms.add_pool(config).interpret(storage=init_storage, sender=admin, now=1000)
+        self.assertEqual(res.storage["next_pool_id"], 3)
+        self.assertEqual(res.storage["pools"][2]["reward_at_week"], [6555697, 4916773, 3687580, 2765685, 2074263])
+        self.assertEqual(res.storage["pools"][2]["creation_time"], 1000)
+        self.assertEqual(res.storage["pools"][2]["farm_points"], [])
+        self.assertEqual(res.storage["pools"][2]["config"], config)
+
+    def test_add_pool_5week_30Kreward_80rate_should_initialize_the_pool(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        res = self.farms.add_pool(dict(config, total_reward=30_000_000, rate=8000)).interpret(storage=init_storage, sender=admin)
+        self.assertEqual(res.storage["pools"][2]["reward_at_week"], [8924321, 7139457, 5711565, 4569252, 3655402])
+
+    def test_add_pool_3week_40Kreward_60rate_should_initialize_the_pool(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        res = self.farms.add_pool(dict(config, total_reward=40_000_000, total_weeks=3, rate=6000)).interpret(storage=init_storage, sender=admin)
+        self.assertEqual(res.storage["pools"][2]["reward_at_week"], [20408163, 12244897, 7346938])
+
+    def test_add_pool_if_not_admin_should_fail(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        with self.raisesMichelsonError(only_admin):
+            self.farms.add_pool(config).interpret(storage=init_storage, sender=fox)
+
+    def test_add_pool_with_null_week_duration_should_fail(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        with self.raisesMichelsonError(week_duration_is_null):
+            self.farms.add_pool(dict(config, week_duration=0)).interpret(storage=init_storage, sender=admin)
+
+    #########################
+    # Test increase rewards #
+    #########################
+
+    def test_increase_reward_reward_50k_on_week_3_should_only_change_the_pool(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        res = self.farms.increase_reward(pool_id=1, amount=50_000_000).interpret(storage=init_storage, sender=admin,
+                                                                                 now=int(sec_week * 2 + sec_week/2))
+        self.assertEqual(res.storage["pools"][1]["reward_at_week"], [6555697, 4916773, 25309201, 18981901, 14236425])
+        self.assertEqual(res.storage["pools"][1]["config"]["total_reward"], 70_000_000)
+        self.assertEqual(res.storage["pools"][0], init_storage["pools"][0])
+
+    def test_increase_reward_reward_20k_on_week_2_should_work(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        init_storage["pools"][0] = pool(dict(config, total_reward=10_000_000, total_weeks=3))
+        init_storage["pools"][0]["reward_at_week"] = [4324324, 3243243, 2432432]
+        # Execute entrypoint
+        res = self.farms.increase_reward(pool_id=0, amount=20_000_000).interpret(storage=init_storage, sender=admin,
+                                                                                 now=int(sec_week + sec_week/2))
+        self.assertEqual(res.storage["pools"][0]["reward_at_week"], [4324324, 14671814, 11003860])
+        self.assertEqual(res.storage["pools"][0]["config"]["total_reward"], 30_000_000)
+
+    def test_increase_reward_if_not_admin_should_fail(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        with self.raisesMichelsonError(only_admin):
+            self.farms.increase_reward(pool_id=0, amount=20_000_000).interpret(storage=init_storage, sender=fox,
+                                                                               now=int(sec_week + sec_week/2))
+
+    def test_increase_reward_after_end_of_pool_should_fail(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        with self.raisesMichelsonError(no_week_left):
+            self.farms.increase_reward(pool_id=0, amount=20_000_000).interpret(storage=init_storage, sender=admin,
+                                                                               now=int(sec_week * 20 + sec_week/2))
+
+    def test_increase_reward_of_null_amount_should_fail(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        with self.raisesMichelsonError(increase_amount_is_null):
+            self.farms.increase_reward(pool_id=0, amount=0).interpret(storage=init_storage, sender=admin, now=int(sec_week/2))
+
+    def test_increase_reward_of_unknown_pool_should_fail(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        with self.raisesMichelsonError(unknown_pool):
+            self.farms.increase_reward(pool_id=2, amount=20_000_000).interpret(storage=init_storage, sender=admin,
+                                                                               now=int(sec_week + sec_week/2))
+
+    ######################
+    # Tests for Staking #
+    ######################
+
+    def test_stake_with_XTZ_should_fail(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        with self.raisesMichelsonError(amount_must_be_zero_tez):
+            self.farms.stake(pool_id=0, amount=20).interpret(storage=init_storage, sender=bob, now=int(sec_week + sec_week/2), amount=1)
+
+    def test_stake_0_LP_should_fail(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        with self.raisesMichelsonError(amount_is_null):
+            self.farms.stake(pool_id=0, amount=0).interpret(storage=init_storage, sender=alice, now=int(sec_week + sec_week/2))
+
+    def test_stake_after_end_of_pool_should_fail(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        with self.raisesMichelsonError(no_week_left):
+            self.farms.stake(pool_id=0, amount=10).interpret(storage=init_storage, sender=alice, now=int(5 * sec_week + sec_week/2))
+
+    def test_stake_in_unknown_pool_should_fail(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        with self.raisesMichelsonError(unknown_pool):
+            self.farms.stake(pool_id=2, amount=10).interpret(storage=init_storage, sender=alice, now=int(sec_week + sec_week/2))
+
+    def test_stake_one_time_on_second_week_should_only_change_the_pool(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        # Execute entrypoint
+        res = self.farms.stake(pool_id=0, amount=20).interpret(storage=init_storage, sender=bob, now=int(sec_week + sec_week/2))
+        self.assertEqual(len(res.operations), 1)
+        verify_fa12_stake_tx(transfer_tx_params(res.operations[0], None), bob, farm_address, 20)
+        expected_user_points = [0, sec_week * 20 / 2, sec_week * 20, sec_week * 20, sec_week * 20]
+        self.assertEqual(res.storage["user_stakes"], {(0, bob): 20})
+        self.assertEqual(res.storage["user_points"], {(0, bob): expected_user_points})
+        self.assertEqual(res.storage["pools"][0]["farm_points"], expected_user_points)
+        self.assertEqual(res.storage["pools"][1], init_storage["pools"][1])
+
+    def test_stake_in_two_pools_should_keep_separate_points(self):
+        # Init
+        init_storage = self.staked_storage(0)
+        # Execute entrypoint
+        res = self.farms.stake(pool_id=1, amount=300).interpret(storage=init_storage, sender=alice, now=int(2 * sec_week + sec_week/2))
+        verify_fa2_stake_tx(transfer_tx_params(res.operations[0], 3), alice, farm_address, 3, 300)
+        self.assertEqual(res.storage["user_stakes"], {(0, alice): 500, (1, alice): 300})
+        self.assertEqual(res.storage["user_points"][0, alice], staked_points)
+        self.assertEqual(res.storage["user_points"][1, alice], [0, 0, int(300 * sec_week / 2), 300 * sec_week, 300 * sec_week])
+        self.assertEqual(res.storage["pools"][0]["farm_points"], staked_points)
+
+    def test_stake_with_4_week_periods_should_count_points_by_period(self):
+        # Init
+        init_storage = self.farm_storage.overlay()
+        init_storage["pools"][0] = pool(dict(config, total_weeks=3, week_duration=4 * sec_week))
+        init_storage["pools"][0]["reward_at_week"] = [20408163, 12244897, 7346938]
+        # Execute entrypoint: 2 weeks before the end of the second period
+        res = self.farms.stake(pool_id=0, amount=10).interpret(storage=init_storage, sender=alice, now=6 * sec_week)
+        expected_user_points = [0, 10 * 2 * sec_week, 10 * 4 * sec_week]
+        self.assertEqual(res.storage["user_points"][0, alice], expected_user_points)
+        self.assertEqual(res.storage["pools"][0]["farm_points"], expected_user_points)
+        # The pool ends after 3 periods, not 3 weeks
+        with self.raisesMichelsonError(no_week_left):
+            self.farms.stake(pool_id=0, amount=10).interpret(storage=init_storage, sender=alice, now=12 * sec_week)
+
+    #####################
+    # Tests for Unstake #
+    #####################
+
+    def test_unstake_more_than_staked_should_fail(self):
+        # Init
+        init_storage = self.staked_storage()
+        # Execute entrypoint
+        with self.raisesMichelsonError(unstake_more_than_stake):
+            self.farms.unstake(pool_id=0, amount=501).interpret(sender=alice, storage=init_storage, now=int(sec_week + sec_week / 2))
+
+    def test_unstake_with_0_staked_should_fail(self):
+        # Init
+        init_storage = self.staked_storage()
+        # Execute entrypoint: bob did not stake, alice did not stake in pool 1
+        with self.raisesMichelsonError(no_stakes):
+            self.farms.unstake(pool_id=0, amount=10).interpret(storage=init_storage, sender=bob)
+        with self.raisesMichelsonError(no_stakes):
+            self.farms.unstake(pool_id=1, amount=10).interpret(storage=init_storage, sender=alice)
+
+    def test_unstake_from_unknown_pool_should_fail(self):
+        # Init
+        init_storage = self.staked_storage()
+        # Execute entrypoint
+        with self.raisesMichelsonError(unknown_pool):
+            self.farms.unstake(pool_id=2, amount=500).interpret(sender=alice, storage=init_storage, now=int(sec_week + sec_week / 2))
+
+    def test_unstake_basic(self):
+        # Init
+        init_storage = self.staked_storage()
+        # Execute entrypoint
+        res = self.farms.unstake(pool_id=0, amount=250).interpret(sender=alice, storage=init_storage, now=int(sec_week + sec_week/2))
+        self.assertEqual(len(res.operations), 1)
+        verify_fa12_unstake_tx(transfer_tx_params(res.operations[0], None), alice, farm_address, 250)
+        expected_user_points = [int(500 * sec_week/2), int((500+250) * sec_week/2), 250 * sec_week, 250 * sec_week, 250 * sec_week]
+        self.assertEqual(res.storage["user_stakes"][0, alice], 250)
+        self.assertEqual(res.storage["user_points"][0, alice], expected_user_points)
+        self.assertEqual(res.storage["pools"][0]["farm_points"], expected_user_points)
+
+    def test_unstake_after_pool_end_should_keep_points(self):
+        # Init
+        init_storage = self.staked_storage()
+        # Execute entrypoint
+        res = self.farms.unstake(pool_id=0, amount=500).interpret(sender=alice, storage=init_storage, now=sec_week * 10)
+        self.assertEqual(res.storage["user_stakes"][0, alice], 0)
+        self.assertEqual(res.storage["user_points"][0, alice], staked_points)
+        self.assertEqual(res.storage["pools"][0]["farm_points"], staked_points)
+
+    ######################
+    # Tests for ClaimAll #
+    ######################
+
+    def test_claimall_with_0_points_should_work_with_0_operation(self):
+        # Init
+        init_storage = self.staked_storage()
+        # Execute entrypoint
+        res = self.farms.claim_all(0).interpret(storage=init_storage, sender=bob, now=int(sec_week * 7 + sec_week/2))
+        self.assertEqual(res.operations, [])
+        self.assertEqual(res.storage["user_points"], init_storage["user_points"])
+
+    def test_claimall_with_XTZ_should_fail(self):
+        # Init
+        init_storage = self.staked_storage()
+        # Execute entrypoint
+        with self.raisesMichelsonError(amount_must_be_zero_tez):
+            self.farms.claim_all(0).interpret(storage=init_storage, sender=alice, now=sec_week * 12, amount=1)
+
+    def test_claimall_on_first_week_should_fail(self):
+        # Init
+        init_storage = self.staked_storage()
+        # Execute entrypoint
+        with self.raisesMichelsonError(no_claim_first_week):
+            self.farms.claim_all(0).interpret(storage=init_storage, sender=alice, now=int(sec_week * 3/4))
+
+    def test_claimall_3rd_week_should_drop_claimed_weeks(self):
+        # Init
+        init_storage = self.staked_storage()
+        # Execute entrypoint
+        res = self.farms.claim_all(0).interpret(storage=init_storage, sender=alice, now=int(sec_week * 2 + sec_week/2))
+        verify_fa12_claim_tx(transfer_tx_params(res.operations[0], None), alice, admin, sum(reward_at_week[:2]))
+        self.assertEqual(res.storage["user_points"][0, alice], staked_points[2:])
+        self.assertEqual(res.storage["user_claimed_week"], {(0, alice): 2})
+        self.assertEqual(res.storage["pools"][0]["farm_points"], staked_points)
+
+    def test_claimall_should_pay_with_the_pool_reward_token(self):
+        # Init
+        init_storage = self.staked_storage(1)
+        # Execute entrypoint
+        res = self.farms.claim_all(1).interpret(storage=init_storage, sender=alice, now=int(sec_week + sec_week/2))
+        verify_fa2_claim_tx(transfer_tx_params(res.operations[0], 5), alice, admin, 5, reward_at_week[0])
+        self.assertEqual(res.operations[0]["destination"], fa2_config["reward_token_address"])
+
+    def test_claimall_after_unstaking_everything_should_remove_the_user(self):
+        # Init
+        init_storage = self.staked_storage()
+        init_storage["user_stakes"][0, alice] = 0
+        # Execute entrypoint
+        res = self.farms.claim_all(0).interpret(storage=init_storage, sender=alice, now=sec_week * 10)
+        verify_fa12_claim_tx(transfer_tx_params(res.operations[0], None), alice, admin, sum(reward_at_week))
+        self.assertEqual(res.storage["user_stakes"], {})
+        self.assertEqual(res.storage["user_points"], {})
+        self.assertEqual(res.storage["user_claimed_week"], {})
+
+    def test_claim_for_should_send_reward_to_user(self):
+        # Init
+        init_storage = self.staked_storage()
+        # Execute entrypoint
+        res = self.farms.claim_for(pool_id=0, user=alice).interpret(storage=init_storage, sender=bob, now=int(sec_week * 2 + sec_week/2))
+        verify_fa12_claim_tx(transfer_tx_params(res.operations[0], None), alice, admin, sum(reward_at_week[:2]))
+        self.assertEqual(res.storage["user_claimed_week"], {(0, alice): 2})
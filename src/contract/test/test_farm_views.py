@@ -0,0 +1,82 @@
+from unittest import TestCase
+
+from pytezos.contract.metadata import ContractMetadata
+
+from contract_cache import load_contract
+from farm_metadata import farm_metadata, metadata_big_map, run_view
+from farm_model import FarmModel
+from gas_benchmark import farm_fixture, farm_storage, farm_contract_path
+from gas_scaling import staker_address
+from test_farm import alice, bob, sec_week
+
+
+def claimed_amount(res) -> int:
+    """Reward sent by an FA1.2 claim, 0 when nothing is sent."""
+    if not res.operations:
+        return 0
+    return int(res.operations[0]["parameters"]["value"]["args"][2]["int"])
+
+
+class FarmViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.farms = load_contract(farm_contract_path)
+        cls.metadata = farm_metadata()
+        cls.maxDiff = None
+
+    def staked_storage(self) -> dict:
+        """Storage of a farm where stakers came and left over the first weeks."""
+        model = FarmModel.from_storage(farm_storage)
+        stakers = [alice, bob] + [staker_address(i) for i in range(4)]
+        model.stake(stakers, [500, 100, 1, 20_000, 3, 777], int(sec_week / 2))
+        model.stake(stakers[1:3], [400, 9], int(sec_week + sec_week / 3))
+        model.unstake(alice, 200, int(2 * sec_week + sec_week / 4))
+        model.stake(stakers[4], 1_000, int(3 * sec_week + sec_week / 5))
+        storage = model.to_storage(farm_fixture.overlay())
+        storage["metadata"] = metadata_big_map(self.metadata)
+        return storage
+
+    def test_metadata_should_declare_views(self):
+        metadata = ContractMetadata.from_json(self.metadata, self.farms.context)
+        self.assertEqual(set(metadata.storage_view_impl), {"currentWeek", "pendingReward", "userStake"})
+        stored = metadata_big_map(self.metadata)
+        self.assertEqual(stored[""], b"tezos-storage:contents")
+        # The metadata fits in the storage of the farm
+        res = self.farms.set_admin(bob).interpret(storage=self.staked_storage(), sender=farm_storage["admin"])
+        self.assertEqual(res.storage["metadata"], stored)
+
+    def test_current_week_should_count_from_creation_time(self):
+        storage = self.staked_storage()
+        for creation_time in [0, 1_000_000]:
+            storage["creation_time"] = creation_time
+            for delay in [0, sec_week - 1, sec_week, 5 * sec_week + 3]:
+                now = creation_time + delay
+                self.assertEqual(run_view(self.farms, self.metadata, "current_week", None, storage, now), delay // sec_week + 1)
+
+    def test_pending_reward_should_match_claim_all(self):
+        # Init
+        storage = self.staked_storage()
+        model = FarmModel.from_storage(storage)
+        # Execute entrypoint
+        for now in [int(sec_week / 2), int(sec_week + sec_week / 2), int(2 * sec_week + sec_week / 2), 4 * sec_week, 7 * sec_week]:
+            for user in list(storage["user_stakes"]) + [staker_address(100)]:
+                pending = run_view(self.farms, self.metadata, "pending_reward", user, storage, now)
+                self.assertEqual(pending, int(model.claimable(user, now)[0]), (user, now))
+                if now < sec_week:
+                    continue
+                res = self.farms.claim_all().interpret(storage=storage, sender=user, now=now)
+                self.assertEqual(pending, claimed_amount(res), (user, now))
+                storage = res.storage
+                model.claim_all(user, now)
+                self.assertEqual(run_view(self.farms, self.metadata, "pending_reward", user, storage, now), 0)
+
+    def test_pending_reward_should_be_zero_before_initialization(self):
+        storage = self.staked_storage()
+        storage["initialized"] = False
+        self.assertEqual(run_view(self.farms, self.metadata, "pending_reward", alice, storage, 3 * sec_week), 0)
+
+    def test_user_stake_should_read_user_stakes(self):
+        storage = self.staked_storage()
+        for user, stake in storage["user_stakes"].items():
+            self.assertEqual(run_view(self.farms, self.metadata, "user_stake", user, storage), stake)
+        self.assertEqual(run_view(self.farms, self.metadata, "user_stake", staker_address(100), storage), 0)
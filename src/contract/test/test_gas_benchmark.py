@@ -0,0 +1,95 @@
+from unittest import TestCase
+
+from contract_cache import load_contract
+from gas_benchmark import (benchmarks, run_benchmarks, load_baseline, regressions, stale_contracts, sources_digest, batch_claim, period_length, exit_farm,
+                           comparisons, run_comparisons, comparison_failures,
+                           separate_farms, multi_pool, farm_contract_path, multi_pool_contract_path,
+                           farm_fixture, alice, sec_week)
+from gas_meter import Metering, meter_call
+
+
+class GasBenchmarkTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.farms = load_contract(farm_contract_path)
+        cls.maxDiff = None
+
+    def test_metered_call_should_match_interpret(self):
+        # Init
+        init_storage = farm_fixture.overlay()
+        # Execute entrypoint
+        res, metering = meter_call(self.farms.stake(500), init_storage, sender=alice, now=int(sec_week / 2))
+        expected = self.farms.stake(500).interpret(storage=init_storage, sender=alice, now=int(sec_week / 2))
+        self.assertEqual(res.storage, expected.storage)
+        self.assertEqual(res.operations, expected.operations)
+        self.assertEqual(metering.entrypoint, "stake")
+        self.assertEqual(metering.steps, sum(metering.instructions.values()))
+        self.assertGreater(metering.storage_delta, 0)
+
+    def test_regressions_should_respect_tolerance(self):
+        baseline = {"benchmarks": {"farm/stake": {"gas": 1000, "storage_delta": 100}}}
+        cheaper = {"farm/stake": Metering("stake", steps=1, gas=900, storage_size=0, storage_delta=-10)}
+        within = {"farm/stake": Metering("stake", steps=1, gas=1020, storage_size=0, storage_delta=102)}
+        above = {"farm/stake": Metering("stake", steps=1, gas=1021, storage_size=0, storage_delta=103)}
+        unknown = {"farm/unstake": Metering("unstake", steps=1, gas=10 ** 6, storage_size=0, storage_delta=0)}
+        self.assertEqual(regressions(cheaper, baseline, 0.02), [])
+        self.assertEqual(regressions(within, baseline, 0.02), [])
+        self.assertEqual(len(regressions(above, baseline, 0.02)), 2)
+        self.assertEqual(regressions(unknown, baseline, 0.02), ["farm/unstake: no baseline entry, run `gas_benchmark.py --update`"])
+
+    def test_comparison_failures_should_gate_the_cheapest_alternative(self):
+        comparisons["cheaper_batch"] = comparisons["batch_claim_10_farms"]
+        self.addCleanup(comparisons.pop, "cheaper_batch")
+        baseline = {"comparisons": {"cheaper_batch": {"claim_farms": 1000, "claim_all": 2000}}}
+        self.assertEqual(comparison_failures({"cheaper_batch": {"claim_farms": 1020, "claim_all": 1500}}, baseline, 0.02), [])
+        self.assertEqual(len(comparison_failures({"cheaper_batch": {"claim_farms": 1021, "claim_all": 2000}}, baseline, 0.02)), 1)
+        self.assertEqual(len(comparison_failures({"cheaper_batch": {"claim_farms": 1000, "claim_all": 900}}, baseline, 0.02)), 1)
+        self.assertEqual(comparison_failures({"batch_claim_10_farms": {"claim_farms": 1, "claim_all": 2}}, baseline, 0.02),
+                         ["batch_claim_10_farms: no baseline entry, run `gas_benchmark.py --update`"])
+
+    def test_comparisons_should_not_exceed_baseline(self):
+        compared, skipped = run_comparisons()
+        self.assertEqual(skipped, [])
+        self.assertEqual(set(compared), set(comparisons))
+        self.assertEqual(comparison_failures(compared, load_baseline()), [])
+
+    def test_entrypoints_should_not_exceed_baseline(self):
+        results, skipped = run_benchmarks()
+        baseline = load_baseline()
+        self.assertEqual(set(results) | set(skipped), set(benchmarks))
+        # Every entrypoint of the farm and of the database is gated
+        self.assertEqual(skipped, [])
+        self.assertEqual(stale_contracts(baseline), [])
+        self.assertEqual(regressions(results, baseline), [])
+
+    def test_baseline_should_be_stale_after_a_source_change(self):
+        contract_paths = {benchmark.contract_path for benchmark in benchmarks.values()}
+        contract_paths.update(contract_path for compared in comparisons.values() for contract_path, _ in compared.requires)
+        baseline = {"sources": {contract_path: sources_digest(contract_path) for contract_path in contract_paths}}
+        self.assertEqual(stale_contracts(baseline), [])
+        baseline["sources"][farm_contract_path] = "0" * 64
+        self.assertEqual(len(stale_contracts(baseline)), 1)
+        self.assertTrue(stale_contracts(baseline)[0].startswith(farm_contract_path))
+        # The multi-pool farm shares the partials of the farm
+        self.assertNotEqual(sources_digest(farm_contract_path), sources_digest(multi_pool_contract_path))
+
+    def test_batch_claim_should_cost_less_than_separate_claims(self):
+        for farms_count in [2, 5]:
+            batch_gas, separate_gas = batch_claim(farms_count)
+            self.assertLess(batch_gas, separate_gas, farms_count)
+
+    def test_longer_periods_should_cost_less(self):
+        gas = period_length(52 * sec_week, [sec_week, 4 * sec_week])
+        for entrypoint in ["stake", "unstake", "claim_all"]:
+            self.assertLess(gas[4 * sec_week][entrypoint], gas[sec_week][entrypoint], entrypoint)
+
+    def test_exit_should_cost_less_than_claim_and_unstake(self):
+        for now in [int(sec_week * 2.5), sec_week * 10]:
+            exit_metering, separate = exit_farm(now)
+            self.assertLess(exit_metering.gas, separate.gas, now)
+            self.assertLess(exit_metering.storage_delta, separate.storage_delta, now)
+
+    def test_pools_should_cost_less_than_separate_farms(self):
+        farms, pools = separate_farms(10), multi_pool(10)
+        self.assertLess(pools.gas, farms.gas)
+        self.assertLess(pools.storage, farms.storage)
@@ -0,0 +1,98 @@
+from collections import Counter
+from unittest import TestCase
+import os
+import tempfile
+
+from contract_cache import load_contract
+from gas_benchmark import benchmarks, farm_contract_path
+from gas_profiler import Location, SourceIndex, folded_stacks, parse_michelson, profile_call, report, root_path
+
+methods_file = "src/contract/farm/partials/methods.mligo"
+
+
+def line_of(text: str, path: str = methods_file) -> int:
+    with open(os.path.join(root_path, path)) as f:
+        return next(number for number, line in enumerate(f.read().split("\n"), 1) if line.startswith(text))
+
+
+class GasProfilerTest(TestCase):
+    def test_parse_should_attach_comments_to_their_node(self):
+        source = parse_michelson("""{ parameter nat ; storage nat ;
+  code { /* File "main.mligo", line 3, characters 0-4 */
+         UNPAIR ;
+         IF_LEFT { /* File "methods.mligo", line 10, characters 0-4 */ DROP } { PUSH nat 2 /* File "methods.mligo", line 12, characters 0-4 */ ; ADD } ;
+         NIL operation ; PAIR } }""")
+        self.assertEqual([section.prim for section in source.args], ["parameter", "storage", "code"])
+        code = source.args[2].args[0]
+        self.assertEqual(code.location, Location("main.mligo", 3))
+        self.assertEqual([node.prim for node in code.args], ["UNPAIR", "IF_LEFT", "NIL", "PAIR"])
+        left, right = code.args[1].args
+        self.assertIsNone(code.args[1].location)
+        self.assertEqual(left.location, Location("methods.mligo", 10))
+        self.assertEqual([node.prim for node in right.args], ["PUSH", "ADD"])
+        self.assertEqual(right.args[0].location, Location("methods.mligo", 12))
+        self.assertIsNone(right.args[1].location)
+
+    def test_lines_should_map_to_their_ligo_function(self):
+        index = SourceIndex()
+
+        def function(text: str) -> str:
+            return index.function(Location(methods_file, line_of(text)))
+
+        self.assertEqual(function("let add_or_subtract_list"), "add_or_subtract_list")
+        self.assertEqual(function("    let rec merge_list"), "add_or_subtract_list.merge_list")
+        self.assertEqual(function("let rec reverse_list"), "reverse_list")
+        self.assertEqual(function("    let rec multiply"), "power.multiply")
+        # Back to power after its local function
+        self.assertEqual(index.function(Location(methods_file, line_of("    let rec multiply") + 1)), "power")
+        self.assertEqual(index.function(Location(methods_file, line_of("    let rec calculate_new_points_by_week") + 1)),
+                         "new_points_by_weeks.calculate_new_points_by_week")
+
+    def test_profile_should_charge_the_ligo_functions(self):
+        power = line_of("    multiply(1n, x, y)")
+        multiply = line_of("    let rec multiply")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "located.tz")
+            with open(path, "w") as f:
+                f.write(f"""{{ parameter nat ;
+  storage (pair (nat %total) (nat %rate)) ;
+  code {{ /* File "src/contract/farm/main.mligo", line 3, characters 4-8 */
+         UNPAIR ;
+         DIP {{ UNPAIR }} ;
+         PUSH nat 2 /* File "{methods_file}", line {power}, characters 4-22 */ ;
+         MUL /* File "{methods_file}", line {multiply}, characters 60-70 */ ;
+         ADD ;
+         PAIR ;
+         NIL operation ;
+         PAIR }} }}""")
+            contract = load_contract(path)
+            profile = profile_call("located", path, contract.default(3), {"total": 4, "rate": 1})
+        self.assertTrue(profile.located)
+        self.assertEqual({name: stats.count for name, stats in profile.functions.items()},
+                         {"main": profile.metering.steps - 2, "power": 1, "power.multiply": 1})
+        self.assertIn("located;main;power;PUSH", profile.stacks)
+        self.assertIn("located;main;power.multiply;MUL", profile.stacks)
+
+    def test_profile_should_account_for_every_instruction(self):
+        contract_path, entrypoint, prepare = benchmarks["farm/stake_second_staker"]
+        call, storage, kwargs = prepare(load_contract(contract_path))
+        profile = profile_call("farm/stake_second_staker", farm_contract_path, call, storage, **kwargs)
+        self.assertEqual(profile.entrypoint, entrypoint)
+        self.assertGreater(profile.wall_time, 0)
+        self.assertEqual(Counter({prim: stats.count for prim, stats in profile.instructions.items()}), profile.metering.instructions)
+        self.assertEqual(sum(stats.count for stats in profile.functions.values()), profile.metering.steps)
+        milligas = sum(stats.milligas for stats in profile.instructions.values())
+        self.assertEqual(sum(stats.milligas for stats in profile.functions.values()), milligas)
+        # The committed contract has no locations, its loops are the frames
+        self.assertFalse(profile.located)
+        self.assertTrue(any(name.startswith("LOOP_LEFT#") for name in profile.functions))
+        lines = folded_stacks([profile])
+        self.assertTrue(all(line.startswith("farm/stake_second_staker;") for line in lines))
+        self.assertEqual(sum(int(line.rsplit(" ", 1)[1]) for line in lines), milligas)
+        self.assertEqual(sum(int(line.rsplit(" ", 1)[1]) for line in folded_stacks([profile], "steps")), profile.metering.steps)
+        # Most expensive instruction first
+        text = report([profile])
+        self.assertIn("--ligo", text)
+        top = max(profile.instructions, key=lambda prim: profile.instructions[prim].milligas)
+        table = text.split("  instruction")[1].split("\n")
+        self.assertEqual(table[1].split()[0], top)
@@ -0,0 +1,61 @@
+from unittest import TestCase
+
+from contract_cache import load_contract
+from gas_benchmark import farm_contract_path, farm_fixture, alice, bob, sec_week
+from gas_meter import lazy_storage, meter_call
+from gas_scaling import Point, calibrate, gas_limit_size, prepare_weeks, summary, sweep
+
+oscar = 'tz1Phy92c2n817D17dUGzxNgw1qCkNSTWZY2'
+
+
+class GasScalingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.farms = load_contract(farm_contract_path)
+        cls.maxDiff = None
+
+    def test_lazy_big_maps_should_meter_like_inline_storage(self):
+        # Init
+        storage = farm_fixture.overlay()
+        storage = self.farms.stake(500).interpret(storage=storage, sender=alice, now=int(sec_week / 2)).storage
+        storage = self.farms.stake(300).interpret(storage=storage, sender=bob, now=sec_week).storage
+        lazy, big_maps = lazy_storage(self.farms.context.storage_expr, storage, ["user_points", "user_stakes"])
+        calls = [
+            (self.farms.stake(10), dict(sender=alice, now=2 * sec_week)),
+            (self.farms.stake(10), dict(sender=oscar, now=2 * sec_week)),
+            (self.farms.unstake(300), dict(sender=bob, now=2 * sec_week)),
+            (self.farms.claim_all(), dict(sender=alice, now=9 * sec_week)),
+        ]
+        # Execute entrypoints
+        for call, kwargs in calls:
+            res, inline_metering = meter_call(call, storage, **kwargs)
+            lazy_res, lazy_metering = meter_call(call, lazy, big_maps=big_maps, **kwargs)
+            self.assertEqual(lazy_res.operations, res.operations)
+            self.assertEqual(lazy_metering.steps, inline_metering.steps)
+            self.assertEqual(lazy_metering.gas, inline_metering.gas)
+            self.assertEqual(lazy_metering.storage_delta, inline_metering.storage_delta)
+
+    def test_sweep_should_extrapolate_above_max_steps(self):
+        points = sweep("claim_all", "total_weeks", [1, 2, 3, 4], prepare_weeks, max_steps=450)
+        self.assertEqual([p.extrapolated for p in points], [False, False, False, True])
+        # claim_all walks the weeks once: the fit is exact
+        measured = sweep("claim_all", "total_weeks", [4], prepare_weeks)[0]
+        self.assertAlmostEqual(points[3].steps, measured.steps, delta=1)
+        self.assertAlmostEqual(points[3].gas, measured.gas, delta=1)
+
+    def test_gas_limit_size_should_solve_fitted_curve(self):
+        points = [Point("initialize", "total_weeks", n, 0, 1000 + 4 * n * n, 0, False) for n in (1, 10, 50, 100)]
+        self.assertAlmostEqual(gas_limit_size(points, limit=41000), 100, places=3)
+        self.assertAlmostEqual(gas_limit_size(points, limit=1_001_000), 500, places=3)
+        flat = [Point("stake", "stakers", n, 0, 1900, 0, False) for n in (1, 10, 100)]
+        self.assertIsNone(gas_limit_size(flat))
+
+    def test_calibration_should_scale_the_curve_to_the_node_gas(self):
+        points = [Point("initialize", "total_weeks", n, 0, 1000 + 4 * n * n, 0, False) for n in (1, 10, 50, 100)]
+        # The node consumed twice the estimate at 50 weeks
+        calibrated = calibrate(points, 50, 2 * (1000 + 4 * 50 * 50) * 1000)
+        for point, scaled in zip(points, calibrated):
+            self.assertAlmostEqual(scaled.gas, 2 * point.gas, places=6)
+        self.assertAlmostEqual(gas_limit_size(calibrated, limit=82000), 100, places=3)
+        self.assertIn("relative only", summary(points))
+        self.assertIn("calibrated", summary(calibrated, calibrated=True))
@@ -0,0 +1,75 @@
+from unittest import TestCase
+from dataclasses import replace
+
+from gas_benchmark import farm_contract_path
+from layout_optimizer import (Layout, access_counts, candidate_layouts, measure, methods_path, migrate_literals, rank,
+                              record_fields, types_path, with_layout)
+
+store_literal = """    const store = {
+        'admin': admin,
+        'farm_points': farm_points,
+        'initialized': false,
+        'reward_at_week': reward_at_week,
+        'user_points': user_points,
+        'week_duration' : week_duration,
+    }
+    const other = {
+        'admin': admin,
+        'total_supply': total_supply
+    }"""
+
+
+class LayoutOptimizerTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(types_path) as f:
+            cls.types_source = f.read()
+        with open(methods_path) as f:
+            cls.methods_source = f.read()
+        cls.fields = [field.name for field in record_fields(cls.types_source)]
+
+    def test_with_layout_should_reorder_storage_farm_only(self):
+        order = list(reversed(self.fields))
+        source = with_layout(self.types_source, Layout("reversed", order, comb=True))
+        self.assertIn("type storage_farm = [@layout:comb] {", source)
+        self.assertEqual([field.name for field in record_fields(source)], order)
+        # Comments follow their field, the last field has no separator
+        self.assertIn("    metadata : (string, bytes) big_map;            // TZIP-16 metadata", source)
+        self.assertIn("    admin: address\n}", source)
+        self.assertEqual(source.split("type storage_farm")[0], self.types_source.split("type storage_farm")[0])
+        self.assertIn("type storage_farm_accumulator = {", source)
+        # Back to the tree layout in declaration order
+        self.assertEqual(with_layout(source, Layout("tree", self.fields, comb=False)), self.types_source)
+        with self.assertRaises(ValueError):
+            with_layout(self.types_source, Layout("missing", self.fields[1:], comb=True))
+
+    def test_hot_fields_should_come_first(self):
+        counts = access_counts(self.methods_source, self.fields)
+        layouts = {layout.name: layout for layout in candidate_layouts(self.types_source, self.methods_source, [self.fields[::-1]])}
+        self.assertEqual(set(layouts), {"tree", "comb", "comb_hot", "order_1"})
+        hot = layouts["comb_hot"].order
+        self.assertEqual(sorted(hot), sorted(self.fields))
+        self.assertEqual([counts[name] for name in hot], sorted(counts.values(), reverse=True))
+        self.assertLess(hot.index("initialized"), hot.index("reward_reserve_address"))
+
+    def test_migrate_literals_should_follow_the_order(self):
+        migrated = migrate_literals(store_literal, ["initialized", "user_points", "reward_at_week", "farm_points", "admin"])
+        self.assertEqual(migrated.split("\n")[1:7], [
+            "        'initialized': false,",
+            "        'user_points': user_points,",
+            "        'reward_at_week': reward_at_week,",
+            "        'farm_points': farm_points,",
+            "        'admin': admin,",
+            "        'week_duration': week_duration,",
+        ])
+        # Other objects are left as they are
+        self.assertEqual(migrated.split("\n")[8:], store_literal.split("\n")[8:])
+
+    def test_rank_should_sort_by_total_gas(self):
+        results = measure({"current": farm_contract_path})
+        self.assertTrue(results["current"])
+        self.assertTrue(all(name.startswith("farm/") for name in results["current"]))
+        cheaper = {name: replace(metering, gas=metering.gas - 1) for name, metering in results["current"].items()}
+        ranking = rank({"current": results["current"], "cheaper": cheaper})
+        self.assertEqual([name for name, _ in ranking], ["cheaper", "current"])
+        self.assertEqual(ranking[1][1] - ranking[0][1], len(cheaper))
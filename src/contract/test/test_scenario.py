@@ -0,0 +1,87 @@
+from unittest import TestCase
+
+from contract_cache import load_contract
+from gas_benchmark import farm_fixture, farm_contract_path
+from gas_scaling import staker_address
+from scenario import ScenarioRunner, Step, max_layers
+from test_farm import admin, alice, bob, sec_week
+
+steps = [
+    Step("stake", alice, now=int(sec_week / 2), parameter=500),
+    Step("stake", bob, now=int(sec_week + sec_week / 3), parameter=100),
+    Step("increase_reward", admin, now=int(sec_week + sec_week / 2), parameter=7_000_000),
+    Step("unstake", alice, now=int(2 * sec_week + sec_week / 4), parameter=200),
+    Step("claim_all", bob, now=int(3 * sec_week + sec_week / 2)),
+]
+
+
+class ScenarioRunnerTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.farms = load_contract(farm_contract_path)
+        cls.maxDiff = None
+
+    def test_run_should_match_chained_interpret(self):
+        # Init
+        runner = ScenarioRunner(self.farms)
+        storage = farm_fixture.overlay()
+        storage["user_stakes"] = {bob: 10}
+        storage["user_points"] = {bob: [10 * sec_week] * 5}
+        storage["farm_points"] = [10 * sec_week] * 5
+        # Execute entrypoints
+        results = runner.run(runner.state(storage), steps)
+        for step, result in zip(steps, results):
+            call = getattr(self.farms, step.entrypoint)
+            res = (call() if step.parameter is None else call(step.parameter)).interpret(storage=storage, sender=step.sender, now=step.now)
+            self.assertEqual(result.state.storage(), res.storage, step)
+            self.assertEqual(result.operations, res.operations, step)
+            storage = res.storage
+
+    def test_branches_should_share_prefix(self):
+        # Init
+        runner = ScenarioRunner(self.farms)
+        initial = runner.state(farm_fixture.overlay())
+        prefix = runner.run(initial, steps[:3])
+        # Execute entrypoints
+        unstake = runner.run(initial, steps[:3] + [steps[3]])
+        claim = runner.run(initial, steps[:3] + [steps[4]])
+        self.assertEqual(runner.cache_hits, 6)
+        self.assertIs(unstake[2], prefix[2])
+        self.assertIs(claim[-1].state.big_maps[0].parent, prefix[2].state.big_maps[0])
+        self.assertEqual(unstake[-1].state.big_map("user_stakes"), {alice: 300, bob: 100})
+        self.assertEqual(claim[-1].state.big_map("user_stakes"), {alice: 500, bob: 100})
+
+    def test_same_content_should_have_same_digest(self):
+        # Init
+        runner = ScenarioRunner(self.farms)
+        initial = runner.state(farm_fixture.overlay())
+        # Execute entrypoints
+        results = runner.run(initial, [Step("set_admin", admin, parameter=bob), Step("set_admin", bob, parameter=admin)])
+        self.assertNotEqual(results[0].state.digest, initial.digest)
+        self.assertEqual(results[1].state.digest, initial.digest)
+        runner.step(results[1].state, steps[0])
+        self.assertEqual(runner.step(initial, steps[0]).state.digest, runner.step(results[1].state, steps[0]).state.digest)
+        self.assertEqual(runner.cache_hits, 2)
+
+    def test_long_scenario_should_not_copy_big_maps(self):
+        # Init
+        stakers = [staker_address(i) for i in range(1000)]
+        storage = farm_fixture.overlay()
+        storage["user_stakes"] = dict.fromkeys(stakers, 10)
+        storage["user_points"] = dict.fromkeys(stakers, [10 * sec_week] * 5)
+        storage["farm_points"] = [len(stakers) * 10 * sec_week] * 5
+        runner = ScenarioRunner(self.farms)
+        initial = runner.state(storage)
+        long_steps = [Step("stake", stakers[i % 50], now=int(sec_week / 2) + i, parameter=1) for i in range(max_layers + 2)]
+        # Execute entrypoints
+        results = runner.run(initial, long_steps)
+        big_map = results[max_layers - 2].state.big_maps[0]
+        self.assertEqual(len(big_map.entries), 1)
+        self.assertEqual(big_map.layers, max_layers)
+        flattened = results[max_layers - 1].state.big_maps[0]
+        self.assertEqual((flattened.layers, len(flattened.entries)), (1, len(stakers)))
+        self.assertIs(results[-1].state.big_maps[0].parent.parent, flattened)
+        stakes = results[-1].state.big_map("user_stakes")
+        self.assertEqual(sum(stakes.values()), 10 * len(stakers) + len(long_steps))
+        user_points = results[-1].state.big_map("user_points")
+        self.assertEqual(results[-1].state.storage()["farm_points"][0], sum(points[0] for points in user_points.values()))
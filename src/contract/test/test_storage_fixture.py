@@ -0,0 +1,39 @@
+from unittest import TestCase
+from copy import copy, deepcopy
+import pickle
+
+from storage_fixture import FrozenDict, FrozenList, StorageFixture
+
+storage = {"admin": "tz1fABJ97CJMSP2DKrQx2HAFazh6GgahQ7ZK", "farm_points": [1, 2],
+           "user_points": {"alice": [3, 4]}, "batches": [{"alice": 5}]}
+
+
+def frozen_types(value) -> list:
+    """Frozen containers anywhere in value."""
+    found = [type(value)] if isinstance(value, (FrozenDict, FrozenList)) else []
+    items = value.values() if isinstance(value, dict) else value if isinstance(value, list) else []
+    for item in items:
+        found += frozen_types(item)
+    return found
+
+
+class StorageFixtureTest(TestCase):
+    def test_overlay_should_not_modify_the_base(self):
+        fixture = StorageFixture(storage)
+        overlay = fixture.overlay(admin="tz1hNVs94TTjZh6BZ1PM5HL83A7aiZXkQ8ur")
+        overlay["user_points"]["alice"].append(5)
+        overlay["batches"][0]["bob"] = 6
+        self.assertEqual(fixture.overlay(), storage)
+        with self.assertRaises(TypeError):
+            fixture.base["user_points"]["alice"].append(5)
+
+    def test_copies_should_be_plain_mutable_containers(self):
+        fixture = StorageFixture(storage)
+        for copied in [deepcopy(fixture.overlay()), deepcopy(fixture.base), pickle.loads(pickle.dumps(fixture.overlay())),
+                       pickle.loads(pickle.dumps(fixture.base)), dict(fixture.overlay()), {**fixture.overlay()},
+                       copy(fixture.base), dict(fixture.overlay().items())]:
+            self.assertEqual(copied, storage)
+            self.assertEqual(frozen_types(copied), [])
+            copied["user_points"]["alice"].append(5)
+            copied["batches"][0]["bob"] = 6
+        self.assertEqual(fixture.overlay(), storage)